@@ -1,100 +1,183 @@
 # DO NOT run this document on Web Deployment, run it locally ONLY. This links to the local django server, not to the online one
-# To modify, change those 127.0.0.1... to ${apiBase}/sentiment/ for sentiment
+# To modify, pass --api ${apiBase} (default http://127.0.0.1:8000/api)
+#
+# Scores all_stocks_news_master_dataset.csv into all_stocks_news_with_sentiment.csv, resumable:
+# - the master csv is read --chunksize rows at a time (never the whole file in memory)
+# - each chunk goes to /api/sentiment/batch/ in --batch-size article requests, --concurrency of them in flight
+# - a finished chunk is appended to the output, then <output>.checkpoint.json records how many input rows are done
+#   (and the output size at that point), so after a crash / Ctrl-C a rerun carries on from the last finished chunk
+# - every output row has a content_hash (headline + summary), articles already scored (earlier runs, duplicates
+#   in the master file) reuse their score instead of calling the API again
+#   python apply_sentiment_analysis.py                  -> carry on / start
+#   python apply_sentiment_analysis.py --restart        -> ignore the checkpoint (still reuses scores by hash)
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import requests
-import time
-import os
+from requests.adapters import HTTPAdapter
+
+RETRIES = 3
+
 
 # ensure django backend can be accessed
-def test_backend_connection():
+def test_backend_connection(api):
     try:
         response = requests.post(
-            "http://127.0.0.1:8000/api/sentiment/",
-            json={"headline": "Test headline", "summary": "Test summary"},
+            f"{api}/sentiment/batch/",
+            json={"articles": [{"headline": "Test headline", "summary": "Test summary"}]},
             timeout=5 # Sends a single test post to sentiment with dummy text, with 5s timeout
         )
-        if response.status_code == 200: # means that the Backend is working
-            return True
-        else: # If not 200, backend is not working
-            #print(f"Backend not working {response.status_code}")
-            return False
-    except Exception as e: #catch all errors
+        return response.status_code == 200
+    except Exception: #catch all errors
         return False
 
-# Analyse sentiment for a batch of articles
-def analyse_sentiment_batch(headlines, summaries):
-    results = []
-
-    for i, (headline, summary) in enumerate(zip(headlines, summaries)):
-        try:
-            # Clean the data
-            headline = str(headline) if pd.notna(headline) else "" # if NaN, convert into "" to avoid sending None (will be interpreted as Sentiment = 0)
-            summary = str(summary) if pd.notna(summary) else ""
-
-            # Call Django API
-            response = requests.post(
-                "http://127.0.0.1:8000/api/sentiment/",
-                json={"headline": headline, "summary": summary},
-                timeout=10
-            )
-# essentially, anyt wrong js give sentiment = 0
-            if response.status_code == 200:
-                data = response.json()
-                sentiment_score = data.get('final_sentiment_score', 0)
-                results.append(sentiment_score)
-            else:
-                results.append(0)  # Default neutral sentiment
-
-        except Exception as e:
-            results.append(0)  # Default neutral sentiment
-
-        # Rate limiting because API sometimes lags/cnnt process
-        time.sleep(0.05)  # 50ms delay between requests
 
-    return results
+def clean_text(value):
+    return str(value) if pd.notna(value) else "" # NaN -> "" so None is never sent
 
 
-def main():
-    if not test_backend_connection(): #if server is not working then we stop
-        return
-
-    # master dataset (contains all stock news)
-    input_file = 'all_stocks_news_master_dataset.csv'
-
-    try:
-        df = pd.read_csv(input_file)
-        #print(f"Loaded {len(df):,} articles from {input_file}") # for debug use
-    except FileNotFoundError:
-        #print("file not found")
-        return
+def content_hash(headline, summary):
+    return hashlib.sha1(f"{headline}\n{summary}".encode('utf-8')).hexdigest()
 
-    # Process in batches to avoid overwhelming the API
-    batch_size = 100
-    all_sentiment_scores = []
 
-    for batch_start in range(0, len(df), batch_size):
-        batch_end = min(batch_start + batch_size, len(df))
+def make_session(concurrency):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency) # one kept-alive connection per worker
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
-        batch_headlines = df.iloc[batch_start:batch_end]['Headline'].tolist()
-        batch_summaries = df.iloc[batch_start:batch_end]['Summary'].tolist()
 
-        batch_results = analyse_sentiment_batch(batch_headlines, batch_summaries)
-        all_sentiment_scores.extend(batch_results)
+# one /api/sentiment/batch/ call, retried with backoff. Raises if it still fails, so the chunk is not written and
+# the next run does it again (instead of the old "anything wrong = sentiment 0")
+def score_batch(session, api, articles):
+    for attempt in range(RETRIES):
+        try:
+            response = session.post(f"{api}/sentiment/batch/", json={"articles": articles}, timeout=60)
+            if response.status_code == 200:
+                scores = [r['final_sentiment_score'] for r in response.json()['results']]
+                missing = [i for i, score in enumerate(scores) if score is None and (articles[i]['headline'] or articles[i]['summary'])]
+                if not missing:
+                    return [0.0 if score is None else score for score in scores] # no text at all = neutral, as before
+            error = f"status {response.status_code}"
+        except (requests.RequestException, ValueError, KeyError) as e:
+            error = str(e)
+        time.sleep(2 ** attempt)
+    raise RuntimeError(f"sentiment batch failed after {RETRIES} tries: {error}")
+
+
+def read_checkpoint(path, input_file):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint if checkpoint.get('input') == os.path.abspath(input_file) else None
+
+
+def write_checkpoint(path, input_file, rows_done, output_bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'input': os.path.abspath(input_file), 'rows_done': rows_done, 'output_bytes': output_bytes,
+                   'updated': time.strftime('%Y-%m-%dT%H:%M:%S')}, f)
+    os.replace(tmp, path) # never a half written checkpoint
+
+
+# content_hash -> score for everything already in the output
+def known_scores(output_file, chunksize):
+    known = {}
+    if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
+        return known
+    if 'content_hash' not in pd.read_csv(output_file, nrows=0).columns:
+        return known # output from the old version of this script, no hashes to match on
+    for chunk in pd.read_csv(output_file, usecols=['content_hash', 'sentiment_score'], chunksize=chunksize, float_precision='round_trip'):
+        known.update(zip(chunk['content_hash'], chunk['sentiment_score']))
+    return known
+
+
+def run(input_file, output_file, api, chunksize=2000, batch_size=64, concurrency=4, restart=False):
+    checkpoint_file = f"{output_file}.checkpoint.json"
+    checkpoint = None if restart else read_checkpoint(checkpoint_file, input_file)
+    rows_done = checkpoint['rows_done'] if checkpoint else 0
+    if checkpoint and (not os.path.exists(output_file) or os.path.getsize(output_file) < checkpoint['output_bytes']):
+        print("Output is shorter than the checkpoint says, starting over")
+        checkpoint, rows_done = None, 0
+    if checkpoint:
+        # anything written after the last checkpoint belongs to a chunk that did not finish
+        with open(output_file, 'ab') as f:
+            f.truncate(checkpoint['output_bytes'])
+    elif os.path.exists(output_file):
+        os.replace(output_file, f"{output_file}.previous") # kept until the run finishes so its scores can be reused
+    known = known_scores(f"{output_file}.previous", chunksize)
+    known.update(known_scores(output_file, chunksize))
+    if checkpoint:
+        print(f"Resuming after {rows_done:,} rows ({len(known):,} articles already scored)")
+
+    session = make_session(concurrency)
+    start = time.perf_counter()
+    scored = reused = 0
+    reader = pd.read_csv(input_file, chunksize=chunksize, skiprows=range(1, rows_done + 1))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for chunk in reader:
+            headlines = chunk['Headline'].map(clean_text)
+            summaries = chunk['Summary'].map(clean_text)
+            hashes = [content_hash(h, s) for h, s in zip(headlines, summaries)]
+
+            todo = {}
+            for h, headline, summary in zip(hashes, headlines, summaries):
+                if h not in known and h not in todo:
+                    todo[h] = {'headline': headline, 'summary': summary}
+            todo_hashes = list(todo)
+            batches = [todo_hashes[i:i + batch_size] for i in range(0, len(todo_hashes), batch_size)]
+            results = pool.map(lambda keys: score_batch(session, api, [todo[k] for k in keys]), batches)
+            for keys, scores in zip(batches, results):
+                known.update(zip(keys, scores))
+            scored += len(todo_hashes)
+            reused += len(hashes) - len(todo_hashes)
+
+            chunk['sentiment_score'] = [known[h] for h in hashes]
+            chunk['content_hash'] = hashes
+            write_header = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+            with open(output_file, 'a', newline='', encoding='utf-8') as f:
+                chunk.to_csv(f, header=write_header, index=False)
+                f.flush()
+                os.fsync(f.fileno())
+                output_bytes = f.tell()
+            rows_done += len(chunk)
+            write_checkpoint(checkpoint_file, input_file, rows_done, output_bytes)
+
+            elapsed = time.perf_counter() - start
+            print(f"{rows_done:,} rows done, {scored:,} scored ({scored / max(elapsed, 1e-9):.0f}/s), {reused:,} reused")
+
+    if os.path.exists(f"{output_file}.previous"):
+        os.remove(f"{output_file}.previous")
+    return rows_done
 
-    # append computed scores to a new column
-    df['sentiment_score'] = all_sentiment_scores
 
-    # save to a new csv
-    output_file = 'all_stocks_news_with_sentiment.csv'
-    df.to_csv(output_file, index=False)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default='all_stocks_news_master_dataset.csv') # master dataset (contains all stock news)
+    parser.add_argument('--output', default='all_stocks_news_with_sentiment.csv')
+    parser.add_argument('--api', default='http://127.0.0.1:8000/api')
+    parser.add_argument('--chunksize', type=int, default=2000, help='input rows per checkpoint')
+    parser.add_argument('--batch-size', type=int, default=64, help='articles per request (server max SENTIMENT_MAX_BATCH_REQUEST)')
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight')
+    parser.add_argument('--restart', action='store_true', help='start from the first row instead of the checkpoint')
+    args = parser.parse_args()
+
+    if not test_backend_connection(args.api): #if server is not working then we stop
+        print(f"Backend not reachable at {args.api}")
+        return
+    if not os.path.exists(args.input):
+        print(f"{args.input} not found")
+        return
+    run(args.input, args.output, args.api, args.chunksize, args.batch_size, args.concurrency, args.restart)
 
-    # summary showing just to ensure its running fine
-    #sentiment_stats = df['sentiment_score'].describe()
-    #print("Sentiment Score Stats:")
-    #print(f" Mean: {sentiment_stats['mean']:.3f}")
-    #print(f" Min: {sentiment_stats['min']:.3f}")
-    #print(f" Max: {sentiment_stats['max']:.3f}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
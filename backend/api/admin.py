@@ -1,3 +1,49 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import NewsArticle, NewsCursor, DailySentiment, SentimentState, QuotaBucket, FeatureRow, DailyBar, PredictionRecord
+
+
+@admin.register(NewsArticle)
+class NewsArticleAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'headline', 'source', 'published_at', 'sentiment_score')
+    list_filter = ('symbol',)
+    search_fields = ('headline', 'url')
+
+
+@admin.register(NewsCursor)
+class NewsCursorAdmin(admin.ModelAdmin):
+    list_display = ('feed', 'last_published_at', 'last_finnhub_id', 'last_fetched_at')
+
+
+@admin.register(DailySentiment)
+class DailySentimentAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'date', 'article_count', 'sentiment_sum', 'updated_at')
+    list_filter = ('symbol',)
+
+
+@admin.register(SentimentState)
+class SentimentStateAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'total', 'weight', 'last_at', 'half_life_hours', 'updated_at')
+
+
+@admin.register(QuotaBucket)
+class QuotaBucketAdmin(admin.ModelAdmin):
+    list_display = ('key', 'tokens', 'refilled_at', 'day', 'day_count')
+
+
+@admin.register(FeatureRow)
+class FeatureRowAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'date', 'close', 'rsi', 'news_sentiment', 'source', 'updated_at')
+    list_filter = ('symbol', 'source')
+
+
+@admin.register(DailyBar)
+class DailyBarAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'date', 'open', 'high', 'low', 'close', 'volume', 'source', 'updated_at')
+    list_filter = ('symbol', 'source')
+
+
+@admin.register(PredictionRecord)
+class PredictionRecordAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'created_at', 'prediction_code', 'source', 'model_version')
+    list_filter = ('symbol', 'source')
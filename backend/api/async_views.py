@@ -0,0 +1,112 @@
+# Async versions of SentimentAnalysisView and StockPredictionView for the ASGI deployment (config/asgi.py)
+# Same request/response format as the DRF views. While a prediction waits on Finnhub/AlphaVantage/HF the worker
+# keeps serving other requests, instead of one slow prediction holding a whole sync worker
+
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import drift, prediction_log, predictor, quota
+from .sentiment import ascore_sentiment, SentimentError
+from .views import parse_flag, parse_query_date
+
+
+# the body as a dict, None if it isn't a JSON object
+def read_json(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@csrf_exempt
+@require_POST
+async def sentiment_analysis(request):
+    data = read_json(request)
+    if data is None:
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+    headline = data.get('headline', '') or ''
+    summary = data.get('summary', '') or ''
+    if not isinstance(headline, str) or not isinstance(summary, str):
+        return JsonResponse({'error': 'headline and summary must be strings'}, status=400)
+    if not (headline + ' ' + summary).strip():
+        return JsonResponse({'error': 'No text provided.'}, status=400) # checks that some text was sent
+    try:
+        final_score, scores = await ascore_sentiment(headline, summary)
+    except SentimentError as e:
+        return JsonResponse({'error': str(e), 'details': e.details}, status=500)
+    return JsonResponse({ # must return both aggregate and indiv score
+        "final_sentiment_score": final_score,
+        "details": scores
+    })
+
+
+@csrf_exempt
+@require_POST
+async def stock_prediction(request):
+    started = time.perf_counter()
+    data = read_json(request)
+    if data is None:
+        return JsonResponse({'error': 'Expected a JSON object.'}, status=400)
+    symbol = data.get('symbol') or ''
+    symbol = symbol.upper().strip() if isinstance(symbol, str) else ''
+    if not symbol:
+        return JsonResponse({'error': 'Symbol is required'}, status=400)
+
+    model, feature_columns, model_info = await sync_to_async(predictor.model_for, thread_sensitive=False)(symbol) # disk read on first use
+    if not model or not feature_columns:
+        return JsonResponse({
+            'error': 'Model not loaded. Check Django console for details.',
+            'model_loaded': model is not None,
+            'features_loaded': feature_columns is not None
+        }, status=500)
+
+    try:
+        day = parse_query_date(data.get('date'))
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Dates must be YYYY-MM-DD'}, status=400)
+    stale = None
+    if day:
+        features, error = await sync_to_async(predictor.stored_features, thread_sensitive=False)(symbol, day)
+        if error:
+            return JsonResponse({'error': error}, status=404)
+    else:
+        try:
+            features, error = await predictor.afetch_features(symbol, await quota.aclient_key(request))
+        except quota.QuotaExceeded as e: # latest stored features, marked stale
+            day, features = await sync_to_async(predictor.fallback_features, thread_sensitive=False)(symbol)
+            if features is None:
+                response = JsonResponse({'error': str(e), 'retry_after': e.retry_after}, status=429)
+                response['Retry-After'] = str(e.retry_after)
+                return response
+            stale, error = {'as_of': day.isoformat(), 'reason': str(e), 'retry_after': e.retry_after}, None
+        except Exception as e:
+            features, error = None, f"Error fetching data: {e}"
+    if error:
+        return JsonResponse({'error': error}, status=500)
+
+    try:
+        fetched = time.perf_counter()
+        # forest + attribution are cpu work, on a thread so the loop keeps serving the other requests / sockets
+        body, status_code = await sync_to_async(predictor.predict, thread_sensitive=False)(
+            model, feature_columns, symbol, features, parse_flag(data.get('explain')), model_info)
+        if status_code == 200:
+            prediction_log.record_prediction(body, 'stored' if day else 'live', day, started, fetched)
+            if not day:
+                drift.observe(features)
+        if stale:
+            response = JsonResponse(body | {'stale': stale}, status=status_code)
+            response['Retry-After'] = str(stale['retry_after'])
+            return response
+        return JsonResponse(body, status=status_code)
+    except Exception as e:
+        return JsonResponse({
+            'error': f'Prediction error: {str(e)}',
+            'features_received': features,
+            'model_features': feature_columns
+        }, status=500)
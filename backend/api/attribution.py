@@ -0,0 +1,93 @@
+# Per-prediction feature contributions for the random forest (decision path decomposition, a.k.a. Saabas / treeinterpreter)
+# Walking a tree from the root, every split moves the class probabilities from the parent's to the child's; that
+# change is credited to the feature the parent split on. Summed along the path: leaf value = root value + the
+# feature credits, and averaged over the trees: predict_proba = bias + sum of contributions (exactly).
+# A row's path is fixed by the leaf it lands in, so the feature credits are summed per leaf once per model into a
+# [all leaves of all trees, features * classes] table. A batch of rows is then the trees' apply (leaf ids, the same
+# walk predict_proba does) + one sparse (rows x leaves) product with that table, no python loop over rows or nodes
+
+import threading
+import weakref
+
+import numpy as np
+from scipy import sparse
+
+_explainers = weakref.WeakKeyDictionary() # model -> explainer, dropped with the model (family cache eviction)
+_lock = threading.Lock()
+
+
+class ForestExplainer:
+    def __init__(self, model):
+        self.estimators = model.estimators_ # not the model itself, so the cache entry doesn't keep it alive
+        self.n_features = model.n_features_in_
+        self.n_classes = len(model.classes_)
+        self.n_trees = len(model.estimators_)
+        bias = np.zeros(self.n_classes)
+        tables, leaf_rows, offsets = [], [], []
+        n_leaves = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            value = tree.value[:, 0, :]
+            value = value / value.sum(axis=1, keepdims=True) # class proportions per node (what predict_proba uses)
+            left, right = tree.children_left, tree.children_right
+            credit = np.zeros((tree.node_count, self.n_features, self.n_classes))
+            frontier = np.array([0])
+            while len(frontier): # one level of the tree at a time, children inherit the parent's credits
+                frontier = frontier[left[frontier] >= 0]
+                for children in (left[frontier], right[frontier]):
+                    credit[children] = credit[frontier]
+                    credit[children, tree.feature[frontier]] += value[children] - value[frontier]
+                frontier = np.concatenate([left[frontier], right[frontier]])
+            leaves = np.flatnonzero(left < 0)
+            row = np.full(tree.node_count, -1)
+            row[leaves] = np.arange(len(leaves)) + n_leaves
+            tables.append(credit[leaves].reshape(len(leaves), -1))
+            leaf_rows.append(row)
+            bias += value[0]
+            n_leaves += len(leaves)
+
+        self.bias = bias / self.n_trees
+        self.table = np.vstack(tables) / self.n_trees
+        self.leaf_rows = leaf_rows # tree -> node id -> row of table
+
+    # X [rows, features] -> contributions [rows, features, classes]; bias + contributions.sum(axis=1) == predict_proba(X)
+    # The trees' own apply one after the other: the forest's version fans out to joblib threads, which for the usual
+    # single row costs more than the work
+    def contributions(self, X):
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float32)) # what the trees split on (sklearn casts the same way)
+        leaves = np.column_stack([rows[estimator.tree_.apply(X)] for estimator, rows in zip(self.estimators, self.leaf_rows)])
+        indicator = sparse.csr_matrix(
+            (np.ones(leaves.size), leaves.ravel(), np.arange(0, leaves.size + 1, self.n_trees)),
+            shape=(len(X), len(self.table)),
+        )
+        return (indicator @ self.table).reshape(-1, self.n_features, self.n_classes)
+
+
+# one explainer per loaded model (building it walks every tree once, ~tens of ms)
+def explainer_for(model):
+    entry = _explainers.get(model)
+    if entry is not None:
+        return entry
+    with _lock:
+        entry = _explainers.get(model)
+        if entry is None:
+            entry = _explainers[model] = ForestExplainer(model)
+    return entry
+
+
+# The slow way, kept for the benchmark and the tests: walk each tree per row in python
+def naive_contributions(model, X):
+    X = np.asarray(X, dtype=np.float32)
+    n_classes = len(model.classes_)
+    out = np.zeros((len(X), X.shape[1], n_classes))
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        value = tree.value[:, 0, :] / tree.value[:, 0, :].sum(axis=1, keepdims=True)
+        for i, row in enumerate(X):
+            node = 0
+            while tree.children_left[node] >= 0:
+                feature = tree.feature[node]
+                child = tree.children_left[node] if row[feature] <= tree.threshold[node] else tree.children_right[node]
+                out[i, feature] += value[child] - value[node]
+                node = child
+    return out / len(model.estimators_)
@@ -0,0 +1,117 @@
+# Read/write helpers for the DailyBar table (one OHLCV bar per ticker per day)
+# Written in bulk from the price csvs (import_csv / manage.py import_bars) and one row at a time from the live
+# quotes fetched for /api/predict/ (upsert_quote). Range reads come back as numpy arrays straight off the db cursor,
+# no model instances in between
+
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+import pandas as pd
+from django.db import connections
+
+from .models import DailyBar
+
+logger = logging.getLogger(__name__)
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+WRITE_BATCH = 1000
+
+
+def clean_value(value):
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+# rows = iterable of (date, open, high, low, close, volume). Existing (symbol, date) bars are overwritten in the
+# same statement (INSERT ... ON CONFLICT DO UPDATE)
+def write_bars(symbol, rows, source='csv'):
+    objs = [
+        DailyBar(symbol=symbol.upper(), date=day, source=source,
+                 **{col: clean_value(value) for col, value in zip(BAR_COLUMNS, values)})
+        for day, *values in rows
+    ]
+    DailyBar.objects.bulk_create(
+        objs, batch_size=WRITE_BATCH,
+        update_conflicts=True, unique_fields=['symbol', 'date'],
+        update_fields=BAR_COLUMNS + ['source', 'updated_at'],
+    )
+    return len(objs)
+
+
+# raw csvs have dd/mm/yyyy (16:00:00) dates, the processed ones ISO. Never let pandas guess: it reads 05/06 as May 6th
+def parse_dates(values):
+    values = values.astype(str).str.strip()
+    if values.str.contains('/').any():
+        return pd.to_datetime(values.str.split(' ').str[0], format='%d/%m/%Y')
+    return pd.to_datetime(values.str[:10], format='%Y-%m-%d')
+
+
+# one ticker's DataFrame with a date column + open/high/low/close/volume (any case)
+def write_frame(symbol, df, date_col='date', source='csv'):
+    df = df.rename(columns=str.lower)
+    dates = parse_dates(df[date_col.lower()]).dt.date
+    columns = df.reindex(columns=BAR_COLUMNS)
+    return write_bars(symbol, zip(dates, *(columns[col].to_numpy() for col in BAR_COLUMNS)), source)
+
+
+def import_csv(path, symbol):
+    return write_frame(symbol, pd.read_csv(path, encoding='latin1'))
+
+
+# Bar for today's live quote: Finnhub o/h/l/c (+ AlphaVantage volume when both are for the same day), or the
+# AlphaVantage Global Quote alone if Finnhub had nothing. A day already imported from the csvs is left alone
+def quote_bar(quote_data, av_json):
+    av = (av_json or {}).get('Global Quote') or {}
+    av_day = av.get('07. latest trading day')
+    if quote_data and quote_data.get('c'):
+        day = datetime.fromtimestamp(quote_data['t'], tz=dt_timezone.utc).date() if quote_data.get('t') else datetime.utcnow().date()
+        volume = av.get('06. volume') if av_day == day.isoformat() else None
+        return day, (quote_data.get('o'), quote_data.get('h'), quote_data.get('l'), quote_data['c'], volume), 'finnhub'
+    if av_day and av.get('05. price'):
+        day = datetime.strptime(av_day, '%Y-%m-%d').date()
+        return day, (av.get('02. open'), av.get('03. high'), av.get('04. low'), av.get('05. price'), av.get('06. volume')), 'alphavantage'
+    return None
+
+
+def upsert_quote(symbol, quote_data, av_json=None):
+    try:
+        bar = quote_bar(quote_data, av_json)
+        if bar is None:
+            return False
+        day, values, source = bar
+        if DailyBar.objects.filter(symbol=symbol.upper(), date=day, source='csv').exists():
+            return False
+        write_bars(symbol, [(day, *values)], source)
+        return True
+    except Exception as e: # the request already has its quote, storing it is best effort
+        logger.warning("Could not store live bar for %s: %s", symbol, e)
+        return False
+
+
+# -> (dates as datetime64[D], float64 matrix [days, len(BAR_COLUMNS)]) in date order, missing values as nan.
+# Runs the ORM's SQL on the raw cursor so rows go straight from the driver into numpy (no model instances,
+# no per-row field converters)
+def get_range(symbol, from_date=None, to_date=None):
+    qs = DailyBar.objects.filter(symbol=symbol.upper())
+    if from_date:
+        qs = qs.filter(date__gte=from_date)
+    if to_date:
+        qs = qs.filter(date__lte=to_date)
+    qs = qs.order_by('date').values_list('date', *BAR_COLUMNS)
+    sql, params = qs.query.sql_with_params()
+    with connections[qs.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if not rows:
+        return np.empty(0, dtype='datetime64[D]'), np.empty((0, len(BAR_COLUMNS)))
+    dates = np.array([row[0] for row in rows], dtype='datetime64[D]') # sqlite gives 'YYYY-MM-DD', postgres dates
+    matrix = np.array([row[1:] for row in rows], dtype=float) # None -> nan
+    return dates, matrix
+
+
+def symbols():
+    return list(DailyBar.objects.order_by().values_list('symbol', flat=True).distinct())
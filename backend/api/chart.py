@@ -0,0 +1,90 @@
+# Chart series (OHLCV + MACD / RSI / Bollinger / OBV) for /api/chart/ out of the feature store, downsampled with
+# LTTB (largest triangle three buckets) so a 10 year range comes back as ~points rows that still look like the full
+# series (peaks and drops kept, unlike taking every nth day)
+# Responses carry an ETag / Last-Modified from the stored rows, the view answers 304 while nothing changed
+
+import hashlib
+import math
+
+import numpy as np
+from django.db.models import Count, Max
+
+from . import feature_store
+from .models import FeatureRow
+
+SERIES = [
+    'open', 'high', 'low', 'close', 'volume', 'macd', 'macd_signal', 'macd_diff', 'rsi',
+    'bb_bbm', 'bb_bbh', 'bb_bbl', 'bb_bbwidth', 'obv',
+]
+
+
+# indices of the n points LTTB keeps out of y (x = positions), always including the first and last one
+def lttb_indices(x, y, n):
+    size = len(y)
+    if n >= size or n < 3:
+        return np.arange(size) if n >= size else np.linspace(0, size - 1, max(n, 1)).round().astype(int)
+    # n - 2 buckets between the fixed first and last point
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    picked = np.empty(n, dtype=int)
+    picked[0], picked[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        # the next bucket's average is the third corner of the triangle
+        next_end = edges[i + 2] if i + 2 < len(edges) else size
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+
+# rows -> n rows: line series are taken at the LTTB points (picked on close), high / low / volume cover every day
+# up to the next kept point (max / min / sum) so wicks and volume spikes don't disappear between points
+def downsample(dates, matrix, n):
+    if len(dates) <= n:
+        return dates, matrix
+    close = matrix[:, SERIES.index('close')]
+    x = np.array([d.toordinal() for d in dates], dtype=float)
+    keep = lttb_indices(x, np.nan_to_num(close, nan=np.nanmean(close) if np.isfinite(close).any() else 0.0), n)
+
+    out = matrix[keep].copy()
+    bounds = np.r_[keep, len(dates)]
+    for col, reduce in (('high', np.fmax), ('low', np.fmin), ('volume', np.add)):
+        j = SERIES.index(col)
+        values = matrix[:, j] if col != 'volume' else np.nan_to_num(matrix[:, j])
+        out[:, j] = reduce.reduceat(values, bounds[:-1])
+    return [dates[i] for i in keep], out
+
+
+# (row count, newest updated_at) for the range, one indexed aggregate. Drives ETag / Last-Modified
+def range_state(symbol, from_date, to_date):
+    state = FeatureRow.objects.filter(symbol=symbol, date__gte=from_date, date__lte=to_date).aggregate(
+        rows=Count('id'), last_modified=Max('updated_at'))
+    return state['rows'], state['last_modified']
+
+
+def make_etag(symbol, from_date, to_date, points, rows, last_modified):
+    key = f"{symbol}:{from_date}:{to_date}:{points}:{rows}:{last_modified.isoformat() if last_modified else ''}"
+    return '"' + hashlib.md5(key.encode()).hexdigest() + '"'
+
+
+def clean(values):
+    return [None if not math.isfinite(v) else round(v, 4) for v in values.tolist()]
+
+
+def chart_data(symbol, from_date, to_date, points):
+    dates, matrix = feature_store.get_range(symbol, from_date, to_date)
+    columns = [feature_store.FEATURE_COLUMNS.index(col) for col in SERIES]
+    matrix = matrix[:, columns]
+    total = len(dates)
+    dates, matrix = downsample(dates, matrix, points)
+    return {
+        'symbol': symbol,
+        'from': from_date.isoformat(),
+        'to': to_date.isoformat(),
+        'total_points': total,
+        'points': len(dates),
+        'dates': [d.isoformat() for d in dates],
+        'series': {col: clean(matrix[:, j]) for j, col in enumerate(SERIES)},
+    }
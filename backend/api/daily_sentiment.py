@@ -0,0 +1,59 @@
+# Maintains the DailySentiment table (running sum + count per ticker per UTC day)
+# Every time articles get scored they are added here (and to the decayed state, sentiment_state.py), so reads never
+# have to re-average the articles
+
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import sentiment_state
+from .models import DailySentiment
+
+
+# scored = iterable of (published_at datetime, score). Unscored (None) articles are ignored
+def record_scores(symbol, scored):
+    scored = [(published_at, score) for published_at, score in scored if score is not None]
+    totals = defaultdict(lambda: [0.0, 0])
+    for published_at, score in scored:
+        day = published_at.astimezone(dt_timezone.utc).date() if timezone.is_aware(published_at) else published_at.date()
+        totals[day][0] += score
+        totals[day][1] += 1
+
+    for day, (score_sum, count) in totals.items():
+        add_to_day(symbol, day, score_sum, count)
+    if scored:
+        sentiment_state.add_scores(symbol, scored)
+
+
+# O(1): single UPDATE with F() so concurrent workers don't overwrite each other, insert if the row is new
+def add_to_day(symbol, day, score_sum, count):
+    updated = DailySentiment.objects.filter(symbol=symbol, date=day).update(
+        sentiment_sum=F('sentiment_sum') + score_sum,
+        article_count=F('article_count') + count,
+        updated_at=timezone.now(),
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DailySentiment.objects.create(symbol=symbol, date=day, sentiment_sum=score_sum, article_count=count)
+    except IntegrityError: # another worker created it first
+        add_to_day(symbol, day, score_sum, count)
+
+
+def daily_range(symbol, from_date=None, to_date=None):
+    qs = DailySentiment.objects.filter(symbol=symbol.upper())
+    if from_date:
+        qs = qs.filter(date__gte=from_date)
+    if to_date:
+        qs = qs.filter(date__lte=to_date)
+    return qs.order_by('date')
+
+
+# mean sentiment for one day, 0 if there was no news that day (same as training)
+def sentiment_for_day(symbol, day):
+    row = DailySentiment.objects.filter(symbol=symbol.upper(), date=day).first()
+    return row.mean if row else 0.0
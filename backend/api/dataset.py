@@ -0,0 +1,249 @@
+# Labelled dataset (ticker, date, features, target) as binary record batches, for notebooks / research jobs that
+# would otherwise re-parse ml_training_data.csv. Used by /api/dataset/ and `python manage.py export_dataset`
+# Formats:
+#   npy   - one structured numpy array (fields ticker S16, date datetime64[D], the features float32, target int8)
+#           np.load(path, mmap_mode='r')['close'] reads straight from the file, no parsing. The dtype is the schema
+#   arrow - Arrow IPC, one record batch per ticker (or csv chunk), needs pyarrow. Files use the IPC file format
+#           (pa.memory_map + pa.ipc.open_file, zero copy), the endpoint the IPC stream format
+# Rows come from the feature store labelled per ticker with create_target_labels (the same rule train_model.py
+# trains on, the last future_days rows of a ticker have no label and are left out) or from the labelled csv.
+# Column / ticker / date filters are applied while reading; only one batch is held in memory at a time.
+# Missing feature values stay nan, the gap filling is training_data.fill_gaps' job
+
+import hmac
+import io
+
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+
+from scripts.create_target_labels import create_target_labels
+
+from . import feature_store
+from .models import FeatureRow
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+FORMATS = ['npy', 'arrow']
+KEY_COLUMNS = ['ticker', 'date']
+VALUE_COLUMNS = feature_store.FEATURE_COLUMNS + ['target']
+TICKER_BYTES = FeatureRow._meta.get_field('symbol').max_length
+CSV_CHUNK_ROWS = 100_000
+NPY_ALIGN = 64
+
+
+class DatasetError(ValueError):
+    pass
+
+
+def has_dataset_token(request):
+    token = settings.DATASET_TOKEN
+    sent = request.headers.get('X-Dataset-Token', '')
+    return bool(token) and hmac.compare_digest(sent.encode(), token.encode())
+
+
+# None = every value column. Keys are always included and go first
+def select_columns(columns=None):
+    if not columns:
+        return VALUE_COLUMNS[:]
+    unknown = [c for c in columns if c not in VALUE_COLUMNS + KEY_COLUMNS]
+    if unknown:
+        raise DatasetError(f"Unknown columns: {', '.join(unknown)}")
+    return [c for c in VALUE_COLUMNS if c in columns]
+
+
+def record_dtype(columns):
+    fields = [('ticker', f'S{TICKER_BYTES}'), ('date', 'datetime64[D]')]
+    fields += [(c, np.int8 if c == 'target' else np.float32) for c in columns]
+    return np.dtype(fields)
+
+
+# positions of the labelled rows in one ticker's date ordered series, and their targets
+def ticker_labels(symbol, dates, close):
+    frame = pd.DataFrame({'ticker': symbol, 'date': pd.to_datetime(dates), 'close': close})
+    labelled = create_target_labels(frame)
+    return labelled.index.to_numpy(), labelled['target'].to_numpy(np.int8)
+
+
+def store_symbols(symbols=None):
+    qs = FeatureRow.objects.all()
+    if symbols:
+        qs = qs.filter(symbol__in=[s.upper() for s in symbols])
+    return list(qs.order_by('symbol').values_list('symbol', flat=True).distinct())
+
+
+def in_range(dates, from_date, to_date):
+    keep = np.ones(len(dates), dtype=bool)
+    if from_date:
+        keep &= dates >= np.datetime64(from_date, 'D')
+    if to_date:
+        keep &= dates <= np.datetime64(to_date, 'D')
+    return keep
+
+
+# newest stored date. The npy endpoint reads both passes up to it, so a live upsert of a newer day in between can't
+# move the label window (and the row count) under the header
+def store_until(symbols=None):
+    qs = FeatureRow.objects.all()
+    if symbols:
+        qs = qs.filter(symbol__in=[s.upper() for s in symbols])
+    return qs.aggregate(until=Max('date'))['until']
+
+
+# batches = {'ticker': str array, 'date': datetime64[D] array, column: array, ...}, one per ticker
+# (labels need the ticker's whole series, the date filter is applied after labelling)
+# until = ignore rows stored after that date (see store_until)
+def store_batches(columns, symbols=None, from_date=None, to_date=None, until=None):
+    for symbol in store_symbols(symbols):
+        dates, matrix = feature_store.get_range(symbol, to_date=until)
+        dates = np.array(dates, dtype='datetime64[D]')
+        rows, target = ticker_labels(symbol, dates, matrix[:, feature_store.FEATURE_COLUMNS.index('close')])
+        keep = in_range(dates[rows], from_date, to_date)
+        rows, target = rows[keep], target[keep]
+        if not len(rows):
+            continue
+        batch = {'ticker': np.full(len(rows), symbol), 'date': dates[rows]}
+        for col in columns:
+            batch[col] = target if col == 'target' else matrix[rows, feature_store.FEATURE_COLUMNS.index(col)].astype(np.float32)
+        yield batch
+
+
+# rows store_batches will produce, from the dates + closes only (the npy header needs the count up front)
+def store_count(symbols=None, from_date=None, to_date=None, until=None):
+    total = 0
+    for symbol in store_symbols(symbols):
+        qs = FeatureRow.objects.filter(symbol=symbol)
+        if until:
+            qs = qs.filter(date__lte=until)
+        rows = list(qs.order_by('date').values_list('date', 'close'))
+        dates = np.array([r[0] for r in rows], dtype='datetime64[D]')
+        positions, _ = ticker_labels(symbol, dates, np.array([r[1] for r in rows], dtype=float))
+        total += int(in_range(dates[positions], from_date, to_date).sum())
+    return total
+
+
+# columns of the csv to export: the asked for ones it has. A csv built before a feature column existed (e.g.
+# news_sentiment_decayed) just goes without it, unless that column was asked for by name
+def csv_columns(path, columns, requested=False):
+    try:
+        header = set(pd.read_csv(path, nrows=0).columns)
+    except (OSError, ValueError) as e:
+        raise DatasetError(f"Can't read {path}: {e}")
+    missing = [c for c in KEY_COLUMNS + columns if c not in header]
+    if missing and (requested or set(missing) & set(KEY_COLUMNS + ['target'])):
+        raise DatasetError(f"{path} has no {', '.join(missing)} column(s), rebuild it with the current pipeline")
+    return [c for c in columns if c in header]
+
+
+# the already labelled csv (create_target_labels output), read CSV_CHUNK_ROWS at a time with only the needed columns
+def csv_batches(path, columns, symbols=None, from_date=None, to_date=None):
+    wanted = {s.upper() for s in symbols} if symbols else None
+    dtypes = {col: (np.int8 if col == 'target' else np.float32) for col in columns}
+    dtypes['ticker'] = str
+    for chunk in pd.read_csv(path, usecols=KEY_COLUMNS + columns, dtype=dtypes, chunksize=CSV_CHUNK_ROWS):
+        dates = pd.to_datetime(chunk['date']).to_numpy().astype('datetime64[D]')
+        keep = in_range(dates, from_date, to_date)
+        if wanted is not None:
+            keep &= chunk['ticker'].str.upper().isin(wanted).to_numpy()
+        if not keep.any():
+            continue
+        batch = {'ticker': chunk['ticker'].to_numpy()[keep], 'date': dates[keep]}
+        for col in columns:
+            batch[col] = chunk[col].to_numpy()[keep]
+        yield batch
+
+
+def to_records(batch, dtype):
+    records = np.empty(len(batch['date']), dtype=dtype)
+    for name in dtype.names:
+        records[name] = batch[name]
+    return records
+
+
+# .npy header for `rows` records, always the same length for a dtype so a file's header can be rewritten in place
+def npy_header(dtype, rows):
+    text = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(dtype), rows)
+    widest = len(text) - len(str(rows)) + 20 # room for any row count
+    size = -(-(10 + widest + 1) // NPY_ALIGN) * NPY_ALIGN # magic + version + length + text + newline
+    text = text.ljust(size - 10 - 1) + '\n'
+    return b'\x93NUMPY\x01\x00' + (size - 10).to_bytes(2, 'little') + text.encode('latin1')
+
+
+# the header is already out when the rows are read: a body that doesn't match it is an error, not a shorter file
+def npy_chunks(batches, columns, rows):
+    dtype = record_dtype(columns)
+    yield npy_header(dtype, rows)
+    sent = 0
+    for batch in batches:
+        sent += len(batch['date'])
+        if sent > rows:
+            raise DatasetError(f"Dataset changed while streaming: more than the {rows} rows in the header")
+        yield to_records(batch, dtype).tobytes()
+    if sent != rows:
+        raise DatasetError(f"Dataset changed while streaming: {sent} rows, the header says {rows}")
+
+
+def arrow_schema(columns):
+    fields = [pa.field('ticker', pa.string()), pa.field('date', pa.date32())]
+    fields += [pa.field(c, pa.int8() if c == 'target' else pa.float32()) for c in columns]
+    return pa.schema(fields)
+
+
+def arrow_batch(batch, schema):
+    return pa.record_batch([pa.array(batch[f.name], type=f.type) for f in schema], schema=schema)
+
+
+# IPC stream format, one record batch per chunk yielded
+def arrow_chunks(batches, columns):
+    if pa is None:
+        raise DatasetError("Arrow output needs pyarrow: pip install pyarrow")
+    schema = arrow_schema(columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(arrow_batch(batch, schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue() # end of stream marker
+
+
+# write a file (export command). Returns the number of rows. The npy header is rewritten with the count at the end,
+# the arrow file footer makes the batches randomly accessible
+def write_file(path, fmt, batches, columns):
+    rows = 0
+    if fmt == 'arrow':
+        if pa is None:
+            raise DatasetError("Arrow output needs pyarrow: pip install pyarrow")
+        schema = arrow_schema(columns)
+        with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(arrow_batch(batch, schema))
+                rows += len(batch['date'])
+        return rows
+    dtype = record_dtype(columns)
+    with open(path, 'wb') as f:
+        f.write(npy_header(dtype, 0))
+        for batch in batches:
+            f.write(to_records(batch, dtype).tobytes())
+            rows += len(batch['date'])
+        f.seek(0)
+        f.write(npy_header(dtype, rows))
+    return rows
+
+
+# sync iterator -> async one, each step on the Django (thread sensitive) thread, so an ASGI response streams
+# instead of Django collecting the whole sync iterator first
+async def aiterate(chunks):
+    step = sync_to_async(next)
+    done = object()
+    while True:
+        chunk = await step(chunks, done)
+        if chunk is done:
+            return
+        yield chunk
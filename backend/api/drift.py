@@ -0,0 +1,155 @@
+# Serving feature drift vs the training data, without keeping any prediction history
+# Reference = Models/feature_reference.json, written with the model by train_model.py (scripts/feature_reference.py):
+# quantile bin edges + the share of training rows per bin, per feature. Every live prediction adds its features to
+# exponentially decayed bin counts (half life DRIFT_HALF_LIFE predictions), O(1) and fixed memory per feature:
+# instead of decaying every count on each update, each new observation is weighted 1/decay more than the last and
+# the counts are rescaled once the weight gets big. /api/drift/ compares the recent bin shares with the reference
+# (PSI, population stability index) and reports the share of exact zeros, which is what a failed upstream call
+# turns a feature into. Counts are per worker process
+
+import bisect
+import json
+import math
+import os
+import threading
+
+from django.conf import settings
+
+from . import predictor
+
+REFERENCE_FILE = 'feature_reference.json'
+PSI_EPSILON = 1e-4 # empty bins
+RESCALE_AT = 1e100
+
+
+def psi(expected, actual):
+    total = 0.0
+    for e, a in zip(expected, actual):
+        e, a = max(e, PSI_EPSILON), max(a, PSI_EPSILON)
+        total += (a - e) * math.log(a / e)
+    return total
+
+
+def drift_status(score):
+    if score >= settings.DRIFT_PSI_ALERT:
+        return 'drift'
+    if score >= settings.DRIFT_PSI_WARN:
+        return 'warn'
+    return 'ok'
+
+
+class DriftMonitor:
+    def __init__(self, reference, half_life):
+        self.reference = reference
+        self.names = list(reference['features'])
+        self.edges = [reference['features'][name]['edges'] for name in self.names]
+        self.decay = 0.5 ** (1 / half_life)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counts = [[0.0] * (len(edges) + 1) for edges in self.edges]
+        self.zeros = [0.0] * len(self.names)
+        self.missing = [0.0] * len(self.names)
+        self.total = 0.0 # decayed weight of all observations
+        self.weight = 1.0 # weight of the next one
+        self.observations = 0
+
+    def observe(self, features):
+        with self.lock:
+            w = self.weight
+            for i, name in enumerate(self.names):
+                value = features.get(name)
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    value = math.nan
+                if math.isnan(value) or math.isinf(value):
+                    self.missing[i] += w
+                    continue
+                self.counts[i][bisect.bisect_right(self.edges[i], value)] += w
+                if value == 0:
+                    self.zeros[i] += w
+            self.total += w
+            self.observations += 1
+            self.weight = w / self.decay
+            if self.weight > RESCALE_AT: # same shares, smaller numbers
+                scale = 1 / self.weight
+                self.counts = [[c * scale for c in row] for row in self.counts]
+                self.zeros = [z * scale for z in self.zeros]
+                self.missing = [m * scale for m in self.missing]
+                self.total *= scale
+                self.weight = 1.0
+
+    def report(self):
+        with self.lock:
+            counts = [row[:] for row in self.counts]
+            zeros, missing, total, weight = self.zeros[:], self.missing[:], self.total, self.weight
+            observations = self.observations
+        # decayed sum of weights relative to the newest one = how many recent predictions the shares stand for
+        effective = total / (weight * self.decay) if total else 0.0
+        features = {}
+        for i, name in enumerate(self.names):
+            ref = self.reference['features'][name]
+            seen = sum(counts[i])
+            entry = {
+                'reference_zero_share': round(ref['zero_share'], 4),
+                'zero_share': round(zeros[i] / total, 4) if total else None,
+                'missing_share': round(missing[i] / total, 4) if total else None,
+            }
+            if seen and effective >= settings.DRIFT_MIN_OBSERVATIONS:
+                shares = [c / seen for c in counts[i]]
+                score = psi(ref['fractions'], shares)
+                entry.update(psi=round(score, 4), status=drift_status(score),
+                             shares=[round(s, 4) for s in shares], reference_shares=ref['fractions'])
+            else:
+                entry.update(psi=None, status='not enough data')
+            features[name] = entry
+        scored = [f['psi'] for f in features.values() if f['psi'] is not None]
+        worst = max(scored) if scored else None
+        return {
+            'model_version': predictor.model_version(),
+            'reference_model_version': self.reference.get('model_version'),
+            'reference_rows': self.reference.get('rows'),
+            'observations': observations,
+            'effective_observations': round(effective, 1),
+            'half_life': settings.DRIFT_HALF_LIFE,
+            'max_psi': worst,
+            'status': drift_status(worst) if worst is not None else 'not enough data',
+            'pid': os.getpid(),
+            'features': features,
+        }
+
+
+_monitor = None
+_monitor_version = None # model version the monitor (or the missing reference) was checked for
+_monitor_lock = threading.Lock()
+
+
+def load_reference():
+    try:
+        with open(os.path.join(predictor.MODEL_DIR, REFERENCE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Monitor for the loaded model (a new model = new reference, counts start over); None without a reference file
+def get_monitor():
+    global _monitor, _monitor_version
+    version = predictor.model_version()
+    if _monitor_version == version:
+        return _monitor
+    with _monitor_lock:
+        if _monitor_version != version:
+            reference = load_reference()
+            _monitor = DriftMonitor(reference, settings.DRIFT_HALF_LIFE) if reference else None
+            _monitor_version = version
+    return _monitor
+
+
+# live serving features only (stored feature-store days are the training distribution)
+def observe(features):
+    monitor = get_monitor()
+    if monitor is not None:
+        monitor.observe(features)
@@ -0,0 +1,102 @@
+# Read/write helpers for the FeatureRow table (point-in-time model features per ticker per day)
+# Offline pipeline writes whole tickers with write_frame, live predictions upsert today's row with upsert_live,
+# train_model.py reads everything with training_frame, the views read single days / ranges
+
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from .models import FeatureRow
+
+logger = logging.getLogger(__name__)
+
+# the model's features, in training order. build_features / consolidate / train_model all use these names
+FEATURE_COLUMNS = [
+    'open', 'high', 'low', 'close', 'volume', 'macd', 'macd_signal', 'macd_diff', 'rsi',
+    'bb_bbm', 'bb_bbh', 'bb_bbl', 'bb_bbwidth', 'obv', 'news_sentiment', 'news_sentiment_decayed',
+]
+
+WRITE_BATCH = 500
+
+
+def clean_value(value):
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else value
+
+
+# rows = iterable of (date, {feature: value}). Existing (symbol, date) rows are overwritten in the same statement
+def write_rows(symbol, rows, source='pipeline'):
+    objs = [
+        FeatureRow(symbol=symbol.upper(), date=day, source=source,
+                   **{col: clean_value(features.get(col)) for col in FEATURE_COLUMNS})
+        for day, features in rows
+    ]
+    FeatureRow.objects.bulk_create(
+        objs, batch_size=WRITE_BATCH,
+        update_conflicts=True, unique_fields=['symbol', 'date'],
+        update_fields=FEATURE_COLUMNS + ['source', 'updated_at'],
+    )
+    return len(objs)
+
+
+# one ticker's DataFrame (a row per day, FEATURE_COLUMNS + a date column) from the pipeline
+def write_frame(symbol, df, date_col='date', source='pipeline'):
+    dates = pd.to_datetime(df[date_col]).dt.date
+    records = df.reindex(columns=FEATURE_COLUMNS).to_dict('records')
+    return write_rows(symbol, zip(dates, records), source)
+
+
+def upsert_live(symbol, day, features):
+    try:
+        write_rows(symbol, [(day, features)], source='live')
+    except Exception as e: # the prediction itself already succeeded, don't fail the request over this
+        logger.warning("Could not store live features for %s: %s", symbol, e)
+
+
+def row_to_dict(row):
+    return {col: row[i] for i, col in enumerate(FEATURE_COLUMNS)}
+
+
+# features exactly on that day, None if the store has no row for it
+def get_features(symbol, day):
+    row = FeatureRow.objects.filter(symbol=symbol.upper(), date=day).values_list(*FEATURE_COLUMNS).first()
+    return row_to_dict(row) if row else None
+
+
+# point in time: the latest row on or before day -> (date, features), (None, None) if there is none
+def as_of(symbol, day):
+    row = (FeatureRow.objects.filter(symbol=symbol.upper(), date__lte=day)
+           .order_by('-date').values_list('date', *FEATURE_COLUMNS).first())
+    if not row:
+        return None, None
+    return row[0], row_to_dict(row[1:])
+
+
+# -> (list of dates, float64 matrix [days, len(FEATURE_COLUMNS)]) in date order, missing values as nan
+def get_range(symbol, from_date=None, to_date=None):
+    qs = FeatureRow.objects.filter(symbol=symbol.upper())
+    if from_date:
+        qs = qs.filter(date__gte=from_date)
+    if to_date:
+        qs = qs.filter(date__lte=to_date)
+    rows = list(qs.order_by('date').values_list('date', *FEATURE_COLUMNS))
+    if not rows:
+        return [], np.empty((0, len(FEATURE_COLUMNS)))
+    dates = [row[0] for row in rows]
+    matrix = np.array([row[1:] for row in rows], dtype=float) # None -> nan
+    return dates, matrix
+
+
+# everything (or some tickers) as one DataFrame: ticker, date + FEATURE_COLUMNS as float32, ordered by ticker then date
+def training_frame(symbols=None):
+    qs = FeatureRow.objects.all()
+    if symbols:
+        qs = qs.filter(symbol__in=[s.upper() for s in symbols])
+    columns = ['ticker', 'date'] + FEATURE_COLUMNS
+    rows = qs.order_by('symbol', 'date').values_list('symbol', 'date', *FEATURE_COLUMNS).iterator(chunk_size=5000)
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    return df.astype({col: np.float32 for col in FEATURE_COLUMNS})
@@ -0,0 +1,299 @@
+# Live updates over a websocket (ws://<host>/ws/live/, served by config/asgi.py next to the Django app)
+# Clients send {"action": "subscribe" | "unsubscribe", "symbols": ["AAPL", ...]} and get pushed
+#   {"type": "news", "symbol", "hours", "articles", "new"}   when the symbol's scored news changes
+#   {"type": "prediction", "symbol", "data"}                  when the /api/predict/ body changes
+# One refresh loop per watched symbol (per worker) runs every LIVE_REFRESH_SECONDS and each
+# update is serialized once and queued to every subscriber, so the upstream + model cost follows the number of
+# distinct symbols, not the number of open sockets. Loops stop when a symbol's last subscriber leaves.
+# News is re-read every refresh (news_store rate limits Finnhub itself). The upstream fetch for a prediction only
+# happens every fetch_interval() - what the AlphaVantage quota pays for - or after the quota's retry_after; until the
+# first one works the socket gets the prediction from the latest stored features, marked stale like /api/predict/
+# Each socket has a bounded queue: a client that can't keep up loses its oldest updates instead of holding up the rest
+# Every symbol is a refresh loop calling upstream, so sockets are only accepted from our own origins (or non browser
+# clients, which send none), at most LIVE_MAX_CONNECTIONS_PER_CLIENT per ip, symbols have to look like tickers
+# and a worker watches at most LIVE_MAX_TOPICS of them
+
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter
+from datetime import date
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import drift, news_store, prediction_log, predictor, quota
+
+logger = logging.getLogger(__name__)
+
+SYMBOL_PATTERN = re.compile(r'[A-Z0-9][A-Z0-9.\-]{0,11}') # AAPL, BRK.B, RDS-A (well under NewsCursor.feed's 32)
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=settings.LIVE_QUEUE_SIZE)
+        self.symbols = set()
+        self.dropped = 0
+
+    def push(self, text):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(text)
+
+
+# One refresh of a symbol -> list of messages to publish. `state` is the symbol's memory between refreshes
+# (article ids / prediction already sent), so unchanged data isn't pushed again
+async def refresh_symbol(symbol, state):
+    messages = []
+    hours, articles = await sync_to_async(news_store.company_news_page, thread_sensitive=False)(symbol)
+    articles = [news_store.article_dict(a) for a in articles]
+    seen = state.get('news')
+    current = {(a['id'], a['sentiment_score']) for a in articles}
+    if current != seen:
+        old_ids = {article_id for article_id, _ in seen or ()}
+        state['news'] = current
+        messages.append({'type': 'news', 'symbol': symbol, 'hours': hours, 'articles': articles,
+                         'new': [a['id'] for a in articles if a['id'] not in old_ids] if seen is not None else []})
+
+    model, feature_columns, model_info = await sync_to_async(predictor.model_for, thread_sensitive=False)(symbol)
+    if model is None:
+        return messages
+    started = time.perf_counter()
+    features, stale = None, None
+    if time.monotonic() >= state.get('next_fetch', 0):
+        features = await fetch_live(symbol, state)
+    if features is None:
+        if state.get('prediction') and not state.get('stale'):
+            return messages # the last push came from upstream, newer than anything stored
+        # nothing pushed yet (or only stale ones): the latest stored features until the next upstream fetch
+        day, features = await sync_to_async(predictor.fallback_features, thread_sensitive=False)(symbol)
+        if features is None:
+            return messages
+        wait = max(0, round(state['next_fetch'] - time.monotonic()))
+        stale = {'as_of': day.isoformat(), 'reason': f'Next upstream refresh in {wait}s', 'retry_after': wait}
+    fetched = time.perf_counter()
+    body, status_code = await sync_to_async(predictor.predict, thread_sensitive=False)( # cpu work, off the event loop
+        model, feature_columns, symbol, features, model_info=model_info)
+    if status_code != 200:
+        return messages
+    # what the client would see change: not the timestamp, not the seconds left on a stale one
+    key = json.dumps([{k: v for k, v in body.items() if k != 'timestamp'}, stale and stale['as_of']], sort_keys=True, default=str)
+    if stale is None:
+        prediction_log.record_prediction(body, 'push', None, started, fetched)
+        drift.observe(features)
+    if key != state.get('prediction'):
+        if stale is not None:
+            prediction_log.record_prediction(body, 'stored', date.fromisoformat(stale['as_of']), started, fetched)
+        state['prediction'], state['stale'] = key, stale is not None
+        messages.append({'type': 'prediction', 'symbol': symbol, 'data': body | {'stale': stale} if stale else body})
+    return messages
+
+
+# seconds between two upstream fetches for one symbol: LIVE_REFRESH_SECONDS, or longer when the background share of
+# the alphavantage quota can't pay for a prediction that often (shipped limits: 5 calls out of 25 a day -> ~6.9h)
+def fetch_interval():
+    if not settings.UPSTREAM_QUOTA:
+        return settings.LIVE_REFRESH_SECONDS
+    cost = predictor.quota_costs()[quota.provider_key('alphavantage')]
+    interval = max(settings.LIVE_REFRESH_SECONDS, cost * 60 / settings.UPSTREAM_QUOTA_PER_MINUTE['alphavantage'])
+    daily = settings.UPSTREAM_QUOTA_PER_DAY.get('alphavantage')
+    if daily:
+        interval = max(interval, cost * 86400 / (daily * (1 - settings.QUOTA_BACKGROUND_RESERVE)))
+    return interval
+
+
+# features from upstream, None when out of quota / failed. Sets when the symbol may fetch again
+async def fetch_live(symbol, state):
+    try: # background priority: leaves the end of the quota to interactive predictions
+        features, error = await predictor.afetch_features(symbol, priority=quota.BACKGROUND)
+    except quota.QuotaExceeded as e:
+        logger.info("Live prediction for %s from the store: %s", symbol, e)
+        state['next_fetch'] = time.monotonic() + e.retry_after
+        return None
+    state['next_fetch'] = time.monotonic() + fetch_interval()
+    if error:
+        logger.warning("Live prediction for %s failed: %s", symbol, error)
+        return None
+    return features
+
+
+class Hub:
+    def __init__(self, refresh=refresh_symbol, interval=None):
+        self.refresh = refresh
+        self.interval = interval
+        self.topics = {} # symbol -> set of Subscriber
+        self.tasks = {} # symbol -> refresh loop
+        self.latest = {} # symbol -> {message type: text}, replayed to new subscribers
+        self.refreshes = 0
+        self.connections = Counter() # client key -> open sockets
+
+    def subscribe(self, subscriber, symbol):
+        self.topics.setdefault(symbol, set()).add(subscriber)
+        subscriber.symbols.add(symbol)
+        for text in self.latest.get(symbol, {}).values():
+            subscriber.push(text)
+        if symbol not in self.tasks:
+            self.tasks[symbol] = asyncio.create_task(self.run(symbol))
+
+    def unsubscribe(self, subscriber, symbol):
+        subscriber.symbols.discard(symbol)
+        subscribers = self.topics.get(symbol)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self.topics[symbol]
+            self.latest.pop(symbol, None)
+            task = self.tasks.pop(symbol, None)
+            if task:
+                task.cancel()
+
+    def leave(self, subscriber):
+        for symbol in list(subscriber.symbols):
+            self.unsubscribe(subscriber, symbol)
+
+    def publish(self, symbol, message):
+        text = json.dumps(message, default=str) # once, whatever the number of subscribers
+        self.latest.setdefault(symbol, {})[message['type']] = text
+        for subscriber in self.topics.get(symbol, ()):
+            subscriber.push(text)
+
+    async def run(self, symbol):
+        state = {}
+        while True:
+            try:
+                self.refreshes += 1
+                for message in await self.refresh(symbol, state):
+                    self.publish(symbol, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e: # keep the loop alive, the next refresh may work
+                logger.warning("Live refresh for %s failed: %s", symbol, e)
+            await asyncio.sleep(self.interval or settings.LIVE_REFRESH_SECONDS)
+
+    def stats(self):
+        subscribers = {s for subs in self.topics.values() for s in subs}
+        return {
+            'symbols': len(self.topics),
+            'subscribers': len(subscribers),
+            'clients': len(self.connections),
+            'refreshes': self.refreshes,
+            'dropped': sum(s.dropped for s in subscribers),
+        }
+
+
+hub = Hub()
+
+
+def parse_symbols(message):
+    symbols = message.get('symbols')
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    if not isinstance(symbols, list):
+        return None
+    return [s.upper().strip() for s in symbols if isinstance(s, str) and s.strip()]
+
+
+def header(scope, name):
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin1')
+    return None
+
+
+# same client key as the per-client quota, from the handshake
+def scope_client_key(scope):
+    client = scope.get('client') or ('',)
+    return quota.client_key(None, {'HTTP_X_FORWARDED_FOR': header(scope, b'x-forwarded-for') or '', 'REMOTE_ADDR': client[0]})
+
+
+def origin_allowed(origin):
+    if origin is None: # not a browser
+        return True
+    origin = origin.rstrip('/')
+    if origin in settings.LIVE_ALLOWED_ORIGINS:
+        return True
+    host = urlsplit(origin).hostname or ''
+    return any(allowed == host or (allowed.startswith('.') and host.endswith(allowed)) for allowed in settings.ALLOWED_HOSTS)
+
+
+# error text for a subscribe the socket / worker can't take, None if it's fine
+def subscribe_error(hub, subscriber, symbols):
+    invalid = [s for s in symbols if not SYMBOL_PATTERN.fullmatch(s)]
+    if invalid:
+        return f"Not a ticker symbol: {', '.join(invalid[:5])}"
+    if len(subscriber.symbols | set(symbols)) > settings.LIVE_MAX_SYMBOLS:
+        return f'At most {settings.LIVE_MAX_SYMBOLS} symbols per connection'
+    if len(hub.topics.keys() | set(symbols)) > settings.LIVE_MAX_TOPICS:
+        return 'Too many symbols watched on this server, try again later'
+    return None
+
+
+# ASGI websocket handler (config/asgi.py routes scope['type'] == 'websocket' here)
+async def websocket_app(scope, receive, send, hub=hub):
+    event = await receive()
+    if event['type'] != 'websocket.connect':
+        return
+    if scope['path'].rstrip('/') != '/ws/live':
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    if not origin_allowed(header(scope, b'origin')):
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+    client = scope_client_key(scope)
+    if hub.connections[client] >= settings.LIVE_MAX_CONNECTIONS_PER_CLIENT:
+        await send({'type': 'websocket.close', 'code': 4429})
+        return
+    hub.connections[client] += 1
+    try:
+        await serve_socket(receive, send, hub)
+    finally:
+        hub.connections[client] -= 1
+        if not hub.connections[client]:
+            del hub.connections[client]
+
+
+async def serve_socket(receive, send, hub):
+    await send({'type': 'websocket.accept'})
+
+    subscriber = Subscriber()
+
+    async def writer():
+        while True:
+            await send({'type': 'websocket.send', 'text': await subscriber.queue.get()})
+
+    writer_task = asyncio.create_task(writer())
+    try:
+        while True:
+            event = await receive()
+            if event['type'] == 'websocket.disconnect':
+                break
+            if event['type'] != 'websocket.receive':
+                continue
+            try:
+                message = json.loads(event.get('text') or event.get('bytes') or '')
+                action = message.get('action')
+                symbols = parse_symbols(message)
+            except (ValueError, AttributeError):
+                action, symbols = None, None
+            if action not in ('subscribe', 'unsubscribe') or symbols is None:
+                subscriber.push(json.dumps({'type': 'error', 'error': 'Expected {"action": "subscribe"|"unsubscribe", "symbols": [...]}'}))
+                continue
+            if action == 'subscribe':
+                error = subscribe_error(hub, subscriber, symbols)
+                if error:
+                    subscriber.push(json.dumps({'type': 'error', 'error': error}))
+                    continue
+                for symbol in symbols:
+                    hub.subscribe(subscriber, symbol)
+            else:
+                for symbol in symbols:
+                    hub.unsubscribe(subscriber, symbol)
+            subscriber.push(json.dumps({'type': 'subscribed', 'symbols': sorted(subscriber.symbols)}))
+    finally:
+        hub.leave(subscriber)
+        writer_task.cancel()
@@ -0,0 +1,80 @@
+# Labelled dataset -> one memory-mappable file (see api/dataset.py for the layouts), plus <out>.schema.json:
+#   python manage.py export_dataset --out data.npy
+#   python manage.py export_dataset --out data.arrow --format arrow --symbols AAPL,MSFT --from 2024-01-01 --columns close,rsi,target
+#   python manage.py export_dataset --out data.npy --source csv      (from ml_training_data.csv instead of the feature store)
+# then in a notebook:  data = np.load('data.npy', mmap_mode='r');  X = data[['close', 'rsi']]
+
+import json
+import os
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import dataset
+from scripts import universe
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Dates are YYYY-MM-DD, got {value}")
+
+
+def split(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+class Command(BaseCommand):
+    help = "Export the labelled dataset as a structured .npy or an Arrow IPC file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--out', required=True)
+        parser.add_argument('--format', choices=dataset.FORMATS, help='default: from the --out extension, else npy')
+        parser.add_argument('--source', choices=['store', 'csv'], default='store')
+        parser.add_argument('--input', default=universe.TRAINING_FILE, help='labelled csv for --source csv')
+        parser.add_argument('--symbols', help='comma separated, default every ticker')
+        parser.add_argument('--columns', help='comma separated features / target, default all')
+        parser.add_argument('--from', dest='from_date', type=parse_date)
+        parser.add_argument('--to', dest='to_date', type=parse_date)
+
+    def handle(self, *args, **options):
+        out = options['out']
+        fmt = options['format'] or ('arrow' if out.endswith(('.arrow', '.feather')) else 'npy')
+        symbols = split(options['symbols'])
+        try:
+            columns = dataset.select_columns(split(options['columns']))
+        except dataset.DatasetError as e:
+            raise CommandError(str(e))
+        filters = (symbols, options['from_date'], options['to_date'])
+        if options['source'] == 'csv':
+            try:
+                columns = dataset.csv_columns(options['input'], columns, requested=bool(split(options['columns'])))
+            except dataset.DatasetError as e:
+                raise CommandError(str(e))
+            batches = dataset.csv_batches(options['input'], columns, *filters)
+        else:
+            batches = dataset.store_batches(columns, *filters)
+
+        start = time.perf_counter()
+        try:
+            rows = dataset.write_file(out, fmt, batches, columns)
+        except dataset.DatasetError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - start
+
+        schema = {
+            'format': fmt,
+            'rows': rows,
+            'columns': dataset.KEY_COLUMNS + columns,
+            'dtypes': {name: str(dt) for name, (dt, _) in dataset.record_dtype(columns).fields.items()},
+            'source': options['input'] if options['source'] == 'csv' else 'feature store',
+            'symbols': symbols or None,
+            'from': str(options['from_date'] or '') or None,
+            'to': str(options['to_date'] or '') or None,
+            'target': {'1': 'BUY', '0': 'HOLD', '-1': 'SELL'},
+        }
+        with open(f"{os.path.splitext(out)[0]}.schema.json", 'w') as f:
+            json.dump(schema, f, indent=2)
+        self.stdout.write(f"{rows:,} rows x {len(columns)} columns -> {out} ({os.path.getsize(out) / 1e6:.1f} MB) in {elapsed:.2f}s")
@@ -0,0 +1,32 @@
+# Load the per-ticker price csvs (Data Files/Price) into the DailyBar table, re-running just overwrites the same bars:
+#   python manage.py import_bars             -> the whole universe (scripts/universe.py)
+#   python manage.py import_bars AAPL MSFT
+
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import bar_store
+from scripts import universe
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert daily OHLCV bars from the price csvs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help='Tickers to import (default: the universe)')
+
+    def handle(self, *args, **options):
+        tickers = universe.get_universe(options['tickers'] or None)
+        total, start = 0, time.perf_counter()
+        for ticker in tickers:
+            path = universe.price_path(ticker)
+            if not os.path.exists(path):
+                self.stdout.write(f"{ticker}: no price file")
+                continue
+            count = bar_store.import_csv(path, ticker)
+            total += count
+            self.stdout.write(f"{ticker}: {count} bars")
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{total:,} bars in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f}/s)")
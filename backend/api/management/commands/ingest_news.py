@@ -0,0 +1,31 @@
+# Pull new Finnhub articles into the news store, e.g. from a scheduler:
+#   python manage.py ingest_news AAPL MSFT NVDA --general
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import news_store
+
+
+class Command(BaseCommand):
+    help = "Incrementally ingest (and score) Finnhub news for the given symbols and/or the general feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*', help='Ticker symbols to ingest company news for')
+        parser.add_argument('--general', action='store_true', help='Also ingest general market news')
+        parser.add_argument('--hours', type=int, default=24, help='Backfill window for symbols with no cursor yet')
+        parser.add_argument('--force', action='store_true', help='Ignore NEWS_REFRESH_SECONDS')
+
+    def handle(self, *args, **options):
+        api_key = getattr(settings, 'FINNHUB_API_KEY', None)
+        if not api_key:
+            raise CommandError("FINNHUB_API_KEY not configured")
+        if not options['symbols'] and not options['general']:
+            raise CommandError("Give at least one symbol or --general")
+
+        for symbol in options['symbols']:
+            added = news_store.ingest_symbol_news(symbol, api_key, hours_window=options['hours'], force=options['force'])
+            self.stdout.write(f"{symbol.upper()}: {added} new articles")
+        if options['general']:
+            added = news_store.ingest_general_news(api_key, force=options['force'])
+            self.stdout.write(f"general: {added} new articles")
@@ -0,0 +1,36 @@
+# Recent request / pipeline profiles (PROFILE_DIR), newest first:
+#   python manage.py profiles
+#   python manage.py profiles --show <id> --kind cpu > out.folded   (then flamegraph.pl out.folded > out.svg)
+
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from scripts import profiling
+
+
+class Command(BaseCommand):
+    help = "List recent CPU / allocation profiles or print one of them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--show', metavar='ID', help='print this profile instead of the list')
+        parser.add_argument('--kind', choices=['cpu', 'alloc', 'json'], default='cpu')
+
+    def handle(self, *args, **options):
+        if options['show']:
+            path = profiling.profile_file(options['show'], options['kind'], settings.PROFILE_DIR)
+            if path is None:
+                raise CommandError(f"No {options['kind']} profile {options['show']} in {settings.PROFILE_DIR}")
+            with open(path) as f:
+                sys.stdout.write(f.read())
+            return
+
+        profiles = profiling.list_profiles(settings.PROFILE_DIR, options['limit'])
+        if not profiles:
+            self.stdout.write(f"No profiles in {settings.PROFILE_DIR}")
+        for p in profiles:
+            top = p['top_allocations'][0]['stack'] if p['top_allocations'] else '-'
+            self.stdout.write(f"{p['id']}  {p['duration_ms']:>9.1f} ms  {p['samples']:>6} samples  "
+                              f"peak {p['peak_traced_mb']:.1f} MB  top alloc {top}")
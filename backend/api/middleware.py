@@ -0,0 +1,62 @@
+# Request profiling (scripts/profiling.py): a request is profiled when it sends X-Profile: <PROFILE_TOKEN>, or at random
+# for PROFILE_SAMPLE_RATE of requests. The response gets X-Profile-Id, the files are listed at /api/profiles/
+# Sync requests sample the request thread. Async ones (ASGI) sample every busy thread, since the view and its
+# sync_to_async work run on different threads - so other requests served at the same time can show up in it too
+
+import hmac
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from scripts import profiling
+
+
+def has_profile_token(request):
+    token = settings.PROFILE_TOKEN
+    sent = request.headers.get('X-Profile', '')
+    return bool(token) and hmac.compare_digest(sent.encode(), token.encode())
+
+
+def wants_profile(request):
+    if request.path.startswith('/api/profiles/'):
+        return False
+    return has_profile_token(request) or random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not wants_profile(request):
+            return self.get_response(request)
+        with profiling.profile(self.name(request), settings.PROFILE_DIR, extra=self.extra(request)) as info:
+            response = self.get_response(request)
+        return self.tag(response, info)
+
+    async def __acall__(self, request):
+        if not wants_profile(request):
+            return await self.get_response(request)
+        with profiling.profile(self.name(request), settings.PROFILE_DIR, thread_ids=None, extra=self.extra(request)) as info:
+            response = await self.get_response(request)
+        return self.tag(response, info)
+
+    def name(self, request):
+        return f"{request.method}-{request.path.strip('/').replace('/', '-') or 'root'}"
+
+    def extra(self, request):
+        return {'kind': 'request', 'method': request.method, 'path': request.get_full_path()}
+
+    def tag(self, response, info):
+        if info['id']:
+            response['X-Profile-Id'] = info['id']
+        return response
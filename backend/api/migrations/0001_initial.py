@@ -0,0 +1,46 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NewsCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(max_length=32, unique=True)),
+                ('last_published_at', models.DateTimeField(blank=True, null=True)),
+                ('last_finnhub_id', models.BigIntegerField(blank=True, null=True)),
+                ('last_fetched_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NewsArticle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(blank=True, default='', max_length=16)),
+                ('category', models.CharField(blank=True, default='', max_length=32)),
+                ('finnhub_id', models.BigIntegerField(blank=True, null=True)),
+                ('url', models.URLField(max_length=1000)),
+                ('headline', models.TextField(blank=True, default='')),
+                ('summary', models.TextField(blank=True, default='')),
+                ('source', models.CharField(blank=True, default='', max_length=128)),
+                ('image', models.URLField(blank=True, default='', max_length=1000)),
+                ('published_at', models.DateTimeField()),
+                ('sentiment_score', models.FloatField(blank=True, null=True)),
+                ('sentiment_details', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', '-published_at'], name='news_symbol_published_idx')],
+                'constraints': [models.UniqueConstraint(fields=('symbol', 'finnhub_id'), name='unique_news_id_per_symbol'), models.UniqueConstraint(fields=('symbol', 'url'), name='unique_news_url_per_symbol')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-19 12:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_daily_sentiment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeatureRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=16)),
+                ('date', models.DateField()),
+                ('open', models.FloatField(null=True)),
+                ('high', models.FloatField(null=True)),
+                ('low', models.FloatField(null=True)),
+                ('close', models.FloatField(null=True)),
+                ('volume', models.FloatField(null=True)),
+                ('macd', models.FloatField(null=True)),
+                ('macd_signal', models.FloatField(null=True)),
+                ('macd_diff', models.FloatField(null=True)),
+                ('rsi', models.FloatField(null=True)),
+                ('bb_bbm', models.FloatField(null=True)),
+                ('bb_bbh', models.FloatField(null=True)),
+                ('bb_bbl', models.FloatField(null=True)),
+                ('bb_bbwidth', models.FloatField(null=True)),
+                ('obv', models.FloatField(null=True)),
+                ('news_sentiment', models.FloatField(null=True)),
+                ('source', models.CharField(choices=[('pipeline', 'Offline pipeline'), ('live', 'Live prediction')], default='pipeline', max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('symbol', 'date'), name='unique_feature_row')],
+            },
+        ),
+    ]
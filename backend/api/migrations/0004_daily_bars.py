@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_feature_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=16)),
+                ('date', models.DateField()),
+                ('open', models.FloatField(null=True)),
+                ('high', models.FloatField(null=True)),
+                ('low', models.FloatField(null=True)),
+                ('close', models.FloatField(null=True)),
+                ('volume', models.FloatField(null=True)),
+                ('source', models.CharField(choices=[('csv', 'Price csv'), ('finnhub', 'Finnhub quote'), ('alphavantage', 'AlphaVantage quote')], default='csv', max_length=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('symbol', 'date'), name='unique_daily_bar')],
+            },
+        ),
+    ]
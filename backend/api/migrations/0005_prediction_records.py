@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_daily_bars'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=16)),
+                ('created_at', models.DateTimeField()),
+                ('as_of', models.DateField(blank=True, null=True)),
+                ('source', models.CharField(choices=[('live', 'Live upstream data'), ('stored', 'Feature store day'), ('push', 'Websocket push')], default='live', max_length=16)),
+                ('prediction_code', models.SmallIntegerField()),
+                ('probabilities', models.JSONField(default=dict)),
+                ('features', models.JSONField(default=dict)),
+                ('model_version', models.CharField(blank=True, default='', max_length=64)),
+                ('latency_ms', models.JSONField(default=dict)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', '-created_at'], name='prediction_symbol_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_prediction_records'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentimentState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=16, unique=True)),
+                ('total', models.FloatField(default=0.0)),
+                ('weight', models.FloatField(default=0.0)),
+                ('last_at', models.DateTimeField(blank=True, null=True)),
+                ('half_life_hours', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='featurerow',
+            name='news_sentiment_decayed',
+            field=models.FloatField(null=True),
+        ),
+    ]
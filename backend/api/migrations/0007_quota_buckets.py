@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_sentiment_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('tokens', models.FloatField()),
+                ('refilled_at', models.FloatField()),
+                ('day', models.DateField(blank=True, null=True)),
+                ('day_count', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
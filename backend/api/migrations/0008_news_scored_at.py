@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-19 14:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_quota_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='newsarticle',
+            name='scored_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
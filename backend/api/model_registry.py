@@ -0,0 +1,114 @@
+# Serving side of the model family (scripts/model_family.py): routes a symbol to its most specific model
+# (ticker > sector > global) and loads models from Models/family/<version>/ on first use. Loaded models are kept
+# in LRU order and the least recently used ones are dropped once their forests add up to more than MODEL_CACHE_MB
+# (the one just loaded always stays). Without a family manifest, predictor keeps serving the single global model.
+# Counts (loads / hits / evictions) are per worker process, shown at /api/models/
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import joblib
+from django.conf import settings
+
+from scripts.model_budget import forest_memory
+from scripts.model_family import FAMILY_DIR, model_directory, read_manifest
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self, manifest, family_dir=FAMILY_DIR, max_mb=None):
+        self.manifest = manifest
+        self.family_dir = family_dir
+        self.version = manifest['version']
+        self.feature_columns = manifest['feature_columns']
+        self.max_bytes = (max_mb if max_mb is not None else settings.MODEL_CACHE_MB) * 1e6
+        self.models = OrderedDict() # key -> (model, bytes), least recently used first
+        self.loading = {} # key -> lock, one load per key at a time
+        self.lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def route(self, symbol):
+        models = self.manifest['models']
+        sector = self.manifest['sectors'].get(symbol)
+        for key in (f"ticker:{symbol}", f"sector:{sector}" if sector else None, 'global'):
+            if key in models:
+                return key
+        return None
+
+    def get(self, key):
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.hits += 1
+                return self.models[key][0]
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self.lock:
+                if key in self.models: # loaded by another thread while we waited
+                    self.hits += 1
+                    return self.models[key][0]
+            start = time.perf_counter()
+            model = joblib.load(os.path.join(self.family_dir, model_directory(self.manifest, key), self.manifest['models'][key]['file']))
+            size = forest_memory(model)
+            with self.lock:
+                self.load_seconds += time.perf_counter() - start
+                self.loads += 1
+                self.models[key] = (model, size)
+                self.evict()
+        return model
+
+    def evict(self):
+        total = sum(size for _, size in self.models.values())
+        while total > self.max_bytes and len(self.models) > 1:
+            key, (_, size) = self.models.popitem(last=False)
+            total -= size
+            self.evictions += 1
+            logger.info("Model cache over %.0f MB, dropped %s", self.max_bytes / 1e6, key)
+
+    # (model, feature columns, {'model': key, 'version': ...}) for a symbol, None if the family has nothing for it
+    def model_for(self, symbol):
+        key = self.route(symbol)
+        if key is None:
+            return None
+        return self.get(key), self.feature_columns, {'model': key, 'version': f"{self.version}/{key}"}
+
+    def stats(self):
+        with self.lock:
+            loaded = {key: round(size / 1e6, 2) for key, (_, size) in self.models.items()}
+        return {
+            'version': self.version,
+            'models': len(self.manifest['models']),
+            'loaded': loaded, # least recently used first
+            'loaded_mb': round(sum(loaded.values()), 2),
+            'max_mb': self.max_bytes / 1e6,
+            'loads': self.loads,
+            'hits': self.hits,
+            'evictions': self.evictions,
+            'load_ms': round(self.load_seconds * 1000, 1),
+            'pid': os.getpid(),
+        }
+
+
+_registry = None
+_registry_checked = False
+_registry_lock = threading.Lock()
+
+
+# the process' registry, None when no family was trained (checked once per process, like the global model)
+def get_registry():
+    global _registry, _registry_checked
+    if _registry_checked:
+        return _registry
+    with _registry_lock:
+        if not _registry_checked:
+            manifest = read_manifest(settings.MODEL_FAMILY_DIR) if settings.MODEL_FAMILY_DIR else None
+            _registry = ModelRegistry(manifest, settings.MODEL_FAMILY_DIR) if manifest else None
+            _registry_checked = True
+    return _registry
@@ -1,3 +1,179 @@
 from django.db import models
 
-# Create your models here.
+
+# One row per (feed, article). symbol is '' for the general market news feed
+# Sentiment is scored once when the article is ingested, so nobody needs to call HF again for it
+class NewsArticle(models.Model):
+    symbol = models.CharField(max_length=16, blank=True, default='')
+    category = models.CharField(max_length=32, blank=True, default='')
+    finnhub_id = models.BigIntegerField(null=True, blank=True)
+    url = models.URLField(max_length=1000)
+    headline = models.TextField(blank=True, default='')
+    summary = models.TextField(blank=True, default='')
+    source = models.CharField(max_length=128, blank=True, default='')
+    image = models.URLField(max_length=1000, blank=True, default='')
+    published_at = models.DateTimeField()
+    sentiment_score = models.FloatField(null=True, blank=True) # None = scoring failed, can be retried later
+    sentiment_details = models.JSONField(default=dict, blank=True)
+    scored_at = models.DateTimeField(null=True, blank=True) # last scoring attempt, failed ones retry after SENTIMENT_RETRY_SECONDS
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [ # dedupe by finnhub id and by url within a feed
+            models.UniqueConstraint(fields=['symbol', 'finnhub_id'], name='unique_news_id_per_symbol'),
+            models.UniqueConstraint(fields=['symbol', 'url'], name='unique_news_url_per_symbol'),
+        ]
+        indexes = [ # "articles for symbol X in the last N hours"
+            models.Index(fields=['symbol', '-published_at'], name='news_symbol_published_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol or 'general'}: {self.headline[:50]}"
+
+
+# Where we got up to for each feed (a symbol, or 'general'), so the next ingest only asks for newer articles
+class NewsCursor(models.Model):
+    feed = models.CharField(max_length=32, unique=True)
+    last_published_at = models.DateTimeField(null=True, blank=True)
+    last_finnhub_id = models.BigIntegerField(null=True, blank=True)
+    last_fetched_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.feed} @ {self.last_published_at}"
+
+
+# Materialised per-ticker, per-day (UTC) sentiment. Running sum + count so each scored article is an O(1) update,
+# and training/serving both read the daily mean from here instead of re-averaging articles
+class DailySentiment(models.Model):
+    symbol = models.CharField(max_length=16)
+    date = models.DateField()
+    sentiment_sum = models.FloatField(default=0.0)
+    article_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'date'], name='unique_daily_sentiment'), # also the lookup index
+        ]
+
+    @property
+    def mean(self):
+        return self.sentiment_sum / self.article_count if self.article_count else 0.0
+
+    def __str__(self):
+        return f"{self.symbol} {self.date}: {self.mean:.3f} ({self.article_count})"
+
+
+# Time-decayed sentiment per ticker (scripts/sentiment_decay.py): decayed score sum + article weight as of last_at.
+# Updated in O(1) per scored article by api/sentiment_state.py, read at prediction time. half_life_hours is what the
+# sums were decayed with, a different SENTIMENT_HALF_LIFE_HOURS rebuilds the row from the scored articles
+class SentimentState(models.Model):
+    symbol = models.CharField(max_length=16, unique=True)
+    total = models.FloatField(default=0.0)
+    weight = models.FloatField(default=0.0)
+    last_at = models.DateTimeField(null=True, blank=True)
+    half_life_hours = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.symbol}: {self.total:.3f}/{self.weight:.2f} @ {self.last_at}"
+
+
+# Point-in-time feature store: the 15 model features per (ticker, trading day), written by the offline pipeline
+# (consolidate_data_with_sentiment.py) and by live predictions, read by train_model.py and the prediction views.
+# The unique constraint is the sorted (symbol, date) index, so a day is an index lookup and a date range is one scan.
+# Column list is feature_store.FEATURE_COLUMNS
+class FeatureRow(models.Model):
+    SOURCE_CHOICES = [('pipeline', 'Offline pipeline'), ('live', 'Live prediction')]
+
+    symbol = models.CharField(max_length=16)
+    date = models.DateField()
+    open = models.FloatField(null=True)
+    high = models.FloatField(null=True)
+    low = models.FloatField(null=True)
+    close = models.FloatField(null=True)
+    volume = models.FloatField(null=True)
+    macd = models.FloatField(null=True)
+    macd_signal = models.FloatField(null=True)
+    macd_diff = models.FloatField(null=True)
+    rsi = models.FloatField(null=True)
+    bb_bbm = models.FloatField(null=True)
+    bb_bbh = models.FloatField(null=True)
+    bb_bbl = models.FloatField(null=True)
+    bb_bbwidth = models.FloatField(null=True)
+    obv = models.FloatField(null=True)
+    news_sentiment = models.FloatField(null=True)
+    news_sentiment_decayed = models.FloatField(null=True)
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default='pipeline')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'date'], name='unique_feature_row'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.date} ({self.source})"
+
+
+# One OHLCV bar per ticker per day, from the price csvs (api/bar_store.import_csv) and every live quote the API fetches.
+# The (symbol, date) unique constraint is also the composite index the range reads use
+class DailyBar(models.Model):
+    SOURCE_CHOICES = [('csv', 'Price csv'), ('finnhub', 'Finnhub quote'), ('alphavantage', 'AlphaVantage quote')]
+
+    symbol = models.CharField(max_length=16)
+    date = models.DateField()
+    open = models.FloatField(null=True)
+    high = models.FloatField(null=True)
+    low = models.FloatField(null=True)
+    close = models.FloatField(null=True)
+    volume = models.FloatField(null=True)
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default='csv')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['symbol', 'date'], name='unique_daily_bar'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.date} close {self.close}"
+
+
+# Every prediction served (/api/predict/ sync + async, and the /ws/live/ pushes), for looking at accuracy over time.
+# Written in batches off the request path by api/prediction_log.py, so created_at is when the prediction was made,
+# not when the row was flushed
+class PredictionRecord(models.Model):
+    SOURCE_CHOICES = [('live', 'Live upstream data'), ('stored', 'Feature store day'), ('push', 'Websocket push')]
+
+    symbol = models.CharField(max_length=16)
+    created_at = models.DateTimeField()
+    as_of = models.DateField(null=True, blank=True) # the stored day for source='stored'
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default='live')
+    prediction_code = models.SmallIntegerField()
+    probabilities = models.JSONField(default=dict) # {'SELL': p, 'HOLD': p, 'BUY': p}
+    features = models.JSONField(default=dict)
+    model_version = models.CharField(max_length=64, blank=True, default='')
+    latency_ms = models.JSONField(default=dict) # {'features': ms, 'predict': ms, 'total': ms}
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['symbol', '-created_at'], name='prediction_symbol_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.created_at:%Y-%m-%d %H:%M} {self.prediction_code} ({self.source})"
+
+
+# Token buckets shared by every worker (api/quota.py): one row per upstream provider ('provider:alphavantage') and
+# per client ('client:user:12', 'client:ip:1.2.3.4'). tokens as of refilled_at (unix seconds), plus the calls
+# counted against the provider's daily cap on `day` (UTC)
+class QuotaBucket(models.Model):
+    key = models.CharField(max_length=128, unique=True)
+    tokens = models.FloatField()
+    refilled_at = models.FloatField()
+    day = models.DateField(null=True, blank=True)
+    day_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.key}: {self.tokens:.2f} tokens, {self.day_count} on {self.day}"
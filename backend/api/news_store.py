@@ -0,0 +1,286 @@
+# News store - ingests Finnhub company news (per symbol) and general market news into the db incrementally
+# Each feed has a cursor (latest article time + id) so we only ask Finnhub for what we don't have yet,
+# articles are deduped by Finnhub id / url and sentiment is scored once at ingest.
+# Reads ("articles for symbol X in the last N hours") come straight off the indexed NewsArticle table.
+
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import requests
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Q
+from django.utils import timezone
+
+from . import upstream
+from .daily_sentiment import record_scores
+from .models import NewsArticle, NewsCursor
+from .sentiment import score_many
+
+logger = logging.getLogger(__name__)
+
+GENERAL_FEED = 'general'
+
+
+# only go back to Finnhub if the feed was not refreshed recently (prevents every prediction from refetching)
+def refresh_due(cursor, force=False):
+    if force or cursor.last_fetched_at is None:
+        return True
+    min_age = timedelta(seconds=getattr(settings, 'NEWS_REFRESH_SECONDS', 300))
+    return timezone.now() - cursor.last_fetched_at >= min_age
+
+
+def fetch_company_news(symbol, api_key, from_dt, to_dt):
+    params = {
+        "symbol": symbol,
+        "from": from_dt.strftime('%Y-%m-%d'), # finnhub only takes dates, so we still filter by time after
+        "to": to_dt.strftime('%Y-%m-%d'),
+        "token": api_key
+    }
+    resp = upstream.call('finnhub', 'company-news', lambda timeout: requests.get(
+        f"{settings.FINNHUB_API_URL}/company-news", params=params, timeout=timeout), upstream.FINNHUB_TIMEOUT)
+    if resp.status_code != 200:
+        raise requests.exceptions.HTTPError(f"Finnhub news API error: {resp.status_code}")
+    return resp.json()
+
+
+def fetch_general_news(api_key, min_id=None):
+    params = {"category": "general", "token": api_key}
+    if min_id:
+        params["minId"] = min_id # finnhub returns only articles newer than this id
+    resp = upstream.call('finnhub', 'news', lambda timeout: requests.get(
+        f"{settings.FINNHUB_API_URL}/news", params=params, timeout=timeout), upstream.FINNHUB_TIMEOUT)
+    if resp.status_code != 200:
+        raise requests.exceptions.HTTPError(f"Finnhub news API error: {resp.status_code}")
+    return resp.json()
+
+
+# one batched call to the sentiment backend for all the new articles
+def score_new_articles(articles):
+    results = score_many([(a.headline, a.summary) for a in articles])
+    now = timezone.now()
+    for article, (score, details) in zip(articles, results):
+        article.sentiment_score = score
+        article.sentiment_details = details
+        article.scored_at = now
+
+
+# Insert the articles, returns the ones really inserted. Another worker ingesting the same feed can get past the
+# dedupe query at the same time - the unique constraints then reject its rows here, so only one of us counts them
+# towards the daily sentiment
+def insert_new(articles):
+    try:
+        with transaction.atomic():
+            NewsArticle.objects.bulk_create(articles)
+        return articles
+    except IntegrityError: # some of them are there by now, one at a time to find out which
+        inserted = []
+        for article in articles:
+            try:
+                with transaction.atomic():
+                    article.save(force_insert=True)
+                inserted.append(article)
+            except IntegrityError:
+                article.pk = None
+        return inserted
+
+
+# Insert the articles we have not seen for this feed, then move the cursor to the newest one
+def store_articles(symbol, raw_articles, cursor, since=None):
+    candidates = {}
+    for article in raw_articles:
+        url = article.get("url")
+        if "datetime" not in article or not url:
+            continue
+        published = datetime.fromtimestamp(article["datetime"], tz=dt_timezone.utc)
+        if since is not None and published < since:
+            continue
+        if cursor.last_published_at is not None and published < cursor.last_published_at:
+            continue
+        candidates.setdefault(url, (published, article)) # same url twice in one response => keep first
+
+    if candidates:
+        urls = list(candidates)
+        ids = [a.get("id") for _, a in candidates.values() if a.get("id") is not None]
+        existing = NewsArticle.objects.filter(symbol=symbol).filter(Q(url__in=urls) | Q(finnhub_id__in=ids))
+        seen_urls, seen_ids = set(), set()
+        for finnhub_id, url in existing.values_list('finnhub_id', 'url'):
+            seen_ids.add(finnhub_id)
+            seen_urls.add(url)
+
+        # same article may already be scored under another feed, reuse that instead of scoring it again
+        already_scored = {
+            url: (score, details)
+            for url, score, details in NewsArticle.objects.filter(url__in=urls, sentiment_score__isnull=False)
+            .values_list('url', 'sentiment_score', 'sentiment_details')
+        }
+
+        new_articles = []
+        for url, (published, article) in candidates.items():
+            if url in seen_urls or article.get("id") in seen_ids:
+                continue
+            headline = article.get("headline") or ""
+            summary = article.get("summary") or ""
+            score, details = already_scored.get(url, (None, {}))
+            new_articles.append(NewsArticle(
+                symbol=symbol,
+                category=article.get("category") or "",
+                finnhub_id=article.get("id"),
+                url=url,
+                headline=headline,
+                summary=summary,
+                source=article.get("source") or "",
+                image=article.get("image") or "",
+                published_at=published,
+                sentiment_score=score,
+                sentiment_details=details,
+            ))
+            if article.get("id") is not None:
+                seen_ids.add(article.get("id"))
+        score_new_articles([a for a in new_articles if a.url not in already_scored])
+        new_articles = insert_new(new_articles)
+        if symbol:
+            record_scores(symbol, [(a.published_at, a.sentiment_score) for a in new_articles])
+
+        newest_published, newest = max(candidates.values(), key=lambda item: (item[0], item[1].get("id") or 0))
+        if cursor.last_published_at is None or newest_published >= cursor.last_published_at:
+            cursor.last_published_at = newest_published
+            cursor.last_finnhub_id = newest.get("id")
+    else:
+        new_articles = []
+
+    cursor.last_fetched_at = timezone.now()
+    cursor.save()
+    return len(new_articles)
+
+
+# Pull anything new for a symbol. First ingest backfills 'hours_window' hours, after that starts from the cursor
+def ingest_symbol_news(symbol, api_key, hours_window=24, force=False):
+    symbol = symbol.upper().strip()
+    cursor, _ = NewsCursor.objects.get_or_create(feed=symbol)
+    if not refresh_due(cursor, force):
+        return 0
+    now = timezone.now()
+    since = now - timedelta(hours=hours_window)
+    from_dt = max(since, cursor.last_published_at) if cursor.last_published_at else since
+    try:
+        raw_articles = fetch_company_news(symbol, api_key, from_dt, now)
+    except Exception as e:
+        logger.warning("Error fetching news for %s: %s", symbol, e)
+        return 0 # cursor untouched so the next call tries again
+    return store_articles(symbol, raw_articles, cursor, since=since)
+
+
+def ingest_general_news(api_key, force=False):
+    cursor, _ = NewsCursor.objects.get_or_create(feed=GENERAL_FEED)
+    if not refresh_due(cursor, force):
+        return 0
+    try:
+        raw_articles = fetch_general_news(api_key, cursor.last_finnhub_id)
+    except Exception as e:
+        logger.warning("Error fetching general news: %s", e)
+        return 0
+    return store_articles('', raw_articles, cursor)
+
+
+# Offline import (e.g. the yearly news CSVs) - rows are dicts with url, headline, summary, source, published_at
+# Articles already in the store are skipped, so re-running only scores what is new
+def import_articles(symbol, rows):
+    symbol = symbol.upper()
+    rows = [row for row in rows if row.get("url")]
+    existing = set(NewsArticle.objects.filter(symbol=symbol, url__in=[r["url"] for r in rows]).values_list('url', flat=True))
+    new_articles = []
+    for row in rows:
+        if row["url"] in existing:
+            continue
+        existing.add(row["url"])
+        new_articles.append(NewsArticle(
+            symbol=symbol,
+            url=row["url"],
+            headline=row.get("headline") or "",
+            summary=row.get("summary") or "",
+            source=row.get("source") or "",
+            published_at=row["published_at"],
+        ))
+    score_new_articles(new_articles)
+    new_articles = insert_new(new_articles)
+    record_scores(symbol, [(a.published_at, a.sentiment_score) for a in new_articles])
+    return len(new_articles)
+
+
+# symbol '' (or None) means the general feed
+def recent_articles(symbol, hours=12):
+    cutoff = timezone.now() - timedelta(hours=hours)
+    return NewsArticle.objects.filter(symbol=(symbol or '').upper(), published_at__gte=cutoff).order_by('-published_at')
+
+
+# avg sentiment of the scored articles in the window, 0 when there is no news (same as training)
+def recent_sentiment(symbol, hours=12):
+    avg = recent_articles(symbol, hours).filter(sentiment_score__isnull=False).aggregate(avg=Avg('sentiment_score'))['avg']
+    return float(avg) if avg is not None else 0.0
+
+
+# articles whose scoring failed at ingest get another go in one batch (and count towards the daily mean now),
+# at most once per SENTIMENT_RETRY_SECONDS.
+# Two page views can score the same articles at once: each article is saved only if it is still unscored, and only
+# the ones we saved are counted
+def score_unscored(articles):
+    # tried less than SENTIMENT_RETRY_SECONDS ago: the backend is probably still down, don't pay its timeout again
+    cutoff = timezone.now() - timedelta(seconds=settings.SENTIMENT_RETRY_SECONDS)
+    unscored = [a for a in articles if a.sentiment_score is None and (a.headline or a.summary)
+                and (a.scored_at is None or a.scored_at <= cutoff)]
+    if not unscored:
+        return 0
+    # marked first, so other page views skip them while the backend is being tried
+    NewsArticle.objects.filter(pk__in=[a.pk for a in unscored], sentiment_score__isnull=True).update(scored_at=timezone.now())
+    score_new_articles(unscored)
+    scored = [
+        a for a in unscored if a.sentiment_score is not None and NewsArticle.objects.filter(
+            pk=a.pk, sentiment_score__isnull=True).update(sentiment_score=a.sentiment_score, sentiment_details=a.sentiment_details)
+    ]
+    by_symbol = {}
+    for a in scored:
+        if a.symbol:
+            by_symbol.setdefault(a.symbol, []).append((a.published_at, a.sentiment_score))
+    for symbol, scores in by_symbol.items():
+        record_scores(symbol, scores)
+    return len(scored)
+
+
+def article_dict(article):
+    return {
+        'id': article.finnhub_id,
+        'headline': article.headline,
+        'summary': article.summary,
+        'url': article.url,
+        'source': article.source,
+        'image': article.image,
+        'datetime': int(article.published_at.timestamp()), # epoch seconds like finnhub
+        'sentiment_score': article.sentiment_score,
+    }
+
+
+# Company news for the dashboard with the window adjustment the page used to do itself: start with `hours`,
+# more than NEWS_BUSY_COUNT articles -> narrow to 6h, fewer than NEWS_QUIET_COUNT -> widen to 24h (once).
+# Ingest (24h back, rate limited by NEWS_REFRESH_SECONDS) -> (hours actually used, list of scored articles)
+def company_news_page(symbol, hours=12, adjust=True):
+    symbol = symbol.upper().strip()
+    if settings.FINNHUB_API_KEY:
+        ingest_symbol_news(symbol, settings.FINNHUB_API_KEY, hours_window=max(hours, 24))
+    articles = list(recent_articles(symbol, hours))
+    if adjust:
+        if len(articles) > settings.NEWS_BUSY_COUNT and hours > 6:
+            hours = 6
+        elif len(articles) < settings.NEWS_QUIET_COUNT and hours < 24:
+            hours = 24
+        articles = list(recent_articles(symbol, hours))
+    score_unscored(articles)
+    return hours, articles
+
+
+def general_news_page(hours=48, limit=12):
+    if settings.FINNHUB_API_KEY:
+        ingest_general_news(settings.FINNHUB_API_KEY)
+    articles = list(recent_articles('', hours)[:limit])
+    score_unscored(articles)
+    return articles
@@ -0,0 +1,129 @@
+# Prediction history without a db write on the request path: record() puts the row on a bounded in-process queue
+# and returns, a daemon thread bulk_creates PredictionRecord rows PREDICTION_LOG_BATCH at a time or every
+# PREDICTION_LOG_FLUSH_SECONDS, whichever comes first. When the queue is full (db slow/down under load) new rows
+# are dropped and counted instead of blocking the request or growing memory. Whatever is still queued is written
+# at exit
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import predictor
+from .models import PredictionRecord
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLog:
+    def __init__(self, max_size, batch_size, flush_seconds, start=True):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.start = start
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.flusher = None
+        self.lock = threading.Lock()
+
+    def record(self, row):
+        if self.start and self.flusher is None:
+            self.start_flusher()
+        try:
+            self.queue.put_nowait(row)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("Prediction log full (%d queued), %d predictions dropped so far", self.queue.maxsize, self.dropped)
+
+    def start_flusher(self):
+        with self.lock:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self._flush_loop, name='prediction-log', daemon=True)
+                self.flusher.start()
+                atexit.register(self.flush)
+
+    # up to batch_size rows, waiting at most flush_seconds after the first one arrived
+    def next_batch(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _flush_loop(self):
+        while True:
+            self.write(self.next_batch())
+
+    def write(self, batch):
+        try:
+            PredictionRecord.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.written += len(batch)
+        except Exception as e: # losing history rows is fine, killing the flusher is not
+            self.failed += len(batch)
+            logger.warning("Could not write %d prediction records: %s", len(batch), e)
+        finally:
+            close_old_connections() # long lived thread: honour CONN_MAX_AGE, drop broken connections
+
+    # write everything queued right now from the calling thread (exit, tests, manage.py shell)
+    def flush(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.write(batch)
+        return len(batch)
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+        }
+
+
+log = PredictionLog(
+    settings.PREDICTION_LOG_SIZE, settings.PREDICTION_LOG_BATCH, settings.PREDICTION_LOG_FLUSH_SECONDS,
+    start=settings.PREDICTION_LOG_SIZE > 0,
+)
+
+
+# body = predictor.predict's 200 response, started/fetched = time.perf_counter() at the start of the request and once
+# the features were in. Cheap (no db, no serialization), safe to call from async views
+def record_prediction(body, source='live', as_of=None, started=None, fetched=None):
+    if settings.PREDICTION_LOG_SIZE <= 0:
+        return
+    latency = {}
+    if started is not None and fetched is not None:
+        done = time.perf_counter()
+        latency = {'features': fetched - started, 'predict': done - fetched, 'total': done - started}
+    log.record(PredictionRecord(
+        symbol=body['symbol'],
+        created_at=timezone.now(),
+        as_of=as_of,
+        source=source,
+        prediction_code=body['prediction_code'],
+        probabilities=body['confidence_scores'],
+        features=body['features_used'],
+        model_version=body.get('model_info', {}).get('version') or predictor.model_version() or '',
+        latency_ms={k: round(v * 1000, 2) for k, v in latency.items()},
+    ))
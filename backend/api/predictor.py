@@ -0,0 +1,379 @@
+# Everything the prediction views need that is not request handling, shared by the sync (WSGI) and async (ASGI) views:
+# loading the model once per process, getting the live features from Finnhub/AlphaVantage + news store, and predicting
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import joblib
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import attribution, bar_store, model_registry, news_store, daily_sentiment, feature_store, quota, sentiment_state, upstream
+
+logger = logging.getLogger(__name__)
+
+# Path - <project root>/Data Files/Models
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'Data Files', 'Models')
+
+PREDICTION_MAP = {-1: 'SELL', 0: 'HOLD', 1: 'BUY'}
+TOP_CONTRIBUTIONS = 5
+
+# AlphaVantage indicators (latest bar, settings.INDICATOR_INTERVAL). MACD - Used MACDEXT to get around the Alphavantage Free Tier issue
+INDICATOR_REQUESTS = {
+    'macd': ('MACDEXT', dict(interval=settings.INDICATOR_INTERVAL, series_type='close', fastperiod=12, slowperiod=26, signalperiod=9, fastmatype=1, slowmatype=1, signalmatype=1)),
+    'rsi': ('RSI', dict(interval=settings.INDICATOR_INTERVAL, time_period=14, series_type='close')),
+    'bb': ('BBANDS', dict(interval=settings.INDICATOR_INTERVAL, time_period=20, series_type='close')),
+    'obv': ('OBV', dict(interval=settings.INDICATOR_INTERVAL)),
+}
+
+_model = None
+_feature_columns = None
+_model_version = None
+_model_lock = threading.Lock()
+
+
+# Load trained model and feature columns once per process (they used to be loaded on every request)
+def load_model():
+    global _model, _feature_columns, _model_version
+    if _model is not None:
+        return _model, _feature_columns
+    with _model_lock:
+        if _model is None:
+            model_path = os.path.join(MODEL_DIR, 'stock_prediction_model.pkl')
+            features_path = os.path.join(MODEL_DIR, 'feature_columns.pkl')
+            if not os.path.exists(model_path) or not os.path.exists(features_path):
+                #print("Files not found at expected location")
+                return None, None
+            try:
+                _model = joblib.load(model_path)
+                _feature_columns = joblib.load(features_path)
+                metadata = read_metadata()
+                _model_version = read_model_version(model_path, metadata)
+                problems = check_budget(metadata)
+                if problems: # alarm, but still serve it
+                    logger.warning("Model %s is over the serving budget: %s", _model_version, '; '.join(problems))
+            except Exception as e:
+                #print(f"Error loading model: {e}")
+                _model, _feature_columns = None, None
+    return _model, _feature_columns
+
+
+# (model, feature columns, model info) for a symbol: its ticker / sector / global model from the family when one was
+# trained (api/model_registry.py), otherwise the single model. model is None when nothing could be loaded
+def model_for(symbol):
+    registry = model_registry.get_registry()
+    if registry is not None:
+        try:
+            found = registry.model_for(symbol)
+            if found is not None:
+                return found
+        except Exception as e: # missing / broken file: serve the single model rather than fail
+            logger.warning("Family model for %s failed to load: %s", symbol, e)
+    model, feature_columns = load_model()
+    return model, feature_columns, {'model': 'default', 'version': model_version()}
+
+
+def read_metadata():
+    try:
+        with open(os.path.join(MODEL_DIR, 'model_metadata.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# created_date from model_metadata.json (written by train_model.py), otherwise the pkl's mtime
+def read_model_version(model_path, metadata):
+    return metadata.get('created_date') or str(int(os.path.getmtime(model_path)))
+
+
+# MODEL_MAX_* settings vs the inference cost train_model.py measured, list of what is over (empty = fine)
+def check_budget(metadata):
+    cost = metadata.get('inference_cost')
+    if not cost:
+        return []
+    limits = [
+        ('single_row_ms', settings.MODEL_MAX_LATENCY_MS),
+        ('memory_mb', settings.MODEL_MAX_MEMORY_MB),
+        ('pickle_mb', settings.MODEL_MAX_SIZE_MB),
+    ]
+    return [f"{field} {cost[field]:.2f} > {limit}" for field, limit in limits if limit and cost.get(field, 0) > limit]
+
+
+def model_version():
+    load_model()
+    return _model_version
+
+
+def latest_values(indicator_json, key):
+    data = indicator_json.get(key, {}) if indicator_json else {}
+    return next(iter(data.values()), {}) if data else {}
+
+
+# Compose the model features from the raw upstream responses (keys = feature_store.FEATURE_COLUMNS)
+# sentiment = news_sentiment_for's {'news_sentiment': ..., 'news_sentiment_decayed': ...}
+def build_features(quote_data, volume_json, indicator_jsons, sentiment):
+    # Getting OHLC frm Finnhub. AV will get V
+    if quote_json_ok(volume_json):
+        volume = float(volume_json["Global Quote"].get("06. volume", 0))
+    else:
+        volume = 0.0
+
+    latest_macd = latest_values(indicator_jsons.get('macd'), 'Technical Analysis: MACDEXT')
+    latest_rsi = latest_values(indicator_jsons.get('rsi'), 'Technical Analysis: RSI')
+    latest_bb = latest_values(indicator_jsons.get('bb'), 'Technical Analysis: BBANDS')
+    latest_obv = latest_values(indicator_jsons.get('obv'), 'Technical Analysis: OBV')
+
+    bb_bbm = float(latest_bb.get('Real Middle Band', 0))
+    bb_bbh = float(latest_bb.get('Real Upper Band', 0))
+    bb_bbl = float(latest_bb.get('Real Lower Band', 0))
+
+    return {
+        'open': float(quote_data['o']),
+        'high': float(quote_data['h']),
+        'low': float(quote_data['l']),
+        'close': float(quote_data['c']),
+        'volume': volume,
+        'macd': float(latest_macd.get('MACD', 0)),
+        'macd_signal': float(latest_macd.get('MACD_Signal', 0)),
+        'macd_diff': float(latest_macd.get('MACD_Hist', 0)),
+        'rsi': float(latest_rsi.get('RSI', 0)),
+        'bb_bbm': bb_bbm,
+        'bb_bbh': bb_bbh,
+        'bb_bbl': bb_bbl,
+        'bb_bbwidth': float(bb_bbh - bb_bbl) if bb_bbh and bb_bbl else 0,
+        'obv': float(latest_obv.get('OBV', 0)),
+        **sentiment,
+    }
+
+
+def quote_json_ok(quote_json):
+    return bool(quote_json) and "Global Quote" in quote_json
+
+
+def invalid_quote(quote_data):
+    return not quote_data or 'c' not in quote_data or quote_data['c'] == 0
+
+
+def api_keys():
+    return getattr(settings, 'FINNHUB_API_KEY', None), getattr(settings, 'ALPHAVANTAGE_API_KEY', None)
+
+
+# only new articles are fetched + scored (which also updates the daily aggregate and the decayed state)
+# then read today's daily mean and the decayed value as of now, same definitions the model was trained on
+def news_sentiment_for(symbol, finnhub_api_key):
+    news_store.ingest_symbol_news(symbol, finnhub_api_key)
+    return {
+        'news_sentiment': daily_sentiment.sentiment_for_day(symbol, datetime.utcnow().date()),
+        'news_sentiment_decayed': sentiment_state.decayed_sentiment(symbol, timezone.now()),
+    }
+
+
+# quota.acquire costs of one live fetch (the news fetch is throttled on its own, NEWS_REFRESH_SECONDS)
+def quota_costs(client=None):
+    costs = {quota.provider_key('alphavantage'): 1 + len(INDICATOR_REQUESTS), quota.provider_key('finnhub'): 1}
+    if client:
+        costs[client] = 1
+    return costs
+
+
+# Fetch real-time stock data (OCLH) from finnhub, V + technicals from AlphaVantage (V, MACD, RSI, BB, OBV), and news sentiment
+# returns (features, error). Charged against the shared quota first, raises quota.QuotaExceeded (nothing sent) if it's out
+def fetch_features(symbol, client=None, priority=quota.INTERACTIVE):
+    finnhub_api_key, alphavantage_api_key = api_keys()
+    if not finnhub_api_key or not alphavantage_api_key:
+        return None, "API key(s) not configured"
+    quota.acquire(quota_costs(client), priority)
+
+    quote_data, error = upstream.fetch_finnhub_quote(symbol, finnhub_api_key)
+    if error:
+        return None, error
+    if invalid_quote(quote_data):
+        return None, f"Invalid or missing price data from Finnhub: {quote_data}"
+
+    volume_json = upstream.fetch_alpha_vantage_quote(symbol, alphavantage_api_key)
+    indicator_jsons = {
+        name: upstream.fetch_alpha_vantage_indicator(symbol, function, alphavantage_api_key, **params)
+        for name, (function, params) in INDICATOR_REQUESTS.items()
+    }
+    sentiment = news_sentiment_for(symbol, finnhub_api_key)
+    features = build_features(quote_data, volume_json, indicator_jsons, sentiment)
+    store_live(symbol, features, quote_data, volume_json)
+    return features, None
+
+
+# Same as fetch_features but every upstream call goes out at once, so the request waits for the slowest call
+# instead of the sum of all of them. News store is sync (ORM) so it runs in a thread
+async def afetch_features(symbol, client=None, priority=quota.INTERACTIVE):
+    finnhub_api_key, alphavantage_api_key = api_keys()
+    if not finnhub_api_key or not alphavantage_api_key:
+        return None, "API key(s) not configured"
+    await sync_to_async(quota.acquire, thread_sensitive=False)(quota_costs(client), priority)
+
+    async with upstream.async_client() as client:
+        names = list(INDICATOR_REQUESTS)
+        results = await asyncio.gather(
+            upstream.afetch_finnhub_quote(client, symbol, finnhub_api_key),
+            upstream.afetch_alpha_vantage_quote(client, symbol, alphavantage_api_key),
+            sync_to_async(news_sentiment_for, thread_sensitive=False)(symbol, finnhub_api_key),
+            *[
+                upstream.afetch_alpha_vantage_indicator(client, symbol, INDICATOR_REQUESTS[name][0], alphavantage_api_key, **INDICATOR_REQUESTS[name][1])
+                for name in names
+            ],
+        )
+    (quote_data, error), volume_json, sentiment = results[:3]
+    if error:
+        return None, error
+    if invalid_quote(quote_data):
+        return None, f"Invalid or missing price data from Finnhub: {quote_data}"
+    indicator_jsons = dict(zip(names, results[3:]))
+    features = build_features(quote_data, volume_json, indicator_jsons, sentiment)
+    await sync_to_async(store_live, thread_sensitive=False)(symbol, features, quote_data, volume_json)
+    return features, None
+
+
+# today's features + price bar from the live upstream data (both best effort, they log instead of raising)
+def store_live(symbol, features, quote_data, volume_json):
+    feature_store.upsert_live(symbol, datetime.utcnow().date(), features)
+    bar_store.upsert_quote(symbol, quote_data, volume_json)
+
+
+# Features for a past day straight from the feature store (same rows the model was trained on), no upstream calls
+# returns (features, error)
+def stored_features(symbol, day):
+    features = feature_store.get_features(symbol, day)
+    if features is None:
+        return None, f"No stored features for {symbol} on {day.isoformat()}"
+    if any(features[col] is None for col in feature_store.FEATURE_COLUMNS):
+        features = {col: value if value is not None else 0.0 for col, value in features.items()} # same fill as training
+    return features, None
+
+
+# Out of quota: the latest stored features instead (a previous live fetch or the pipeline), if they are at most
+# QUOTA_FALLBACK_MAX_AGE_DAYS old. returns (day, features), (None, None) if there is nothing recent enough
+def fallback_features(symbol):
+    today = datetime.utcnow().date()
+    day, features = feature_store.as_of(symbol, today)
+    if day is None or (today - day).days > settings.QUOTA_FALLBACK_MAX_AGE_DAYS:
+        return None, None
+    return day, {col: value if value is not None else 0.0 for col, value in features.items()} # same fill as training
+
+
+# Per-feature contributions for one row: bias + sum of a class's contributions = its confidence score
+def explanation(model, feature_columns, feature_array, prediction_label):
+    explainer = attribution.explainer_for(model)
+    contributions = explainer.contributions(feature_array)[0]
+    bias = explainer.bias
+    labels = [PREDICTION_MAP[c] for c in model.classes_]
+    predicted = labels.index(prediction_label)
+    top = np.argsort(-np.abs(contributions[:, predicted]))[:TOP_CONTRIBUTIONS]
+    return {
+        'bias': {label: round(float(bias[i]), 5) for i, label in enumerate(labels)},
+        'contributions': {
+            label: {col: round(float(contributions[j, i]), 5) for j, col in enumerate(feature_columns)}
+            for i, label in enumerate(labels)
+        },
+        'top_features': [{'feature': feature_columns[j], 'contribution': round(float(contributions[j, predicted]), 5)} for j in top],
+    }
+
+
+# returns (response body, status code); explain=True adds the per-feature contributions ('explanation')
+# model_info = model_for's, which model answered
+def predict(model, feature_columns, symbol, features, explain=False, model_info=None):
+    # Prepare features for model (ensure all required features are present)
+    missing_features = [col for col in feature_columns if col not in features]
+    if missing_features:
+        return {
+            'error': f'Missing features: {missing_features}',
+            'available_features': list(features.keys()),
+            'required_features': feature_columns
+        }, 500
+
+    # Create feature vector in correct order
+    feature_array = np.array([features[col] for col in feature_columns]).reshape(1, -1)
+
+    # Makes prediction (predict is just the argmax of predict_proba, so only run the forest once)
+    prediction_proba = model.predict_proba(feature_array)[0]
+    classes = model.classes_
+    prediction = classes[int(np.argmax(prediction_proba))]
+    prediction_label = PREDICTION_MAP[prediction]
+
+    # calc confidence/probability score
+    confidence_scores = {
+        PREDICTION_MAP[classes[i]]: float(prediction_proba[i])
+        for i in range(len(classes))
+    }
+
+    body = {
+        'symbol': symbol,
+        'prediction': prediction_label,
+        'prediction_code': int(prediction),
+        'confidence_scores': confidence_scores,
+        'features_used': features,
+        'timestamp': pd.Timestamp.now().isoformat(),
+        'model_info': {
+            'features_count': len(feature_columns),
+            'classes': [PREDICTION_MAP[c] for c in classes],
+            **(model_info or {}),
+        }
+    }
+    if explain:
+        body['explanation'] = explanation(model, feature_columns, feature_array, prediction_label)
+    return body, 200
+
+
+# Signals for every stored day in [from_date, to_date] (default: the last year) with one predict_proba over the
+# whole feature matrix. Columnar so a year is a few small arrays instead of 250 objects.
+# explain=True adds bias + per-day contributions for every class/feature (all rows in one sparse product).
+# Cached per (symbol, model version, range, explain) for PREDICTION_HISTORY_CACHE_SECONDS
+# version = model_for's model_info['version'] (default: the single model's)
+def predict_history(model, feature_columns, symbol, from_date=None, to_date=None, explain=False, version=None):
+    to_date = to_date or datetime.utcnow().date()
+    from_date = from_date or to_date - timedelta(days=365)
+    version = version or model_version()
+    cache_key = f"predict-history:{symbol}:{version}:{from_date.isoformat()}:{to_date.isoformat()}:{int(explain)}"
+    body = cache.get(cache_key)
+    if body is not None:
+        return body
+
+    missing = [col for col in feature_columns if col not in feature_store.FEATURE_COLUMNS]
+    if missing:
+        raise ValueError(f"Feature store has no column for: {missing}")
+    dates, matrix = feature_store.get_range(symbol, from_date, to_date)
+    order = [feature_store.FEATURE_COLUMNS.index(col) for col in feature_columns] # model's column order
+    X = np.nan_to_num(matrix[:, order], nan=0.0) # same fill as training
+    if hasattr(model, 'feature_names_in_'): # model was fitted on a DataFrame, give it the names back (no copy)
+        X = pd.DataFrame(X, columns=feature_columns)
+
+    classes = [int(c) for c in model.classes_]
+    proba = model.predict_proba(X) if len(X) else np.empty((0, len(classes)))
+    codes = np.asarray(classes)[proba.argmax(axis=1)] if len(X) else np.empty(0, dtype=int)
+    body = {
+        'symbol': symbol,
+        'from': from_date.isoformat(),
+        'to': to_date.isoformat(),
+        'model_version': version,
+        'dates': [d.isoformat() for d in dates],
+        'prediction': [PREDICTION_MAP[c] for c in codes.tolist()],
+        'prediction_code': codes.tolist(),
+        'probabilities': {
+            PREDICTION_MAP[c]: np.round(proba[:, i], 4).tolist() for i, c in enumerate(classes)
+        },
+    }
+    if explain:
+        explainer = attribution.explainer_for(model)
+        contributions = explainer.contributions(X) if len(X) else np.empty((0, len(feature_columns), len(classes)))
+        body['bias'] = {PREDICTION_MAP[c]: round(float(explainer.bias[i]), 5) for i, c in enumerate(classes)}
+        body['contributions'] = {
+            PREDICTION_MAP[c]: {col: np.round(contributions[:, j, i], 5).tolist() for j, col in enumerate(feature_columns)}
+            for i, c in enumerate(classes)
+        }
+    cache.set(cache_key, body, settings.PREDICTION_HISTORY_CACHE_SECONDS)
+    return body
@@ -0,0 +1,139 @@
+# Cluster wide upstream quota: token buckets in the QuotaBucket table, so every worker process draws from the same
+# budget per provider key instead of each one guessing on its own (the free AlphaVantage tier is a handful of calls
+# a minute and one live prediction takes five of them).
+# A live prediction asks for everything it needs at once (its client's bucket, alphavantage x5, finnhub x1) and gets
+# all of it or none, so a request that would run dry half way never sends its first call. Each bucket is charged with
+# one conditional UPDATE (refill, check and take in the same statement, like daily_sentiment.add_to_day), so two
+# workers can't both spend the last token. Background callers (/ws/live/ refreshes) have to leave the last
+# QUOTA_BACKGROUND_RESERVE of a provider's bucket to interactive requests. Nothing waits: out of quota raises
+# QuotaExceeded with the seconds until the request would fit, and the views answer from the feature store or 429
+
+import math
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .models import QuotaBucket
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, key, retry_after):
+        super().__init__(f"Upstream quota exhausted ({key}), retry in {retry_after}s")
+        self.key = key
+        self.retry_after = retry_after # whole seconds, for the Retry-After header
+
+
+def provider_key(provider):
+    return f"provider:{provider}"
+
+
+# signed in user, else the client's ip. Behind the host's proxy that is the X-Forwarded-For hop our own proxies
+# added (counted from the end), the leading hops are whatever the client put in the header
+def client_key(user, meta):
+    if user is not None and user.is_authenticated:
+        return f"client:user:{user.pk}"
+    hops = [hop.strip() for hop in meta.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    proxies = settings.TRUSTED_PROXY_COUNT
+    ip = hops[-proxies] if proxies and len(hops) >= proxies else meta.get('REMOTE_ADDR', '')
+    return f"client:ip:{ip}"
+
+
+# async views: request.auser() comes from AuthenticationMiddleware
+async def aclient_key(request):
+    return client_key(await request.auser() if hasattr(request, 'auser') else None, request.META)
+
+
+# key -> (capacity, refill per second, daily cap or None)
+def limits(key):
+    kind, _, name = key.partition(':')
+    if kind == 'client':
+        per_minute = settings.CLIENT_PREDICTIONS_PER_MINUTE
+        return per_minute, per_minute / 60, None
+    per_minute = settings.UPSTREAM_QUOTA_PER_MINUTE[name]
+    return per_minute, per_minute / 60, settings.UPSTREAM_QUOTA_PER_DAY.get(name)
+
+
+def reserve(key, priority):
+    return settings.QUOTA_BACKGROUND_RESERVE * limits(key)[0] if priority == BACKGROUND and key.startswith('provider:') else 0.0
+
+
+# tokens the bucket needs to hold for take(key, n). A background request on a bucket too small for n + the reserve
+# (alphavantage: 5 a minute, 5 per prediction) goes when the bucket is full, which still leaves interactive requests
+# all the tokens that come in while it was filling
+def needed(key, n, priority):
+    return min(n + reserve(key, priority), max(limits(key)[0], n))
+
+
+# tokens in the bucket at `now`, as a db expression
+def refilled(capacity, rate, now):
+    return Least(Value(float(capacity)), F('tokens') + (Value(now) - F('refilled_at')) * Value(rate), output_field=FloatField())
+
+
+# one UPDATE: refill + take n if there are enough (and the day's count allows it). True if taken
+def take(key, n, priority, now, today):
+    capacity, rate, daily = limits(key)
+    tokens = refilled(capacity, rate, now)
+    updates = {'tokens': tokens - Value(float(n)), 'refilled_at': now}
+    condition = Q()
+    if daily is not None:
+        condition = ~Q(day=today) | Q(day_count__lte=daily - n) # a new day starts from 0
+        updates['day'] = today
+        updates['day_count'] = Case(When(day=today, then=F('day_count') + n), default=Value(n))
+    taken = QuotaBucket.objects.filter(
+        condition, GreaterThanOrEqual(tokens, Value(needed(key, n, priority))), key=key,
+    ).update(**updates)
+    return taken == 1
+
+
+# seconds until take() would succeed
+def retry_after(row, key, n, priority, now, today):
+    capacity, rate, daily = limits(key)
+    if daily is not None and row.day == today and row.day_count + n > daily:
+        tomorrow = datetime.combine(today + timedelta(days=1), datetime.min.time(), dt_timezone.utc)
+        return math.ceil(tomorrow.timestamp() - now)
+    tokens = min(capacity, row.tokens + (now - row.refilled_at) * rate)
+    return max(1, math.ceil((needed(key, n, priority) - tokens) / rate))
+
+
+# costs = {bucket key: tokens}. Takes all of them or raises QuotaExceeded and takes none
+def acquire(costs, priority=INTERACTIVE):
+    if not settings.UPSTREAM_QUOTA:
+        return
+    now = time.time()
+    today = datetime.fromtimestamp(now, dt_timezone.utc).date()
+    with transaction.atomic():
+        for key in sorted(costs): # same order in every worker
+            n = costs[key]
+            if take(key, n, priority, now, today):
+                continue
+            row = QuotaBucket.objects.filter(key=key).first()
+            if row is None: # first use of this bucket: starts full
+                QuotaBucket.objects.bulk_create([QuotaBucket(key=key, tokens=limits(key)[0], refilled_at=now, day=today)],
+                                                ignore_conflicts=True)
+                if take(key, n, priority, now, today):
+                    continue
+                row = QuotaBucket.objects.get(key=key)
+            raise QuotaExceeded(key, retry_after(row, key, n, priority, now, today)) # rolls back the keys already taken
+
+
+# provider buckets as of now, for /api/upstream/
+def snapshot():
+    now = time.time()
+    body = {}
+    for row in QuotaBucket.objects.filter(key__startswith='provider:').order_by('key'):
+        capacity, rate, daily = limits(row.key)
+        body[row.key.partition(':')[2]] = {
+            'tokens': round(min(capacity, row.tokens + (now - row.refilled_at) * rate), 2),
+            'capacity': capacity,
+            'today': row.day_count if row.day == datetime.fromtimestamp(now, dt_timezone.utc).date() else 0,
+            'daily_cap': daily,
+        }
+    return body
@@ -0,0 +1,296 @@
+# Sentiment scoring shared by the /api/sentiment/ endpoint and the news store
+# Score is mapped into -1 (negative), 0 (neutral), +1 (positive) weighted by the model probabilities
+#
+# Backends (settings.SENTIMENT_BACKEND):
+#   remote  - HF inference API (mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis), the original behaviour
+#   local   - same kind of model loaded in-process from SENTIMENT_MODEL_DIR, dynamically batched CPU inference
+#   lexicon - tiny word list scorer, no network/model needed (offline tests, dev)
+# scripts/benchmark_sentiment.py reports articles/s + latency for each so we can pick per deployment
+
+import asyncio
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import upstream
+
+try:
+    import httpx # only needed for the async views
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+HF_MODEL_URL = "https://api-inference.huggingface.co/models/mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis"
+
+
+class SentimentError(Exception):
+    # raised when the backend does not give us a usable answer, details is whatever it sent back
+    def __init__(self, message, details=None):
+        super().__init__(message)
+        self.details = details
+
+
+def build_text(headline, summary):
+    return ((headline or '') + ' ' + (summary or '')).strip()
+
+
+# turns the label/score list into the aggregate score + indiv scores
+def aggregate_scores(sentiments):
+    scores = {item['label']: item['score'] for item in sentiments}
+    final_score = (-1 * scores.get('negative', 0)) + (0 * scores.get('neutral', 0)) + (1 * scores.get('positive', 0))
+    return final_score, scores
+
+
+class SentimentBackend:
+    name = 'base'
+
+    # texts -> list of (final_score, scores), same order. Raises SentimentError if the whole batch failed
+    def score_batch(self, texts):
+        raise NotImplementedError
+
+    def score(self, text):
+        return self.score_batch([text])[0]
+
+    # async views: by default run the sync scorer in a thread so the event loop is not blocked
+    async def ascore_batch(self, texts):
+        return await asyncio.to_thread(self.score_batch, texts)
+
+    async def ascore(self, text):
+        return (await self.ascore_batch([text]))[0]
+
+
+class RemoteHFBackend(SentimentBackend):
+    name = 'remote'
+
+    def __init__(self, api_token, url=HF_MODEL_URL):
+        self.api_token = api_token
+        self.url = url
+
+    def request_args(self, texts):
+        headers = {
+            "Authorization": f"Bearer {self.api_token}"
+        }
+        # HF takes a list of inputs and gives back one label/score list per input
+        return dict(headers=headers, json={"inputs": texts if len(texts) > 1 else texts[0]})
+
+    def parse_response(self, status_code, body_text, body_json):
+        if status_code != 200:
+            raise SentimentError('Hugging Face API error', body_text)
+        return [aggregate_scores(sentiments) for sentiments in body_json()]
+
+    def score_batch(self, texts):
+        args = self.request_args(texts)
+        response = upstream.call('hf', 'inference', lambda timeout: requests.post(self.url, timeout=timeout, **args), upstream.HF_TIMEOUT)
+        return self.parse_response(response.status_code, response.text, response.json)
+
+    # non-blocking version for the ASGI views
+    async def ascore_batch(self, texts):
+        if httpx is None:
+            return await super().ascore_batch(texts)
+        args = self.request_args(texts)
+        async with httpx.AsyncClient() as client:
+            response = await upstream.acall('hf', 'inference', lambda timeout: client.post(self.url, timeout=timeout, **args), upstream.HF_TIMEOUT)
+        return self.parse_response(response.status_code, response.text, response.json)
+
+
+# Collects single requests from many threads into batches (up to max_batch_size, or whatever arrived within max_wait_ms)
+# and runs them on a bounded pool. Each batch is sorted by length and cut into groups so short texts are not
+# padded up to the longest one in the batch (max_batch_tokens = longest text in group x group size)
+class DynamicBatcher:
+    def __init__(self, run_batch, length_fn, max_batch_size=32, max_wait_ms=10, max_batch_tokens=8192, workers=2):
+        self.run_batch = run_batch
+        self.length_fn = length_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_tokens = max_batch_tokens
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sentiment')
+        self.requests = queue.Queue()
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name='sentiment-batcher', daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, texts):
+        futures = []
+        for text in texts:
+            future = Future()
+            self.requests.put((text, future))
+            futures.append(future)
+        return [f.result() for f in futures]
+
+    # padding-aware grouping: sort by length, then cut whenever adding the next text would blow the token budget
+    def plan_groups(self, items):
+        items = sorted(items, key=lambda item: item[2])
+        groups, current = [], []
+        for item in items:
+            longest = max(item[2], current[-1][2] if current else 0)
+            if current and (len(current) + 1) * longest > self.max_batch_tokens:
+                groups.append(current)
+                current = []
+            current.append(item)
+        if current:
+            groups.append(current)
+        return groups
+
+    def _dispatch_loop(self):
+        while True:
+            batch = [self.requests.get()] # block until there is at least one
+            try:
+                while len(batch) < self.max_batch_size:
+                    batch.append(self.requests.get(timeout=self.max_wait))
+            except queue.Empty:
+                pass
+            try:
+                lengths = self.length_fn([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            items = [(text, future, length) for (text, future), length in zip(batch, lengths)]
+            for group in self.plan_groups(items):
+                self.pool.submit(self._run_group, group)
+
+    def _run_group(self, group):
+        try:
+            results = self.run_batch([text for text, _, _ in group])
+            for (_, future, _), result in zip(group, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future, _ in group:
+                future.set_exception(e)
+
+
+class LocalModelBackend(SentimentBackend):
+    name = 'local'
+
+    def __init__(self, model_dir, max_batch_size=32, max_wait_ms=10, workers=2, max_length=256):
+        try:
+            import torch
+            from transformers import AutoModelForSequenceClassification, AutoTokenizer
+        except ImportError:
+            raise ImproperlyConfigured("SENTIMENT_BACKEND='local' needs torch + transformers installed")
+        if not model_dir:
+            raise ImproperlyConfigured("SENTIMENT_BACKEND='local' needs SENTIMENT_MODEL_DIR")
+
+        self.torch = torch
+        torch.set_num_threads(max(1, (torch.get_num_threads() or 1) // workers)) # share the cores between the pool threads
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_dir).eval()
+        self.labels = [self.model.config.id2label[i].lower() for i in range(self.model.config.num_labels)]
+        self.max_length = max_length
+        self.batcher = DynamicBatcher(
+            self._infer, self._token_lengths,
+            max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+            max_batch_tokens=max_batch_size * max_length // 2, workers=workers,
+        )
+
+    def _token_lengths(self, texts):
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def _infer(self, texts):
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='pt')
+        with self.torch.inference_mode():
+            probs = self.torch.softmax(self.model(**encoded).logits, dim=-1).numpy()
+        return [
+            aggregate_scores([{'label': label, 'score': float(p)} for label, p in zip(self.labels, row)])
+            for row in probs
+        ]
+
+    def score_batch(self, texts):
+        try:
+            return self.batcher.submit(texts)
+        except Exception as e:
+            raise SentimentError('Local sentiment model error', str(e))
+
+
+class LexiconBackend(SentimentBackend):
+    name = 'lexicon'
+
+    POSITIVE = {
+        'beat', 'beats', 'gain', 'gains', 'growth', 'surge', 'surges', 'rally', 'rallies', 'record', 'profit',
+        'strong', 'upgrade', 'upgraded', 'outperform', 'rise', 'rises', 'jump', 'jumps', 'bullish', 'higher',
+    }
+    NEGATIVE = {
+        'miss', 'misses', 'loss', 'losses', 'decline', 'declines', 'drop', 'drops', 'fall', 'falls', 'plunge',
+        'weak', 'downgrade', 'downgraded', 'lawsuit', 'cut', 'cuts', 'bearish', 'lower', 'recall', 'probe',
+    }
+
+    def score_batch(self, texts):
+        results = []
+        for text in texts:
+            words = re.findall(r"[a-z]+", text.lower())
+            pos = sum(w in self.POSITIVE for w in words)
+            neg = sum(w in self.NEGATIVE for w in words)
+            hits = pos + neg
+            # every word that is not a hit counts a little towards neutral, so one hit in a long text stays mild
+            total = hits + 0.1 * (len(words) - hits) + 1
+            scores = {'positive': pos / total, 'negative': neg / total, 'neutral': 1 - hits / total}
+            results.append(aggregate_scores([{'label': k, 'score': v} for k, v in scores.items()]))
+        return results
+
+
+def create_backend(name):
+    if name == 'remote':
+        return RemoteHFBackend(settings.HF_API_TOKEN, settings.HF_SENTIMENT_URL)
+    if name == 'local':
+        return LocalModelBackend(
+            settings.SENTIMENT_MODEL_DIR,
+            max_batch_size=settings.SENTIMENT_MAX_BATCH,
+            max_wait_ms=settings.SENTIMENT_MAX_WAIT_MS,
+            workers=settings.SENTIMENT_WORKERS,
+        )
+    if name == 'lexicon':
+        return LexiconBackend()
+    raise ImproperlyConfigured(f"Unknown SENTIMENT_BACKEND: {name}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+# one backend per process (the local model is only loaded once)
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(getattr(settings, 'SENTIMENT_BACKEND', 'remote'))
+    return _backend
+
+
+def score_sentiment(headline, summary=''):
+    text = build_text(headline, summary)
+    if not text:
+        raise SentimentError('No text provided.')
+    return get_backend().score(text)
+
+
+async def ascore_sentiment(headline, summary=''):
+    text = build_text(headline, summary)
+    if not text:
+        raise SentimentError('No text provided.')
+    return await get_backend().ascore(text)
+
+
+# (headline, summary) pairs -> list of (final_score, scores), (None, {}) for anything that could not be scored
+def score_many(pairs):
+    texts = [build_text(headline, summary) for headline, summary in pairs]
+    to_score = [i for i, text in enumerate(texts) if text]
+    results = [(None, {})] * len(texts)
+    if not to_score:
+        return results
+    try:
+        scored = get_backend().score_batch([texts[i] for i in to_score])
+    except Exception as e:
+        # leave them unscored (None) rather than pretending they are neutral
+        logger.warning("Sentiment scoring failed for %d articles: %s", len(to_score), e)
+        return results
+    for i, result in zip(to_score, scored):
+        results[i] = result
+    return results
@@ -0,0 +1,76 @@
+# Maintains the SentimentState table: one row per ticker holding the time-decayed sentiment state
+# (scripts/sentiment_decay.py). daily_sentiment.record_scores feeds every newly scored article in here, so a read is
+# one row + one formula, never a pass over the articles
+
+from django.db import IntegrityError, transaction
+
+from scripts import sentiment_decay
+
+from .models import NewsArticle, SentimentState
+
+
+def as_tuple(row):
+    return (row.total, row.weight, sentiment_decay.epoch(row.last_at) if row.last_at else None)
+
+
+def store(row, state):
+    row.total, row.weight, last = state
+    row.last_at = sentiment_decay.to_datetime(last)
+    row.half_life_hours = sentiment_decay.HALF_LIFE_HOURS
+    row.save()
+
+
+# the state from every scored article of a ticker in the news store
+def replay(symbol):
+    state = sentiment_decay.EMPTY
+    scored = (NewsArticle.objects.filter(symbol=symbol, sentiment_score__isnull=False)
+              .order_by('published_at').values_list('published_at', 'sentiment_score'))
+    for published_at, score in scored.iterator():
+        state = sentiment_decay.update(state, score, published_at)
+    return state
+
+
+# row locked for the rest of the transaction, so concurrent workers apply their articles one after the other
+def locked_row(symbol):
+    row = SentimentState.objects.select_for_update().filter(symbol=symbol).first()
+    if row is None:
+        row = SentimentState.objects.create(symbol=symbol, half_life_hours=sentiment_decay.HALF_LIFE_HOURS)
+    return row
+
+
+# scored = list of (published_at, score), already saved on their articles. O(1) per article
+def add_scores(symbol, scored):
+    symbol = symbol.upper()
+    try:
+        with transaction.atomic():
+            row = locked_row(symbol)
+            if row.half_life_hours != sentiment_decay.HALF_LIFE_HOURS:
+                store(row, replay(symbol)) # decayed with another half-life, the replay includes the new articles
+                return
+            state = as_tuple(row)
+            for published_at, score in sorted(scored, key=lambda item: item[0]):
+                state = sentiment_decay.update(state, score, published_at)
+            store(row, state)
+    except IntegrityError: # another worker created the row first
+        add_scores(symbol, scored)
+
+
+# state recomputed from the news store (the offline pipeline does this per ticker, which also fills in the articles
+# scored before this table existed)
+def rebuild(symbol):
+    symbol = symbol.upper()
+    try:
+        with transaction.atomic():
+            store(locked_row(symbol), replay(symbol))
+    except IntegrityError:
+        rebuild(symbol)
+
+
+# decayed sentiment now (or at `at`), 0 without any scored news
+def decayed_sentiment(symbol, at):
+    row = SentimentState.objects.filter(symbol=symbol.upper()).first()
+    if row is None:
+        return 0.0
+    if row.half_life_hours != sentiment_decay.HALF_LIFE_HOURS: # until the next add_scores / rebuild fixes the row
+        return sentiment_decay.value(replay(symbol.upper()), at)
+    return sentiment_decay.value(as_tuple(row), at)
@@ -1,3 +1,1135 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import asyncio
+import threading
+
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+from django.utils import timezone
+
+from . import async_views, attribution, bar_store, dataset, drift, model_registry, live, prediction_log, chart, upstream, news_store, daily_sentiment, feature_store, predictor, quota, sentiment, sentiment_state
+from scripts import sentiment_decay
+from scripts.consolidate_data_with_sentiment import decayed_sentiment_at
+from scripts.create_target_labels import create_target_labels
+from scripts.model_family import train_family
+from .models import NewsArticle, NewsCursor, DailySentiment, SentimentState, FeatureRow, DailyBar, PredictionRecord, QuotaBucket
+
+
+# predictions made by the tests queue up here (no flusher thread, no flush at exit into the real db)
+def setUpModule():
+    global _prediction_log
+    _prediction_log = prediction_log.log
+    prediction_log.log = prediction_log.PredictionLog(1000, 100, 1, start=False)
+
+
+def tearDownModule():
+    prediction_log.log = _prediction_log
+
+
+def mock_article(article_id, hours_ago, url=None, headline="Stock rallies"):
+    return {
+        "id": article_id,
+        "datetime": int((timezone.now() - timedelta(hours=hours_ago)).timestamp()),
+        "headline": headline,
+        "summary": "Some summary",
+        "url": url or f"https://example.com/{article_id}",
+        "source": "Test",
+        "image": "",
+        "category": "company",
+    }
+
+
+class NewsStoreTests(TestCase):
+    def setUp(self):
+        self.scored = []
+        score_patch = mock.patch.object(news_store, 'score_many', side_effect=self.fake_score_many)
+        score_patch.start()
+        self.addCleanup(score_patch.stop)
+
+    def fake_score_many(self, pairs):
+        self.scored.extend(pairs)
+        return [(0.5, {'positive': 0.5})] * len(pairs)
+
+    def test_ingest_dedupes_and_scores_once(self):
+        articles = [mock_article(1, 2), mock_article(2, 3), mock_article(2, 3), mock_article(3, 30)] # dup id 2, id 3 too old
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=articles):
+            added = news_store.ingest_symbol_news('aapl', 'key')
+        self.assertEqual(added, 2)
+        self.assertEqual(len(self.scored), 2)
+
+        # second ingest straight after is skipped (cursor was refreshed recently)
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=articles) as fetch:
+            self.assertEqual(news_store.ingest_symbol_news('AAPL', 'key'), 0)
+            fetch.assert_not_called()
+
+        # forced ingest gets the same articles back + 1 new one, only the new one is stored and scored
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=articles + [mock_article(4, 1)]):
+            self.assertEqual(news_store.ingest_symbol_news('AAPL', 'key', force=True), 1)
+        self.assertEqual(len(self.scored), 3)
+        self.assertEqual(NewsArticle.objects.filter(symbol='AAPL').count(), 3)
+        self.assertEqual(NewsCursor.objects.get(feed='AAPL').last_finnhub_id, 4)
+
+    def test_concurrent_ingest_counts_articles_once(self):
+        def score_while_another_worker_ingests(pairs):
+            if not self.scored: # the other worker gets the same batch past the dedupe and stores it first
+                self.scored.extend(pairs)
+                news_store.ingest_symbol_news('AMD', 'key', force=True)
+            return [(0.5, {})] * len(pairs)
+
+        with mock.patch.object(news_store, 'score_many', side_effect=score_while_another_worker_ingests), \
+                mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 2), mock_article(2, 3)]):
+            self.assertEqual(news_store.ingest_symbol_news('AMD', 'key'), 0)
+        self.assertEqual(NewsArticle.objects.filter(symbol='AMD').count(), 2)
+        self.assertEqual(DailySentiment.objects.get(symbol='AMD').article_count, 2)
+        row = SentimentState.objects.get(symbol='AMD')
+        self.assertAlmostEqual(row.weight, sentiment_state.replay('AMD')[1])
+
+    def test_rescoring_twice_counts_once(self):
+        with mock.patch.object(news_store, 'score_many', return_value=[(None, {})] * 2), \
+                mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 2), mock_article(2, 3)]):
+            news_store.ingest_symbol_news('AMD', 'key')
+        NewsArticle.objects.update(scored_at=timezone.now() - timedelta(hours=1)) # past the retry cooldown
+        first, second = list(NewsArticle.objects.filter(symbol='AMD')), list(NewsArticle.objects.filter(symbol='AMD'))
+        self.assertEqual(news_store.score_unscored(first), 2)
+        self.assertEqual(news_store.score_unscored(second), 0) # two page views loaded them before either saved
+        self.assertEqual(DailySentiment.objects.get(symbol='AMD').article_count, 2)
+
+    def test_recent_sentiment_window(self):
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 2), mock_article(2, 20)]):
+            news_store.ingest_symbol_news('MSFT', 'key')
+        NewsArticle.objects.filter(finnhub_id=2).update(sentiment_score=-1.0)
+        self.assertEqual(news_store.recent_articles('MSFT', hours=12).count(), 1)
+        self.assertAlmostEqual(news_store.recent_sentiment('MSFT', hours=12), 0.5)
+        self.assertAlmostEqual(news_store.recent_sentiment('MSFT', hours=24), -0.25)
+        self.assertEqual(news_store.recent_sentiment('TSLA'), 0.0) # no news => 0
+
+    def test_general_feed_uses_min_id_cursor(self):
+        with mock.patch.object(news_store, 'fetch_general_news', return_value=[mock_article(10, 1), mock_article(11, 1)]):
+            news_store.ingest_general_news('key')
+        with mock.patch.object(news_store, 'fetch_general_news', return_value=[]) as fetch:
+            news_store.ingest_general_news('key', force=True)
+            fetch.assert_called_once_with('key', 11)
+        self.assertEqual(news_store.recent_articles('', hours=12).count(), 2)
+
+    @override_settings(FINNHUB_API_KEY='key')
+    def test_news_endpoint_adjusts_window(self):
+        busy = [mock_article(i, 1 + i % 4) for i in range(12)] + [mock_article(100, 8)]
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=busy) as fetch:
+            body = self.client.get(reverse('news'), {'symbol': 'aapl'}).json()
+            self.client.get(reverse('news'), {'symbol': 'AAPL'}) # cursor is fresh, no second Finnhub call
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(body['hours'], 6)
+        self.assertEqual(len(body['articles']), 12)
+        self.assertTrue(all(a['sentiment_score'] == 0.5 for a in body['articles']))
+
+        with mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 20)]):
+            body = self.client.get(reverse('news'), {'symbol': 'TSLA'}).json()
+        self.assertEqual((body['hours'], len(body['articles'])), (24, 1))
+        self.assertEqual(self.client.get(reverse('news'), {'symbol': 'TSLA', 'hours': 'x'}).status_code, 400)
+
+    def test_news_endpoint_rescores_failed_articles(self):
+        with mock.patch.object(news_store, 'score_many', return_value=[(None, {})]), \
+                mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 2)]):
+            news_store.ingest_symbol_news('NVDA', 'key')
+        self.assertIsNone(NewsArticle.objects.get(symbol='NVDA').sentiment_score)
+        scored = len(self.scored)
+        body = self.client.get(reverse('news'), {'symbol': 'NVDA', 'adjust': '0'}).json() # just failed: not retried yet
+        self.assertIsNone(body['articles'][0]['sentiment_score'])
+        self.assertEqual(len(self.scored), scored)
+
+        NewsArticle.objects.update(scored_at=timezone.now() - timedelta(seconds=301))
+        with mock.patch.object(news_store, 'score_many', return_value=[(None, {})]) as down:
+            self.client.get(reverse('news'), {'symbol': 'NVDA', 'adjust': '0'})
+            self.client.get(reverse('news'), {'symbol': 'NVDA', 'adjust': '0'})
+        self.assertEqual(down.call_count, 1) # one retry per cooldown, however many page views
+
+        NewsArticle.objects.update(scored_at=timezone.now() - timedelta(seconds=301))
+        body = self.client.get(reverse('news'), {'symbol': 'NVDA', 'adjust': '0'}).json()
+        self.assertEqual(body['articles'][0]['sentiment_score'], 0.5)
+        self.assertEqual(NewsArticle.objects.get(symbol='NVDA').sentiment_score, 0.5)
+        self.assertEqual(DailySentiment.objects.get(symbol='NVDA').article_count, 1)
+
+    @override_settings(FINNHUB_API_KEY='key')
+    def test_general_news_endpoint(self):
+        with mock.patch.object(news_store, 'fetch_general_news', return_value=[mock_article(i, i) for i in range(1, 20)]):
+            body = self.client.get(reverse('general_news')).json()
+        self.assertEqual(len(body['articles']), 12)
+        self.assertEqual(body['articles'][0]['id'], 1) # newest first
+
+
+class DailySentimentTests(TestCase):
+    def test_running_sum_and_count(self):
+        day = timezone.now().replace(hour=10)
+        daily_sentiment.record_scores('AAPL', [(day, 0.5), (day, -0.1), (day, None)])
+        daily_sentiment.record_scores('AAPL', [(day, 0.2)])
+        row = DailySentiment.objects.get(symbol='AAPL')
+        self.assertEqual(row.article_count, 3)
+        self.assertAlmostEqual(row.mean, 0.2)
+        self.assertAlmostEqual(daily_sentiment.sentiment_for_day('aapl', day.date()), 0.2)
+        self.assertEqual(daily_sentiment.sentiment_for_day('AAPL', (day - timedelta(days=1)).date()), 0.0)
+
+    def test_ingest_updates_aggregate(self):
+        with mock.patch.object(news_store, 'score_many', side_effect=lambda pairs: [(0.4, {})] * len(pairs)), \
+                mock.patch.object(news_store, 'fetch_company_news', return_value=[mock_article(1, 0), mock_article(2, 0)]):
+            news_store.ingest_symbol_news('NVDA', 'key')
+        self.assertEqual(DailySentiment.objects.get(symbol='NVDA').article_count, 2)
+
+    def test_daily_endpoint(self):
+        today = timezone.now().date()
+        daily_sentiment.add_to_day('KO', today - timedelta(days=2), 1.0, 2)
+        daily_sentiment.add_to_day('KO', today, -0.3, 1)
+        resp = self.client.get(reverse('daily_sentiment'), {'symbol': 'ko', 'from': (today - timedelta(days=1)).isoformat()})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['days'], [{'date': today.isoformat(), 'mean': -0.3, 'article_count': 1}])
+        self.assertEqual(self.client.get(reverse('daily_sentiment'), {'symbol': 'KO', 'to': 'bad'}).status_code, 400)
+
+
+class SentimentStateTests(TestCase):
+    start = datetime(2025, 1, 6, 15, tzinfo=dt_timezone.utc) # 10:00 in New York
+
+    def score(self, symbol, scored):
+        for i, (at, value) in enumerate(scored):
+            NewsArticle.objects.create(symbol=symbol, url=f"https://example.com/{symbol}/{at.timestamp()}/{i}", published_at=at, sentiment_score=value)
+        daily_sentiment.record_scores(symbol, scored)
+
+    def test_incremental_state_matches_replay(self):
+        first = [(self.start + timedelta(hours=h), v) for h, v in [(0, 0.6), (3, -0.2), (20, 0.4)]]
+        late = [(self.start + timedelta(hours=1), 0.9)] # scored after newer articles (retry batch)
+        self.score('AAPL', first)
+        self.score('AAPL', late)
+        row = SentimentState.objects.get(symbol='AAPL')
+        self.assertEqual(row.last_at, self.start + timedelta(hours=20))
+
+        read_at = self.start + timedelta(days=2)
+        expected = sentiment_decay.values_at(sorted(first + late), [read_at])[0]
+        self.assertAlmostEqual(sentiment_state.decayed_sentiment('aapl', read_at), expected)
+        sentiment_state.rebuild('AAPL')
+        self.assertAlmostEqual(sentiment_state.decayed_sentiment('AAPL', read_at), expected)
+        self.assertEqual(sentiment_state.decayed_sentiment('TSLA', read_at), 0.0)
+
+    def test_half_life_change_rebuilds(self):
+        self.score('MSFT', [(self.start, 1.0)])
+        with mock.patch.object(sentiment_decay, 'HALF_LIFE_HOURS', 6.0):
+            self.assertAlmostEqual(sentiment_state.decayed_sentiment('MSFT', self.start + timedelta(hours=6)), 0.5)
+            self.score('MSFT', [(self.start + timedelta(hours=6), 0.0)])
+            self.assertEqual(SentimentState.objects.get(symbol='MSFT').half_life_hours, 6.0)
+
+    def test_training_rows_match_live_reads(self):
+        self.score('NVDA', [(self.start, 0.8), (self.start + timedelta(hours=7), -0.5)]) # 2nd one after the close
+        dates = pd.Series(['06/01/2025 16:00:00', '07/01/2025 16:00:00'])
+        offline = decayed_sentiment_at('NVDA', dates)
+
+        live_state = sentiment_decay.update(sentiment_decay.EMPTY, 0.8, self.start)
+        close = datetime(2025, 1, 6, 21, tzinfo=dt_timezone.utc) # 16:00 in New York
+        self.assertAlmostEqual(offline[0], sentiment_decay.value(live_state, close))
+        self.assertAlmostEqual(offline[1], sentiment_state.decayed_sentiment('NVDA', close + timedelta(days=1)))
+
+
+class SentimentBackendTests(TestCase):
+    def test_lexicon_backend(self):
+        backend = sentiment.LexiconBackend()
+        (pos, pos_details), (neg, _), (neutral, _) = backend.score_batch([
+            "Apple beats estimates, shares surge", "Tesla shares drop after recall", "Company holds annual meeting"])
+        self.assertGreater(pos, 0)
+        self.assertLess(neg, 0)
+        self.assertEqual(neutral, 0)
+        self.assertAlmostEqual(sum(pos_details.values()), 1.0)
+
+    @override_settings(SENTIMENT_BACKEND='lexicon')
+    def test_score_many_skips_empty(self):
+        with mock.patch.object(sentiment, '_backend', None):
+            results = sentiment.score_many([("Shares surge", ""), ("", "")])
+        self.assertGreater(results[0][0], 0)
+        self.assertEqual(results[1], (None, {}))
+
+    @override_settings(SENTIMENT_BACKEND='lexicon', SENTIMENT_MAX_BATCH_REQUEST=3)
+    def test_batch_view(self):
+        url = reverse('sentiment_batch')
+        with mock.patch.object(sentiment, '_backend', None):
+            resp = self.client.post(url, {'articles': [
+                {'headline': 'Shares surge', 'summary': ''}, {'headline': '', 'summary': ''}]}, content_type='application/json')
+            self.assertEqual(resp.status_code, 200)
+            results = resp.json()['results']
+            self.assertGreater(results[0]['final_sentiment_score'], 0)
+            self.assertIsNone(results[1]['final_sentiment_score'])
+            self.assertEqual(self.client.post(url, {'articles': [{}] * 4}, content_type='application/json').status_code, 400)
+            self.assertEqual(self.client.post(url, {'articles': []}, content_type='application/json').status_code, 400)
+            for bad in [['Shares surge'], [{'headline': 'ok'}, 7], [None], [{'headline': 12}]]:
+                self.assertEqual(self.client.post(url, {'articles': bad}, content_type='application/json').status_code, 400)
+            with mock.patch.object(sentiment.LexiconBackend, 'score_batch', side_effect=RuntimeError('down')):
+                resp = self.client.post(url, {'articles': [{'headline': 'Shares surge'}]}, content_type='application/json')
+            self.assertEqual(resp.status_code, 503)
+
+    def test_dynamic_batcher_groups_by_length(self):
+        batches = []
+        batcher = sentiment.DynamicBatcher(
+            lambda texts: batches.append(texts) or [(len(t), {}) for t in texts],
+            lambda texts: [len(t) for t in texts],
+            max_batch_size=8, max_wait_ms=50, max_batch_tokens=40, workers=2,
+        )
+        texts = ["a" * 2, "b" * 30, "c" * 3, "d" * 4]
+        results = []
+        threads = [threading.Thread(target=lambda t=t: results.append(batcher.submit([t]))) for t in texts]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(sorted(r[0][0] for r in results), [2, 3, 4, 30])
+        # the 30 char text never gets padded together with the short ones
+        self.assertTrue(all(len(b) == 1 for b in batches if any(len(t) == 30 for t in b)))
+
+
+class AsyncViewTests(TestCase):
+    factory = AsyncRequestFactory()
+
+    def post(self, view, data):
+        request = self.factory.post('/', data=json.dumps(data), content_type='application/json')
+        response = async_to_sync(view)(request)
+        return response.status_code, json.loads(response.content)
+
+    @override_settings(SENTIMENT_BACKEND='lexicon')
+    def test_async_sentiment(self):
+        with mock.patch.object(sentiment, '_backend', None):
+            status_code, body = self.post(async_views.sentiment_analysis, {'headline': 'Shares surge', 'summary': ''})
+        self.assertEqual(status_code, 200)
+        self.assertGreater(body['final_sentiment_score'], 0)
+        self.assertEqual(self.post(async_views.sentiment_analysis, {'headline': ''})[0], 400)
+
+    def test_async_views_reject_non_objects_and_non_text(self):
+        for view in (async_views.sentiment_analysis, async_views.stock_prediction):
+            for body in ([], 'x', 1, None):
+                self.assertEqual(self.post(view, body)[0], 400)
+        self.assertEqual(self.post(async_views.sentiment_analysis, {'headline': 5, 'summary': 'up'})[0], 400)
+        self.assertEqual(self.post(async_views.sentiment_analysis, {'headline': 'Up', 'summary': ['x']})[0], 400)
+        self.assertEqual(self.post(async_views.stock_prediction, {'symbol': 123})[0], 400)
+
+    def test_async_prediction_matches_sync_shape(self):
+        features = {col: 1.0 for col in predictor.load_model()[1]}
+
+        threads = {}
+        predict = predictor.predict
+
+        async def fake_fetch(symbol, client=None, priority=None):
+            threads['loop'] = threading.current_thread()
+            return features, None
+
+        def recording_predict(*args, **kwargs):
+            threads['predict'] = threading.current_thread()
+            return predict(*args, **kwargs)
+
+        with mock.patch.object(predictor, 'afetch_features', fake_fetch), mock.patch.object(predictor, 'predict', recording_predict):
+            status_code, body = self.post(async_views.stock_prediction, {'symbol': 'aapl'})
+        self.assertIsNot(threads['predict'], threads['loop']) # the forest runs off the event loop
+        self.assertEqual(status_code, 200)
+        self.assertEqual(body['symbol'], 'AAPL')
+        self.assertIn(body['prediction'], ['SELL', 'HOLD', 'BUY'])
+        self.assertAlmostEqual(sum(body['confidence_scores'].values()), 1.0)
+
+
+class LiveHubTests(TestCase):
+    def make_hub(self):
+        calls = []
+
+        async def fake_refresh(symbol, state):
+            calls.append(symbol)
+            return [{'type': 'prediction', 'symbol': symbol, 'data': {'n': len(calls)}}]
+
+        return live.Hub(refresh=fake_refresh, interval=60), calls
+
+    def test_one_refresh_per_symbol_fanned_out(self):
+        async def scenario():
+            hub, calls = self.make_hub()
+            a, b, c = live.Subscriber(), live.Subscriber(), live.Subscriber()
+            hub.subscribe(a, 'AAPL')
+            hub.subscribe(b, 'AAPL')
+            await asyncio.sleep(0.01)
+            hub.subscribe(c, 'AAPL') # late joiner gets the latest update replayed
+            self.assertEqual(calls, ['AAPL'])
+            texts = [s.queue.get_nowait() for s in (a, b, c)]
+            self.assertTrue(texts[0] is texts[1] is texts[2]) # serialized once
+            self.assertEqual(json.loads(texts[0])['data'], {'n': 1})
+
+            for s in (a, b, c):
+                hub.leave(s)
+            await asyncio.sleep(0)
+            self.assertEqual((hub.tasks, hub.topics), ({}, {}))
+
+        async_to_sync(scenario)()
+
+    def test_refresh_only_pushes_changes(self):
+        features = {col: 1.0 for col in predictor.load_model()[1]}
+
+        async def fake_fetch(symbol, client=None, priority=None):
+            return features, None
+
+        async def scenario():
+            state = {}
+            with mock.patch.object(predictor, 'afetch_features', fake_fetch):
+                first = await live.refresh_symbol('AAPL', state)
+                second = await live.refresh_symbol('AAPL', state)
+            return first, second
+
+        first, second = async_to_sync(scenario)()
+        self.assertEqual([m['type'] for m in first], ['news', 'prediction'])
+        self.assertEqual(first[1]['data']['symbol'], 'AAPL')
+        self.assertEqual(second, []) # nothing changed
+
+    def test_slow_subscriber_drops_oldest(self):
+        subscriber = live.Subscriber()
+        for i in range(subscriber.queue.maxsize + 2):
+            subscriber.push(str(i))
+        self.assertEqual(subscriber.dropped, 2)
+        self.assertEqual(subscriber.queue.get_nowait(), '2')
+
+    def test_websocket_protocol(self):
+        async def scenario():
+            hub, calls = self.make_hub()
+            inbox, sent = asyncio.Queue(), []
+
+            async def send(message):
+                sent.append(message)
+
+            for event in [
+                {'type': 'websocket.connect'},
+                {'type': 'websocket.receive', 'text': 'nope'},
+                {'type': 'websocket.receive', 'text': json.dumps({'action': 'subscribe', 'symbols': ['aapl']})},
+            ]:
+                inbox.put_nowait(event)
+            task = asyncio.create_task(live.websocket_app({'type': 'websocket', 'path': '/ws/live/'}, inbox.get, send, hub=hub))
+            await asyncio.sleep(0.05)
+            inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+            await task
+            self.assertEqual(sent[0]['type'], 'websocket.accept')
+            types = [json.loads(m['text'])['type'] for m in sent[1:]]
+            self.assertEqual(types, ['error', 'subscribed', 'prediction'])
+            self.assertEqual(hub.topics, {})
+
+        async_to_sync(scenario)()
+
+
+    @override_settings(LIVE_MAX_CONNECTIONS_PER_CLIENT=2, LIVE_MAX_TOPICS=2, ALLOWED_HOSTS=['api.example.com'],
+                       LIVE_ALLOWED_ORIGINS=['https://app.example.com'])
+    def test_websocket_rejects_foreign_origins_floods_and_bad_symbols(self):
+        async def scenario():
+            hub, calls = self.make_hub()
+
+            async def connect(origin=None, ip='1.1.1.1', messages=()):
+                inbox, sent = asyncio.Queue(), []
+
+                async def send(message):
+                    sent.append(message)
+
+                inbox.put_nowait({'type': 'websocket.connect'})
+                for message in messages:
+                    inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps(message)})
+                headers = [(b'origin', origin.encode())] if origin else []
+                scope = {'type': 'websocket', 'path': '/ws/live/', 'headers': headers, 'client': (ip, 1234)}
+                task = asyncio.create_task(live.websocket_app(scope, inbox.get, send, hub=hub))
+                await asyncio.sleep(0.02)
+                return inbox, task, sent
+
+            _, task, sent = await connect('https://evil.example.net')
+            await task
+            self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+            sockets = [await connect('https://app.example.com'), await connect('https://api.example.com')]
+            _, task, sent = await connect() # third from the same ip
+            await task
+            self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4429}])
+            self.assertEqual(hub.connections['client:ip:1.1.1.1'], 2)
+
+            inbox, task, sent = await connect(ip='2.2.2.2', messages=[
+                {'action': 'subscribe', 'symbols': ['x' * 40]},
+                {'action': 'subscribe', 'symbols': ['AAPL', 'MSFT', 'NVDA']}, # one more loop than the worker allows
+                {'action': 'subscribe', 'symbols': ['brk.b', 'MSFT']},
+            ])
+            errors = [json.loads(m['text']) for m in sent[1:] if json.loads(m['text'])['type'] == 'error']
+            self.assertEqual(len(errors), 2)
+            self.assertIn('Not a ticker symbol', errors[0]['error'])
+            self.assertEqual(set(hub.topics), {'BRK.B', 'MSFT'})
+            for inbox, task, _ in sockets + [(inbox, task, sent)]:
+                inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+                await task
+            self.assertEqual((hub.topics, dict(hub.connections)), ({}, {}))
+
+        async_to_sync(scenario)()
+
+
+# the refresh loop's db work runs on worker threads (thread_sensitive=False), which can't see into a TestCase's
+# transaction on sqlite
+class LiveQuotaTests(TransactionTestCase):
+    @override_settings(FINNHUB_API_KEY='key', ALPHAVANTAGE_API_KEY='key', UPSTREAM_QUOTA=True)
+    def test_live_predictions_within_the_shipped_quota(self):
+        from config import settings as shipped
+        feature_store.write_rows('MSFT', [(timezone.now().date() - timedelta(days=1), {col: 1.0 for col in feature_store.FEATURE_COLUMNS})])
+        quote_calls = []
+
+        async def quote(client, symbol, key):
+            quote_calls.append(symbol)
+            return {'c': 100.0, 'o': 99.0, 'h': 101.0, 'l': 98.0, 'pc': 99.5}, None
+
+        async def nothing(*args, **kwargs):
+            return None
+
+        async def scenario():
+            hub = live.Hub(interval=0.01) # the real refresh_symbol, quota and all
+            aapl, msft = live.Subscriber(), live.Subscriber()
+            hub.subscribe(aapl, 'AAPL')
+            await asyncio.sleep(0.3) # many refreshes
+            hub.subscribe(msft, 'MSFT') # the bucket is empty now
+            await asyncio.sleep(0.3)
+            hub.leave(aapl)
+            hub.leave(msft)
+            return [json.loads(aapl.queue.get_nowait()) for _ in range(aapl.queue.qsize())], \
+                [json.loads(msft.queue.get_nowait()) for _ in range(msft.queue.qsize())]
+
+        with self.settings(UPSTREAM_QUOTA_PER_MINUTE=shipped.UPSTREAM_QUOTA_PER_MINUTE, UPSTREAM_QUOTA_PER_DAY=shipped.UPSTREAM_QUOTA_PER_DAY,
+                           QUOTA_BACKGROUND_RESERVE=shipped.QUOTA_BACKGROUND_RESERVE, LIVE_REFRESH_SECONDS=shipped.LIVE_REFRESH_SECONDS), \
+                mock.patch.object(upstream, 'afetch_finnhub_quote', quote), \
+                mock.patch.object(upstream, 'afetch_alpha_vantage_quote', nothing), \
+                mock.patch.object(upstream, 'afetch_alpha_vantage_indicator', nothing), \
+                mock.patch.object(news_store, 'fetch_company_news', return_value=[]):
+            aapl, msft = async_to_sync(scenario)()
+            self.assertGreater(live.fetch_interval(), 6 * 3600) # 5 calls of 25 a day, less the interactive reserve
+
+        self.assertEqual(quote_calls, ['AAPL']) # one upstream fetch, then it waits for fetch_interval()
+        predictions = [m for m in aapl if m['type'] == 'prediction']
+        self.assertEqual(len(predictions), 1)
+        self.assertNotIn('stale', predictions[0]['data'])
+        predictions = [m for m in msft if m['type'] == 'prediction']
+        self.assertEqual(len(predictions), 1) # out of quota: the stored row, once
+        self.assertEqual(predictions[0]['data']['stale']['as_of'], (timezone.now().date() - timedelta(days=1)).isoformat())
+
+class FeatureStoreTests(TestCase):
+    def features(self, close):
+        return {col: 1.0 for col in feature_store.FEATURE_COLUMNS} | {'close': close}
+
+    def test_write_is_an_upsert_and_lookups(self):
+        feature_store.write_rows('aapl', [(date(2025, 1, 2), self.features(100)), (date(2025, 1, 3), self.features(101))])
+        feature_store.write_rows('AAPL', [(date(2025, 1, 3), self.features(102) | {'rsi': float('nan')})], source='live')
+        self.assertEqual(FeatureRow.objects.count(), 2)
+
+        row = feature_store.get_features('AAPL', date(2025, 1, 3))
+        self.assertEqual(row['close'], 102)
+        self.assertIsNone(row['rsi']) # nan stored as NULL
+        self.assertIsNone(feature_store.get_features('AAPL', date(2025, 1, 4)))
+
+        day, row = feature_store.as_of('AAPL', date(2025, 1, 6)) # weekend -> last trading day
+        self.assertEqual((day, row['close']), (date(2025, 1, 3), 102))
+
+        dates, matrix = feature_store.get_range('AAPL', date(2025, 1, 1), date(2025, 1, 31))
+        self.assertEqual(dates, [date(2025, 1, 2), date(2025, 1, 3)])
+        self.assertEqual(matrix.shape, (2, len(feature_store.FEATURE_COLUMNS)))
+
+    def test_prediction_for_stored_day(self):
+        feature_store.write_rows('AAPL', [(date(2025, 1, 2), self.features(100))])
+        response = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': '2025-01-02'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['features_used']['close'], 100)
+
+        response = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': '2025-01-05'}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class PredictionLogTests(TestCase):
+    def setUp(self):
+        prediction_log.log.flush()
+        PredictionRecord.objects.all().delete()
+
+    def test_predictions_are_queued_then_written(self):
+        feature_store.write_rows('AAPL', [(date(2025, 1, 2), {col: 100.0 for col in feature_store.FEATURE_COLUMNS})])
+        body = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': '2025-01-02'}, content_type='application/json').json()
+        self.assertEqual(PredictionRecord.objects.count(), 0) # nothing written on the request path
+        self.assertEqual(prediction_log.log.flush(), 1)
+
+        record = PredictionRecord.objects.get()
+        self.assertEqual((record.symbol, record.source, record.as_of), ('AAPL', 'stored', date(2025, 1, 2)))
+        self.assertEqual(record.prediction_code, body['prediction_code'])
+        self.assertEqual(record.probabilities, body['confidence_scores'])
+        self.assertEqual(record.model_version, predictor.model_version())
+        self.assertEqual(set(record.latency_ms), {'features', 'predict', 'total'})
+
+    def test_full_queue_drops_and_flusher_batches(self):
+        log = prediction_log.PredictionLog(3, 2, 0.05, start=False)
+        body = {'symbol': 'AAPL', 'prediction_code': 1, 'confidence_scores': {}, 'features_used': {}}
+        with mock.patch.object(prediction_log, 'log', log):
+            for _ in range(5):
+                prediction_log.record_prediction(body)
+        self.assertEqual(log.stats(), {'queued': 3, 'enqueued': 3, 'dropped': 2, 'written': 0, 'failed': 0})
+        self.assertEqual(len(log.next_batch()), 2) # by size
+        self.assertEqual(len(log.next_batch()), 1) # by time
+
+        with mock.patch.object(PredictionRecord.objects, 'bulk_create', side_effect=RuntimeError('db down')):
+            log.write([PredictionRecord()])
+        self.assertEqual(log.failed, 1)
+
+
+class DriftTests(TestCase):
+    reference = {'model_version': 'v1', 'rows': 100, 'features': {
+        'close': {'edges': [10.0, 20.0, 30.0], 'fractions': [0.25, 0.25, 0.25, 0.25], 'zero_share': 0.0},
+        'rsi': {'edges': [50.0], 'fractions': [0.5, 0.5], 'zero_share': 0.0},
+    }}
+
+    def test_psi_follows_recent_features(self):
+        monitor = drift.DriftMonitor(self.reference, half_life=50)
+        self.assertEqual(monitor.report()['status'], 'not enough data')
+        for i in range(200): # same distribution as training
+            monitor.observe({'close': [5, 15, 25, 35][i % 4], 'rsi': [40, 60][i % 2]})
+        report = monitor.report()
+        self.assertEqual(report['status'], 'ok')
+        self.assertLess(report['max_psi'], 0.01)
+
+        for _ in range(500): # upstream broke: everything 0 / missing rsi
+            monitor.observe({'close': 0.0, 'rsi': None})
+        report = monitor.report()
+        self.assertEqual(report['features']['close']['status'], 'drift')
+        self.assertGreater(report['features']['close']['zero_share'], 0.99)
+        self.assertGreater(report['features']['rsi']['missing_share'], 0.99)
+        self.assertAlmostEqual(report['effective_observations'], 1 / (1 - 0.5 ** (1 / 50)), delta=5)
+
+    def test_weights_rescale_without_overflow(self):
+        monitor = drift.DriftMonitor(self.reference, half_life=1) # weight doubles per observation
+        for i in range(2000):
+            monitor.observe({'close': 15.0, 'rsi': 60.0})
+        self.assertLess(monitor.weight, drift.RESCALE_AT)
+        self.assertAlmostEqual(monitor.report()['effective_observations'], 2.0, places=3)
+
+    def test_live_predictions_feed_the_endpoint(self):
+        monitor = drift.DriftMonitor(self.reference, half_life=20)
+        features = {col: 0.0 for col in predictor.load_model()[1]}
+        with mock.patch.object(drift, 'get_monitor', return_value=monitor), \
+                mock.patch.object(predictor, 'fetch_features', return_value=(features, None)):
+            self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL'}, content_type='application/json')
+            body = self.client.get(reverse('drift')).json()
+        self.assertEqual(body['observations'], 1)
+        self.assertEqual(body['features']['close']['zero_share'], 1.0)
+
+        with mock.patch.object(drift, 'get_monitor', return_value=None):
+            self.assertEqual(self.client.get(reverse('drift')).status_code, 503)
+
+
+@override_settings(UPSTREAM_MIN_SAMPLES=5, UPSTREAM_TIMEOUT_MIN=0.05, UPSTREAM_HEDGE_PROVIDERS=['fake'],
+                   UPSTREAM_HEDGE_MAX_SHARE=0.5, UPSTREAM_QUOTA_PER_MINUTE={'fake': 1000}, UPSTREAM_QUOTA=False)
+class UpstreamTests(TestCase): # (the shared bucket only in test_hedges_are_charged_to_the_shared_quota)
+    def setUp(self):
+        upstream.reset()
+        self.addCleanup(upstream.reset)
+
+    def warm(self, seconds=0.01, n=20):
+        t = upstream.tracker('fake:quote')
+        for _ in range(n):
+            t.add(seconds)
+        return t
+
+    # first call slow (the tail), later ones fast
+    def sender(self, slow=1.0, fast=0.01):
+        calls = []
+
+        def send(timeout):
+            calls.append(timeout)
+            time.sleep(slow if len(calls) == 1 else fast)
+            return len(calls)
+        return send, calls
+
+    def test_timeout_follows_latency(self):
+        t = upstream.tracker('fake:quote')
+        self.assertEqual(t.timeout(10), 10) # no samples yet: the fixed ceiling
+        self.warm(0.1)
+        self.assertAlmostEqual(t.timeout(10), 0.3)
+        self.warm(100)
+        self.assertEqual(t.timeout(10), 10)
+
+    def test_slow_request_is_hedged(self):
+        t = self.warm()
+        send, calls = self.sender()
+        start = time.perf_counter()
+        self.assertEqual(upstream.call('fake', 'quote', send, 10), 2) # the hedge's answer
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual((t.hedges, t.hedge_wins), (1, 1))
+
+        async def hedged():
+            async def asend(timeout):
+                calls.append(timeout)
+                await asyncio.sleep(1.0 if len(calls) == 3 else 0.01)
+                return len(calls)
+            return await upstream.acall('fake', 'quote', asend, 10)
+        self.assertEqual(async_to_sync(hedged)(), 4)
+        self.assertEqual((t.hedges, t.hedge_wins), (2, 2))
+        self.assertIn('fake:quote', self.client.get(reverse('upstream')).json()['endpoints'])
+
+    def test_no_hedge_over_quota(self):
+        t = self.warm()
+        send, calls = self.sender(slow=0.2)
+        with self.settings(UPSTREAM_QUOTA_PER_MINUTE={'fake': 1}):
+            upstream.window('fake').note()
+            self.assertEqual(upstream.call('fake', 'quote', send, 10), 1)
+        self.assertEqual((len(calls), t.hedges), (1, 0))
+        with self.settings(UPSTREAM_HEDGE_PROVIDERS=[]):
+            self.assertEqual(upstream.call('fake', 'quote', self.sender(slow=0.2)[0], 10), 1)
+        self.assertEqual(t.hedges, 0)
+
+
+    @override_settings(UPSTREAM_QUOTA=True, UPSTREAM_QUOTA_PER_MINUTE={'fake': 60}, QUOTA_BACKGROUND_RESERVE=0.3)
+    def test_hedges_are_charged_to_the_shared_quota(self):
+        t = self.warm()
+        quota.acquire({quota.provider_key('fake'): 45}) # other workers spent most of the minute: 15 left, 18 reserved
+        send, calls = self.sender(slow=0.2)
+        self.assertEqual(upstream.call('fake', 'quote', send, 10), 1)
+        self.assertEqual((len(calls), t.hedges), (1, 0))
+
+        QuotaBucket.objects.filter(key='provider:fake').update(tokens=60)
+        self.assertEqual(upstream.call('fake', 'quote', self.sender(slow=0.2)[0], 10), 2)
+        self.assertEqual(t.hedges, 1)
+        self.assertAlmostEqual(QuotaBucket.objects.get(key='provider:fake').tokens, 59, places=0)
+
+    def test_window_forgets_requests_older_than_a_minute(self):
+        w = upstream.window('alphavantage') # not hedged, so only note() ever trims it
+        with mock.patch.object(upstream.time, 'monotonic', side_effect=[0.0, 1.0, 30.0, 61.5, 200.0]):
+            for _ in range(5):
+                w.note()
+        self.assertEqual(list(w.sent), [200.0])
+
+@override_settings(UPSTREAM_QUOTA=True, UPSTREAM_QUOTA_PER_MINUTE={'alphavantage': 10, 'finnhub': 60}, UPSTREAM_QUOTA_PER_DAY={},
+                   QUOTA_BACKGROUND_RESERVE=0.3, CLIENT_PREDICTIONS_PER_MINUTE=100)
+class QuotaTests(TestCase):
+    def tokens(self, provider):
+        return QuotaBucket.objects.get(key=quota.provider_key(provider)).tokens
+
+    def test_all_or_nothing(self):
+        costs = predictor.quota_costs('client:ip:1.2.3.4')
+        quota.acquire(costs)
+        quota.acquire(costs)
+        with self.assertRaises(quota.QuotaExceeded) as raised:
+            quota.acquire(costs)
+        self.assertEqual(raised.exception.key, 'provider:alphavantage')
+        self.assertGreaterEqual(raised.exception.retry_after, 29) # 5 calls at 10 a minute
+        self.assertAlmostEqual(self.tokens('finnhub'), 58, places=1) # the refused request took nothing
+
+        QuotaBucket.objects.filter(key='provider:alphavantage').update(refilled_at=F('refilled_at') - 30) # half a minute later
+        quota.acquire(costs)
+
+    def test_background_gets_a_full_bucket_with_the_shipped_settings(self):
+        from config import settings as shipped
+        with self.settings(UPSTREAM_QUOTA_PER_MINUTE=shipped.UPSTREAM_QUOTA_PER_MINUTE, UPSTREAM_QUOTA_PER_DAY=shipped.UPSTREAM_QUOTA_PER_DAY,
+                           QUOTA_BACKGROUND_RESERVE=shipped.QUOTA_BACKGROUND_RESERVE):
+            quota.acquire(predictor.quota_costs(), quota.BACKGROUND) # 5 calls out of a 5 a minute bucket
+            with self.assertRaises(quota.QuotaExceeded) as raised:
+                quota.acquire(predictor.quota_costs(), quota.BACKGROUND)
+            self.assertEqual(raised.exception.retry_after, 60) # full again in a minute
+            QuotaBucket.objects.filter(key='provider:alphavantage').update(refilled_at=F('refilled_at') - 60)
+            quota.acquire(predictor.quota_costs(), quota.BACKGROUND)
+
+    def test_background_leaves_the_reserve_to_interactive(self):
+        costs = predictor.quota_costs()
+        quota.acquire(costs, quota.BACKGROUND) # 10 -> 5
+        with self.assertRaises(quota.QuotaExceeded):
+            quota.acquire(costs, quota.BACKGROUND) # would go under the 3 reserved
+        quota.acquire(costs, quota.INTERACTIVE)
+
+    @override_settings(CLIENT_PREDICTIONS_PER_MINUTE=1)
+    def test_per_client_limit(self):
+        quota.acquire(predictor.quota_costs('client:ip:1.1.1.1'))
+        with self.assertRaises(quota.QuotaExceeded) as raised:
+            quota.acquire(predictor.quota_costs('client:ip:1.1.1.1'))
+        self.assertEqual(raised.exception.key, 'client:ip:1.1.1.1')
+        quota.acquire(predictor.quota_costs('client:ip:2.2.2.2'))
+
+    def test_client_key_ignores_spoofed_hops(self):
+        meta = {'REMOTE_ADDR': '10.0.0.1', 'HTTP_X_FORWARDED_FOR': '203.0.113.7'}
+        self.assertEqual(quota.client_key(None, meta), 'client:ip:203.0.113.7')
+        spoofed = dict(meta, HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7') # client sent its own header, router appended
+        self.assertEqual(quota.client_key(None, spoofed), 'client:ip:203.0.113.7')
+        self.assertEqual(quota.client_key(None, {'REMOTE_ADDR': '10.0.0.1'}), 'client:ip:10.0.0.1')
+        with override_settings(TRUSTED_PROXY_COUNT=0):
+            self.assertEqual(quota.client_key(None, spoofed), 'client:ip:10.0.0.1')
+        with override_settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(quota.client_key(None, dict(meta, HTTP_X_FORWARDED_FOR='6.6.6.6, 203.0.113.7, 10.1.1.1')),
+                             'client:ip:203.0.113.7')
+
+    @override_settings(UPSTREAM_QUOTA_PER_DAY={'alphavantage': 5})
+    def test_daily_cap_waits_for_tomorrow(self):
+        quota.acquire(predictor.quota_costs())
+        QuotaBucket.objects.filter(key='provider:alphavantage').update(tokens=10)
+        with self.assertRaises(quota.QuotaExceeded) as raised:
+            quota.acquire(predictor.quota_costs())
+        self.assertGreater(raised.exception.retry_after, 0)
+        self.assertLessEqual(raised.exception.retry_after, 86400)
+        QuotaBucket.objects.filter(key='provider:alphavantage').update(day=date(2000, 1, 1)) # a new day
+        quota.acquire(predictor.quota_costs())
+
+    @override_settings(FINNHUB_API_KEY='key', ALPHAVANTAGE_API_KEY='key')
+    def test_out_of_quota_answers_from_store_or_429(self):
+        quota.acquire(predictor.quota_costs())
+        quota.acquire(predictor.quota_costs()) # alphavantage empty
+        feature_store.write_rows('AAPL', [(timezone.now().date() - timedelta(days=1), {col: 1.0 for col in feature_store.FEATURE_COLUMNS})])
+        with mock.patch.object(upstream, 'call', side_effect=AssertionError('no upstream call when out of quota')):
+            response = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL'}, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(int(response['Retry-After']) >= 1)
+            self.assertEqual(response.json()['stale']['as_of'], (timezone.now().date() - timedelta(days=1)).isoformat())
+
+            response = self.client.post(reverse('stock_prediction'), {'symbol': 'MSFT'}, content_type='application/json')
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+
+
+@override_settings(DATASET_TOKEN='secret')
+class DatasetTests(TestCase):
+    def setUp(self):
+        for i, symbol in enumerate(['AAPL', 'MSFT']):
+            feature_store.write_rows(symbol, [(date(2025, 1, 1) + timedelta(days=d), {col: 100.0 + (d % 4) * 3 + i for col in feature_store.FEATURE_COLUMNS})
+                                              for d in range(20)])
+
+    def get(self, **params):
+        return self.client.get(reverse('dataset'), params, HTTP_X_DATASET_TOKEN='secret')
+
+    def test_npy_stream_matches_training_labels(self):
+        self.assertEqual(self.client.get(reverse('dataset')).status_code, 403)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        data = np.load(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(data), int(response['X-Dataset-Rows']))
+        self.assertEqual(len(data), 2 * 15) # the last 5 days of a ticker have no label
+
+        expected = create_target_labels(feature_store.training_frame())
+        np.testing.assert_array_equal(data['target'], expected['target'].to_numpy())
+        np.testing.assert_array_equal(data['close'], expected['close'].to_numpy(np.float32))
+        self.assertEqual(data['ticker'][0], b'AAPL')
+
+        response = self.get(symbols='msft', columns='rsi,target', **{'from': '2025-01-10'})
+        data = np.load(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(data.dtype.names, ('ticker', 'date', 'rsi', 'target'))
+        self.assertEqual(len(data), int(response['X-Dataset-Rows']))
+        self.assertTrue((data['date'] >= np.datetime64('2025-01-10')).all() and (data['ticker'] == b'MSFT').all())
+        self.assertEqual(self.get(columns='nope').status_code, 400)
+        if dataset.pa is None:
+            self.assertEqual(self.get(output='arrow').status_code, 400)
+
+    def test_npy_rows_match_the_header_with_a_live_write_in_between(self):
+        response = self.get(symbols='AAPL')
+        rows = int(response['X-Dataset-Rows'])
+        feature_store.write_rows('AAPL', [(date(2025, 1, 21), {col: 150.0 for col in feature_store.FEATURE_COLUMNS})])
+        data = np.load(io.BytesIO(b''.join(response.streaming_content))) # body read after the write
+        self.assertEqual(len(data), rows)
+
+        with self.assertRaises(dataset.DatasetError):
+            list(dataset.npy_chunks(dataset.store_batches(['close'], ['AAPL']), ['close'], rows))
+        with self.assertRaises(dataset.DatasetError):
+            list(dataset.npy_chunks(dataset.store_batches(['close'], ['AAPL']), ['close'], rows + 5))
+
+    def test_export_command_csv(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        frame = create_target_labels(feature_store.training_frame())
+        frame.assign(date=frame['date'].dt.strftime('%Y-%m-%d')).to_csv(os.path.join(tmp, 'labelled.csv'), index=False)
+        out = os.path.join(tmp, 'out.npy')
+        call_command('export_dataset', out=out, source='csv', input=os.path.join(tmp, 'labelled.csv'), symbols='AAPL', stdout=io.StringIO())
+        data = np.load(out, mmap_mode='r')
+        self.assertEqual(len(data), 15)
+        np.testing.assert_array_equal(data['rsi'], frame[frame['ticker'] == 'AAPL']['rsi'].to_numpy(np.float32))
+        with open(os.path.join(tmp, 'out.schema.json')) as f:
+            self.assertEqual(json.load(f)['rows'], 15)
+
+
+    def test_export_csv_from_before_a_feature_column(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'labelled.csv')
+        frame = create_target_labels(feature_store.training_frame()).drop(columns=['news_sentiment_decayed'])
+        frame.assign(date=frame['date'].dt.strftime('%Y-%m-%d')).to_csv(path, index=False)
+        out = os.path.join(tmp, 'out.npy')
+        call_command('export_dataset', out=out, source='csv', input=path, stdout=io.StringIO())
+        data = np.load(out)
+        self.assertEqual(len(data), 30)
+        self.assertNotIn('news_sentiment_decayed', data.dtype.names)
+        self.assertIn('news_sentiment', data.dtype.names)
+        with self.assertRaisesMessage(CommandError, 'news_sentiment_decayed'):
+            call_command('export_dataset', out=out, source='csv', input=path, columns='close,news_sentiment_decayed', stdout=io.StringIO())
+
+class ModelFamilyTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.family_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        tickers = np.repeat(['AAPL', 'MSFT', 'XOM'], 120)
+        X = rng.normal(size=(len(tickers), len(feature_store.FEATURE_COLUMNS))).astype(np.float32)
+        y = np.where(X[:, 3] > 0.5, 1, np.where(X[:, 3] < -0.5, -1, 0))
+        train_family(X, y, tickers, feature_store.FEATURE_COLUMNS, levels=['global', 'sector', 'ticker'], workers=1,
+                     params={'n_estimators': 5, 'max_depth': 3}, family_dir=cls.family_dir,
+                     sectors={'AAPL': 'Tech', 'MSFT': 'Tech', 'XOM': 'Energy', 'NVDA': 'Tech'})
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.family_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.addCleanup(setattr, model_registry, '_registry_checked', False)
+        model_registry._registry_checked = False
+
+    def test_routes_to_most_specific_model_and_evicts_lru(self):
+        manifest = model_registry.read_manifest(self.family_dir)
+        registry = model_registry.ModelRegistry(manifest, self.family_dir, max_mb=1)
+        self.assertEqual(registry.route('AAPL'), 'ticker:AAPL')
+        self.assertEqual(registry.route('NVDA'), 'sector:Tech') # no model of its own
+        self.assertEqual(registry.route('ZZZZ'), 'global')
+
+        one = max(entry['memory_mb'] for entry in manifest['models'].values())
+        registry.max_bytes = one * 2.5e6 # room for two models
+        for key in ['ticker:AAPL', 'ticker:MSFT', 'ticker:AAPL', 'ticker:XOM', 'ticker:MSFT']:
+            registry.get(key)
+        stats = registry.stats()
+        self.assertEqual((stats['loads'], stats['hits'], stats['evictions']), (4, 1, 2))
+        self.assertEqual(list(stats['loaded']), ['ticker:XOM', 'ticker:MSFT']) # least recently used first
+
+    def test_partial_retrain_keeps_the_other_levels(self):
+        family_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, family_dir)
+        rng = np.random.default_rng(1)
+        tickers = np.repeat(['AAPL', 'XOM'], 120)
+        X = rng.normal(size=(len(tickers), len(feature_store.FEATURE_COLUMNS))).astype(np.float32)
+        y = np.where(X[:, 3] > 0, 1, -1)
+        train = lambda levels: train_family(X, y, tickers, feature_store.FEATURE_COLUMNS, levels=levels, workers=1,
+                                            params={'n_estimators': 3, 'max_depth': 2}, family_dir=family_dir,
+                                            sectors={'AAPL': 'Tech', 'XOM': 'Energy'})
+        first = train(['global', 'sector', 'ticker'])
+        train(['ticker'])
+        manifest = train(['ticker']) # the first run's folder is now older than the previous one, still in use
+        self.assertEqual(set(manifest['models']), {'global', 'sector:Tech', 'sector:Energy', 'ticker:AAPL', 'ticker:XOM'})
+        self.assertEqual(manifest['models']['global']['directory'], first['directory'])
+        self.assertEqual(manifest['models']['ticker:AAPL']['directory'], manifest['directory'])
+        self.assertEqual(len(os.listdir(family_dir)), 4) # first run, previous, current + manifest.json
+        registry = model_registry.ModelRegistry(model_registry.read_manifest(family_dir), family_dir)
+        self.assertEqual(registry.route('NVDA'), 'global')
+        registry.get('global')
+        registry.get('ticker:XOM')
+
+    def test_prediction_uses_symbol_model(self):
+        feature_store.write_rows('AAPL', [(date(2025, 1, 6), {col: 1.0 for col in feature_store.FEATURE_COLUMNS})])
+        with self.settings(MODEL_FAMILY_DIR=self.family_dir):
+            body = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': '2025-01-06'}, content_type='application/json').json()
+            self.assertEqual(body['model_info']['model'], 'ticker:AAPL')
+            history = self.client.get(reverse('prediction_history'), {'symbol': 'AAPL', 'from': '2025-01-01', 'to': '2025-01-31'}).json()
+            self.assertTrue(history['model_version'].endswith('/ticker:AAPL'))
+            self.assertEqual(self.client.get(reverse('models')).json()['family']['loads'], 1)
+        model_registry._registry_checked = False
+        with self.settings(MODEL_FAMILY_DIR=''): # no family: the single model, as before
+            body = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': '2025-01-06'}, content_type='application/json').json()
+            self.assertEqual(body['model_info']['model'], 'default')
+
+
+class PredictionHistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i in range(5):
+            feature_store.write_rows('AAPL', [(date(2025, 1, 6 + i), {col: 100.0 + 10 * i for col in feature_store.FEATURE_COLUMNS})])
+
+    def test_history_matches_single_day_predictions(self):
+        response = self.client.get(reverse('prediction_history'), {'symbol': 'aapl', 'from': '2025-01-01', 'to': '2025-01-31'})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(len(body['dates']), 5)
+        self.assertEqual(set(body['probabilities']), {'SELL', 'HOLD', 'BUY'})
+        self.assertTrue(all(len(v) == 5 for v in body['probabilities'].values()))
+
+        single = self.client.post(reverse('stock_prediction'), {'symbol': 'AAPL', 'date': body['dates'][2]}, content_type='application/json').json()
+        self.assertEqual(body['prediction'][2], single['prediction'])
+        self.assertAlmostEqual(body['probabilities']['BUY'][2], single['confidence_scores']['BUY'], places=4)
+
+    def test_history_is_cached_per_range(self):
+        params = {'symbol': 'AAPL', 'from': '2025-01-01', 'to': '2025-01-31'}
+        with mock.patch.object(feature_store, 'get_range', wraps=feature_store.get_range) as get_range:
+            self.client.get(reverse('prediction_history'), params)
+            self.client.get(reverse('prediction_history'), params)
+            self.client.get(reverse('prediction_history'), params | {'to': '2025-01-08'})
+        self.assertEqual(get_range.call_count, 2)
+
+    def test_bad_range(self):
+        response = self.client.get(reverse('prediction_history'), {'symbol': 'AAPL', 'from': '2025-02-01', 'to': '2025-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AttributionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.model, self.feature_columns = predictor.load_model()
+        self.X = np.random.default_rng(0).normal(100, 20, (30, len(self.feature_columns))).astype(np.float32)
+
+    def test_contributions_add_up_and_match_tree_walk(self):
+        explainer = attribution.explainer_for(self.model)
+        self.assertIs(attribution.explainer_for(self.model), explainer) # built once per model
+        contributions = explainer.contributions(self.X)
+        proba = self.model.predict_proba(pd.DataFrame(self.X, columns=self.feature_columns))
+        np.testing.assert_allclose(explainer.bias + contributions.sum(axis=1), proba, atol=1e-9)
+        np.testing.assert_allclose(contributions[:5], attribution.naive_contributions(self.model, self.X[:5]), atol=1e-9)
+
+    def test_explain_flag(self):
+        feature_store.write_rows('AAPL', [(date(2025, 1, 2), {col: 100.0 for col in feature_store.FEATURE_COLUMNS})])
+        url = reverse('stock_prediction')
+        plain = self.client.post(url, {'symbol': 'AAPL', 'date': '2025-01-02'}, content_type='application/json').json()
+        self.assertNotIn('explanation', plain)
+
+        body = self.client.post(url, {'symbol': 'AAPL', 'date': '2025-01-02', 'explain': True}, content_type='application/json').json()
+        explanation = body['explanation']
+        for label, score in body['confidence_scores'].items():
+            total = explanation['bias'][label] + sum(explanation['contributions'][label].values())
+            self.assertAlmostEqual(total, score, places=3)
+        self.assertEqual(len(explanation['top_features']), predictor.TOP_CONTRIBUTIONS)
+
+        history = self.client.get(reverse('prediction_history'), {'symbol': 'AAPL', 'from': '2025-01-01', 'to': '2025-01-31', 'explain': '1'}).json()
+        self.assertEqual(history['contributions']['BUY']['close'], [explanation['contributions']['BUY']['close']])
+
+
+class ChartTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        start = date(2024, 1, 1)
+        rows = []
+        for i in range(400):
+            features = {col: 100.0 + math.sin(i / 10) for col in feature_store.FEATURE_COLUMNS}
+            features.update(high=150.0 if i == 123 else 101.5, volume=1000.0)
+            rows.append((start + timedelta(days=i), features))
+        feature_store.write_rows('MSFT', rows)
+
+    def test_lttb_keeps_ends_and_spike(self):
+        y = np.zeros(1000)
+        y[500] = 50
+        keep = chart.lttb_indices(np.arange(1000.0), y, 20)
+        self.assertEqual(len(keep), 20)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(500, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_downsampled_chart(self):
+        params = {'symbol': 'msft', 'from': '2024-01-01', 'to': '2025-12-31', 'points': 50}
+        response = self.client.get(reverse('chart'), params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['total_points'], body['points'], len(body['dates'])), (400, 50, 50))
+        self.assertEqual(body['dates'][0], '2024-01-01')
+        self.assertEqual(max(body['series']['high']), 150.0) # spike day kept through the high aggregation
+        self.assertEqual(sum(body['series']['volume']), 400 * 1000.0)
+
+    def test_not_modified_until_rows_change(self):
+        params = {'symbol': 'MSFT', 'from': '2024-01-01', 'to': '2025-12-31'}
+        first = self.client.get(reverse('chart'), params)
+        etag = first['ETag']
+        again = self.client.get(reverse('chart'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.client.get(reverse('chart'), params, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        feature_store.write_rows('MSFT', [(date(2025, 3, 1), {'close': 1.0})])
+        changed = self.client.get(reverse('chart'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.json()['total_points'], 401)
+
+    def test_gzip_and_errors(self):
+        response = self.client.get(reverse('chart'), {'symbol': 'MSFT', 'from': '2024-01-01', 'to': '2025-12-31'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(self.client.get(reverse('chart'), {'symbol': 'NOPE'}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('chart'), {'symbol': 'MSFT', 'points': 1}).status_code, 400)
+
+
+class ModelBudgetTests(TestCase):
+    metadata = {'created_date': 'x', 'inference_cost': {'single_row_ms': 40.0, 'memory_mb': 20.0, 'pickle_mb': 30.0}}
+
+    @override_settings(MODEL_MAX_LATENCY_MS=25, MODEL_MAX_MEMORY_MB=0, MODEL_MAX_SIZE_MB=50)
+    def test_over_latency_budget(self):
+        problems = predictor.check_budget(self.metadata)
+        self.assertEqual(len(problems), 1)
+        self.assertIn('single_row_ms', problems[0])
+
+    @override_settings(MODEL_MAX_LATENCY_MS=0, MODEL_MAX_MEMORY_MB=0, MODEL_MAX_SIZE_MB=0)
+    def test_no_budget_or_no_costs(self):
+        self.assertEqual(predictor.check_budget(self.metadata), [])
+        self.assertEqual(predictor.check_budget({}), [])
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.settings_override = override_settings(PROFILE_DIR=self.dir, PROFILE_TOKEN='secret', PROFILE_SAMPLE_RATE=0)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_only_token_requests_are_profiled(self):
+        url = reverse('daily_sentiment')
+        self.assertNotIn('X-Profile-Id', self.client.get(url, {'symbol': 'AAPL'}))
+        self.assertNotIn('X-Profile-Id', self.client.get(url, {'symbol': 'AAPL'}, HTTP_X_PROFILE='wrong'))
+        profile_id = self.client.get(url, {'symbol': 'AAPL'}, HTTP_X_PROFILE='secret')['X-Profile-Id']
+
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 403)
+        listed = self.client.get(reverse('profiles'), HTTP_X_PROFILE='secret').json()['profiles']
+        self.assertEqual([(p['id'], p['path']) for p in listed], [(profile_id, '/api/sentiment/daily/?symbol=AAPL')])
+        folded = self.client.get(reverse('profile_file', args=[profile_id]), {'kind': 'alloc'}, HTTP_X_PROFILE='secret')
+        self.assertEqual(folded.status_code, 200)
+        self.assertEqual(self.client.get(reverse('profile_file', args=['nope']), HTTP_X_PROFILE='secret').status_code, 404)
+
+        out = io.StringIO()
+        call_command('profiles', stdout=out)
+        self.assertIn(profile_id, out.getvalue())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_async_request(self):
+        response = async_to_sync(AsyncClient().get)(reverse('daily_sentiment'), {'symbol': 'AAPL'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['X-Profile-Id'])
+
+
+class BarStoreTests(TestCase):
+    def write_csv(self, directory, ticker, rows):
+        path = os.path.join(directory, f"13M Data {ticker} - Sheet1.csv")
+        with open(path, 'w') as f:
+            f.write("Date,Open,High,Low,Close,Volume\n" + "".join(f"{row}\n" for row in rows))
+        return path
+
+    def test_import_is_dayfirst_and_upserts(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = self.write_csv(directory, 'AAPL', ["05/06/2024 16:00:00,1,2,0.5,1.5,100", "06/06/2024 16:00:00,1.5,2,1,,200"])
+        self.assertEqual(bar_store.import_csv(path, 'aapl'), 2)
+        self.write_csv(directory, 'AAPL', ["05/06/2024 16:00:00,1,2,0.5,1.8,100"])
+        with mock.patch('scripts.universe.PRICE_DIR', directory):
+            call_command('import_bars', 'AAPL', stdout=io.StringIO())
+
+        self.assertEqual(DailyBar.objects.count(), 2)
+        dates, bars = bar_store.get_range('AAPL', date(2024, 6, 1), date(2024, 6, 30))
+        self.assertEqual(dates.tolist(), [date(2024, 6, 5), date(2024, 6, 6)])
+        self.assertEqual(bars.shape, (2, 5))
+        self.assertEqual(bars[0, 3], 1.8) # re-import overwrote the close
+        self.assertTrue(np.isnan(bars[1, 3]))
+        self.assertEqual(len(bar_store.get_range('AAPL', date(2025, 1, 1))[0]), 0)
+
+    def test_live_quote_bar(self):
+        t = int(datetime(2025, 3, 4, 15, tzinfo=dt_timezone.utc).timestamp())
+        quote = {'o': 10, 'h': 12, 'l': 9, 'c': 11, 't': t}
+        av = {'Global Quote': {'07. latest trading day': '2025-03-04', '06. volume': '5000'}}
+        self.assertTrue(bar_store.upsert_quote('MSFT', quote, av))
+        bar = DailyBar.objects.get(symbol='MSFT')
+        self.assertEqual((bar.date, bar.close, bar.volume, bar.source), (date(2025, 3, 4), 11, 5000, 'finnhub'))
+
+        # AlphaVantage alone when Finnhub had nothing, and csv days are never overwritten by a live quote
+        av_only = {'Global Quote': {'07. latest trading day': '2025-03-05', '02. open': '11', '03. high': '12',
+                                    '04. low': '10', '05. price': '11.5', '06. volume': '10'}}
+        self.assertTrue(bar_store.upsert_quote('MSFT', {}, av_only))
+        self.assertEqual(DailyBar.objects.get(symbol='MSFT', date=date(2025, 3, 5)).source, 'alphavantage')
+        bar_store.write_bars('MSFT', [(date(2025, 3, 4), 1, 1, 1, 1, 1)])
+        self.assertFalse(bar_store.upsert_quote('MSFT', quote, av))
+        self.assertEqual(DailyBar.objects.get(symbol='MSFT', date=date(2025, 3, 4)).close, 1)
@@ -0,0 +1,318 @@
+# Calls to the upstream data providers (Finnhub, AlphaVantage, Hugging Face) used by the views
+# Sync versions (requests) are for the WSGI views + scripts, async versions (httpx) are for the ASGI views
+# Base urls come from settings so a load test can point them at a local fake upstream
+#
+# Every call goes through call()/acall(), which keep the last UPSTREAM_LATENCY_WINDOW latencies per provider +
+# endpoint (e.g. 'alphavantage:RSI'). Once there are UPSTREAM_MIN_SAMPLES of them:
+# - the timeout is p99 * UPSTREAM_TIMEOUT_FACTOR, between UPSTREAM_TIMEOUT_MIN and the old fixed value (the ceiling)
+# - for providers in UPSTREAM_HEDGE_PROVIDERS, a request still running at p95 gets a second identical one and
+#   whichever answers first is used. Hedges are capped at UPSTREAM_HEDGE_MAX_SHARE of the provider's requests,
+#   never go out when the provider already had UPSTREAM_QUOTA_PER_MINUTE requests in the last minute, and each one is
+#   charged to the provider's shared quota bucket (quota.py) at background priority - no token, no hedge
+# A timed out request counts as a sample of the timeout, so a slowing provider raises its own timeout
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import quota
+
+try:
+    import httpx # only needed for the async views
+except ImportError:
+    httpx = None
+
+# the fixed timeouts the calls used to have, now the ceilings
+ALPHAVANTAGE_TIMEOUT = 12
+FINNHUB_TIMEOUT = 10
+HF_TIMEOUT = 30 # model cold starts on the inference API take a while
+CEILINGS = {'alphavantage': ALPHAVANTAGE_TIMEOUT, 'finnhub': FINNHUB_TIMEOUT, 'hf': HF_TIMEOUT}
+
+TIMEOUT_ERRORS = (requests.exceptions.Timeout,) + ((httpx.TimeoutException,) if httpx else ())
+
+
+class LatencyTracker:
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._sorted = None
+
+    def add(self, seconds, timed_out=False):
+        with self.lock:
+            self.samples.append(seconds)
+            self.requests += 1
+            self.timeouts += timed_out
+            self._sorted = None
+
+    def add_hedge(self):
+        with self.lock:
+            self.hedges += 1
+
+    def add_hedge_result(self, won):
+        with self.lock:
+            self.hedge_wins += won
+
+    def quantile(self, q):
+        with self.lock:
+            if len(self.samples) < settings.UPSTREAM_MIN_SAMPLES:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self.samples)
+            return self._sorted[min(len(self._sorted) - 1, int(q * len(self._sorted)))]
+
+    def timeout(self, ceiling):
+        p99 = self.quantile(0.99)
+        if p99 is None:
+            return ceiling
+        return min(ceiling, max(settings.UPSTREAM_TIMEOUT_MIN, p99 * settings.UPSTREAM_TIMEOUT_FACTOR))
+
+    def stats(self):
+        quantiles = {f'p{int(q * 100)}_ms': self.quantile(q) for q in (0.5, 0.95, 0.99)}
+        return {
+            **{k: round(v * 1000, 1) if v is not None else None for k, v in quantiles.items()},
+            'samples': len(self.samples),
+            'requests': self.requests,
+            'timeouts': self.timeouts,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+        }
+
+
+# requests (+ hedges) sent to one provider in the last minute, for the quota check
+class ProviderWindow:
+    def __init__(self):
+        self.sent = deque()
+        self.hedged = deque()
+        self.lock = threading.Lock()
+
+    def trim(self, now):
+        for times in (self.sent, self.hedged):
+            while times and times[0] < now - 60:
+                times.popleft()
+
+    def note(self):
+        now = time.monotonic()
+        with self.lock:
+            self.trim(now) # providers that never hedge would otherwise keep every request they ever sent
+            self.sent.append(now)
+
+    def take_hedge(self, provider):
+        now = time.monotonic()
+        with self.lock:
+            self.trim(now)
+            quota = settings.UPSTREAM_QUOTA_PER_MINUTE.get(provider)
+            if quota is not None and len(self.sent) >= quota:
+                return False
+            if len(self.hedged) >= max(1, settings.UPSTREAM_HEDGE_MAX_SHARE * len(self.sent)):
+                return False
+            self.sent.append(now)
+            self.hedged.append(now)
+            return True
+
+
+_trackers = {}
+_windows = {}
+_registry_lock = threading.Lock()
+_hedge_pool = None
+
+
+def tracker(key):
+    if key not in _trackers:
+        with _registry_lock:
+            _trackers.setdefault(key, LatencyTracker(settings.UPSTREAM_LATENCY_WINDOW))
+    return _trackers[key]
+
+
+def window(provider):
+    if provider not in _windows:
+        with _registry_lock:
+            _windows.setdefault(provider, ProviderWindow())
+    return _windows[provider]
+
+
+def hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _registry_lock:
+            if _hedge_pool is None:
+                _hedge_pool = ThreadPoolExecutor(max_workers=settings.UPSTREAM_HEDGE_THREADS, thread_name_prefix='upstream')
+    return _hedge_pool
+
+
+def stats():
+    return {key: t.stats() | {'timeout_s': round(t.timeout(CEILINGS.get(key.split(':')[0], HF_TIMEOUT)), 3)}
+            for key, t in sorted(_trackers.items())}
+
+
+def reset():
+    _trackers.clear()
+    _windows.clear()
+
+
+# a hedge is an extra request the cluster-wide quota didn't hand out with the original one: it takes its own token.
+# (A refused hedge still counts in this worker's window, which only makes the next one less likely)
+def charge_hedge(provider):
+    if not settings.UPSTREAM_QUOTA or provider not in settings.UPSTREAM_QUOTA_PER_MINUTE:
+        return True
+    try:
+        quota.acquire({quota.provider_key(provider): 1}, quota.BACKGROUND)
+    except quota.QuotaExceeded:
+        return False
+    return True
+
+
+# (tracker, timeout, hedge delay or None) for the next request
+def plan(provider, endpoint, ceiling):
+    t = tracker(f"{provider}:{endpoint}")
+    timeout = t.timeout(ceiling)
+    delay = t.quantile(0.95) if provider in settings.UPSTREAM_HEDGE_PROVIDERS else None
+    if delay is not None and delay >= timeout:
+        delay = None
+    return t, timeout, delay
+
+
+def timed_send(t, send, timeout):
+    start = time.perf_counter()
+    try:
+        response = send(timeout)
+    except TIMEOUT_ERRORS:
+        t.add(timeout, timed_out=True)
+        raise
+    t.add(time.perf_counter() - start)
+    return response
+
+
+async def atimed_send(t, send, timeout):
+    start = time.perf_counter()
+    try:
+        response = await send(timeout)
+    except TIMEOUT_ERRORS:
+        t.add(timeout, timed_out=True)
+        raise
+    t.add(time.perf_counter() - start)
+    return response
+
+
+# send(timeout) does the request (requests.get/post) and returns the response. ceiling = the most we'd ever wait
+def call(provider, endpoint, send, ceiling):
+    t, timeout, delay = plan(provider, endpoint, ceiling)
+    window(provider).note()
+    if delay is None:
+        return timed_send(t, send, timeout)
+
+    primary = hedge_pool().submit(timed_send, t, send, timeout)
+    done, _ = wait([primary], timeout=delay)
+    if done or not window(provider).take_hedge(provider) or not charge_hedge(provider):
+        return primary.result()
+    t.add_hedge()
+    hedge = hedge_pool().submit(timed_send, t, send, timeout)
+    pending, error = {primary, hedge}, None
+    while pending: # first one that succeeds. A sync request can't be stopped, the loser finishes in the pool
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                t.add_hedge_result(future is hedge)
+                return future.result()
+            error = error or future.exception()
+    raise error
+
+
+# async send(timeout) -> response (client.get/post)
+async def acall(provider, endpoint, send, ceiling):
+    t, timeout, delay = plan(provider, endpoint, ceiling)
+    window(provider).note()
+
+    if delay is None:
+        return await atimed_send(t, send, timeout)
+
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(atimed_send(t, send, timeout))
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done or not window(provider).take_hedge(provider) or not await sync_to_async(charge_hedge, thread_sensitive=False)(provider):
+        return await primary
+    t.add_hedge()
+    hedge = asyncio.ensure_future(atimed_send(t, send, timeout))
+    pending, error = {primary, hedge}, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        winner = next((task for task in done if task.exception() is None), None) # (also marks failures as retrieved)
+        if winner is None:
+            error = error or next(iter(done)).exception()
+            continue
+        for loser in pending: # cancelled, its time so far still goes in as a (lower bound) sample
+            loser.cancel()
+            t.add(time.perf_counter() - started if loser is primary else time.perf_counter() - started - delay)
+        t.add_hedge_result(winner is hedge)
+        return winner.result()
+    raise error
+
+
+def alpha_vantage_params(symbol, function, apikey, **kwargs):
+    params = {"function": function, "symbol": symbol, "apikey": apikey} # Required param, which indicator, ticker and API key
+    params.update(kwargs) # updates keyword arguments (merge additional param)
+    return params
+
+
+def fetch_alpha_vantage_indicator(symbol, function, apikey, **kwargs):
+    params = alpha_vantage_params(symbol, function, apikey, **kwargs)
+    try:
+        r = call('alphavantage', function, lambda timeout: requests.get(settings.ALPHAVANTAGE_API_URL, params=params, timeout=timeout), ALPHAVANTAGE_TIMEOUT) # timeout to prevent resources from waiting forever. At least this dosent ghost the user
+        if r.status_code == 200:
+            return r.json() # return json if successful
+        else:
+            return None
+    except Exception as e:
+        #print(f"Error fetching {function} from AlphaVantage: {e}")
+        return None
+
+# Fetch AlphaVantage Quote for volume, instead of OHLC + V
+def fetch_alpha_vantage_quote(symbol, apikey):
+    # Fetches the global_quote which essentially is price + volume
+    return fetch_alpha_vantage_indicator(symbol, "GLOBAL_QUOTE", apikey)
+
+# Finnhub quote (OCLH), returns (json, error)
+def fetch_finnhub_quote(symbol, api_key):
+    response = call('finnhub', 'quote', lambda timeout: requests.get(
+        f"{settings.FINNHUB_API_URL}/quote", params={"symbol": symbol, "token": api_key}, timeout=timeout), FINNHUB_TIMEOUT)
+    if response.status_code != 200:
+        return None, f"Finnhub API error: {response.status_code}"
+    return response.json(), None
+
+
+# Async versions, same behaviour. client is a shared httpx.AsyncClient for the request
+async def afetch_alpha_vantage_indicator(client, symbol, function, apikey, **kwargs):
+    params = alpha_vantage_params(symbol, function, apikey, **kwargs)
+    try:
+        r = await acall('alphavantage', function, lambda timeout: client.get(settings.ALPHAVANTAGE_API_URL, params=params, timeout=timeout), ALPHAVANTAGE_TIMEOUT)
+        if r.status_code == 200:
+            return r.json()
+        else:
+            return None
+    except Exception as e:
+        return None
+
+async def afetch_alpha_vantage_quote(client, symbol, apikey):
+    return await afetch_alpha_vantage_indicator(client, symbol, "GLOBAL_QUOTE", apikey)
+
+async def afetch_finnhub_quote(client, symbol, api_key):
+    response = await acall('finnhub', 'quote', lambda timeout: client.get(
+        f"{settings.FINNHUB_API_URL}/quote", params={"symbol": symbol, "token": api_key}, timeout=timeout), FINNHUB_TIMEOUT)
+    if response.status_code != 200:
+        return None, f"Finnhub API error: {response.status_code}"
+    return response.json(), None
+
+
+def async_client():
+    if httpx is None:
+        raise RuntimeError("httpx is required for the async views")
+    return httpx.AsyncClient()
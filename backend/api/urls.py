@@ -1,7 +1,29 @@
+from django.conf import settings
 from django.urls import path
-from .views import SentimentAnalysisView, StockPredictionView
+from .views import SentimentAnalysisView, SentimentBatchView, StockPredictionView, DailySentimentView, PredictionHistoryView, ChartView, NewsView, GeneralNewsView, ProfileListView, ProfileFileView, DriftView, UpstreamView, DatasetView, ModelsView
+from . import async_views
+
+# under ASGI (config/asgi.py) the two upstream-bound endpoints are served by the async views
+if settings.ASYNC_VIEWS:
+    sentiment_view = async_views.sentiment_analysis
+    prediction_view = async_views.stock_prediction
+else:
+    sentiment_view = SentimentAnalysisView.as_view()
+    prediction_view = StockPredictionView.as_view()
 
 urlpatterns = [
-    path("sentiment/", SentimentAnalysisView.as_view(), name="sentiment"),
-    path("predict/", StockPredictionView.as_view(), name="stock_prediction"),
-]
\ No newline at end of file
+    path("sentiment/", sentiment_view, name="sentiment"),
+    path("sentiment/batch/", SentimentBatchView.as_view(), name="sentiment_batch"),
+    path("sentiment/daily/", DailySentimentView.as_view(), name="daily_sentiment"),
+    path("news/", NewsView.as_view(), name="news"),
+    path("news/general/", GeneralNewsView.as_view(), name="general_news"),
+    path("predict/", prediction_view, name="stock_prediction"),
+    path("chart/", ChartView.as_view(), name="chart"),
+    path("predict/history/", PredictionHistoryView.as_view(), name="prediction_history"),
+    path("drift/", DriftView.as_view(), name="drift"),
+    path("upstream/", UpstreamView.as_view(), name="upstream"),
+    path("dataset/", DatasetView.as_view(), name="dataset"),
+    path("models/", ModelsView.as_view(), name="models"),
+    path("profiles/", ProfileListView.as_view(), name="profiles"),
+    path("profiles/<str:profile_id>/", ProfileFileView.as_view(), name="profile_file"),
+]
@@ -1,110 +1,47 @@
-# Django backend and def 2 rest api endpoints
+# Django backend rest api endpoints
 # 1) SentimentAnalysisView - Validates  JSON for Headline and Summary, then sends it to the HF API and returns the aggregate score + probabilities of Positive, Negative or Neutral
+#    (SentimentBatchView - same for a list of articles in one request)
 # 2) StockPredictionView -  Input a Stock ticker and get the prediction (either buy, hold or sell the stock), together with confidence score
+#    (optional date = predict from the feature store row for that day, explain = per-feature contributions)
+# 3) PredictionHistoryView - same prediction for every stored day in a date range, for chart overlays
+# 4) ChartView - OHLCV + indicator series from the feature store, downsampled to ?points=, 304 when unchanged
+# 5) NewsView / GeneralNewsView - dashboard / general page news with the sentiment already attached (one request per page)
+# 6) ProfileListView / ProfileFileView - recent request / pipeline profiles (X-Profile token required)
+# 7) DriftView - live serving features vs the training distribution (PSI per feature)
+# 8) UpstreamView - per provider/endpoint upstream latency quantiles, adaptive timeouts and hedges (this worker)
+# 9) DatasetView - the labelled training dataset streamed as npy / Arrow record batches (X-Dataset-Token required)
+# 10) ModelsView - model family routing + the per worker model cache (loads, hits, evictions)
 # rmb comment out debug print
 
 import requests
-import joblib
-import numpy as np
-import pandas as pd
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from django.conf import settings
-import os
 import logging
-from datetime import datetime
+import os
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from datetime import datetime, timedelta
+from . import chart, daily_sentiment, dataset, drift, model_registry, news_store, prediction_log, predictor, quota, upstream
+from .middleware import has_profile_token
+from scripts import profiling
+from .sentiment import build_text, score_many, score_sentiment, SentimentError
 
 logger = logging.getLogger(__name__)
 
-def fetch_alpha_vantage_indicator(symbol, function, apikey, **kwargs):
-    url = "https://www.alphavantage.co/query"
-    params = {"function": function, "symbol": symbol, "apikey": apikey} # Required param, which indicator, ticker and API key
-    params.update(kwargs) # updates keyword arguments (merge additional param)
-    try:
-        r = requests.get(url, params=params, timeout=12) # implemented to prevent resources from waiting forever. At least this dosent ghost the user
-        if r.status_code == 200:
-            return r.json() # return json if successful
-        else:
-            return None
-    except Exception as e:
-        #print(f"Error fetching {function} from AlphaVantage: {e}")
+# optional ?from=/?to= query dates
+def parse_query_date(value):
+    if not value:
         return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
-# Fetch AlphaVantage Quote for volume, instead of OHLC + V
-def fetch_alpha_vantage_quote(symbol, apikey):
-    url = "https://www.alphavantage.co/query"
-    params = {
-        "function": "GLOBAL_QUOTE",
-        "symbol": symbol,
-        "apikey": apikey
-    }
-    try: # Fetches the global_quote which essentially is price + volume
-        r = requests.get(url, params=params, timeout=12) # to prevent ghosting the user duringt he GET reqest
-        if r.status_code == 200:
-            return r.json()
-        else:
-            return None
-    except Exception as e:
-        #print(f"Error fetching GLOBAL_QUOTE from AlphaVantage: {e}")
-        return None
-
-# Fetch news articles for a symbol from Finnhub within the last 'hours_window' hours
-def fetch_finnhub_news(symbol, api_key, hours_window=12):
-    try:
-        now = datetime.utcnow()
-        window_ago = now - pd.Timedelta(hours=hours_window) # Calculate the cutoff timestamp
-        from_str = window_ago.strftime('%Y-%m-%d')
-        to_str = now.strftime('%Y-%m-%d')
-        url = "https://finnhub.io/api/v1/company-news"
-        params = {
-            "symbol": symbol,
-            "from": from_str,
-            "to": to_str,
-            "token": api_key
-        }
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code != 200:
-            #print(f"Finnhub news API error: {resp.status_code}")
-            return []
-        articles = resp.json()
-        # Only keep articles within the actual time window
-        news_list = []
-        for article in articles:
-            if "datetime" in article:
-                news_time = datetime.utcfromtimestamp(article["datetime"])
-                if news_time >= window_ago:
-                    news_list.append(article)
-        return news_list
-    except Exception as e:
-        #print(f"Error fetching news: {e}")
-        return []
-
-# call sentiment api for each article and return the avg sentiment.
-def get_aggregated_news_sentiment(articles, api_base_url):
-    sentiment_scores = []
-    for article in articles:
-        headline = article.get("headline") or article.get("title") or ""
-        summary = article.get("summary") or ""
-        if not (headline or summary):
-            continue
-        try:
-            resp = requests.post(
-                f"{api_base_url}/sentiment/",
-                json={"headline": headline, "summary": summary},
-                timeout=10
-            )
-            if resp.status_code == 200:
-                data = resp.json()
-                score = data.get('final_sentiment_score')
-                if score is not None:
-                    sentiment_scores.append(score)
-        except Exception as e:
-            #print(f"Sentiment API error: {e} for article: {headline}")
-            if sentiment_scores:
-                return float(sum(sentiment_scores)/len(sentiment_scores))
-            else:
-                return 0.0
+# optional explain flag, JSON true or ?explain=1
+def parse_flag(value):
+    return value is True or str(value).lower() in ('1', 'true', 'yes')
 
 class SentimentAnalysisView(APIView):
     def post(self, request):
@@ -113,168 +50,172 @@ class SentimentAnalysisView(APIView):
         text = (headline + ' ' + summary).strip()
         if not text:
             return Response({'error': 'No text provided.'}, status=status.HTTP_400_BAD_REQUEST) # checks that some text was sent
-        headers = {
-            "Authorization": f"Bearer {settings.HF_API_TOKEN}"
-        }
-        url = "https://api-inference.huggingface.co/models/mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis"
-        response = requests.post(url, headers=headers, json={"inputs": text})
-        if response.status_code != 200:
-            return Response({'error': 'Hugging Face API error', 'details': response.text}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        sentiments = response.json()[0]  # should be a list of dicts
-        # map scores into -1 for negative, neutral 0 and positive +1
-        scores = {item['label']: item['score'] for item in sentiments}
-        final_score = (-1 * scores.get('negative', 0)) + (0 * scores.get('neutral', 0)) + (1 * scores.get('positive', 0))
+        try:
+            final_score, scores = score_sentiment(headline, summary)
+        except SentimentError as e:
+            return Response({'error': str(e), 'details': e.details}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         return Response({ # must return both aggregate and indiv score
             "final_sentiment_score": final_score,
             "details": scores
         })
 
 
-class StockPredictionView(APIView):
-    def __init__(self):
-        super().__init__()
-        self.model = None
-        self.feature_columns = None
-        self.load_model()
-
-    #Load trained model and feature columns
-    def load_model(self):
+# Many articles in one request (bulk jobs like Data Files/News Article/apply_sentiment_analysis.py)
+# {"articles": [{"headline": ..., "summary": ...}, ...]} -> {"results": [{"final_sentiment_score", "details"}, ...]} same order,
+# score is None for an article without text
+class SentimentBatchView(APIView):
+    def post(self, request):
+        articles = request.data.get('articles')
+        if not isinstance(articles, list) or not articles:
+            return Response({'error': 'articles must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(articles) > settings.SENTIMENT_MAX_BATCH_REQUEST:
+            return Response({'error': f'At most {settings.SENTIMENT_MAX_BATCH_REQUEST} articles per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not all(isinstance(a, dict) for a in articles):
+            return Response({'error': 'each article must be an object with headline / summary'}, status=status.HTTP_400_BAD_REQUEST)
+        pairs = [(a.get('headline') or '', a.get('summary') or '') for a in articles]
+        if not all(isinstance(text, str) for pair in pairs for text in pair):
+            return Response({'error': 'headline and summary must be strings'}, status=status.HTTP_400_BAD_REQUEST)
+        results = score_many(pairs)
+        has_text = [bool(build_text(h, s)) for h, s in pairs]
+        if any(has_text) and all(score is None for (score, _), text in zip(results, has_text) if text):
+            return Response({'error': 'Sentiment backend unavailable'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'results': [{'final_sentiment_score': score, 'details': details} for score, details in results]})
+
+
+# /api/news/?symbol=&hours= (default 12, narrowed to 6 / widened to 24 depending on how much news there is,
+# ?adjust=0 keeps the window as given)
+class NewsView(APIView):
+    def get(self, request):
+        symbol = request.query_params.get('symbol', '').upper().strip()
+        if not symbol:
+            return Response({'error': 'Symbol is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            current_file = os.path.abspath(__file__)
-            backend_dir = os.path.dirname(os.path.dirname(current_file))
-            project_root = os.path.dirname(backend_dir)
-            model_dir = os.path.join(project_root, 'Data Files', 'Models')
-
-            model_path = os.path.join(model_dir, 'stock_prediction_model.pkl')
-            features_path = os.path.join(model_dir, 'feature_columns.pkl')
-            # Build full paths for the model and feature columns
+            hours = int(request.query_params.get('hours', 12))
+        except ValueError:
+            return Response({'error': 'hours must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= hours <= 24 * 7:
+            return Response({'error': 'hours must be between 1 and 168'}, status=status.HTTP_400_BAD_REQUEST)
+        adjust = request.query_params.get('adjust', '1') != '0'
+        hours, articles = news_store.company_news_page(symbol, hours, adjust)
+        return Response({'symbol': symbol, 'hours': hours, 'articles': [news_store.article_dict(a) for a in articles]})
+
+
+# /api/news/general/?hours=48&limit=12 - newest general market news
+class GeneralNewsView(APIView):
+    def get(self, request):
+        try:
+            hours = int(request.query_params.get('hours', 48))
+            limit = int(request.query_params.get('limit', 12))
+        except ValueError:
+            return Response({'error': 'hours and limit must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= hours <= 24 * 7 or not 1 <= limit <= 100:
+            return Response({'error': 'hours must be between 1 and 168, limit between 1 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+        articles = news_store.general_news_page(hours, limit)
+        return Response({'hours': hours, 'articles': [news_store.article_dict(a) for a in articles]})
+
+
+# Daily (UTC) mean sentiment per ticker from the materialised aggregate, dates as YYYY-MM-DD
+class DailySentimentView(APIView):
+    def get(self, request):
+        symbol = request.query_params.get('symbol', '').upper().strip()
+        if not symbol:
+            return Response({'error': 'Symbol is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            from_date = parse_query_date(request.query_params.get('from'))
+            to_date = parse_query_date(request.query_params.get('to'))
+        except ValueError:
+            return Response({'error': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = daily_sentiment.daily_range(symbol, from_date, to_date)
+        return Response({
+            'symbol': symbol,
+            'days': [
+                {'date': row.date.isoformat(), 'mean': row.mean, 'article_count': row.article_count}
+                for row in rows
+            ]
+        })
 
-            if not os.path.exists(model_path) or not os.path.exists(features_path):
-                #print("Files not found at expected location")
-                return
 
-            self.model = joblib.load(model_path)
-            self.feature_columns = joblib.load(features_path)
-            #print(f"Feature columns ({len(self.feature_columns)}): {self.feature_columns}") -- Impt for debug
+# BUY/SELL/HOLD for every stored day in a range (chart overlays), ?symbol=&from=&to= (YYYY-MM-DD, default last year)
+# &explain=1 adds the per-day feature contributions
+class PredictionHistoryView(APIView):
+    def get(self, request):
+        symbol = request.query_params.get('symbol', '').upper().strip()
+        if not symbol:
+            return Response({'error': 'Symbol is required'}, status=status.HTTP_400_BAD_REQUEST)
+        model, feature_columns, model_info = predictor.model_for(symbol)
+        if not model or not feature_columns:
+            return Response({'error': 'Model not loaded. Check Django console for details.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        try:
+            from_date = parse_query_date(request.query_params.get('from'))
+            to_date = parse_query_date(request.query_params.get('to'))
+        except ValueError:
+            return Response({'error': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        if from_date and to_date and from_date > to_date:
+            return Response({'error': 'from must be before to'}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            return Response(predictor.predict_history(
+                model, feature_columns, symbol, from_date, to_date, parse_flag(request.query_params.get('explain')), model_info['version']))
         except Exception as e:
-            #print(f"Error loading model: {e}")
-            self.model = None
-            self.feature_columns = None
+            return Response({'error': f'Prediction error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    #Fetch real-time stock data (OCLH) from finnhub, V + technicals from AlphaVantage (V, MACD, RSI, BB, OBV), and news sentiment
-    def fetch_real_time_data(self, symbol):
+
+# /api/chart/?symbol=&from=&to=&points= (default the last year, CHART_DEFAULT_POINTS points)
+class ChartView(APIView):
+    def get(self, request):
+        symbol = request.query_params.get('symbol', '').upper().strip()
+        if not symbol:
+            return Response({'error': 'Symbol is required'}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            finnhub_api_key = getattr(settings, 'FINNHUB_API_KEY', None)
-            alphavantage_api_key = getattr(settings, 'ALPHAVANTAGE_API_KEY', None)
-            api_base_url = "http://localhost:8000/api" if "localhost" in os.environ.get("HOSTNAME", "") else "https://ggwoman-b3a74177016a.herokuapp.com/api"
-            # local host component added for easy conversion btw local and deployed
-
-            if not finnhub_api_key or not alphavantage_api_key:
-                return None, "API key(s) not configured"
-
-            # Get basic price data from Finnhub - OCLH
-            quote_url = f"https://finnhub.io/api/v1/quote?symbol={symbol}&token={finnhub_api_key}"
-            response = requests.get(quote_url, timeout=10)
-            if response.status_code != 200:
-                return None, f"Finnhub API error: {response.status_code}"
-            quote_data = response.json()
-
-            # Validate response
-            if not quote_data or 'c' not in quote_data or quote_data['c'] == 0:
-                return None, f"Invalid or missing price data from Finnhub: {quote_data}"
-
-            # Getting OHLC frm Finnhub. AV will get V
-            current_price = quote_data['c']
-            high_price = quote_data['h']
-            low_price = quote_data['l']
-            open_price = quote_data['o']
-            previous_close = quote_data['pc']
-
-            # Get volume from AlphaVantage (will have more but compartmentalised to OCLHV + Technicals )
-            quote_json = fetch_alpha_vantage_quote(symbol, alphavantage_api_key)
-            if quote_json and "Global Quote" in quote_json:
-                global_quote = quote_json["Global Quote"]
-                volume = float(global_quote.get("06. volume", 0))
-            else:
-                volume = 0.0
-
-            #Get indicators from AlphaVantage (latest daily) (MACD, RSI, BB, OBV)
-
-            # MACD - Used MACDEXT to get around the Alphavantage Free Tier issue
-            macd_json = fetch_alpha_vantage_indicator( symbol, 'MACDEXT', alphavantage_api_key, interval='daily', series_type='close', fastperiod=12, slowperiod=26, signalperiod=9, fastmatype=1, slowmatype=1, signalmatype=1)
-            macd_data = macd_json.get('Technical Analysis: MACDEXT', {}) if macd_json else {}
-            latest_macd = next(iter(macd_data.values()), {}) if macd_data else {}
-            macd = float(latest_macd.get('MACD', 0))
-            macd_signal = float(latest_macd.get('MACD_Signal', 0))
-            macd_diff = float(latest_macd.get('MACD_Hist', 0))
-
-            # RSI
-            rsi_json = fetch_alpha_vantage_indicator(symbol, 'RSI', alphavantage_api_key, interval='daily', time_period=14, series_type='close')
-            rsi_data = rsi_json.get('Technical Analysis: RSI', {}) if rsi_json else {}
-            latest_rsi = next(iter(rsi_data.values()), {}) if rsi_data else {}
-            rsi = float(latest_rsi.get('RSI', 0))
-
-            # Bollinger Bands
-            bb_json = fetch_alpha_vantage_indicator(symbol, 'BBANDS', alphavantage_api_key, interval='daily', time_period=20, series_type='close')
-            bb_data = bb_json.get('Technical Analysis: BBANDS', {}) if bb_json else {}
-            latest_bb = next(iter(bb_data.values()), {}) if bb_data else {}
-            bb_bbm = float(latest_bb.get('Real Middle Band', 0))
-            bb_bbh = float(latest_bb.get('Real Upper Band', 0))
-            bb_bbl = float(latest_bb.get('Real Lower Band', 0))
-            bb_bbwidth = float(bb_bbh - bb_bbl) if bb_bbh and bb_bbl else 0
-
-            # OBV
-            obv_json = fetch_alpha_vantage_indicator(symbol, 'OBV', alphavantage_api_key, interval='daily')
-            obv_data = obv_json.get('Technical Analysis: OBV', {}) if obv_json else {}
-            latest_obv = next(iter(obv_data.values()), {}) if obv_data else {}
-            obv = float(latest_obv.get('OBV', 0))
-
-            # Get avg news Sentiment
-            articles = fetch_finnhub_news(symbol, finnhub_api_key)
-            news_sentiment = get_aggregated_news_sentiment(articles, api_base_url)
-            #print(f"Aggregated news sentiment for {symbol}: {news_sentiment}")
-
-            # Compose features (sentiment is now real)
-            features = {
-                'open': float(open_price),
-                'high': float(high_price),
-                'low': float(low_price),
-                'close': float(current_price),
-                'volume': float(volume),
-                'macd': macd,
-                'macd_signal': macd_signal,
-                'macd_diff': macd_diff,
-                'rsi': rsi,
-                'bb_bbm': bb_bbm,
-                'bb_bbh': bb_bbh,
-                'bb_bbl': bb_bbl,
-                'bb_bbwidth': bb_bbwidth,
-                'obv': obv,
-                'news_sentiment': news_sentiment
-            }
-
-            #print(f"Features from APIs: {features}") # Make sure its not 0. If 0, means that it is not working
-            return features, None
+            to_date = parse_query_date(request.query_params.get('to')) or datetime.utcnow().date()
+            from_date = parse_query_date(request.query_params.get('from')) or to_date - timedelta(days=365)
+            points = int(request.query_params.get('points', settings.CHART_DEFAULT_POINTS))
+        except ValueError:
+            return Response({'error': 'Dates must be YYYY-MM-DD and points a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if from_date > to_date:
+            return Response({'error': 'from must be before to'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 2 <= points <= settings.CHART_MAX_POINTS:
+            return Response({'error': f'points must be between 2 and {settings.CHART_MAX_POINTS}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows, last_modified = chart.range_state(symbol, from_date, to_date)
+        if not rows:
+            return Response({'error': f'No chart data for {symbol}'}, status=status.HTTP_404_NOT_FOUND)
+        etag = chart.make_etag(symbol, from_date, to_date, points, rows, last_modified)
+        modified = int(last_modified.timestamp()) # http dates are whole seconds
+        not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+        if not_modified is None:
+            body = cache.get(f"chart:{etag}")
+            if body is None:
+                body = chart.chart_data(symbol, from_date, to_date, points)
+                cache.set(f"chart:{etag}", body, settings.CHART_CACHE_SECONDS)
+            response = Response(body)
+        else:
+            response = not_modified
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified)
+        response['Cache-Control'] = 'no-cache' # browser keeps it but asks (If-None-Match) every time
+        return response
+
 
+class StockPredictionView(APIView):
+    #Fetch real-time stock data (OCLH) from finnhub, V + technicals from AlphaVantage (V, MACD, RSI, BB, OBV), and news sentiment
+    def fetch_real_time_data(self, symbol, client=None):
+        try:
+            return predictor.fetch_features(symbol, client)
+        except quota.QuotaExceeded:
+            raise
         except requests.exceptions.Timeout:
-            return None
+            return None, "Upstream API timed out"
         except requests.exceptions.RequestException as e:
-            return None
+            return None, f"Upstream API error: {e}"
         except Exception as e:
-            return None
+            return None, f"Error fetching data: {e}"
 
 # Prediction for given ticker
     def post(self, request):
-        # Check if model is loaded
-        if not self.model or not self.feature_columns:
-            print('Model not loaded properly')
-            return Response({
-                'error': 'Model not loaded. Check Django console for details.',
-                'model_loaded': self.model is not None,
-                'features_loaded': self.feature_columns is not None
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
+        started = time.perf_counter()
         # Get symbol from request
         symbol = request.data.get('symbol', '').upper().strip()
         if not symbol:
@@ -282,8 +223,37 @@ class StockPredictionView(APIView):
                 'error': 'Symbol is required'
             }, status=status.HTTP_400_BAD_REQUEST)
 
-        # Fetch real-time data
-        features, error = self.fetch_real_time_data(symbol)
+        # Check if model is loaded (the symbol's own / sector / global model, cached per process in predictor)
+        model, feature_columns, model_info = predictor.model_for(symbol)
+        if not model or not feature_columns:
+            print('Model not loaded properly')
+            return Response({
+                'error': 'Model not loaded. Check Django console for details.',
+                'model_loaded': model is not None,
+                'features_loaded': feature_columns is not None
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Optional date (YYYY-MM-DD): predict from that day's stored features instead of live data
+        try:
+            day = parse_query_date(request.data.get('date'))
+        except (TypeError, ValueError):
+            return Response({'error': 'Dates must be YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Fetch real-time data. Out of upstream quota: the latest stored features, marked stale
+        stale = None
+        if day:
+            features, error = predictor.stored_features(symbol, day)
+            if error:
+                return Response({'error': error}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            try:
+                features, error = self.fetch_real_time_data(symbol, quota.client_key(request.user, request.META))
+            except quota.QuotaExceeded as e:
+                day, features = predictor.fallback_features(symbol)
+                headers = {'Retry-After': str(e.retry_after)}
+                if features is None:
+                    return Response({'error': str(e), 'retry_after': e.retry_after}, status=status.HTTP_429_TOO_MANY_REQUESTS, headers=headers)
+                stale, error = {'as_of': day.isoformat(), 'reason': str(e), 'retry_after': e.retry_after}, None
         if error:
             #print(f"data fetch error: {error}")
             return Response({
@@ -291,54 +261,110 @@ class StockPredictionView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
         try:
-            # Prepare features for model (ensure all required features are present)
-            missing_features = [col for col in self.feature_columns if col not in features]
-            if missing_features:
-                #print(f"missing features: {missing_features}")
-                return Response({
-                    'error': f'Missing features: {missing_features}',
-                    'available_features': list(features.keys()),
-                    'required_features': self.feature_columns
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            # Create feature vector in correct order
-            feature_vector = [features[col] for col in self.feature_columns]
-            feature_array = np.array(feature_vector).reshape(1, -1)
-
-            # Makes prediction
-            prediction = self.model.predict(feature_array)[0]
-            prediction_proba = self.model.predict_proba(feature_array)[0]
-
-            # mapping of the prediction
-            prediction_map = {-1: 'SELL', 0: 'HOLD', 1: 'BUY'}
-            prediction_label = prediction_map[prediction]
-
-            # calc confidence/probability score
-            classes = self.model.classes_
-            confidence_scores = {
-                prediction_map[classes[i]]: float(prediction_proba[i])
-                for i in range(len(classes))
-            }
-
-            #print(f"Prediction: {prediction_label} ({prediction})")
-            #print(f"Confidence: {confidence_scores}")
-
-            return Response({
-                'symbol': symbol,
-                'prediction': prediction_label,
-                'prediction_code': int(prediction),
-                'confidence_scores': confidence_scores,
-                'features_used': features,
-                'timestamp': pd.Timestamp.now().isoformat(),
-                'model_info': {
-                    'features_count': len(self.feature_columns),
-                    'classes': [prediction_map[c] for c in classes]
-                }
-            })
+            fetched = time.perf_counter()
+            body, status_code = predictor.predict(model, feature_columns, symbol, features, parse_flag(request.data.get('explain')), model_info)
+            if status_code == 200: # queued for the prediction history table, written in the background
+                prediction_log.record_prediction(body, 'stored' if day else 'live', day, started, fetched)
+                if not day:
+                    drift.observe(features)
+            if stale:
+                return Response(body | {'stale': stale}, status=status_code, headers={'Retry-After': str(stale['retry_after'])})
+            return Response(body, status=status_code)
 
         except Exception as e:
             return Response({
                 'error': f'Prediction error: {str(e)}',
                 'features_received': features,
-                'model_features': self.feature_columns
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+                'model_features': feature_columns
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# /api/drift/ - recent live features vs the model's training data (this worker's counts)
+class DriftView(APIView):
+    def get(self, request):
+        monitor = drift.get_monitor()
+        if monitor is None:
+            return Response({'error': 'No feature reference for the current model, run train_model.py --reference-only'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response(monitor.report())
+
+
+class UpstreamView(APIView):
+    def get(self, request):
+        return Response({'pid': os.getpid(), 'hedge_providers': settings.UPSTREAM_HEDGE_PROVIDERS, 'endpoints': upstream.stats(),
+                         'quota': quota.snapshot() if settings.UPSTREAM_QUOTA else None})
+
+
+# /api/models/?symbol=AAPL - which model serves the symbol + this worker's family model cache
+class ModelsView(APIView):
+    def get(self, request):
+        registry = model_registry.get_registry()
+        if registry is None:
+            return Response({'family': None, 'model_version': predictor.model_version()})
+        body = {'family': registry.stats()}
+        symbol = request.query_params.get('symbol', '').upper().strip()
+        if symbol:
+            body['route'] = {'symbol': symbol, 'model': registry.route(symbol)}
+        return Response(body)
+
+
+# /api/dataset/?output=npy|arrow&symbols=AAPL,MSFT&from=&to=&columns=close,rsi,target (default npy, everything)
+# (?format= is taken by DRF) ticker + date always come first. npy responses carry the row count in X-Dataset-Rows
+class DatasetView(APIView):
+    def get(self, request):
+        if not dataset.has_dataset_token(request):
+            return Response({'error': 'Dataset token required'}, status=status.HTTP_403_FORBIDDEN)
+        fmt = request.query_params.get('output', 'npy')
+        symbols = [s for s in request.query_params.get('symbols', '').split(',') if s.strip()]
+        try:
+            if fmt not in dataset.FORMATS:
+                raise dataset.DatasetError(f"output must be one of {', '.join(dataset.FORMATS)}")
+            if fmt == 'arrow' and dataset.pa is None:
+                raise dataset.DatasetError("Arrow output needs pyarrow on the server, use output=npy")
+            columns = dataset.select_columns([c.strip() for c in request.query_params.get('columns', '').split(',') if c.strip()])
+            from_date = parse_query_date(request.query_params.get('from'))
+            to_date = parse_query_date(request.query_params.get('to'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        until = dataset.store_until(symbols) if fmt == 'npy' else None # same rows for the count and the body
+        batches = dataset.store_batches(columns, symbols, from_date, to_date, until)
+        headers = {'X-Dataset-Columns': ','.join(dataset.KEY_COLUMNS + columns)}
+        if fmt == 'npy':
+            rows = dataset.store_count(symbols, from_date, to_date, until)
+            chunks = dataset.npy_chunks(batches, columns, rows)
+            headers['X-Dataset-Rows'] = str(rows)
+            content_type, filename = 'application/octet-stream', 'dataset.npy'
+        else:
+            chunks = dataset.arrow_chunks(batches, columns)
+            content_type, filename = 'application/vnd.apache.arrow.stream', 'dataset.arrows'
+        if settings.ASYNC_VIEWS:
+            chunks = dataset.aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type, headers=headers)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+# /api/profiles/?limit=20 - newest first, same X-Profile token header as the profiled requests
+class ProfileListView(APIView):
+    def get(self, request):
+        if not has_profile_token(request):
+            return Response({'error': 'Profiling token required'}, status=status.HTTP_403_FORBIDDEN)
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'profiles': profiling.list_profiles(settings.PROFILE_DIR, limit)})
+
+
+# /api/profiles/<id>/?kind=cpu|alloc|json - the folded stacks (feed to flamegraph.pl / speedscope) or the summary
+class ProfileFileView(APIView):
+    def get(self, request, profile_id):
+        if not has_profile_token(request):
+            return Response({'error': 'Profiling token required'}, status=status.HTTP_403_FORBIDDEN)
+        kind = request.query_params.get('kind', 'cpu')
+        path = profiling.profile_file(profile_id, kind, settings.PROFILE_DIR)
+        if path is None:
+            return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+        content_type = 'application/json' if kind == 'json' else 'text/plain; charset=utf-8'
+        return FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=kind != 'json', filename=os.path.basename(path))
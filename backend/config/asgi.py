@@ -12,5 +12,16 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_VIEWS', '1') # serve /api/sentiment/ + /api/predict/ with the async views
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api import live # needs the apps loaded
+
+
+# websockets (/ws/live/ prediction + news push) go to the live hub, everything else to Django
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        await live.websocket_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -16,12 +16,106 @@ load_dotenv()
 HF_API_TOKEN = os.getenv('HF_API_TOKEN')
 ALPHAVANTAGE_API_KEY = os.getenv('ALPHAVANTAGE_API_KEY')
 FINNHUB_API_KEY = os.getenv('FINNHUB_API_KEY')
+# Upstream base urls (overridable so the load test can point them at a local fake upstream)
+FINNHUB_API_URL = os.getenv('FINNHUB_API_URL', 'https://finnhub.io/api/v1')
+ALPHAVANTAGE_API_URL = os.getenv('ALPHAVANTAGE_API_URL', 'https://www.alphavantage.co/query')
+HF_SENTIMENT_URL = os.getenv('HF_SENTIMENT_URL', 'https://api-inference.huggingface.co/models/mrm8488/distilroberta-finetuned-financial-news-sentiment-analysis')
+# set by config/asgi.py: /api/sentiment/ + /api/predict/ are served by the async views (api/async_views.py)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS') == '1'
+
+# api/upstream.py: timeouts from observed latency, hedged requests (second copy after p95) for the listed providers
+UPSTREAM_LATENCY_WINDOW = 200 # latencies kept per provider + endpoint
+UPSTREAM_MIN_SAMPLES = 20 # fixed timeouts + no hedging until then
+UPSTREAM_TIMEOUT_FACTOR = 3.0 # timeout = p99 * this, capped at the old fixed timeout
+UPSTREAM_TIMEOUT_MIN = 1.0
+UPSTREAM_HEDGE_PROVIDERS = [p for p in os.getenv('UPSTREAM_HEDGE_PROVIDERS', 'finnhub').split(',') if p] # AlphaVantage's free tier can't spare the calls
+UPSTREAM_HEDGE_MAX_SHARE = 0.1 # hedges per provider request, over the last minute
+UPSTREAM_HEDGE_THREADS = 32 # sync views: pool the hedged requests run on
+UPSTREAM_QUOTA_PER_MINUTE = { # no hedge once a provider had this many requests in the last minute
+    'finnhub': int(os.getenv('FINNHUB_QUOTA_PER_MINUTE', 60)),
+    'alphavantage': int(os.getenv('ALPHAVANTAGE_QUOTA_PER_MINUTE', 5)),
+    'hf': int(os.getenv('HF_QUOTA_PER_MINUTE', 60)),
+}
+
+# api/quota.py: cluster wide token buckets (db rows) in front of the live predictions. Provider buckets hold
+# UPSTREAM_QUOTA_PER_MINUTE tokens and refill at that rate, plus a daily cap. Background refreshes (/ws/live/) can't
+# dip into the last QUOTA_BACKGROUND_RESERVE of a provider's bucket, which is kept for interactive requests. Out of
+# quota -> the latest stored features (up to QUOTA_FALLBACK_MAX_AGE_DAYS old) marked stale, or a 429, with Retry-After
+UPSTREAM_QUOTA = os.getenv('UPSTREAM_QUOTA', '1') == '1' # 0 = no buckets (load tests against the fake upstream)
+UPSTREAM_QUOTA_PER_DAY = {
+    'alphavantage': int(os.getenv('ALPHAVANTAGE_QUOTA_PER_DAY', 25)),
+}
+QUOTA_BACKGROUND_RESERVE = float(os.getenv('QUOTA_BACKGROUND_RESERVE', 0.3))
+CLIENT_PREDICTIONS_PER_MINUTE = float(os.getenv('CLIENT_PREDICTIONS_PER_MINUTE', 2)) # live predictions per user / ip
+# proxies in front of the app that append to X-Forwarded-For (1 = the Heroku router), the client ip is that many
+# hops from the end - anything before it was sent by the client. 0 = use REMOTE_ADDR
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 1))
+QUOTA_FALLBACK_MAX_AGE_DAYS = int(os.getenv('QUOTA_FALLBACK_MAX_AGE_DAYS', 7))
+
+NEWS_REFRESH_SECONDS = int(os.getenv('NEWS_REFRESH_SECONDS', 300)) # min gap between Finnhub news fetches per feed
+NEWS_BUSY_COUNT = 10 # /api/news/: more articles than this in the window -> 6h window
+NEWS_QUIET_COUNT = 3 # fewer than this -> 24h window
+
+# Sentiment backend: 'remote' (HF inference API), 'local' (in-process model from SENTIMENT_MODEL_DIR) or 'lexicon' (offline)
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'remote')
+SENTIMENT_MODEL_DIR = os.getenv('SENTIMENT_MODEL_DIR')
+SENTIMENT_MAX_BATCH = int(os.getenv('SENTIMENT_MAX_BATCH', 32))
+SENTIMENT_MAX_WAIT_MS = int(os.getenv('SENTIMENT_MAX_WAIT_MS', 10))
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', 2))
+SENTIMENT_MAX_BATCH_REQUEST = int(os.getenv('SENTIMENT_MAX_BATCH_REQUEST', 256)) # articles per /api/sentiment/batch/ call
+SENTIMENT_RETRY_SECONDS = int(os.getenv('SENTIMENT_RETRY_SECONDS', 300)) # articles that failed scoring aren't retried sooner
+
+# Serving budget for the trained model (0 = no limit). train_model.py uses the same env vars as its default budget
+# and the API logs a warning on model load when the costs in model_metadata.json are over
+MODEL_MAX_LATENCY_MS = float(os.getenv('MODEL_MAX_LATENCY_MS') or 0) # single-row predict_proba
+MODEL_MAX_MEMORY_MB = float(os.getenv('MODEL_MAX_MEMORY_MB') or 0)
+MODEL_MAX_SIZE_MB = float(os.getenv('MODEL_MAX_SIZE_MB') or 0)
+
+PREDICTION_HISTORY_CACHE_SECONDS = int(os.getenv('PREDICTION_HISTORY_CACHE_SECONDS', 300)) # /api/predict/history/ results
+CHART_DEFAULT_POINTS = int(os.getenv('CHART_DEFAULT_POINTS', 500)) # /api/chart/ downsamples to this many points
+CHART_MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 5000))
+CHART_CACHE_SECONDS = int(os.getenv('CHART_CACHE_SECONDS', 300)) # keyed by ETag, so new rows never serve a stale chart
+
+PREDICTION_LOG_SIZE = int(os.getenv('PREDICTION_LOG_SIZE', 10000)) # predictions queued for the history table, 0 = off
+PREDICTION_LOG_BATCH = 200 # rows per bulk_create
+PREDICTION_LOG_FLUSH_SECONDS = float(os.getenv('PREDICTION_LOG_FLUSH_SECONDS', 2)) # max wait before a partial batch
+
+DRIFT_HALF_LIFE = int(os.getenv('DRIFT_HALF_LIFE', 500)) # /api/drift/: predictions until an observation counts half
+DRIFT_MIN_OBSERVATIONS = 30 # no drift score before this many (decayed) predictions, keep it under DRIFT_HALF_LIFE / ln 2
+DRIFT_PSI_WARN = 0.1
+DRIFT_PSI_ALERT = 0.25
+
+LIVE_REFRESH_SECONDS = int(os.getenv('LIVE_REFRESH_SECONDS', 60)) # /ws/live/: upstream refresh per watched symbol
+LIVE_QUEUE_SIZE = 50 # updates buffered per socket before the oldest are dropped
+LIVE_MAX_SYMBOLS = 20 # per connection
+LIVE_MAX_CONNECTIONS_PER_CLIENT = int(os.getenv('LIVE_MAX_CONNECTIONS_PER_CLIENT', 5)) # open sockets per ip, per worker
+LIVE_MAX_TOPICS = int(os.getenv('LIVE_MAX_TOPICS', 200)) # distinct symbols (= refresh loops) per worker
+# browser origins allowed to open /ws/live/ besides pages on ALLOWED_HOSTS, e.g. https://app.example.com (the frontend)
+LIVE_ALLOWED_ORIGINS = [o.strip().rstrip('/') for o in os.getenv('LIVE_ALLOWED_ORIGINS', '').split(',') if o.strip()]
 
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# Request profiling (api/middleware.py): requests with X-Profile: <PROFILE_TOKEN> (unset = disabled) or a random
+# PROFILE_SAMPLE_RATE of all requests get a CPU + allocation profile in PROFILE_DIR (shared with the scripts' --profile)
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE') or 0)
+
+# Model family (scripts/model_family.py, train_model.py --family): each symbol is served by its ticker / sector /
+# global model when MODEL_FAMILY_DIR has a manifest ('' = always the single model), loaded on first use and
+# least recently used ones dropped above MODEL_CACHE_MB of loaded forests per worker
+MODEL_FAMILY_DIR = os.getenv('MODEL_FAMILY_DIR', str(BASE_DIR.parent / 'Data Files' / 'Models' / 'family'))
+MODEL_CACHE_MB = float(os.getenv('MODEL_CACHE_MB', 256))
+# AlphaVantage bar size the live indicators are computed on (daily, 60min, 15min, 5min, 1min). Has to match the bars
+# the model was trained on (scripts/resample.py --interval), an intraday model fed daily MACD/RSI is meaningless
+INDICATOR_INTERVAL = os.getenv('INDICATOR_INTERVAL', 'daily')
+
+# /api/dataset/ (labelled dataset as npy / Arrow record batches) needs X-Dataset-Token: <DATASET_TOKEN>, unset = disabled
+DATASET_TOKEN = os.getenv('DATASET_TOKEN', '')
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
@@ -51,6 +145,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'django.middleware.gzip.GZipMiddleware', # compresses large JSON (chart / history) for clients that accept gzip
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -59,6 +154,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.ProfilingMiddleware', # last, so the profile covers the view and not the rest of the stack
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -96,7 +192,7 @@ DATABASES = {
     'default': dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=os.environ.get('DATABASE_URL', '').startswith('postgres') # sqlite (local/tests) does not take sslmode
     )
 }
 
@@ -0,0 +1,82 @@
+# Cost of the per-feature contributions behind /api/predict/ {"explain": true} and /api/predict/history/?explain=1
+# Usage (from backend/scripts): python benchmark_attribution.py [--rows 1000]
+# Times plain predict_proba, api.attribution's sparse decision-path product and a naive python walk of every tree,
+# for one row (a live prediction) and a batch (a history range), and checks the two decompositions agree
+
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+
+try:
+    from . import universe
+    from .benchmark_feature_store import percentiles
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    import universe
+    from benchmark_feature_store import percentiles
+    from django_env import setup_django
+
+
+# rows spread over the range each feature is actually split on, so paths go as deep as they do on real data
+def sample_rows(model, n, rng):
+    low = np.zeros(model.n_features_in_)
+    high = np.ones(model.n_features_in_)
+    for feature in range(model.n_features_in_):
+        thresholds = np.concatenate([t.tree_.threshold[t.tree_.feature == feature] for t in model.estimators_])
+        if len(thresholds):
+            low[feature], high[feature] = thresholds.min(), thresholds.max()
+    return rng.uniform(low, high, (n, model.n_features_in_)).astype(np.float32)
+
+
+def timed(fn, repeats):
+    fn() # warm up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default=os.path.join(universe.MODELS_DIR, 'stock_prediction_model.pkl'))
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from api import attribution
+
+    model = joblib.load(args.model)
+    model.set_params(n_jobs=1) # what a request thread pays, no joblib fan out for one row
+    nodes = sum(t.tree_.node_count for t in model.estimators_)
+    print(f"{len(model.estimators_)} trees, {nodes:,} nodes, {model.n_features_in_} features, {len(model.classes_)} classes")
+
+    start = time.perf_counter()
+    explainer = attribution.ForestExplainer(model)
+    print(f"explainer build: {(time.perf_counter() - start) * 1000:.1f} ms, {explainer.table.nbytes / 1e6:.1f} MB")
+
+    X = sample_rows(model, args.rows, np.random.default_rng(0))
+    row = X[:1]
+    print(f"1 row      predict_proba        {percentiles(timed(lambda: model.predict_proba(row), args.repeats))}")
+    print(f"1 row      vectorized           {percentiles(timed(lambda: explainer.contributions(row), args.repeats))}")
+    print(f"1 row      naive tree walk      {percentiles(timed(lambda: attribution.naive_contributions(model, row), 10))}")
+
+    print(f"{args.rows} rows  predict_proba        {percentiles(timed(lambda: model.predict_proba(X), 5))}")
+    print(f"{args.rows} rows  vectorized           {percentiles(timed(lambda: explainer.contributions(X), 5))}")
+    naive_rows = X[:100] # the python walk is too slow for the whole batch, timed on 100 rows and scaled
+    naive = np.array(timed(lambda: attribution.naive_contributions(model, naive_rows), 1)) * len(X) / len(naive_rows)
+    print(f"{args.rows} rows  naive tree walk      {percentiles(naive)} (from {len(naive_rows)} rows)")
+
+    contributions = explainer.contributions(X)
+    drift = np.abs(contributions[:len(naive_rows)] - attribution.naive_contributions(model, naive_rows)).max()
+    gap = np.abs(explainer.bias + contributions.sum(axis=1) - model.predict_proba(X)).max()
+    print(f"max |vectorized - naive| {drift:.2e}, max |bias + sum - predict_proba| {gap:.2e}")
+
+
+if __name__ == "__main__":
+    main()
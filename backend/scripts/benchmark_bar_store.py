@@ -0,0 +1,88 @@
+# DailyBar (api.bar_store) bulk import throughput + range read latency on a synthetic universe
+# Usage (from backend/scripts): python benchmark_bar_store.py --tickers 100 --days 2520
+# Uses a throwaway sqlite db unless --database-url is given (point it at an empty postgres db to measure that)
+# Range reads are timed three ways: bar_store.get_range (raw cursor -> numpy), the ORM's values_list -> numpy, and
+# full model instances -> numpy (what a plain DailyBar.objects.filter loop costs)
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+import numpy as np
+
+try:
+    from .benchmark_feature_store import percentiles, storage_bytes, trading_days
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    from benchmark_feature_store import percentiles, storage_bytes, trading_days
+    from django_env import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'bars.db')}"
+    setup_django()
+    from django.core.management import call_command
+    from django.db import connection
+    from api import bar_store
+    from api.models import DailyBar
+
+    call_command('migrate', verbosity=0)
+    rng = np.random.default_rng(0)
+    days = trading_days(args.days)
+    symbols = [f"T{i:04d}" for i in range(args.tickers)]
+    rows = len(symbols) * len(days)
+
+    def bars_for(symbol):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        return list(zip(days, close * 0.99, close * 1.01, close * 0.98, close, rng.integers(1e5, 1e7, len(days)).astype(float)))
+
+    generated = {symbol: bars_for(symbol) for symbol in symbols}
+    for label in ('insert', 'upsert (same rows again)'):
+        start = time.perf_counter()
+        for symbol in symbols:
+            bar_store.write_bars(symbol, generated[symbol])
+        elapsed = time.perf_counter() - start
+        print(f"{label:<26} {rows:,} bars in {elapsed:.1f}s, {rows / elapsed:,.0f} bars/s")
+
+    size = storage_bytes(connection, 'api_dailybar')
+    print(f"{connection.vendor}: {size / 1e6:.1f} MB, {size / rows:.0f} bytes/bar")
+
+    def orm_values(symbol, from_date, to_date):
+        qs = DailyBar.objects.filter(symbol=symbol, date__gte=from_date, date__lte=to_date).order_by('date')
+        rows = list(qs.values_list('date', *bar_store.BAR_COLUMNS))
+        return np.array([r[0] for r in rows], dtype='datetime64[D]'), np.array([r[1:] for r in rows], dtype=float)
+
+    def orm_instances(symbol, from_date, to_date):
+        bars = list(DailyBar.objects.filter(symbol=symbol, date__gte=from_date, date__lte=to_date).order_by('date'))
+        return (np.array([b.date for b in bars], dtype='datetime64[D]'),
+                np.array([[getattr(b, col) for col in bar_store.BAR_COLUMNS] for b in bars], dtype=float))
+
+    for span_name, span in (('1 year', 365), (f'{len(days) // 252} years', None)):
+        for name, fn in (('get_range (cursor)', bar_store.get_range), ('values_list', orm_values), ('model instances', orm_instances)):
+            samples = []
+            for _ in range(args.reads):
+                symbol = random.choice(symbols)
+                to_date = random.choice(days[len(days) // 2:]) if span else days[-1]
+                from_date = to_date - timedelta(days=span) if span else days[0]
+                start = time.perf_counter()
+                fn(symbol, from_date, to_date)
+                samples.append(time.perf_counter() - start)
+            print(f"{span_name:<9} {name:<20} {percentiles(samples)}")
+
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Feature store (api.FeatureRow) lookup latency + storage footprint on a synthetic universe
+# Usage (from backend/scripts): python benchmark_feature_store.py --tickers 100 --days 2520 --lookups 2000
+# Uses a throwaway sqlite db unless --database-url is given (point it at an empty postgres db to measure that)
+# For comparison it also answers the same point lookup the old way: read the training csv and filter it
+# Also times a year of /api/predict/history/ (predictor.predict_history) if the trained model is there, and
+# /api/chart/ work for the whole range: full vs downsampled payload (raw / gzip) and the 304 check
+
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    from django_env import setup_django
+
+
+def percentiles(samples):
+    ms = np.array(samples) * 1000
+    return f"p50 {np.percentile(ms, 50):.2f} ms, p95 {np.percentile(ms, 95):.2f} ms"
+
+
+def trading_days(n):
+    days, day = [], date(2015, 1, 1)
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def storage_bytes(connection, table='api_featurerow'):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT pg_total_relation_size(%s)", [table])
+            return cursor.fetchone()[0]
+        try: # table + its indexes, needs sqlite built with dbstat
+            cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)", [table])
+            return cursor.fetchone()[0]
+        except Exception:
+            return os.path.getsize(connection.settings_dict['NAME'])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tickers', type=int, default=100)
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'features.db')}"
+    setup_django()
+    from django.core.management import call_command
+    from django.db import connection
+    from api import chart, feature_store, predictor
+    from django.core.cache import cache
+
+    call_command('migrate', verbosity=0)
+    rng = np.random.default_rng(0)
+    days = trading_days(args.days)
+    symbols = [f"T{i:04d}" for i in range(args.tickers)]
+    columns = feature_store.FEATURE_COLUMNS
+
+    csv_path = os.path.join(tmp, 'features.csv')
+    start = time.perf_counter()
+    for i, symbol in enumerate(symbols):
+        df = pd.DataFrame(rng.normal(100, 10, (len(days), len(columns))), columns=columns)
+        df.insert(0, 'date', pd.to_datetime(days))
+        feature_store.write_frame(symbol, df)
+        df.insert(1, 'ticker', symbol)
+        df.to_csv(csv_path, mode='a', header=i == 0, index=False)
+    write_s = time.perf_counter() - start
+    rows = len(symbols) * len(days)
+    print(f"{rows:,} rows ({args.tickers} tickers x {args.days} days) on {connection.vendor}")
+    print(f"write (incl. csv copy): {write_s:.1f}s, {rows / write_s:,.0f} rows/s")
+
+    size = storage_bytes(connection)
+    print(f"storage: {size / 1e6:.1f} MB, {size / rows:.0f} bytes/row (csv: {os.path.getsize(csv_path) / rows:.0f} bytes/row)")
+
+    def timed(fn, n):
+        samples = []
+        for _ in range(n):
+            symbol, day = random.choice(symbols), random.choice(days)
+            start = time.perf_counter()
+            fn(symbol, day)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    print(f"get_features (exact day): {percentiles(timed(feature_store.get_features, args.lookups))}")
+    print(f"as_of (latest on/before): {percentiles(timed(feature_store.as_of, args.lookups))}")
+    year_scans = timed(lambda symbol, day: feature_store.get_range(symbol, day - timedelta(days=365), day), max(args.lookups // 10, 1))
+    print(f"get_range (1 year):       {percentiles(year_scans)}")
+
+    # /api/predict/history/ work for a year: range scan + one predict_proba, then the same call from the cache
+    model, feature_columns = predictor.load_model()
+    if model:
+        def history(symbol, day):
+            predictor.predict_history(model, feature_columns, symbol, day - timedelta(days=365), day)
+        predictor.predict_history(model, feature_columns, symbols[0], days[-1] - timedelta(days=365), days[-1]) # warm up
+        cache.clear()
+        print(f"predict_history (1 year): {percentiles(timed(history, max(args.lookups // 20, 1)))} uncached")
+        cached = []
+        for _ in range(max(args.lookups // 20, 1)):
+            start = time.perf_counter()
+            predictor.predict_history(model, feature_columns, symbols[0], days[-1] - timedelta(days=365), days[-1])
+            cached.append(time.perf_counter() - start)
+        print(f"predict_history (1 year): {percentiles(cached)} cached")
+
+    # /api/chart/ for everything stored: raw rows vs LTTB to 500 points, then what a 304 costs (one aggregate)
+    first, last = days[0], days[-1]
+    for points in (len(days), 500):
+        start = time.perf_counter()
+        body = json.dumps(chart.chart_data(symbols[0], first, last, points)).encode()
+        build_ms = (time.perf_counter() - start) * 1000
+        print(f"chart {points:>5} points: {build_ms:.1f} ms, {len(body) / 1e3:.0f} KB json, {len(gzip.compress(body)) / 1e3:.0f} KB gzip")
+    states = timed(lambda symbol, day: chart.range_state(symbol, first, last), max(args.lookups // 10, 1))
+    print(f"chart 304 check:          {percentiles(states)}")
+
+    def csv_lookup(symbol, day):
+        df = pd.read_csv(csv_path)
+        return df[(df['ticker'] == symbol) & (df['date'] == day.isoformat())]
+
+    print(f"csv read + filter:        {percentiles(timed(csv_lookup, 3))}")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
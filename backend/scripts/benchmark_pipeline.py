@@ -0,0 +1,99 @@
+# Wall time + peak memory of the offline pipeline as the universe grows
+# Builds a fake universe of N tickers (real price/news files copied under new names) in a temp data dir, then runs
+# every stage against it through PIPELINE_DATA_DIR with a throwaway sqlite db and the lexicon sentiment backend:
+#   python benchmark_pipeline.py --sizes 10 50 200 --workers 4
+# "peak MB" is the biggest single process of the stage (parent or any worker), which should stay flat as N grows
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try:
+    from . import universe
+except ImportError: # run as a script from backend/scripts
+    import universe
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(SCRIPTS_DIR)
+
+STAGES = [
+    ('indicators', ['calculate_indicators.py'], True),
+    ('clean', ['clean_all_stocks.py'], True),
+    ('consolidate', ['consolidate_data_with_sentiment.py'], True),
+    ('labels', ['create_target_labels.py'], False),
+]
+
+
+# copies of the real tickers under fake names (T0001, T0002, ...) until there are n of them
+def build_universe(data_dir, n):
+    source = universe.discover_tickers()
+    if not source:
+        raise SystemExit(f"No price + news files found in {universe.DATA_DIR}")
+    os.makedirs(os.path.join(data_dir, 'Price'), exist_ok=True)
+    os.makedirs(os.path.join(data_dir, 'News Article'), exist_ok=True)
+    for i in range(n):
+        ticker = f"T{i:04d}"
+        real = source[i % len(source)]
+        shutil.copy(universe.price_path(real), os.path.join(data_dir, 'Price', universe.PRICE_PATTERN.format(ticker=ticker)))
+        shutil.copy(universe.news_path(real), os.path.join(data_dir, 'News Article', universe.NEWS_PATTERN.format(ticker_lower=ticker.lower())))
+
+
+# run one stage in a child and return (seconds, peak rss of its biggest process in MB)
+def measure(cmd, env):
+    # ru_maxrss for children is the max over everything waited for so far, so each stage gets its own wrapper process
+    wrapper = (
+        "import json, resource, subprocess, sys, time\n"
+        "start = time.perf_counter()\n"
+        "rc = subprocess.run(sys.argv[1:], stdout=subprocess.DEVNULL).returncode\n"
+        "print(json.dumps([rc, time.perf_counter() - start, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss]))\n"
+    )
+    out = subprocess.run([sys.executable, '-c', wrapper, *cmd], env=env, cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise SystemExit(out.stderr)
+    rc, seconds, max_rss_kb = json.loads(out.stdout.strip().splitlines()[-1])
+    if rc != 0:
+        raise SystemExit(f"{' '.join(cmd)} exited with {rc}")
+    return seconds, max_rss_kb / 1024
+
+
+def run_size(n, workers):
+    with tempfile.TemporaryDirectory() as data_dir:
+        build_universe(data_dir, n)
+        env = dict(
+            os.environ,
+            PIPELINE_DATA_DIR=data_dir,
+            DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+            SENTIMENT_BACKEND='lexicon',
+        )
+        env.pop('UNIVERSE', None)
+        env.pop('UNIVERSE_FILE', None)
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '-v', '0'], env=env, cwd=BACKEND_DIR, check=True)
+
+        timings = []
+        for name, script, parallel in STAGES:
+            cmd = [sys.executable, *script] + (['--workers', str(workers)] if parallel else [])
+            timings.append((name, *measure(cmd, env)))
+        return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 25, 100])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print(f"{'tickers':>8}{'stage':>14}{'seconds':>10}{'s/ticker':>10}{'peak MB':>10}")
+    for n in args.sizes:
+        total = 0
+        for name, seconds, peak_mb in run_size(n, args.workers):
+            total += seconds
+            print(f"{n:>8}{name:>14}{seconds:>10.2f}{seconds / n:>10.3f}{peak_mb:>10.0f}")
+        print(f"{n:>8}{'total':>14}{total:>10.2f}{total / n:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
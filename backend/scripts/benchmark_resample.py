@@ -0,0 +1,90 @@
+# resample.py throughput + peak memory on synthetic minute bars, against pandas' DataFrame.resample on a subset
+# Usage (from backend/scripts): python benchmark_resample.py --minutes 30000000 --interval 5m
+# Minutes are generated chunk by chunk (24h a day, so the session filter drops most of them, like a real extended
+# hours feed), so the numpy run never holds more than one chunk. pandas gets the first --pandas-minutes as one frame.
+# Peak RSS is the process high water mark, so the numpy run goes first
+
+import argparse
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .resample import CHUNK_ROWS, MINUTE_NS, resample_chunks
+except ImportError: # run as a script from backend/scripts
+    from resample import CHUNK_ROWS, MINUTE_NS, resample_chunks
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3 # bytes on macOS, KB on linux
+
+
+def minute_chunks(total, chunk_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2000-01-03').value
+    price = 100.0
+    for offset in range(0, total, chunk_rows):
+        n = min(chunk_rows, total - offset)
+        ts = start + (offset + np.arange(n, dtype=np.int64)) * MINUTE_NS
+        close = price * np.exp(np.cumsum(rng.normal(0, 0.0005, n)))
+        price = close[-1]
+        yield ts, close * (1 + rng.normal(0, 0.0002, n)), close * 1.0005, close * 0.9995, close, rng.integers(1, 5000, n).astype(float)
+
+
+def pandas_bars(total, chunk_rows, rule):
+    frame = pd.concat([
+        pd.DataFrame({'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}, index=pd.to_datetime(ts))
+        for ts, o, h, l, c, v in minute_chunks(total, chunk_rows)
+    ])
+    start = time.perf_counter()
+    minute = frame.index.hour * 60 + frame.index.minute
+    session = frame[(minute >= 570) & (minute < 960)]
+    bars = session.resample(rule, origin='start_day', offset='30min').agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}).dropna(subset=['open'])
+    return len(bars), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--minutes', type=int, default=30_000_000)
+    parser.add_argument('--pandas-minutes', type=int, default=5_000_000)
+    parser.add_argument('--interval', default='5m')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    base = peak_rss_mb()
+    bars = 0
+    generate = 0.0
+    chunks = minute_chunks(args.minutes, args.chunk_rows)
+    start = time.perf_counter()
+
+    def timed(): # generating the synthetic minutes isn't resampling, keep it out of the throughput
+        nonlocal generate
+        while True:
+            t = time.perf_counter()
+            chunk = next(chunks, None)
+            generate += time.perf_counter() - t
+            if chunk is None:
+                return
+            yield chunk
+
+    for part in resample_chunks(timed(), args.interval):
+        bars += len(part['time'])
+    elapsed = time.perf_counter() - start - generate
+    print(f"numpy  {args.minutes:>12,} minutes -> {bars:,} {args.interval} bars in {elapsed:.2f}s, "
+          f"{args.minutes / elapsed / 1e6:.1f}M minutes/s, peak RSS +{peak_rss_mb() - base:.0f} MB")
+
+    rule = args.interval.replace('m', 'min') if args.interval.endswith('m') else args.interval
+    base = peak_rss_mb()
+    n = min(args.pandas_minutes, args.minutes)
+    pandas_count, pandas_elapsed = pandas_bars(n, args.chunk_rows, rule)
+    print(f"pandas {n:>12,} minutes -> {pandas_count:,} {args.interval} bars in {pandas_elapsed:.2f}s, "
+          f"{n / pandas_elapsed / 1e6:.1f}M minutes/s, peak RSS +{peak_rss_mb() - base:.0f} MB (whole frame in memory)")
+
+
+if __name__ == "__main__":
+    main()
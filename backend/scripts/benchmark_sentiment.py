@@ -0,0 +1,76 @@
+# Throughput/latency of each sentiment backend on real headlines from the news CSVs
+# Usage (from backend/scripts): python benchmark_sentiment.py --backends lexicon remote local --articles 200 --concurrency 8
+# local needs SENTIMENT_MODEL_DIR set, remote needs HF_API_TOKEN
+
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    from django_env import setup_django
+
+NEWS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Data Files", "News Article")
+
+
+def load_texts(n):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(NEWS_FOLDER, "*_news_complete_year.csv"))):
+        df = pd.read_csv(path, encoding="latin1", usecols=['headline', 'summary'])
+        texts.extend((df['headline'].fillna('') + ' ' + df['summary'].fillna('')).str.strip().tolist())
+        if len(texts) >= n:
+            break
+    return texts[:n]
+
+
+# each worker sends one article at a time (like the web endpoint does), so latency = per article
+def run_backend(backend, texts, concurrency):
+    def timed(text):
+        start = time.perf_counter()
+        backend.score(text)
+        return time.perf_counter() - start
+
+    backend.score(texts[0]) # warm up (model load, connection pool)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = np.array(list(pool.map(timed, texts))) * 1000
+    elapsed = time.perf_counter() - start
+    return {
+        'articles_per_s': len(texts) / elapsed,
+        'p50_ms': np.percentile(latencies, 50),
+        'p95_ms': np.percentile(latencies, 95),
+        'max_ms': latencies.max(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backends', nargs='+', default=['lexicon'])
+    parser.add_argument('--articles', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    from api.sentiment import create_backend
+
+    texts = load_texts(args.articles)
+    print(f"{len(texts)} articles, concurrency {args.concurrency}")
+    print(f"{'backend':<10}{'articles/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name in args.backends:
+        try:
+            backend = create_backend(name)
+            stats = run_backend(backend, texts, args.concurrency)
+        except Exception as e:
+            print(f"{name:<10} failed: {e}")
+            continue
+        print(f"{name:<10}{stats['articles_per_s']:>12.1f}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
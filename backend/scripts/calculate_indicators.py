@@ -1,5 +1,6 @@
 # essentially a shortcut for the technical indicator instead of using excel formula. Also transcribes it to a processed folder suhc that it dosent change initial csv
 
+import argparse
 import os
 import pandas as pd
 from ta.momentum import RSIIndicator
@@ -7,15 +8,14 @@ from ta.trend import MACD
 from ta.volatility import BollingerBands
 from ta.volume import OnBalanceVolumeIndicator
 
-# Path
-PRICE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../Data Files/Price')) # where files are found
-PROCESSED_DIR = os.path.join(PRICE_DIR, 'Processed') #Basically just make a smol folder
-
-# Helper: find all CSVs in PRICE_DIR (exclude the 'Processed' folder)
-price_files = [
-    f for f in os.listdir(PRICE_DIR) #essentially for every filename, we will def it as f and include it at the list
-    if f.endswith('.csv') and os.path.isfile(os.path.join(PRICE_DIR, f))
-]
+try:
+    from . import profiling
+    from . import universe
+    from .resample import parse_times
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+    from resample import parse_times
 
 def calculate_indicators(df):
     # Must have Date, Open, High, Low, Close, Volume
@@ -33,8 +33,10 @@ def calculate_indicators(df):
         if col is None:
             raise ValueError(f"Missing expected column in input: {col}")
 
-    # Sort by date ascending if not already
-    df = df.sort_values(date_col)
+    # Sort by date ascending if not already. By the parsed time, not the text: dd/mm/yyyy strings sort by day of month,
+    # and intraday bars (resample.py) have several rows per day. Stable so equal times keep the file order
+    order = parse_times(df[date_col]).reset_index(drop=True).sort_values(kind='stable').index
+    df = df.iloc[order]
 
     #MACD - Technical Definition
     macd = MACD(
@@ -64,17 +66,31 @@ def calculate_indicators(df):
 
     return df #make sure these columns exist first
 
+# one ticker: raw price csv -> Processed/..._with_indicators.csv
+def process_ticker(ticker):
+    df = pd.read_csv(universe.price_path(ticker))
+    df_ind = calculate_indicators(df)
+    os.makedirs(universe.PROCESSED_DIR, exist_ok=True)
+    df_ind.to_csv(universe.indicators_path(ticker), index=False)
+    return len(df_ind)
+
+
 def main():
-    for file in price_files:
-        input_path = os.path.join(PRICE_DIR, file)
-        #print(f"Current file: {file}...") - For Debug
-        df = pd.read_csv(input_path)
-        try:
-            df_ind = calculate_indicators(df)
-        except Exception as e:
-            #print(f" error in {file}: {e}") - For Debug
-            continue
-        # saved as (original_name)_with_indicators.csv
-        base = os.path.splitext(file)[0]
-        output_path = os.path.join(PROCESSED_DIR, f"{base}_with_indicators.csv")
-        df_ind.to_csv(output_path, index=False)
+    parser = argparse.ArgumentParser()
+    universe.add_universe_args(parser)
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+
+    tickers = universe.get_universe(args.tickers)
+    with profiling.stage(args, 'calculate_indicators'):
+        results = universe.run_per_ticker(process_ticker, tickers, args.workers)
+    for ticker, (ok, info) in sorted(results.items()):
+        print(f"{ticker}: {f'{info:,} rows' if ok else info}")
+    failed = sorted(ticker for ticker, (ok, _) in results.items() if not ok)
+    if failed: # non-zero exit so the next stage / benchmark_pipeline.py doesn't carry on without them
+        raise SystemExit(f"{len(failed)} of {len(results)} tickers failed: {', '.join(failed)}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,14 @@
 # Aim: Given a 13m price csv with technicals,
 
+import argparse
 import pandas as pd
-import os
 
-# Finding Project root directory, need move 3 times
-PROJECT_ROOT = os.path.dirname(
-    os.path.dirname(
-        os.path.dirname(
-            os.path.abspath(__file__)
-        )
-    )
-)
-
-# make these folders
-PRICE_FOLDER = os.path.join(PROJECT_ROOT, "Data Files", "Price", "Processed")
-NEWS_FOLDER = os.path.join(PROJECT_ROOT, "Data Files", "News Article")
-
-TICKERS = [ #S&P sel, cover the industries essentially
-    "AAPL", "AMZN", "DIS", "GOOGL", "JNJ",
-    "JPM", "KO", "MSFT", "NVDA", "TSLA"
-]
-
-# IMPT! leave same format, just add the file names behind (with_indicators, complete_year, cleaned)
-
-INDICATOR_SUFFIX = " - Sheet1_with_indicators.csv"
-NEWS_SUFFIX = "_news_complete_year.csv"
-CLEANED_SUFFIX = " - Sheet1_cleaned.csv"
+try:
+    from . import profiling
+    from . import universe
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
 
 indicator_cols = [ #Split into diff technicals
     'MACD', 'MACD_signal', 'MACD_diff',
@@ -36,20 +19,9 @@ indicator_cols = [ #Split into diff technicals
 
 # fn must: read raw price and news csv, standardise column name and types, remove rows missing TI, make the date the same across sets
 def clean_and_truncate(ticker):
-    price_file = os.path.join(
-        PRICE_FOLDER,
-        f"13M Data {ticker}{INDICATOR_SUFFIX}"
-    )
-
-    news_file = os.path.join(
-        NEWS_FOLDER,
-        f"{ticker.lower()}{NEWS_SUFFIX}"
-    )
-
-    cleaned_output_file = os.path.join(
-        PRICE_FOLDER,
-        f"13M Data {ticker}{CLEANED_SUFFIX}"
-    )
+    price_file = universe.indicators_path(ticker)
+    news_file = universe.news_path(ticker)
+    cleaned_output_file = universe.cleaned_path(ticker)
 
     # standardise the price file ('clean') column
     raw_df = pd.read_csv(price_file, encoding="latin1")
@@ -84,11 +56,25 @@ def clean_and_truncate(ticker):
 
     cleaned_df.to_csv(cleaned_output_file, index=False)
     # print(f"{ticker}: cleaned {len(cleaned_df)} rows saved to {cleaned_output_file}") - for debug use
+    return len(cleaned_df)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    universe.add_universe_args(parser)
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+
+    tickers = universe.get_universe(args.tickers)
+    with profiling.stage(args, 'clean_all_stocks'):
+        results = universe.run_per_ticker(clean_and_truncate, tickers, args.workers)
+    for ticker, (ok, info) in sorted(results.items()):
+        print(f"{ticker}: {f'{info:,} rows' if ok else info}")
+    failed = sorted(ticker for ticker, (ok, _) in results.items() if not ok)
+    if failed: # non-zero exit so the next stage / benchmark_pipeline.py doesn't carry on without them
+        raise SystemExit(f"{len(failed)} of {len(results)} tickers failed: {', '.join(failed)}")
+    return results
+
 
 if __name__ == "__main__":
-    for ticker in TICKERS:
-        try:
-            clean_and_truncate(ticker)
-        except Exception as e:
-            pass
-            #print(f"{ticker}: ERROR - {e}")
+    main()
@@ -1,50 +1,37 @@
-# Used to process stock data from multiple CSV files into one training dataset + gather news sentiment data via API
-#need to use existing django sentiment component (hf api)
+# Used to process stock data from multiple CSV files into one training dataset + gather news sentiment data
+# Sentiment now goes through the django news store: articles are scored once (skipped if already stored) and
+# the daily mean is read from the DailySentiment aggregate, the same table the predictor reads at serving time
+# news_sentiment_decayed replays the scored articles through sentiment_decay.py (the predictor reads the same state)
+# and takes the value at each price row's time, so a row only sees news published before its bar closed
+# Every ticker's rows are also written to the feature store (api.FeatureRow)
 # New Sentiment Data Logic
 # News Exists: Calculate as per normal. News does not exist: Assign 0
 # Start from June 26, 2024, because most news start from then
 
+import argparse
 import pandas as pd
 import numpy as np
 import os
-import requests
-import time
-from datetime import datetime
-
-
-# Finding Project root directory, need move 3 times, same as others
-PROJECT_ROOT = os.path.dirname(
-    os.path.dirname(
-        os.path.dirname(
-            os.path.abspath(__file__)
-        )
-    )
-)
-
-# Make sure they exist, else make
-PRICE_FOLDER = os.path.join(PROJECT_ROOT, "Data Files", "Price", "Processed")
-NEWS_FOLDER = os.path.join(PROJECT_ROOT, "Data Files", "News Article")
-OUTPUT_FOLDER = os.path.join(PROJECT_ROOT, "Data Files", "Consolidated")
-
-# Create output folder if it doesn't exist
-os.makedirs(OUTPUT_FOLDER, exist_ok=True)
-
-# Stock tickers
-TICKERS = [
-    "AAPL", "AMZN", "DIS", "GOOGL", "JNJ",
-    "JPM", "KO", "MSFT", "NVDA", "TSLA"
-]
-
-# File naming patterns
-PRICE_SUFFIX = " - Sheet1_with_indicators.csv"
-NEWS_SUFFIX = "_news_complete_year.csv"
+import shutil
+from datetime import datetime, timezone
+
+try:
+    from . import profiling
+    from . import sentiment_decay
+    from .django_env import setup_django
+    from .resample import SESSION_CLOSE, SESSION_TZ, parse_times
+    from . import universe
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import sentiment_decay
+    from django_env import setup_django
+    from resample import SESSION_CLOSE, SESSION_TZ, parse_times
+    import universe
 
 #start date ( news start date across all tickers)
 START_DATE = "26/06/2024"
 
-# API for sentiment
-SENTIMENT_API_URL = "http://127.0.0.1:8000/api/sentiment/"
-BATCH_SIZE = 100  #batch processing to avoid overloading
+BATCH_SIZE = 100  # articles per import batch
 
 
 # Parse date string in DD/MM/YYYY format
@@ -57,63 +44,9 @@ def parse_date(date_str):
         except:
             return None #will remove invalid roles
 
-#Get sentiment score from Django API
-def get_sentiment_score(headline, summary=""):
-    try:
-        payload = {
-            'headline': str(headline) if headline else "",
-            'summary': str(summary) if summary else ""
-        }
-
-        response = requests.post(SENTIMENT_API_URL, json=payload, timeout=10)
-
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('final_sentiment_score', 0)
-        else:
-            return 0
-    # handles connection/timeouts
-    except requests.exceptions.RequestException as e:
-        return 0
-    except Exception as e:
-        return 0
-
-#Process news dataframe and add sentiment scores
-def process_news_sentiment(news_df, ticker):
-    if news_df is None or len(news_df) == 0:
-        return None # none returned if no news
-
-    # start off with the same data as news_df but is distinct in memory [aka its own obj] to prevent mutation
-    df = news_df.copy()
-
-    # Initialize sentiment column
-    df['sentiment_score'] = 0.0
-
-    #process in batches to prevent the error which happened
-    total_batches = (len(df) + BATCH_SIZE - 1) // BATCH_SIZE
-    successful_sentiments = 0 # for debug purposes
-
-    for i in range(0, len(df), BATCH_SIZE):
-        batch_num = (i // BATCH_SIZE) + 1
-        batch_end = min(i + BATCH_SIZE, len(df))
-        batch = df.iloc[i:batch_end]
-
-        for idx, row in batch.iterrows():
-            headline = row.get('headline', '')
-            summary = row.get('summary', '')
-            sentiment = get_sentiment_score(headline, summary) # Get sentiment score
-            df.at[idx, 'sentiment_score'] = sentiment
-
-            if sentiment != 0:
-                successful_sentiments += 1 #essentially for debug
-
-            # delay mechanism, 0.2s
-            time.sleep(0.2)
-    return df
-
 # Load price data with technical indicators for a specific ticker
 def load_price_data(ticker):
-    file_path = os.path.join(PRICE_FOLDER, f"13M Data {ticker}{PRICE_SUFFIX}")
+    file_path = universe.indicators_path(ticker)
     try:
         df = pd.read_csv(file_path, encoding="latin1")
 
@@ -146,7 +79,7 @@ def load_price_data(ticker):
 
 #Load news data and calculate sentiment scores
 def load_news_data(ticker):
-    file_path = os.path.join(NEWS_FOLDER, f"{ticker.lower()}{NEWS_SUFFIX}")
+    file_path = universe.news_path(ticker)
     try:
         df = pd.read_csv(file_path, encoding="latin1")
 
@@ -164,17 +97,34 @@ def load_news_data(ticker):
         if len(df) == 0:
             return None
 
-        # Process sentiment for the tickers news
-        df_with_sentiment = process_news_sentiment(df, ticker)
-
-        if df_with_sentiment is None:
+        # Score + store any articles the news store does not have yet (keeps the daily aggregate up to date)
+        from api import news_store, daily_sentiment
+        rows = []
+        for _, row in df.iterrows():
+            if 'timestamp' in df.columns and pd.notna(row.get('timestamp')):
+                published_at = datetime.fromtimestamp(int(row['timestamp']), tz=timezone.utc)
+            else:
+                published_at = row['date_parsed'].replace(tzinfo=timezone.utc)
+            rows.append({
+                'url': row.get('url') if pd.notna(row.get('url')) else None,
+                'headline': str(row.get('headline', '')) if pd.notna(row.get('headline')) else '',
+                'summary': str(row.get('summary', '')) if pd.notna(row.get('summary')) else '',
+                'source': str(row.get('source', '')) if pd.notna(row.get('source')) else '',
+                'published_at': published_at,
+            })
+        for i in range(0, len(rows), BATCH_SIZE):
+            news_store.import_articles(ticker, rows[i:i + BATCH_SIZE])
+
+        # daily average sentiment comes from the materialised table (UTC days), no groupby here
+        daily_rows = daily_sentiment.daily_range(ticker, (df['date_parsed'].min() - pd.Timedelta(days=1)).date(), df['date_parsed'].max().date())
+        daily_sentiment_df = pd.DataFrame(
+            [(pd.Timestamp(r.date), r.mean) for r in daily_rows],
+            columns=['date_parsed', 'news_sentiment']
+        )
+        if len(daily_sentiment_df) == 0:
             return None
 
-        # Group by date and calculate average sentiment
-        daily_sentiment = df_with_sentiment.groupby('date_parsed')['sentiment_score'].mean().reset_index()
-        daily_sentiment.rename(columns={'sentiment_score': 'news_sentiment'}, inplace=True)
-
-        return daily_sentiment
+        return daily_sentiment_df
 
     except Exception as e:
         return None
@@ -208,86 +158,133 @@ def consolidate_ticker_data(ticker):
         price_df['news_sentiment'] = 0
         merged_df = price_df
 
-    # Sort by date
-    merged_df = merged_df.sort_values('date_parsed')
+    # Sort by date (stable: intraday bars share a date_parsed and are already in time order)
+    merged_df = merged_df.sort_values('date_parsed', kind='stable')
+    merged_df['news_sentiment_decayed'] = decayed_sentiment_at(ticker, merged_df['date'])
+    from api import sentiment_state
+    sentiment_state.rebuild(ticker) # live state = the same replay, incl. articles scored before it existed
     return merged_df
 
-# consoldiate data for all tickers
-def consolidate_all_data():
-    # Debug use - test API connection. API Key alr checked
-    try:
-        test_response = requests.post(SENTIMENT_API_URL, json={'headline': 'test', 'summary': ''}, timeout=5)
-        if test_response.status_code == 200:
-            print("HF Sentiment API connection successful")
-        else:
-            print(f"Sentiment API test failed: {test_response.status_code}")
-    except Exception as e:
-        print(f"Sentiment API not accessible: {e}")
-        return None
 
-    all_data = []
-    successful_tickers = []
-    failed_tickers = []
+# decayed sentiment at each price row's time (exchange local, dates without a time = that day's close), from every
+# scored article in the news store up to then. Same update/value functions as the live state
+def decayed_sentiment_at(ticker, dates):
+    from api.models import NewsArticle
+    times = parse_times(dates.reset_index(drop=True))
+    if (times == times.dt.normalize()).all():
+        times = times + pd.Timedelta(minutes=SESSION_CLOSE)
+    if times.dt.tz is None: # the repeated hour when the clocks go back counts as standard time
+        times = times.dt.tz_localize(SESSION_TZ, ambiguous=np.zeros(len(times), dtype=bool), nonexistent='shift_forward')
+    seconds = times.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+    scored = list(NewsArticle.objects.filter(symbol=ticker.upper(), sentiment_score__isnull=False)
+                  .order_by('published_at').values_list('published_at', 'sentiment_score'))
+    order = np.argsort(seconds, kind='stable') # values_at wants the times sorted
+    values = np.empty(len(seconds))
+    values[order] = sentiment_decay.values_at(scored, seconds[order])
+    return values
+
+# remove date_parsed column for final output
+FINAL_COLUMNS = [
+    'date', 'ticker', 'open', 'high', 'low', 'close', 'volume', 'macd', 'macd_signal', 'macd_diff', 'rsi', 'bb_bbm',
+    'bb_bbh', 'bb_bbl', 'bb_bbwidth', 'obv', 'news_sentiment', 'news_sentiment_decayed'
+]
+SUMMARY_COLS = ['macd', 'rsi', 'bb_bbm', 'obv']
+PARTS_DIR = os.path.join(universe.CONSOLIDATED_DIR, ".parts")
 
-    for ticker in TICKERS:
-        ticker_data = consolidate_ticker_data(ticker)
 
-        if ticker_data is not None:
-            all_data.append(ticker_data)
-            successful_tickers.append(ticker)
-        else:
-            failed_tickers.append(ticker)
+# one ticker -> its own part file, only a few summary numbers go back to the parent (keeps memory to 1 ticker per worker)
+def consolidate_ticker_to_part(ticker):
+    ticker_data = consolidate_ticker_data(ticker)
+    if ticker_data is None:
+        raise ValueError("no price data")
+    ticker_data[FINAL_COLUMNS].to_csv(os.path.join(PARTS_DIR, f"{ticker}.csv"), index=False)
 
-    if not all_data:
-        return None
+    # same rows into the feature store (what train_model --source store and the prediction views read). The store
+    # holds one row per ticker and day, so intraday bars (resample.py) only go to the csv
+    if ticker_data['date_parsed'].duplicated().any():
+        print(f"{ticker}: intraday bars, feature store left as is (train with --source csv)")
+    else:
+        from api import feature_store
+        feature_store.write_frame(ticker, ticker_data, date_col='date_parsed')
 
-    #combine all ticker data
-    consolidated_df = pd.concat(all_data, ignore_index=True)
+    sentiment_scores = ticker_data.loc[ticker_data['news_sentiment'] != 0, 'news_sentiment']
+    return {
+        'rows': len(ticker_data),
+        'min_date': ticker_data['date_parsed'].min(),
+        'max_date': ticker_data['date_parsed'].max(),
+        'non_null': {col: int(ticker_data[col].notna().sum()) for col in SUMMARY_COLS},
+        'sentiment': (len(sentiment_scores), float(sentiment_scores.sum()), float((sentiment_scores ** 2).sum()),
+                      sentiment_scores.min(), sentiment_scores.max()),
+    }
 
-    # clean + sort data
-    consolidated_df = consolidated_df.sort_values(['ticker', 'date_parsed'])
 
-    # remove date_parsed column for final output
-    final_columns = [
-        'date', 'ticker', 'open', 'high', 'low', 'close', 'volume', 'macd', 'macd_signal', 'macd_diff', 'rsi', 'bb_bbm',
-        'bb_bbh', 'bb_bbl', 'bb_bbwidth', 'obv', 'news_sentiment'
-    ]
+# consoldiate data for all tickers
+def consolidate_all_data(tickers=None, workers=1):
+    # sentiment scoring + the daily aggregate live in the django app
+    setup_django()
+    from django.db import connection
+    if connection.vendor == 'sqlite' and workers > 1:
+        workers = 1 # sqlite only takes one writer at a time, parallel workers would just fight over the lock
+    connection.close() # don't share the parent's connection with the worker processes
+
+    tickers = universe.get_universe(tickers)
+    os.makedirs(PARTS_DIR, exist_ok=True)
+    results = universe.run_per_ticker(consolidate_ticker_to_part, tickers, workers, initializer=setup_django)
+    successful_tickers = sorted(t for t, (ok, _) in results.items() if ok)
+    failed_tickers = sorted(t for t, (ok, _) in results.items() if not ok)
+
+    if not successful_tickers:
+        return None
 
-    consolidated_df = consolidated_df[final_columns]
+    # stitch the part files together in ticker order (already sorted by date inside), streaming, never all in memory
+    output_file = universe.CONSOLIDATED_FILE
+    with open(output_file, 'w', newline='') as out:
+        for i, ticker in enumerate(successful_tickers):
+            with open(os.path.join(PARTS_DIR, f"{ticker}.csv"), newline='') as part:
+                header = part.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(part, out)
+    shutil.rmtree(PARTS_DIR, ignore_errors=True)
 
-    # Save consolidated data
-    output_file = os.path.join(OUTPUT_FOLDER, "(OG 10 Stocks) consolidated_data_with_sentiment.csv")
-    consolidated_df.to_csv(output_file, index=False)
+    stats = [results[t][1] for t in successful_tickers]
+    total = sum(s['rows'] for s in stats)
 
     # Get proper date range
-    dates = consolidated_df['date'].apply(parse_date)
-    dates = dates.dropna()
-    if len(dates) > 0:
-        min_date = dates.min().strftime('%d/%m/%Y')
-        max_date = dates.max().strftime('%d/%m/%Y')
-        print(f" Date range: {min_date} to {max_date}") #Impt for seeing truncation (13m -> <12m)
+    min_date = min(s['min_date'] for s in stats).strftime('%d/%m/%Y')
+    max_date = max(s['max_date'] for s in stats).strftime('%d/%m/%Y')
+    print(f" Date range: {min_date} to {max_date}") #Impt for seeing truncation (13m -> <12m)
 
     # Techncal indicator summary (aka ensuring that every price has a corr Technical indicator to ensure proper analysis)
-    for col in ['macd', 'rsi', 'bb_bbm', 'obv']:
-        non_null = consolidated_df[col].notna().sum()
-        total = len(consolidated_df)
+    for col in SUMMARY_COLS:
+        non_null = sum(s['non_null'][col] for s in stats)
         print(f"   {col.upper()}: {non_null:,}/{total:,} ({non_null / total * 100:.1f}%)")
 
     # Sentiment score statistics - just to ensure the data is evenly spread out
-    sentiment_scores = consolidated_df[consolidated_df['news_sentiment'] != 0]['news_sentiment']
-    if len(sentiment_scores) > 0:
-        print(f"   Mean: {sentiment_scores.mean():.3f}")
-        print(f"   Std: {sentiment_scores.std():.3f}")
-        print(f"   Min: {sentiment_scores.min():.3f}")
-        print(f"   Max: {sentiment_scores.max():.3f}")
+    n = sum(s['sentiment'][0] for s in stats)
+    if n > 0:
+        mean = sum(s['sentiment'][1] for s in stats) / n
+        sum_sq = sum(s['sentiment'][2] for s in stats)
+        std = np.sqrt(max(sum_sq - n * mean ** 2, 0) / (n - 1)) if n > 1 else float('nan')
+        print(f"   Mean: {mean:.3f}")
+        print(f"   Std: {std:.3f}")
+        print(f"   Min: {min(s['sentiment'][3] for s in stats if s['sentiment'][0]):.3f}")
+        print(f"   Max: {max(s['sentiment'][4] for s in stats if s['sentiment'][0]):.3f}")
+    if failed_tickers:
+        print(f"Failed: {failed_tickers}")
 
-    return consolidated_df
+    return output_file
 
 
 if __name__ == "__main__":
-    consolidated_data = consolidate_all_data()
-
-    if consolidated_data is not None:
+    parser = argparse.ArgumentParser()
+    universe.add_universe_args(parser)
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+    with profiling.stage(args, 'consolidate_data_with_sentiment'):
+        consolidated_data = consolidate_all_data(args.tickers, args.workers)
+
+    if consolidated_data is None:
         print("fail lmao")
     else:
         print("Great Success - Borat")
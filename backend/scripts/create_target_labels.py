@@ -1,14 +1,25 @@
 # Used to load a consolidated price + sentiment data, then calc a fwd return over a 5 day window and assign
 # #buy/sell/hold labels based on the PnL
 
+import argparse
 import pandas as pd
 import numpy as np
 import os
 
+try:
+    from . import profiling
+    from . import universe
+    from .resample import parse_times
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+    from resample import parse_times
+
 # create buy/sell/hold labels [buy when >= +2%, sell when <= -2%]
+# future_days counts rows, so on intraday bars (resample.py) it is a number of bars
 def create_target_labels(df, future_days=5, buy_threshold=0.02, sell_threshold=-0.02):
     df = df.copy()
-    df['date'] = pd.to_datetime(df['date'], dayfirst=True)
+    df['date'] = parse_times(df['date'])
     df = df.sort_values(['ticker', 'date']) # Sort by icker, then ascending date for proper alignment of calc
     df['future_return'] = df.groupby('ticker')['close'].pct_change(periods=future_days).shift(-future_days) #for each ticker, calc % change over next 5 days, and then move the return back to the current row
 
@@ -24,19 +35,23 @@ def create_target_labels(df, future_days=5, buy_threshold=0.02, sell_threshold=-
 
 # Analyse the distribution of target labels
 def analyse_target_distribution(df):
-    target_counts = df['target'].value_counts().sort_index() #tallies each target value (-1,0,1)
-    total_samples = len(df)
+    ticker_dist = df.groupby(['ticker', 'target']).size().unstack(fill_value=0) # Groups by ticker and target, counts the rows and
+    # ensures each ticker has columns for -1, 0, 1
+    return print_target_distribution(ticker_dist)
+
+
+# ticker_dist = rows per (ticker, target), so it can also be built up chunk by chunk
+def print_target_distribution(ticker_dist):
+    target_counts = ticker_dist.sum(axis=0).sort_index() #tallies each target value (-1,0,1)
+    total_samples = target_counts.sum()
 
     for target, count in target_counts.items():
         percentage = (count / total_samples) * 100
         label = "SELL" if target == -1 else "HOLD" if target == 0 else "BUY"
         print(f"{target} ({label}): {count} samples ({percentage:.1f}%)") #To ensure nth wrong
 
-    ticker_dist = df.groupby(['ticker', 'target']).size().unstack(fill_value=0) # Groups by ticker and target, counts the rows and
-    # ensures each ticker has columns for -1, 0, 1
-
 # loop per ticker
-    for ticker in df['ticker'].unique(): # forces no duplicates
+    for ticker in ticker_dist.index: # forces no duplicates
         ticker_data = ticker_dist.loc[ticker]
         ticker_total = ticker_data.sum()
         print(f"{ticker}: {ticker_total} samples", end=" - ")
@@ -51,35 +66,89 @@ def analyse_target_distribution(df):
     return target_counts
 
 
+# Label a ticker-sorted csv chunk by chunk so memory stays flat however big the universe is.
+# The last ticker of each chunk may continue in the next chunk, so it is carried over instead of labelled early
+def label_file(input_file, output_file, chunksize=200_000, **label_kwargs):
+    carry = None
+    ticker_dist = None
+    first_write = True
+
+    def write(part):
+        nonlocal ticker_dist, first_write
+        if part is None or len(part) == 0:
+            return
+        labeled = create_target_labels(part, **label_kwargs)
+        labeled.to_csv(output_file, index=False, mode='w' if first_write else 'a', header=first_write)
+        first_write = False
+        counts = labeled.groupby(['ticker', 'target']).size().unstack(fill_value=0)
+        ticker_dist = counts if ticker_dist is None else ticker_dist.add(counts, fill_value=0).astype(int)
+
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        last_ticker = chunk['ticker'].iloc[-1]
+        is_last = chunk['ticker'] == last_ticker
+        write(chunk[~is_last])
+        carry = chunk[is_last]
+    write(carry)
+    return ticker_dist
+
+
+# last labelled date per ticker already in the training file
+def last_labeled_dates(output_file):
+    if not os.path.exists(output_file):
+        return {}
+    done = pd.read_csv(output_file, usecols=['ticker', 'date'])
+    return pd.to_datetime(done['date']).groupby(done['ticker']).max().to_dict()
+
+
+# Incremental version of label_file: only rows newer than what the training file already has, and only the ones whose
+# forward return is known by now (the last future_days rows of each ticker wait for the next run). Appends them and
+# returns the new labelled rows
+def label_new_rows(input_file, output_file, chunksize=200_000, **label_kwargs):
+    last = last_labeled_dates(output_file)
+    pending = []
+    for chunk in pd.read_csv(input_file, chunksize=chunksize):
+        dates = parse_times(chunk['date'])
+        cutoff = pd.to_datetime(chunk['ticker'].map(last))
+        pending.append(chunk[cutoff.isna() | (dates > cutoff)])
+    pending = pd.concat(pending, ignore_index=True)
+    if len(pending) == 0:
+        return pending
+
+    labeled = create_target_labels(pending, **label_kwargs)
+    if len(labeled):
+        exists = os.path.exists(output_file)
+        labeled.to_csv(output_file, index=False, mode='a' if exists else 'w', header=not exists)
+    return labeled
+
+
 def main(): # files are written this way because we imported OS earlier + to ensure it can be runned
-    input_file = '../../Data Files/Consolidated/(OG 10 Stocks) consolidated_data_with_sentiment.csv'  #Take note OG File Rename
-    output_file = '../../Data Files/Consolidated/ml_training_data.csv'
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=universe.CONSOLIDATED_FILE) # must be sorted by ticker (consolidate writes it that way)
+    parser.add_argument('--output', default=universe.TRAINING_FILE)
+    parser.add_argument('--future-bars', type=int, default=5, help='label horizon in rows: days, or bars for intraday data')
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+    input_file = args.input
+    output_file = args.output
     # Check if input file exists
     if not os.path.exists(input_file):
         print("check file path for input_file location and verify against input_file")
         return
 
-    # Load the file consolidated_data_with_sentiment
-    try:
-        df = pd.read_csv(input_file)
-    except Exception as e:
-        return
-
-
-    # Create target labels
-    df_labeled = create_target_labels(df) # compute future_return and target fn
-
-    # Analyse target distribution
-    target_counts = analyse_target_distribution(df_labeled)
-
-    # Save the labeled dataset
+    # Create target labels + save the labeled dataset
     try:
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
-        df_labeled.to_csv(output_file, index=False)
-
+        with profiling.stage(args, 'create_target_labels'):
+            ticker_dist = label_file(input_file, output_file, future_days=args.future_bars) # compute future_return and target fn
     except Exception as e:
         print("error saving fle")
         return
 
+    # Analyse target distribution
+    if ticker_dist is not None:
+        target_counts = print_target_distribution(ticker_dist)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
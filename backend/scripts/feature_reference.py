@@ -0,0 +1,45 @@
+# Reference distribution of every model feature, saved next to the model (Models/feature_reference.json) by
+# train_model.py / retrain_incremental.py and compared against live serving features by the API's drift monitor
+# (api/drift.py). Per feature: quantile bin edges over the training rows + the share of rows in each bin, the share
+# of exact zeros (what a failed upstream call turns into) and mean/std
+# Bin rule, shared with the API: bin = bisect_right(edges, value), so len(edges) + 1 bins
+
+import json
+import os
+
+import numpy as np
+
+REFERENCE_FILE = 'feature_reference.json'
+BINS = 10
+
+
+def feature_reference(values, bins=BINS):
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'edges': [], 'fractions': [1.0], 'zero_share': 0.0, 'mean': 0.0, 'std': 0.0}
+    edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])) # ties (e.g. lots of 0 sentiment) merge bins
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return {
+        'edges': edges.tolist(),
+        'fractions': (counts / len(values)).tolist(),
+        'zero_share': float(np.mean(values == 0)),
+        'mean': float(values.mean()),
+        'std': float(values.std()),
+    }
+
+
+# X = training matrix [rows, features] (after the gap filling the model saw), columns in feature_cols order
+def build_reference(X, feature_cols, bins=BINS):
+    X = np.asarray(X, dtype=np.float64)
+    return {
+        'rows': int(len(X)),
+        'bins': bins,
+        'features': {col: feature_reference(X[:, i], bins) for i, col in enumerate(feature_cols)},
+    }
+
+
+def save_reference(reference, models_dir, model_version):
+    path = os.path.join(models_dir, REFERENCE_FILE)
+    with open(path, 'w') as f:
+        json.dump(reference | {'model_version': model_version}, f, indent=2)
+    return path
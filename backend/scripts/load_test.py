@@ -0,0 +1,395 @@
+# Load harness for comparing deployments (sync gunicorn vs ASGI workers)
+#
+# 1) start a fake upstream that answers like Finnhub/AlphaVantage/HF after a delay:
+#      python load_test.py fake-upstream --port 9001 --delay-ms 400
+# 2) start the server pointed at it (same settings for both runs), e.g.
+#      FINNHUB_API_URL=http://127.0.0.1:9001/finnhub ALPHAVANTAGE_API_URL=http://127.0.0.1:9001/alphavantage \
+#      HF_SENTIMENT_URL=http://127.0.0.1:9001/hf FINNHUB_API_KEY=x ALPHAVANTAGE_API_KEY=x UPSTREAM_QUOTA=0 \
+#      gunicorn config.wsgi -w 1                                  (sync)
+#      gunicorn config.asgi -w 1 -k uvicorn.workers.UvicornWorker (async)
+# 3) fire a mix of slow predictions and cheap requests at it:
+#      python load_test.py run --url http://127.0.0.1:8000 --requests 200 --concurrency 40 --predict-share 0.25
+#
+# "held" = how many requests the server was working on at once on average: each request's unloaded latency
+# (measured one at a time before the run) summed up and divided by the wall time. A sync worker holds ~1,
+# an async one holds as many as are waiting on upstream
+#
+# Upstream tail latency, hedging off vs on (api/upstream.py), against a built-in fake upstream with a slow tail:
+#      python load_test.py tail --requests 2000 --concurrency 20 --delay-ms 50 --tail-ms 2000 --tail-share 0.03
+#
+# Websocket fan-out (/ws/live/), in process on one event loop = one worker, upstream replaced by a --delay-ms sleep:
+#      python load_test.py ws --clients 1000 --symbols 20 --interval 1 --rounds 10
+#
+# Shared quota (api/quota.py): worker processes hammering the same token buckets (throwaway sqlite db unless
+# --database-url), checks nothing was granted over the limit and times acquire():
+#      python load_test.py quota --processes 4 --seconds 10 --per-minute 600 --background-share 0.5
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+from urllib.parse import parse_qs
+
+import numpy as np
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    from django_env import setup_django
+
+
+# Fake upstream (tiny ASGI app, run with uvicorn)
+
+def fake_payload(path, query):
+    function = query.get('function', [''])[0]
+    if path.endswith('/quote'):
+        return {'c': 101.0, 'h': 102.0, 'l': 99.0, 'o': 100.0, 'pc': 100.5}
+    if path.endswith('/company-news') or path.endswith('/news'):
+        now = int(time.time())
+        return [
+            {'id': now * 10 + i, 'datetime': now - 60 * i, 'headline': f'Shares rally on results {i}', 'summary': '',
+             'url': f'https://example.com/{now}/{i}', 'source': 'fake', 'image': '', 'category': 'company'}
+            for i in range(3)
+        ]
+    if path.endswith('/hf'):
+        return [[{'label': 'positive', 'score': 0.6}, {'label': 'neutral', 'score': 0.3}, {'label': 'negative', 'score': 0.1}]]
+    if function == 'GLOBAL_QUOTE':
+        return {'Global Quote': {'06. volume': '1000000'}}
+    values = {
+        'MACDEXT': {'MACD': '1.0', 'MACD_Signal': '0.5', 'MACD_Hist': '0.5'},
+        'RSI': {'RSI': '55.0'},
+        'BBANDS': {'Real Middle Band': '100', 'Real Upper Band': '105', 'Real Lower Band': '95'},
+        'OBV': {'OBV': '123456'},
+    }.get(function, {})
+    return {f'Technical Analysis: {function}': {'2025-01-01': values}}
+
+
+def make_fake_upstream(delay_ms, tail_ms=0, tail_share=0.0):
+    async def app(scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        while True: # drain the body
+            message = await receive()
+            if not message.get('more_body'):
+                break
+        delay = delay_ms
+        if tail_share and random.random() < tail_share: # heavy tail: some requests are much slower
+            delay = tail_ms
+        await asyncio.sleep(delay / 1000)
+        body = json.dumps(fake_payload(scope['path'], parse_qs(scope['query_string'].decode()))).encode()
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
+
+
+# same fake upstream on the stdlib threaded server (no uvicorn needed), in a background thread. Returns the base url
+def start_threaded_fake_upstream(delay_ms, tail_ms=0, tail_share=0.0):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            delay = tail_ms if tail_share and random.random() < tail_share else delay_ms
+            time.sleep(delay / 1000)
+            body = json.dumps(fake_payload(url.path, parse_qs(url.query))).encode()
+            try:
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError: # the client gave up (timeout / cancelled hedge)
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 256 # listen backlog, the default 5 turns bursts into connect timeouts
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# Load generator
+
+async def one_request(client, base_url, kind, symbol):
+    start = time.perf_counter()
+    if kind == 'predict':
+        resp = await client.post(f"{base_url}/api/predict/", json={'symbol': symbol})
+    else:
+        resp = await client.get(f"{base_url}/api/sentiment/daily/", params={'symbol': symbol})
+    return kind, resp.status_code, time.perf_counter() - start
+
+
+async def run_load(base_url, total, concurrency, predict_share, timeout):
+    symbols = ['AAPL', 'MSFT', 'NVDA', 'TSLA', 'KO']
+    kinds = ['predict' if random.random() < predict_share else 'daily' for _ in range(total)]
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def worker(i, kind):
+        async with semaphore:
+            try:
+                results.append(await one_request(client, base_url, kind, symbols[i % len(symbols)]))
+            except Exception as e:
+                results.append((kind, type(e).__name__, timeout))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        # unloaded latency per endpoint, one request at a time
+        baseline = {}
+        for kind in set(kinds):
+            samples = [(await one_request(client, base_url, kind, symbols[0]))[2] for _ in range(3)]
+            baseline[kind] = float(np.median(samples))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(i, kind) for i, kind in enumerate(kinds)])
+        elapsed = time.perf_counter() - start
+    return results, elapsed, baseline
+
+
+def report(results, elapsed, baseline):
+    held = sum(baseline[r[0]] for r in results) / elapsed
+    print(f"{len(results)} requests in {elapsed:.2f}s -> {len(results) / elapsed:.1f} req/s, server held {held:.1f} at once on average")
+    print(f"{'endpoint':<10}{'n':>6}{'errors':>8}{'unloaded':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == kind]
+        lat = np.array([r[2] for r in rows]) * 1000
+        errors = sum(1 for r in rows if r[1] != 200)
+        print(f"{kind:<10}{len(rows):>6}{errors:>8}{baseline[kind] * 1000:>10.0f}{np.percentile(lat, 50):>10.0f}{np.percentile(lat, 95):>10.0f}{np.percentile(lat, 99):>10.0f}")
+
+
+# Finnhub quotes through api/upstream.py (the async path the ASGI views use) with hedging off, then on, after a
+# warm up so the latency quantiles exist. The same seed gives both runs the same slow requests on the fake side
+async def run_tail(total, concurrency, warmup):
+    from django.conf import settings
+    from api import upstream
+
+    async def batch(n):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def one(client):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    data, error = await upstream.afetch_finnhub_quote(client, 'AAPL', 'x')
+                    errors += error is not None
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+            await asyncio.gather(*[one(client) for _ in range(n)])
+        return np.array(latencies) * 1000, errors
+
+    print(f"{'hedging':<8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}{'hedges':>8}{'won':>6}{'timeout s':>11}")
+    for hedge in (False, True):
+        settings.UPSTREAM_HEDGE_PROVIDERS = ['finnhub'] if hedge else []
+        upstream.reset()
+        random.seed(0)
+        await batch(warmup)
+        tracker = upstream.tracker('finnhub:quote')
+        before = tracker.hedges, tracker.hedge_wins
+        random.seed(1)
+        lat, errors = await batch(total)
+        _, timeout, _ = upstream.plan('finnhub', 'quote', upstream.FINNHUB_TIMEOUT)
+        print(f"{'on' if hedge else 'off':<8}{np.percentile(lat, 50):>9.0f}{np.percentile(lat, 95):>9.0f}{np.percentile(lat, 99):>9.0f}"
+              f"{lat.max():>9.0f}{errors:>8}{tracker.hedges - before[0]:>8}{tracker.hedge_wins - before[1]:>6}{timeout:>11.2f}")
+
+
+# Websocket fan-out: `clients` sockets spread over `n_symbols` symbols talk to api.live.websocket_app through in
+# memory receive/send channels (no network), the hub's refresh is a fake that sleeps like the upstream calls and
+# returns a prediction sized message. Counts refreshes (upstream cost) vs updates delivered and the publish ->
+# socket send latency
+async def run_ws(clients, n_symbols, interval, rounds, delay_ms):
+    from api import live
+
+    refreshes = Counter()
+    features = {f'feature_{i}': random.random() for i in range(15)}
+
+    async def fake_refresh(symbol, state):
+        refreshes[symbol] += 1
+        await asyncio.sleep(delay_ms / 1000)
+        data = {'symbol': symbol, 'prediction': 'BUY', 'confidence_scores': {'SELL': 0.2, 'HOLD': 0.3, 'BUY': 0.5},
+                'features_used': features, 'refresh': refreshes[symbol]}
+        return [{'type': 'prediction', 'symbol': symbol, 'data': data, 'sent': time.perf_counter()}]
+
+    hub = live.Hub(refresh=fake_refresh, interval=interval)
+    symbols = [f'T{i:03d}' for i in range(n_symbols)]
+    inboxes = [asyncio.Queue() for _ in range(clients)]
+    received = [] # (time sent to the socket, text)
+
+    async def send(message):
+        if message['type'] == 'websocket.send':
+            received.append((time.perf_counter(), message['text']))
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tasks = []
+    for i, inbox in enumerate(inboxes):
+        inbox.put_nowait({'type': 'websocket.connect'})
+        inbox.put_nowait({'type': 'websocket.receive', 'text': json.dumps({'action': 'subscribe', 'symbols': [symbols[i % n_symbols]]})})
+        scope = {'type': 'websocket', 'path': '/ws/live/', 'client': (f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', 0)} # one ip each
+        tasks.append(asyncio.create_task(live.websocket_app(scope, inbox.get, send, hub=hub)))
+    await asyncio.sleep(interval * rounds)
+    stats = hub.stats()
+    for inbox in inboxes:
+        inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.gather(*tasks)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    sent_at = {}
+    latencies = []
+    for at, text in received:
+        if id(text) not in sent_at: # every subscriber of a symbol gets the same str, parse it once
+            sent_at[id(text)] = json.loads(text).get('sent')
+        if sent_at[id(text)]:
+            latencies.append(at - sent_at[id(text)])
+    latencies = np.array(latencies) * 1000
+    updates = len(latencies)
+    print(f"{clients} sockets on {n_symbols} symbols for {interval * rounds:.0f}s (refresh every {interval}s, upstream {delay_ms:.0f} ms)")
+    print(f"refreshes (upstream fan-outs): {sum(refreshes.values())}, polling clients would have made ~{clients * rounds}")
+    print(f"updates delivered: {updates:,}, dropped: {stats['dropped']}, still subscribed at the end: {stats['subscribers']}")
+    if updates:
+        print(f"publish -> send latency p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms")
+    print(f"peak RSS growth: {(rss_after - rss_before) / 1024:.1f} MB") # ru_maxrss is KB on linux
+    print(f"after disconnect: {len(hub.tasks)} refresh loops, {len(hub.topics)} topics")
+
+
+# one worker process: acquire() a prediction's worth of quota in a loop -> [(priority, granted, seconds)]
+def quota_worker(seconds, clients, background_share, seed):
+    setup_django()
+    from api import predictor, quota
+    rng = random.Random(seed)
+    results = []
+    end = time.time() + seconds
+    while time.time() < end:
+        priority = quota.BACKGROUND if rng.random() < background_share else quota.INTERACTIVE
+        client = f"client:ip:10.0.0.{rng.randrange(clients)}" if priority == quota.INTERACTIVE else None
+        started = time.perf_counter()
+        try:
+            quota.acquire(predictor.quota_costs(client), priority)
+            granted = True
+        except quota.QuotaExceeded:
+            granted = False
+        results.append((priority, granted, time.perf_counter() - started))
+    return results
+
+
+def run_quota(processes, seconds, clients, background_share):
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+    from api import predictor, quota
+
+    call_command('migrate', verbosity=0)
+    connection.close() # the workers open their own
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = sum(pool.map(quota_worker, [seconds] * processes, [clients] * processes,
+                               [background_share] * processes, range(processes)), [])
+    elapsed = time.time() - started
+
+    per_call = predictor.quota_costs()[quota.provider_key('alphavantage')]
+    capacity, rate, _ = quota.limits(quota.provider_key('alphavantage'))
+    granted = {p: sum(1 for r in results if r[0] == p and r[1]) for p in (quota.INTERACTIVE, quota.BACKGROUND)}
+    tried = Counter(r[0] for r in results)
+    limit = capacity + rate * elapsed
+    lat = np.array([r[2] for r in results]) * 1000
+    print(f"{processes} processes, {len(results):,} acquire() calls in {elapsed:.1f}s on {connection.vendor}")
+    for p in (quota.INTERACTIVE, quota.BACKGROUND):
+        print(f"{p:<12} granted {granted[p]:>5} of {tried[p]:>6} tries")
+    used = (granted[quota.INTERACTIVE] + granted[quota.BACKGROUND]) * per_call
+    print(f"alphavantage calls granted {used}, limit {limit:.0f} ({capacity} burst + {settings.UPSTREAM_QUOTA_PER_MINUTE['alphavantage']}/min)"
+          f" -> {'OK' if used <= limit else 'OVER'}")
+    print(f"acquire() latency p50 {np.percentile(lat, 50):.2f} ms, p99 {np.percentile(lat, 99):.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fake = sub.add_parser('fake-upstream')
+    fake.add_argument('--port', type=int, default=9001)
+    fake.add_argument('--delay-ms', type=float, default=400)
+    fake.add_argument('--tail-ms', type=float, default=0, help='delay for the slow tail')
+    fake.add_argument('--tail-share', type=float, default=0.0, help='fraction of upstream calls that get --tail-ms')
+
+    run = sub.add_parser('run')
+    run.add_argument('--url', default='http://127.0.0.1:8000')
+    run.add_argument('--requests', type=int, default=200)
+    run.add_argument('--concurrency', type=int, default=40)
+    run.add_argument('--predict-share', type=float, default=0.25)
+    run.add_argument('--timeout', type=float, default=60)
+
+    tail = sub.add_parser('tail')
+    tail.add_argument('--requests', type=int, default=2000)
+    tail.add_argument('--concurrency', type=int, default=20)
+    tail.add_argument('--warmup', type=int, default=200)
+    tail.add_argument('--delay-ms', type=float, default=50)
+    tail.add_argument('--tail-ms', type=float, default=2000)
+    tail.add_argument('--tail-share', type=float, default=0.03)
+    tail.add_argument('--quota', type=int, default=100000, help='finnhub requests per minute (the real free tier is 60)')
+
+    ws = sub.add_parser('ws')
+    ws.add_argument('--clients', type=int, default=1000)
+    ws.add_argument('--symbols', type=int, default=20)
+    ws.add_argument('--interval', type=float, default=1.0, help='seconds between refreshes (LIVE_REFRESH_SECONDS)')
+    ws.add_argument('--rounds', type=int, default=10)
+    ws.add_argument('--delay-ms', type=float, default=400)
+
+    quota_run = sub.add_parser('quota')
+    quota_run.add_argument('--processes', type=int, default=4)
+    quota_run.add_argument('--seconds', type=float, default=10)
+    quota_run.add_argument('--per-minute', type=int, default=600, help='alphavantage calls per minute')
+    quota_run.add_argument('--clients', type=int, default=50)
+    quota_run.add_argument('--background-share', type=float, default=0.5)
+    quota_run.add_argument('--database-url')
+    args = parser.parse_args()
+
+    if args.command == 'tail':
+        if httpx is None:
+            raise SystemExit("httpx is required: pip install httpx")
+        os.environ['FINNHUB_API_URL'] = start_threaded_fake_upstream(args.delay_ms, args.tail_ms, args.tail_share)
+        os.environ['FINNHUB_QUOTA_PER_MINUTE'] = str(args.quota)
+        setup_django()
+        asyncio.run(run_tail(args.requests, args.concurrency, args.warmup))
+    elif args.command == 'quota':
+        tmp = tempfile.mkdtemp()
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tmp, 'quota.db')}"
+        os.environ.update(UPSTREAM_QUOTA='1', ALPHAVANTAGE_QUOTA_PER_MINUTE=str(args.per_minute), FINNHUB_QUOTA_PER_MINUTE=str(10**9),
+                          ALPHAVANTAGE_QUOTA_PER_DAY=str(10**9), CLIENT_PREDICTIONS_PER_MINUTE='1000000')
+        setup_django()
+        try:
+            run_quota(args.processes, args.seconds, args.clients, args.background_share)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    elif args.command == 'ws':
+        setup_django()
+        asyncio.run(run_ws(args.clients, args.symbols, args.interval, args.rounds, args.delay_ms))
+    elif args.command == 'fake-upstream':
+        import uvicorn
+        uvicorn.run(make_fake_upstream(args.delay_ms, args.tail_ms, args.tail_share), port=args.port, log_level='warning')
+    else:
+        if httpx is None:
+            raise SystemExit("httpx is required: pip install httpx")
+        report(*asyncio.run(run_load(args.url, args.requests, args.concurrency, args.predict_share, args.timeout)))
+
+
+if __name__ == "__main__":
+    main()
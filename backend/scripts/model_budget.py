@@ -0,0 +1,131 @@
+# What a trained forest costs to serve, and picking the most accurate candidate that fits a budget
+# Costs per model: single-row predict_proba latency (what /api/predict/ pays), per-row latency in a 1000-row batch
+# (/api/predict/history/), pickle size, and memory once loaded. train_model.py writes them to model_metadata.json,
+# the API warns on load when they go over MODEL_MAX_LATENCY_MS / MODEL_MAX_MEMORY_MB / MODEL_MAX_SIZE_MB
+
+import copy
+import io
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+MIN_TREES = 25 # don't trim below this many trees
+
+
+# each tree keeps its node table + per-node class values in C memory, this is what the loaded forest holds (bytes)
+def forest_memory(model):
+    return sum(tree.tree_.__getstate__()['nodes'].nbytes + tree.tree_.value.nbytes for tree in model.estimators_)
+
+
+def measure_inference_cost(model, X_sample, repeats=30):
+    X_sample = np.asarray(X_sample, dtype=np.float32)
+    model.predict_proba(X_sample[:1]) # warm up (thread pool)
+
+    single = []
+    for i in range(repeats):
+        row = X_sample[i % len(X_sample)].reshape(1, -1)
+        start = time.perf_counter()
+        model.predict_proba(row)
+        single.append(time.perf_counter() - start)
+
+    batch = np.resize(X_sample, (1000, X_sample.shape[1])) # repeat rows up to 1000 if the sample is smaller
+    start = time.perf_counter()
+    model.predict_proba(batch)
+    batch_s = time.perf_counter() - start
+
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    size = buffer.tell()
+    memory = forest_memory(model)
+
+    return {
+        'single_row_ms': float(np.median(single) * 1000),
+        'single_row_p95_ms': float(np.percentile(single, 95) * 1000),
+        'batch_row_us': batch_s / len(batch) * 1e6,
+        'pickle_mb': size / 1e6,
+        'memory_mb': memory / 1e6,
+    }
+
+
+# budget = {'max_latency_ms', 'max_memory_mb', 'max_size_mb'}, any of them None/missing = no limit
+def over_budget(cost, budget):
+    checks = [
+        ('max_latency_ms', 'single_row_ms'),
+        ('max_memory_mb', 'memory_mb'),
+        ('max_size_mb', 'pickle_mb'),
+    ]
+    problems = []
+    for limit, field in checks:
+        if budget.get(limit) is not None and cost[field] > budget[limit]:
+            problems.append(f"{field} {cost[field]:.2f} > {limit} {budget[limit]}")
+    return problems
+
+
+# same forest with only its first k trees (a forest's trees are independent, so this is a valid smaller forest)
+def trim_trees(model, k):
+    trimmed = copy.copy(model)
+    trimmed.estimators_ = model.estimators_[:k]
+    trimmed.n_estimators = k
+    return trimmed
+
+
+def trimmed_versions(model):
+    k = model.n_estimators
+    while k >= MIN_TREES:
+        yield k, (model if k == model.n_estimators else trim_trees(model, k))
+        k //= 2
+
+
+# Go through the grid's candidates from best CV score down (top_n of them), fit each on most of the training set and
+# score it on the rest. If a candidate is over budget, try it with fewer trees, and if nothing in the grid fits try
+# shallower versions of the best params. Returns (params incl. n_estimators, list of everything tried)
+def select_within_budget(grid_search, X_train, y_train, budget, top_n=8):
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.2, random_state=42, stratify=y_train)
+    ranked = pd.DataFrame(grid_search.cv_results_).sort_values('rank_test_score')['params'].tolist()
+    best = dict(grid_search.best_params_)
+    shallower = [best | {'max_depth': depth} for depth in (8, 6, 4) if depth < (best.get('max_depth') or 1000)]
+
+    # trimming covers smaller n_estimators, so fit each combination of the other params once with its most trees
+    candidates = {}
+    for params in ranked[:top_n]:
+        key = tuple(sorted((k, v) for k, v in params.items() if k != 'n_estimators'))
+        n_trees = max(p.get('n_estimators', 100) for p in ranked if all(p.get(k) == v for k, v in key))
+        candidates.setdefault(key, params | {'n_estimators': n_trees})
+
+    tried = []
+    for params in list(candidates.values()) + shallower:
+        if params in shallower and any(t['fits'] for t in tried):
+            break
+        model = clone(grid_search.estimator).set_params(**params).fit(X_fit, y_fit)
+        for n_trees, candidate in trimmed_versions(model):
+            cost = measure_inference_cost(candidate, X_val)
+            problems = over_budget(cost, budget)
+            tried.append({
+                'params': params | {'n_estimators': n_trees},
+                'val_accuracy': float(accuracy_score(y_val, candidate.predict(X_val))),
+                'cost': cost,
+                'fits': not problems,
+                'over_budget': problems,
+            })
+            if not problems:
+                break
+
+    fitting = [t for t in tried if t['fits']]
+    if fitting:
+        pick = max(fitting, key=lambda t: t['val_accuracy'])
+    else: # nothing fits: cheapest thing we tried, metadata will say it is over budget
+        pick = min(tried, key=lambda t: t['cost']['single_row_ms'])
+    return pick['params'], tried
+
+
+# the final refit sees more rows than the candidate did, so its trees can come out bigger: drop trees until it fits
+def shrink_to_budget(model, X_sample, budget):
+    for _, candidate in trimmed_versions(model):
+        if not over_budget(measure_inference_cost(candidate, X_sample), budget):
+            return candidate
+    return candidate # smallest we can go, still over (reported in the metadata)
@@ -0,0 +1,211 @@
+# Model family: a global forest + one per sector + one per ticker, all on the same features, for the API to route each
+# symbol to its most specific model (ticker > sector > global, api/model_registry.py)
+#   python train_model.py --family                       -> global, sector and ticker models
+#   python train_model.py --family ticker --workers 4    -> only the per-ticker models (the sector and global ones
+#                                                           already in the manifest are kept and still served)
+# The training matrix is copied once into shared memory; every worker process maps it instead of getting its own
+# pickled copy, and fits one model at a time (n_jobs=1, the parallelism is across models). A group with fewer than
+# --min-rows labelled rows, or without every class, gets no model and falls back to the next level.
+# Output: Models/family/<version>/<key>.pkl + Models/family/manifest.json (written last, so a half finished run
+# is never served). Every manifest entry names its version folder, so a partial run's manifest can point at models
+# from earlier runs. Folders the current or the previous manifest use are kept, older ones are removed
+
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import train_test_split
+
+try:
+    from . import universe
+    from .model_budget import forest_memory
+except ImportError: # run as a script from backend/scripts
+    import universe
+    from model_budget import forest_memory
+
+FAMILY_DIR = os.path.join(universe.MODELS_DIR, 'family')
+MANIFEST = 'manifest.json'
+LEVELS = ['global', 'sector', 'ticker']
+MIN_ROWS = 100
+# what the grid search settled on for the global model (see PARAM_GRID in train_model.py)
+DEFAULT_PARAMS = {'n_estimators': 200, 'max_depth': 11, 'min_samples_split': 15, 'min_samples_leaf': 6, 'max_features': 'sqrt'}
+
+_shared = {} # worker side: name -> array view on the shared block
+
+
+def model_key(level, name=None):
+    return level if level == 'global' else f"{level}:{name}"
+
+
+def model_file(key):
+    return re.sub(r'[^a-z0-9.]+', '-', key.lower()) + '.pkl'
+
+
+# arrays -> (shared memory blocks, {name: (block name, shape, dtype)} for the workers)
+def share(arrays):
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def attach(specs): # pool initializer
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+        _shared.setdefault('_blocks', []).append(block) # keep the mapping alive
+
+
+# (key, level, row indices or None for all) per model worth training
+def family_specs(y, tickers, sectors, levels, min_rows=MIN_ROWS):
+    classes = np.unique(y)
+
+    def enough(rows):
+        labels = y[rows]
+        return len(rows) >= min_rows and all(np.count_nonzero(labels == c) >= 2 for c in classes)
+
+    specs = []
+    if 'global' in levels:
+        specs.append((model_key('global'), 'global', None))
+    groups = []
+    if 'sector' in levels:
+        ticker_sector = np.array([sectors.get(t, '') for t in tickers])
+        groups += [('sector', s, np.flatnonzero(ticker_sector == s)) for s in sorted(set(ticker_sector) - {''})]
+    if 'ticker' in levels:
+        groups += [('ticker', t, np.flatnonzero(tickers == t)) for t in sorted(set(tickers))]
+    skipped = []
+    for level, name, rows in groups:
+        if enough(rows):
+            specs.append((model_key(level, name), level, rows))
+        else:
+            skipped.append(model_key(level, name))
+    specs.sort(key=lambda spec: -(len(y) if spec[2] is None else len(spec[2]))) # biggest first, keeps workers busy
+    return specs, skipped
+
+
+# runs in a worker: fit on the shared matrix rows, save, return the manifest entry
+def fit_one(key, level, rows, params, out_dir):
+    start = time.perf_counter()
+    X, y = _shared['X'], _shared['y']
+    if rows is not None:
+        X, y = X[rows], y[rows]
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    model = RandomForestClassifier(random_state=42, n_jobs=1, class_weight='balanced', **params).fit(X_train, y_train)
+    test_accuracy = float(model.score(X_test, y_test))
+    path = os.path.join(out_dir, model_file(key))
+    joblib.dump(model, path)
+    return {
+        'key': key,
+        'level': level,
+        'directory': os.path.basename(out_dir),
+        'file': os.path.basename(path),
+        'rows': int(len(y)),
+        'test_accuracy': test_accuracy,
+        'memory_mb': forest_memory(model) / 1e6,
+        'size_mb': os.path.getsize(path) / 1e6,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+# X float32 [rows, features], y labels, tickers = ticker per row. Returns the manifest
+def train_family(X, y, tickers, feature_cols, levels=LEVELS, workers=None, min_rows=MIN_ROWS, params=None,
+                 family_dir=FAMILY_DIR, sectors=None):
+    sectors = universe.get_sectors() if sectors is None else sectors
+    tickers = np.asarray(tickers).astype(str)
+    params = params or DEFAULT_PARAMS
+    specs, skipped = family_specs(np.asarray(y), tickers, sectors, levels, min_rows)
+    version = datetime.now().isoformat()
+    out_dir = os.path.join(family_dir, version.replace(':', '-'))
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Training {len(specs)} models with {workers or 1} worker(s), {len(skipped)} groups too small: {', '.join(skipped) or '-'}")
+
+    start = time.perf_counter()
+    blocks, shared = share({'X': np.asarray(X, dtype=np.float32), 'y': np.asarray(y)})
+    try:
+        jobs = [(key, level, rows, params, out_dir) for key, level, rows in specs]
+        if not workers or workers <= 1:
+            attach(shared)
+            entries = [fit_one(*job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=attach, initargs=(shared,)) as pool:
+                entries = list(pool.map(fit_one, *zip(*jobs)))
+    finally:
+        _shared.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
+    elapsed = time.perf_counter() - start
+
+    manifest = {
+        'version': version,
+        'directory': os.path.basename(out_dir),
+        'feature_columns': list(feature_cols),
+        'params': params,
+        'sectors': dict(sorted(sectors.items())), # all of them: a ticker with no rows can still use its sector's model
+        'models': {entry.pop('key'): entry for entry in entries},
+        'skipped': skipped,
+        'training_seconds': elapsed,
+    }
+    keep_other_levels(manifest, read_manifest(family_dir), levels)
+    write_manifest(manifest, family_dir)
+    for entry_key, entry in sorted(manifest['models'].items()):
+        print(f"{entry_key:<40} {entry['rows']:>7,} rows  test acc {entry['test_accuracy']:.3f}  {entry['memory_mb']:.1f} MB  {entry['seconds']:.1f}s")
+    print(f"{len(entries)} models in {elapsed:.1f}s -> {family_dir}")
+    return manifest
+
+
+# levels this run didn't train keep their models from the previous manifest (only if they were trained on the same
+# features, a model expecting other columns can't be served next to the new ones)
+def keep_other_levels(manifest, previous, levels):
+    if previous is None:
+        return
+    others = {key: entry for key, entry in previous['models'].items() if entry['level'] not in levels}
+    if previous['feature_columns'] != manifest['feature_columns']:
+        if others:
+            print(f"Feature columns changed, dropping {len(others)} models of the levels not retrained: {', '.join(sorted(others))}")
+        return
+    for key, entry in others.items():
+        manifest['models'][key] = dict(entry, directory=model_directory(previous, key))
+    manifest['skipped'] += [key for key in previous.get('skipped', []) if key.partition(':')[0] not in levels]
+
+
+# version folder of one model (manifests written before entries had their own folder: the manifest's)
+def model_directory(manifest, key):
+    return manifest['models'][key].get('directory', manifest['directory'])
+
+
+def manifest_directories(manifest):
+    return {manifest['directory']} | {model_directory(manifest, key) for key in manifest['models']}
+
+
+def write_manifest(manifest, family_dir):
+    tmp = os.path.join(family_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    previous = read_manifest(family_dir)
+    os.replace(tmp, os.path.join(family_dir, MANIFEST))
+    keep = manifest_directories(manifest) | (manifest_directories(previous) if previous else set())
+    for name in os.listdir(family_dir):
+        path = os.path.join(family_dir, name)
+        if os.path.isdir(path) and name not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def read_manifest(family_dir=FAMILY_DIR):
+    try:
+        with open(os.path.join(family_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
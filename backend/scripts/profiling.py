@@ -0,0 +1,199 @@
+# On-demand profiling for the API (api/middleware.py) and the pipeline scripts (--profile)
+# A profile is a CPU sample of the stacks every PROFILE_INTERVAL_MS plus a tracemalloc snapshot, saved in PROFILE_DIR as
+#   <id>.cpu.folded    "frame;frame;frame count"  (flamegraph.pl / speedscope / inferno read this directly)
+#   <id>.alloc.folded  same format, bytes still allocated at the end by the stack that allocated them
+#   <id>.json          name, duration, samples, peak traced memory, top allocation sites
+# Only one profile runs at a time per process (tracemalloc is process wide), a second one is skipped
+# No Django in here so the scripts can use it without a settings module:
+#   python calculate_indicators.py --profile
+#   python manage.py profiles                 -> recent profiles (also GET /api/profiles/)
+
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(BACKEND_DIR, 'profiles'))
+INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+ALLOC_FRAMES = 25
+KEEP = 100 # newest profiles kept in the directory
+
+# a thread sitting in one of these is waiting, not working (event loop select, pool workers waiting for a job)
+IDLE_LEAVES = {('threading.py', 'wait'), ('selectors.py', 'select'), ('queue.py', 'get')}
+
+_running = threading.Lock()
+
+
+def frame_label(code):
+    parent = os.path.basename(os.path.dirname(code.co_filename))
+    return f"{parent}/{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+# Samples the given threads' stacks (None = every thread but itself, idle ones skipped) into folded stack counts
+class StackSampler(threading.Thread):
+    def __init__(self, thread_ids=None, interval_ms=INTERVAL_MS):
+        super().__init__(daemon=True, name='profiling-sampler')
+        self.thread_ids = thread_ids
+        self.interval = interval_ms / 1000
+        self.counts = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+            if self.thread_ids is None and leaf in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.counts
+
+
+def allocation_stacks(snapshot):
+    if snapshot is None:
+        return {}
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    stacks = {}
+    for stat in snapshot.statistics('traceback'):
+        # tracemalloc frames are (file, line), oldest first like the folded format wants
+        key = ';'.join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in stat.traceback)
+        stacks[key] = stacks.get(key, 0) + stat.size
+    return stacks
+
+
+def write_folded(path, counts):
+    with open(path, 'w') as f:
+        for stack, count in sorted(counts.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {count}\n")
+
+
+def prune(directory, keep=None):
+    infos = sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)
+    for name in infos[keep or KEEP:]:
+        profile_id = name[:-len('.json')]
+        for suffix in ('.json', '.cpu.folded', '.alloc.folded'):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+# with profile('name') as info: ...  -> info['id'] set when it finishes, None if another profile was running
+# thread_ids: threads to sample (default the calling one), None samples all threads
+@contextmanager
+def profile(name, directory=None, thread_ids='current', extra=None):
+    info = {'id': None}
+    if not _running.acquire(blocking=False):
+        yield info
+        return
+    try:
+        directory = directory or PROFILE_DIR
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(ALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        sampler = StackSampler({threading.get_ident()} if thread_ids == 'current' else thread_ids)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            duration = time.perf_counter() - start
+            counts = sampler.stop()
+            tracing = tracemalloc.is_tracing() # the profiled code may have stopped it
+            snapshot = tracemalloc.take_snapshot() if tracing else None
+            _, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+            if started_tracing and tracing:
+                tracemalloc.stop()
+
+            os.makedirs(directory, exist_ok=True)
+            safe_name = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)[:60]
+            now = time.time() # ids sort by time (milliseconds), that is how listing / pruning order them
+            profile_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}-{safe_name}"
+            alloc = allocation_stacks(snapshot)
+            write_folded(os.path.join(directory, f"{profile_id}.cpu.folded"), counts)
+            write_folded(os.path.join(directory, f"{profile_id}.alloc.folded"), alloc)
+            top = sorted(alloc.items(), key=lambda item: -item[1])[:10]
+            meta = {
+                'id': profile_id,
+                'name': name,
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'duration_ms': round(duration * 1000, 2),
+                'samples': sampler.samples,
+                'interval_ms': sampler.interval * 1000,
+                'peak_traced_mb': round(peak / 1e6, 3),
+                'top_allocations': [{'stack': stack.split(';')[-1], 'bytes': size} for stack, size in top],
+            } | (extra or {})
+            with open(os.path.join(directory, f"{profile_id}.json"), 'w') as f:
+                json.dump(meta, f, indent=2)
+            prune(directory)
+            info.update(meta)
+    finally:
+        _running.release()
+
+
+def list_profiles(directory=None, limit=20):
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.json')), reverse=True)[:limit]
+    profiles = []
+    for name in names:
+        with open(os.path.join(directory, name)) as f:
+            profiles.append(json.load(f))
+    return profiles
+
+
+# path of one of a profile's files, None if there is no such profile (ids come from list_profiles)
+def profile_file(profile_id, kind='cpu', directory=None):
+    directory = directory or PROFILE_DIR
+    if kind not in ('cpu', 'alloc', 'json') or os.path.basename(profile_id) != profile_id:
+        return None
+    path = os.path.join(directory, f"{profile_id}.json" if kind == 'json' else f"{profile_id}.{kind}.folded")
+    return path if os.path.exists(path) else None
+
+
+def add_profile_arg(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help=f'save a CPU + allocation profile of this run to {PROFILE_DIR}')
+
+
+# Per script run: `with profiling.stage(args, 'clean_all_stocks'):`. Tickers run in this process while profiling
+# (the sampler can't see into pool workers), so --workers is set to 1
+@contextmanager
+def stage(args, name):
+    if not getattr(args, 'profile', False):
+        yield
+        return
+    if getattr(args, 'workers', 1) not in (None, 1):
+        print(f"--profile: running with --workers 1 (was {args.workers}) so the work is in this process")
+        args.workers = 1
+    with profile(name) as info:
+        yield
+    if info['id'] is None:
+        return
+    print(f"Profile {info['id']}: {info['duration_ms'] / 1000:.1f}s, {info['samples']} samples, "
+          f"peak traced {info['peak_traced_mb']:.1f} MB -> {PROFILE_DIR}")
@@ -0,0 +1,217 @@
+# Minute OHLCV bars -> any bar size (5m, 15m, 1h, 1d, ...) with numpy only, chunk by chunk so a ticker with tens of
+# millions of minutes never has to fit in memory at once:
+#   python resample.py --interval 5m --out-dir "/data/intraday 5m"            -> every ticker with a minute file
+#   PIPELINE_DATA_DIR="/data/intraday 5m" python calculate_indicators.py      -> then the rest of the pipeline as usual
+# Minute files: Data Files/Price/Minute/<TICKER> minute.csv (universe.minute_path) with a time column + OHLCV, sorted
+# by time, times in exchange local time (tz-aware times are converted to SESSION_TZ). Output is written in the raw
+# price file format (Date,Open,High,Low,Close,Volume) to <out-dir>/Price, the news folder is linked next to it.
+#
+# Bars never cross a session: minutes are bucketed from the session open (09:30 -> 09:30-09:35, 09:35-09:40, ...), the
+# last bar of a session may be shorter (1h: 15:30-16:00), and 1d is one bar per session. Pre/post market minutes
+# are dropped unless --extended (then the session is the whole calendar day, bucketed from midnight).
+# Open = first minute's open, high/low = max/min (nan minutes ignored), close = last minute's close, volume = sum.
+# Bars are labelled with their start time, 1d bars with the session close (like the daily price files)
+
+import argparse
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import profiling
+    from . import universe
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+
+SESSION_TZ = 'America/New_York'
+SESSION_OPEN = 9 * 60 + 30 # minutes after midnight
+SESSION_CLOSE = 16 * 60
+CHUNK_ROWS = 1_000_000
+MINUTE_NS = 60 * 10**9
+DAY_NS = 24 * 60 * MINUTE_NS
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+# '5m' / '15min' / '1h' / '1d' -> bar length in minutes, None for one bar per session
+def parse_interval(interval):
+    match = re.fullmatch(r'(\d+)\s*(m|min|h|d)', interval.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Interval must look like 5m, 1h or 1d, got {interval!r}")
+    n, unit = int(match.group(1)), match.group(2)
+    if unit == 'd':
+        if n != 1:
+            raise ValueError("Only 1d: multi-day bars need a trading calendar")
+        return None
+    return n * 60 if unit == 'h' else n
+
+
+# one chunk of minutes -> (bucket id per kept row, label time per bucket id, mask of kept rows)
+def buckets(ts, minutes, extended=False):
+    day, minute = np.divmod(ts, DAY_NS)
+    minute //= MINUTE_NS
+    start, end = (0, 24 * 60) if extended else (SESSION_OPEN, SESSION_CLOSE)
+    keep = (minute >= start) & (minute < end)
+    day, minute = day[keep], minute[keep]
+    if minutes is None:
+        return day, day * DAY_NS + end * MINUTE_NS, keep
+    k = (minute - start) // minutes
+    return day * (24 * 60) + k, day * DAY_NS + (start + k * minutes) * MINUTE_NS, keep
+
+
+# minute arrays (sorted by time) -> one row per bucket. `bars` = minutes that went into each bar
+def aggregate(bucket, label, o, h, l, c, v):
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    return {
+        'bucket': bucket[starts],
+        'time': label[starts],
+        'open': o[starts],
+        'high': np.fmax.reduceat(h, starts),
+        'low': np.fmin.reduceat(l, starts),
+        'close': c[ends],
+        'volume': np.add.reduceat(v, starts),
+        'bars': np.diff(np.r_[starts, len(bucket)]),
+    }
+
+
+# a bar cut in two by a chunk boundary: first part + second part
+def merge(first, second):
+    return {
+        'bucket': first['bucket'], 'time': first['time'], 'open': first['open'],
+        'high': np.fmax(first['high'], second['high']), 'low': np.fmin(first['low'], second['low']),
+        'close': second['close'], 'volume': first['volume'] + second['volume'], 'bars': first['bars'] + second['bars'],
+    }
+
+
+def take(bars, index):
+    return {name: values[index] for name, values in bars.items()}
+
+
+# chunks = iterable of (ts int64 ns, open, high, low, close, volume) arrays in time order. Yields finished bars per
+# chunk; the last bar of a chunk is held back (as one partial bar, not its minutes) until the next chunk shows
+# whether it continues
+def resample_chunks(chunks, interval, extended=False):
+    minutes = parse_interval(interval)
+    pending = None
+    last_ts = None
+    for ts, o, h, l, c, v in chunks:
+        ts = np.asarray(ts, dtype=np.int64)
+        if len(ts) == 0:
+            continue
+        if np.any(ts[1:] < ts[:-1]) or (last_ts is not None and ts[0] < last_ts):
+            raise ValueError("Minute bars must be sorted by time")
+        last_ts = ts[-1]
+        bucket, label, keep = buckets(ts, minutes, extended)
+        if not len(bucket):
+            continue
+        bars = aggregate(bucket, label, *(np.asarray(a)[keep] for a in (o, h, l, c)), np.asarray(v, dtype=np.float64)[keep])
+        if pending is not None:
+            if bars['bucket'][0] == pending['bucket']:
+                first = merge(pending, take(bars, 0))
+                bars = {name: np.r_[first[name], values[1:]] for name, values in bars.items()}
+            else:
+                bars = {name: np.r_[pending[name], values] for name, values in bars.items()}
+        pending = take(bars, -1)
+        if len(bars['bucket']) > 1:
+            yield take(bars, slice(0, -1))
+    if pending is not None:
+        yield {name: np.atleast_1d(value) for name, value in pending.items()}
+
+
+# whole arrays at once (tests, small files)
+def resample(ts, o, h, l, c, v, interval, extended=False):
+    parts = list(resample_chunks([(ts, o, h, l, c, v)], interval, extended))
+    if not parts:
+        return {name: np.empty(0) for name in ['bucket', 'time'] + FIELDS + ['bars']}
+    return {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+
+# time strings -> datetimes. The price files are dd/mm/yyyy (dayfirst), but pandas' dayfirst also turns an ISO
+# 2024-05-01 into 5 January, so ISO looking values are parsed as ISO
+def parse_times(values):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values) or not len(values):
+        return pd.to_datetime(values)
+    iso = re.match(r'\d{4}-\d{2}-\d{2}', str(values.iloc[0])) is not None
+    return pd.to_datetime(values, format='ISO8601') if iso else pd.to_datetime(values, dayfirst=True)
+
+
+def to_ns(times):
+    times = parse_times(times)
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert(SESSION_TZ).dt.tz_localize(None)
+    return times.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+# minute csv -> chunks for resample_chunks. Column names like the price files (any case, time column = date/time/timestamp)
+def read_minute_csv(path, chunksize=CHUNK_ROWS):
+    columns = [c for c in pd.read_csv(path, nrows=0).columns]
+    lower = {c.lower().strip(): c for c in columns}
+    time_col = next((lower[name] for name in ('timestamp', 'datetime', 'date', 'time') if name in lower), None)
+    ohlcv = [lower.get(name) for name in FIELDS]
+    if time_col is None or None in ohlcv:
+        raise ValueError(f"{path} needs a time column + {', '.join(FIELDS)}, has {columns}")
+    dtypes = {col: np.float64 for col in ohlcv}
+    for chunk in pd.read_csv(path, usecols=[time_col] + ohlcv, dtype=dtypes, chunksize=chunksize):
+        yield (to_ns(chunk[time_col]), *(chunk[col].to_numpy() for col in ohlcv))
+
+
+# bars -> rows in the raw price file format, appended to `out`
+def write_bars(bars, out, header):
+    frame = pd.DataFrame({
+        'Date': pd.to_datetime(bars['time']).strftime('%d/%m/%Y %H:%M:%S'),
+        'Open': bars['open'], 'High': bars['high'], 'Low': bars['low'], 'Close': bars['close'],
+        'Volume': np.round(bars['volume']).astype(np.int64),
+    })
+    frame.to_csv(out, index=False, header=header)
+
+
+def resample_file(path, out_path, interval, extended=False, chunksize=CHUNK_ROWS):
+    rows = 0
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with open(out_path, 'w', newline='') as out:
+        for bars in resample_chunks(read_minute_csv(path, chunksize), interval, extended):
+            write_bars(bars, out, header=rows == 0)
+            rows += len(bars['time'])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    universe.add_universe_args(parser)
+    parser.add_argument('--interval', required=True, help='bar size: 5m, 15m, 1h, 1d, ...')
+    parser.add_argument('--out-dir', required=True, help='data folder to run the pipeline on (PIPELINE_DATA_DIR)')
+    parser.add_argument('--extended', action='store_true', help='keep pre/post market minutes')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+
+    tickers = universe.get_universe(args.tickers or universe.minute_tickers())
+    price_dir = os.path.join(args.out_dir, os.path.basename(universe.PRICE_DIR))
+    news_dir = os.path.join(args.out_dir, os.path.basename(universe.NEWS_DIR))
+    if not os.path.exists(news_dir) and os.path.isdir(universe.NEWS_DIR):
+        os.makedirs(args.out_dir, exist_ok=True)
+        os.symlink(universe.NEWS_DIR, news_dir) # the pipeline wants price + news side by side
+
+    with profiling.stage(args, 'resample'):
+        results = universe.run_per_ticker(ResampleJob(args, price_dir), tickers, args.workers)
+    for ticker, (ok, info) in sorted(results.items()):
+        print(f"{ticker}: {f'{info:,} bars' if ok else info}")
+    return results
+
+
+# one ticker's minute file -> bars file, picklable for run_per_ticker's process pool
+class ResampleJob:
+    def __init__(self, args, price_dir):
+        self.interval, self.extended, self.chunk_rows, self.price_dir = args.interval, args.extended, args.chunk_rows, price_dir
+
+    def __call__(self, ticker):
+        out_path = os.path.join(self.price_dir, universe.PRICE_PATTERN.format(ticker=ticker))
+        return resample_file(universe.minute_path(ticker), out_path, self.interval, self.extended, self.chunk_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# Daily model update without the full grid search
+# 1) labels only the rows of consolidated_data_with_sentiment.csv that are new since the last run and whose 5 day
+#    forward return now exists (create_target_labels.label_new_rows), appended to ml_training_data.csv
+# 2) updates the saved model:
+#      --mode warm_start  grow --new-trees trees on the last --recent-days of data onto the existing forest and drop the
+#                         same number of oldest trees (so size / serving cost stay the same, see model_budget.py)
+#      --mode refit       refit on everything with the saved hyperparameters (no GridSearchCV)
+# 3) keeps the previous model under Models/previous/<created_date>/, --rollback puts the newest one back
+# With --holdout-days N the last N trading days are kept out of the update and used to report accuracy of the old model,
+# the updated one and (--compare-full) a full grid search retrain, with training times. The old model was trained on
+# every row labelled before this run, so on the whole holdout its number is in-sample (flagged in the report); the
+# 'new rows' column only scores the holdout rows labelled in this run, which none of the models has seen
+#   python retrain_incremental.py --mode refit --holdout-days 10 --compare-full
+# The API loads the model once per process, restart it to serve the new one
+
+import argparse
+import copy
+import json
+import os
+import shutil
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import GridSearchCV
+from sklearn.utils.class_weight import compute_class_weight
+
+try:
+    from . import profiling
+    from . import universe
+    from .create_target_labels import label_new_rows
+    from .feature_reference import build_reference
+    from .model_budget import measure_inference_cost, over_budget
+    from .train_model import PARAM_GRID, analyse_feature_importance, base_forest, save_model_artifacts
+    from .training_data import load_training_data
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+    from create_target_labels import label_new_rows
+    from feature_reference import build_reference
+    from model_budget import measure_inference_cost, over_budget
+    from train_model import PARAM_GRID, analyse_feature_importance, base_forest, save_model_artifacts
+    from training_data import load_training_data
+
+ARTIFACTS = ['stock_prediction_model.pkl', 'feature_columns.pkl', 'feature_importance.csv', 'model_metadata.json', 'feature_reference.json']
+KEEP_PREVIOUS = 5
+
+
+def previous_dir():
+    return os.path.join(universe.MODELS_DIR, 'previous')
+
+
+def read_metadata():
+    path = os.path.join(universe.MODELS_DIR, 'model_metadata.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+# copy the current artifacts to previous/<version>/, only the newest KEEP_PREVIOUS are kept
+def backup_current_model():
+    version = read_metadata().get('created_date') or str(int(time.time()))
+    target = os.path.join(previous_dir(), version.replace(':', '-'))
+    os.makedirs(target, exist_ok=True)
+    for name in ARTIFACTS:
+        path = os.path.join(universe.MODELS_DIR, name)
+        if os.path.exists(path):
+            shutil.copy2(path, target)
+    for old in sorted(os.listdir(previous_dir()))[:-KEEP_PREVIOUS]:
+        shutil.rmtree(os.path.join(previous_dir(), old), ignore_errors=True)
+    return target
+
+
+# rows of the training file labelled in this run (new_rows), the only ones the saved model wasn't trained on
+def new_since_previous(meta, dates, new_rows):
+    if len(new_rows) == 0:
+        return np.zeros(len(dates), dtype=bool)
+    new = set(zip(new_rows['ticker'].astype(str), pd.to_datetime(new_rows['date'].astype(str)).to_numpy()))
+    return np.array([(ticker, day) in new for ticker, day in zip(meta['ticker'].astype(str), dates)], dtype=bool)
+
+
+def rollback():
+    versions = sorted(os.listdir(previous_dir())) if os.path.isdir(previous_dir()) else []
+    if not versions:
+        print("No previous model to roll back to")
+        return None
+    source = os.path.join(previous_dir(), versions[-1])
+    for name in ARTIFACTS:
+        if os.path.exists(os.path.join(source, name)):
+            shutil.copy2(os.path.join(source, name), universe.MODELS_DIR)
+    shutil.rmtree(source)
+    print(f"Rolled back to {versions[-1]}")
+    return versions[-1]
+
+
+# new trees on recent rows added to a copy of the forest, then the oldest ones dropped so the size stays the same.
+# class weights are fixed from the full label distribution (balanced on a recent slice would be skewed)
+def extend_forest(model, X_recent, y_recent, new_trees, class_weight):
+    if not np.array_equal(np.unique(y_recent), model.classes_):
+        raise ValueError("recent window does not have every class, use a bigger --recent-days or --mode refit")
+    size = model.n_estimators
+    model = copy.deepcopy(model)
+    model.set_params(warm_start=True, n_estimators=size + new_trees, class_weight=class_weight)
+    model.fit(X_recent, y_recent)
+    model.estimators_ = model.estimators_[new_trees:]
+    model.set_params(warm_start=False, n_estimators=size)
+    return model
+
+
+def refit_frozen(model, X, y):
+    return clone(model).set_params(warm_start=False).fit(X, y)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=['warm_start', 'refit'], default='refit')
+    parser.add_argument('--new-trees', type=int, default=25)
+    parser.add_argument('--recent-days', type=int, default=60, help='trading days the warm start trees are trained on')
+    parser.add_argument('--holdout-days', type=int, default=0, help='newest trading days kept out to measure accuracy')
+    parser.add_argument('--compare-full', action='store_true', help='also time a full grid search retrain (needs --holdout-days)')
+    parser.add_argument('--rollback', action='store_true')
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+
+    if args.rollback:
+        rollback()
+        return
+
+    start = time.perf_counter()
+    with profiling.stage(args, 'retrain_incremental-label'):
+        new_rows = label_new_rows(universe.CONSOLIDATED_FILE, universe.TRAINING_FILE)
+    label_s = time.perf_counter() - start
+    print(f"Labelled {len(new_rows):,} new rows in {label_s:.2f}s")
+    if len(new_rows) == 0 and args.holdout_days == 0:
+        print("Nothing new to train on")
+        return
+
+    model = joblib.load(os.path.join(universe.MODELS_DIR, 'stock_prediction_model.pkl'))
+    model_features = joblib.load(os.path.join(universe.MODELS_DIR, 'feature_columns.pkl'))
+    X, y, meta, features = load_training_data(universe.TRAINING_FILE)
+    X = np.ascontiguousarray(X[:, [features.index(col) for col in model_features]]) # saved model's column order
+    if hasattr(model, 'feature_names_in_'): # fitted on a DataFrame before, keep giving it names
+        X = pd.DataFrame(X, columns=model_features)
+
+    dates = pd.to_datetime(meta['date'].astype(str)).to_numpy()
+    unique_dates = np.unique(dates)
+    train = dates < unique_dates[-args.holdout_days] if args.holdout_days else np.ones(len(dates), dtype=bool)
+    holdout = ~train
+    recent_days = unique_dates[unique_dates <= dates[train].max()][-args.recent_days:]
+    recent = train & (dates >= recent_days[0])
+
+    class_weight = dict(zip(model.classes_, compute_class_weight('balanced', classes=model.classes_, y=y[train])))
+    with profiling.stage(args, f'retrain_incremental-{args.mode}'):
+        if args.mode == 'warm_start':
+            updated, train_s = timed(extend_forest, model, X[recent], y[recent], args.new_trees, class_weight)
+            trained_rows = int(recent.sum())
+        else:
+            updated, train_s = timed(refit_frozen, model, X[train], y[train])
+            trained_rows = int(train.sum())
+    print(f"{args.mode}: trained on {trained_rows:,} rows in {train_s:.2f}s")
+
+    report = {'mode': args.mode, 'new_rows': int(len(new_rows)), 'trained_rows': trained_rows,
+              'label_seconds': label_s, 'train_seconds': train_s, 'base_version': read_metadata().get('created_date')}
+    if args.holdout_days:
+        rows = [('previous model', None, model), (args.mode, train_s, updated)]
+        if args.compare_full:
+            search = GridSearchCV(base_forest(), PARAM_GRID, cv=3, scoring='accuracy', n_jobs=-1)
+            full, full_s = timed(lambda: search.fit(X[train], y[train]).best_estimator_)
+            rows.append(('full retrain', full_s, full))
+        unseen = holdout & new_since_previous(meta, dates, new_rows)
+        in_sample = bool((holdout & ~unseen).any())
+        report['previous_model_in_sample'] = in_sample
+        print(f"Holdout: last {args.holdout_days} trading days, {int(holdout.sum()):,} rows, {int(unseen.sum()):,} of them new in this run")
+        print(f"{'model':<18}{'train s':>10}{'accuracy':>10}{'new rows':>10}")
+        for name, seconds, candidate in rows:
+            key = name.replace(' ', '_')
+            accuracy = accuracy_score(y[holdout], candidate.predict(X[holdout]))
+            report[f"holdout_accuracy_{key}"] = float(accuracy)
+            new_accuracy = accuracy_score(y[unseen], candidate.predict(X[unseen])) if unseen.any() else None
+            report[f"holdout_new_rows_accuracy_{key}"] = new_accuracy
+            label = f"{name} *" if candidate is model and in_sample else name
+            print(f"{label:<18}{'-' if seconds is None else f'{seconds:.1f}':>10}{accuracy:>10.3f}"
+                  f"{'-' if new_accuracy is None else f'{new_accuracy:.3f}':>10}")
+            if name == 'full retrain':
+                report['full_retrain_seconds'] = seconds
+        if in_sample:
+            print("* trained on part of the holdout (rows labelled before this run): in-sample, compare on 'new rows'")
+
+    backup = backup_current_model()
+    print(f"Previous model kept in {backup}")
+    metadata = read_metadata()
+    cost = measure_inference_cost(updated, X[train][:1000])
+    training_info = {
+        'params': {k: v for k, v in updated.get_params().items() if k in PARAM_GRID},
+        'inference_cost': cost,
+        'budget': metadata.get('budget', {}),
+        'over_budget': over_budget(cost, metadata.get('budget', {})),
+        'incremental': report,
+    }
+    save_model_artifacts(updated, analyse_feature_importance(updated, model_features), model_features, training_info,
+                         build_reference(X[train], model_features))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Exponentially time-decayed news sentiment. The whole history of a ticker's scored articles is summarised by
+# (total, weight, last): decayed sum of scores, decayed article count, and the time (epoch seconds) both are decayed to.
+# Adding an article and reading the value are O(1), and the same two functions are used offline
+# (consolidate_data_with_sentiment.py replays the articles in time order) and online (api/sentiment_state.py applies
+# them as they get scored), so training and serving see the same number.
+#
+# value = decayed weighted mean of the scores, fading towards 0 once less than one article's worth of weight is
+# left: one article at 0.8 reads 0.8 when published and 0.4 a half-life later, ten fresh articles read their mean.
+# An article older than `last` (scored late) is decayed to `last` instead of moving it back, which gives the same
+# state as if it had arrived in order
+
+import os
+from datetime import datetime, timezone
+
+HALF_LIFE_HOURS = float(os.getenv('SENTIMENT_HALF_LIFE_HOURS', 24))
+EMPTY = (0.0, 0.0, None)
+
+
+def epoch(at):
+    if isinstance(at, (int, float)):
+        return float(at)
+    if at.tzinfo is None: # naive = UTC, like the news store
+        at = at.replace(tzinfo=timezone.utc)
+    return at.timestamp()
+
+
+def decay(seconds, half_life_hours=None):
+    return 0.5 ** (seconds / ((half_life_hours or HALF_LIFE_HOURS) * 3600))
+
+
+def update(state, score, at, half_life_hours=None):
+    total, weight, last = state
+    at = epoch(at)
+    if last is None:
+        return (float(score), 1.0, at)
+    if at >= last:
+        d = decay(at - last, half_life_hours)
+        return (total * d + score, weight * d + 1.0, at)
+    d = decay(last - at, half_life_hours)
+    return (total + score * d, weight + d, last)
+
+
+def value(state, at, half_life_hours=None):
+    total, weight, last = state
+    if last is None:
+        return 0.0
+    d = decay(max(epoch(at) - last, 0.0), half_life_hours)
+    return total * d / max(weight * d, 1.0)
+
+
+# offline: scored = (published_at, score) sorted by time, times = sorted read times. Value at each time from the
+# articles published up to then, one pass over both
+def values_at(scored, times, half_life_hours=None):
+    state = EMPTY
+    out = []
+    i = 0
+    for at in times:
+        t = epoch(at)
+        while i < len(scored) and epoch(scored[i][0]) <= t:
+            state = update(state, scored[i][1], scored[i][0], half_life_hours)
+            i += 1
+        out.append(value(state, t, half_life_hours))
+    return out
+
+
+def to_datetime(seconds):
+    return None if seconds is None else datetime.fromtimestamp(seconds, tz=timezone.utc)
@@ -1,3 +1,4 @@
+import pytest
 import pandas as pd
 from backend.scripts.calculate_indicators import calculate_indicators
 
@@ -16,4 +17,29 @@ def test_calculate_indicators_valid_data():
     # checks for the existance of technical indicator columns
     expected_columns = ['MACD', 'MACD_signal', 'MACD_diff', 'RSI', 'BB_bbm', 'BB_bbh', 'BB_bbl', 'BB_bbwidth', 'OBV']
     for column in expected_columns:
-          assert column in result.columns, f"Missing column: {column}" #if its not the same, will raise error
\ No newline at end of file
+          assert column in result.columns, f"Missing column: {column}" #if its not the same, will raise error
+
+def test_calculate_indicators_sorts_by_parsed_date():
+    # raw price files are dd/mm/yyyy: as text 01/06 would sort before 02/05
+    df = pd.DataFrame({
+        "Date": ["01/05/2024 16:00:00", "02/05/2024 16:00:00", "01/06/2024 16:00:00"],
+        "Open": [1, 2, 3], "High": [1, 2, 3], "Low": [1, 2, 3], "Close": [1, 2, 3], "Volume": [1, 1, 1],
+    })
+    result = calculate_indicators(df)
+    assert list(result["close"]) == [1, 2, 3]
+
+def test_main_reports_failed_tickers_and_exits_non_zero(monkeypatch, capsys):
+    from backend.scripts import calculate_indicators as stage
+
+    def process(ticker):
+        if ticker == "BAD":
+            raise FileNotFoundError("no price file")
+        return 10
+
+    monkeypatch.setattr(stage, "process_ticker", process)
+    monkeypatch.setattr("sys.argv", ["calculate_indicators.py", "--tickers", "AAPL", "BAD", "--workers", "1"])
+    with pytest.raises(SystemExit) as exited:
+        stage.main()
+    assert "1 of 2 tickers failed: BAD" in str(exited.value.code)
+    out = capsys.readouterr().out
+    assert "AAPL: 10 rows" in out and "BAD: FileNotFoundError: no price file" in out
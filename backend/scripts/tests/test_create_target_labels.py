@@ -14,3 +14,45 @@ def test_create_target_labels(): # forces it to be run as a test
     assert result.loc[0, 'target'] == 1, "Expected Buy label" # Buy (1) is the correct action,
     assert result.loc[1, 'target'] == 0, "Expected Hold label" # Other 2 are the same
     assert result.loc[2, 'target'] == -1, "Expected Sell label"
+
+
+def test_label_file_chunks_match_whole_file(tmp_path): # a ticker split across chunks must get the same labels
+    from backend.scripts.create_target_labels import label_file
+    closes = [100, 103, 101, 97, 99, 104, 100, 95]
+    df = pd.DataFrame({
+        "date": [f"2025-01-{d:02d}" for d in range(1, 9)] * 2,
+        "ticker": ["AAPL"] * 8 + ["MSFT"] * 8,
+        "close": closes + closes[::-1],
+    })
+    input_file = tmp_path / "consolidated.csv"
+    df.to_csv(input_file, index=False)
+
+    label_file(input_file, tmp_path / "whole.csv", chunksize=100)
+    ticker_dist = label_file(input_file, tmp_path / "chunked.csv", chunksize=3)
+
+    whole = pd.read_csv(tmp_path / "whole.csv")
+    chunked = pd.read_csv(tmp_path / "chunked.csv")
+    pd.testing.assert_frame_equal(whole, chunked)
+    assert ticker_dist.values.sum() == len(whole)
+
+
+def test_label_new_rows_only_appends_completed_days(tmp_path):
+    from backend.scripts.create_target_labels import label_new_rows
+    closes = [100, 103, 101, 97, 99, 104, 100, 95, 96, 98]
+    df = pd.DataFrame({
+        "date": [f"{d:02d}/01/2025" for d in range(1, 11)],
+        "ticker": ["AAPL"] * 10,
+        "close": closes,
+    })
+    consolidated, training = tmp_path / "consolidated.csv", tmp_path / "training.csv"
+
+    df.iloc[:7].to_csv(consolidated, index=False)
+    assert len(label_new_rows(consolidated, training, future_days=2)) == 5 # last 2 days wait for their future
+
+    df.to_csv(consolidated, index=False) # 3 more days arrive
+    new = label_new_rows(consolidated, training, future_days=2)
+    assert len(new) == 3 # the 2 that were waiting + 1 new one
+
+    result = pd.read_csv(training)
+    expected = create_target_labels(df, future_days=2)
+    assert result["target"].tolist() == expected["target"].tolist()
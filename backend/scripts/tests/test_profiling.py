@@ -0,0 +1,57 @@
+import argparse
+import time
+
+from backend.scripts import profiling
+
+# Note: This component is for the sampling CPU + allocation profiles written by profiling.py
+
+
+def busy_work():
+    end = time.perf_counter() + 0.15
+    blocks = []
+    while time.perf_counter() < end:
+        blocks.append(bytearray(10_000))
+    return blocks
+
+
+def test_profile_writes_folded_stacks(tmp_path):
+    with profiling.profile("unit test", str(tmp_path)) as info:
+        kept = busy_work()
+
+    assert info["samples"] > 5
+    cpu = (tmp_path / f"{info['id']}.cpu.folded").read_text().splitlines()
+    assert any("test_profiling.py:busy_work" in line for line in cpu)
+    stack, count = cpu[0].rsplit(" ", 1) # "frame;frame count" like flamegraph.pl expects
+    assert int(count) > 0 and ";" in stack
+
+    alloc = (tmp_path / f"{info['id']}.alloc.folded").read_text()
+    assert "test_profiling.py" in alloc # the bytearrays still held by `kept`
+    assert profiling.list_profiles(str(tmp_path))[0]["id"] == info["id"]
+    assert profiling.profile_file(info["id"], "alloc", str(tmp_path)).endswith(".alloc.folded")
+    assert profiling.profile_file("../etc", "cpu", str(tmp_path)) is None
+    del kept
+
+
+def test_second_profile_is_skipped_and_old_ones_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "KEEP", 2)
+    with profiling.profile("outer", str(tmp_path)) as outer:
+        with profiling.profile("inner", str(tmp_path)) as inner:
+            pass
+    assert inner["id"] is None and outer["id"]
+
+    for i in range(3):
+        with profiling.profile(f"run{i}", str(tmp_path)):
+            pass
+    assert len(profiling.list_profiles(str(tmp_path))) == 2
+
+
+def test_stage_runs_in_process(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args(["--profile"])
+    with profiling.stage(args, "stage"):
+        pass
+    assert args.workers == 1
+    assert len(profiling.list_profiles(str(tmp_path))) == 1
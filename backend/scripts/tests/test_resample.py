@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.scripts.resample import parse_interval, parse_times, resample, resample_chunks, resample_file
+
+
+def minute_frame(days=3, extended=False, seed=0):
+    rng = np.random.default_rng(seed)
+    times = []
+    for day in pd.date_range('2024-05-01', periods=days, freq='D'):
+        start, end = (day, day + pd.Timedelta('1D')) if extended else (day + pd.Timedelta('8h'), day + pd.Timedelta('17h'))
+        times.append(pd.date_range(start, end, freq='min', inclusive='left'))
+    times = times[0].append(times[1:])
+    times = times[np.sort(rng.choice(len(times), int(len(times) * 0.9), replace=False))] # some missing minutes
+    close = 100 + rng.standard_normal(len(times)).cumsum()
+    return pd.DataFrame({
+        'time': times, 'open': close + rng.standard_normal(len(times)), 'high': close + 1, 'low': close - 1,
+        'close': close, 'volume': rng.integers(1, 1000, len(times)).astype(float),
+    })
+
+
+def arrays(frame):
+    return (frame['time'].to_numpy().astype(np.int64), *(frame[c].to_numpy() for c in ['open', 'high', 'low', 'close', 'volume']))
+
+
+# pandas reference: regular session only, bars anchored at the 09:30 open
+def reference(frame, rule):
+    minute = frame['time'].dt.hour * 60 + frame['time'].dt.minute
+    session = frame[(minute >= 570) & (minute < 960)].set_index('time')
+    bars = session.resample(rule, origin=pd.Timestamp('2024-05-01 09:30')).agg(
+        {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'})
+    return bars[session['open'].resample(rule, origin=pd.Timestamp('2024-05-01 09:30')).count() > 0]
+
+
+@pytest.mark.parametrize('interval, rule', [('5m', '5min'), ('15min', '15min'), ('1h', '1h')])
+def test_resample_matches_pandas_across_chunks(interval, rule):
+    frame = minute_frame()
+    expected = reference(frame, rule)
+    ts, o, h, l, c, v = arrays(frame)
+    cuts = [0, 7, 1003, 1004, 2222, len(ts)] # mid bar, one row chunks, ...
+    chunks = [tuple(a[s:e] for a in (ts, o, h, l, c, v)) for s, e in zip(cuts, cuts[1:])]
+    parts = list(resample_chunks(chunks, interval))
+    bars = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+
+    assert (pd.to_datetime(bars['time']) == expected.index).all()
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        np.testing.assert_allclose(bars[col], expected[col].to_numpy())
+
+
+def test_hour_bars_stop_at_the_close():
+    frame = minute_frame(days=1)
+    bars = resample(*arrays(frame), '1h')
+    labels = pd.to_datetime(bars['time'])
+    assert labels[0] == pd.Timestamp('2024-05-01 09:30') and labels[-1] == pd.Timestamp('2024-05-01 15:30')
+    assert bars['bars'].max() <= 60 and bars['bars'][-1] <= 30 # 15:30-16:00
+
+
+def test_daily_bars_one_per_session():
+    frame = minute_frame(days=3, extended=True)
+    bars = resample(*arrays(frame), '1d')
+    assert list(pd.to_datetime(bars['time'])) == [pd.Timestamp(f'2024-05-0{d} 16:00') for d in (1, 2, 3)]
+    first = frame[(frame['time'] >= '2024-05-01 09:30') & (frame['time'] < '2024-05-01 16:00')]
+    assert bars['open'][0] == first['open'].iloc[0] and bars['close'][0] == first['close'].iloc[-1]
+    assert bars['volume'][0] == first['volume'].sum()
+
+    extended = resample(*arrays(frame), '1d', extended=True)
+    assert extended['volume'].sum() == frame['volume'].sum()
+
+
+def test_unsorted_minutes_are_rejected():
+    ts, o, h, l, c, v = arrays(minute_frame(days=1))
+    with pytest.raises(ValueError):
+        list(resample_chunks([tuple(a[100:] for a in (ts, o, h, l, c, v)), tuple(a[:100] for a in (ts, o, h, l, c, v))], '5m'))
+
+
+def test_parse_interval_and_times():
+    assert parse_interval('5m') == 5 and parse_interval('1h') == 60 and parse_interval('1d') is None
+    for bad in ['5', '2d', '0m', 'hourly']:
+        with pytest.raises(ValueError):
+            parse_interval(bad)
+    assert parse_times(['2024-05-01 09:30:00'])[0] == pd.Timestamp('2024-05-01 09:30')
+    assert parse_times(['01/05/2024 16:00:00'])[0] == pd.Timestamp('2024-05-01 16:00')
+
+
+def test_resample_file_writes_price_format(tmp_path):
+    frame = minute_frame(days=2)
+    frame.rename(columns=str.title).rename(columns={'Time': 'Timestamp'}).to_csv(tmp_path / 'minute.csv', index=False)
+    rows = resample_file(str(tmp_path / 'minute.csv'), str(tmp_path / 'out.csv'), '5m', chunksize=500)
+    out = pd.read_csv(tmp_path / 'out.csv')
+    assert list(out.columns) == ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+    assert rows == len(out) == len(reference(frame, '5min'))
+    assert out['Date'].iloc[0] == '01/05/2024 09:30:00'
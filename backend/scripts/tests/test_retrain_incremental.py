@@ -0,0 +1,47 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from backend.scripts import retrain_incremental, universe
+
+# Note: This component is for the warm start update + model rollback of retrain_incremental.py
+
+
+def test_extend_forest_keeps_size_and_original():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 4)).astype("float32")
+    y = np.digitize(X[:, 0], [-0.5, 0.5]) - 1 # -1, 0, 1 like the real labels
+    model = RandomForestClassifier(n_estimators=40, random_state=0).fit(X, y)
+    first_tree = model.estimators_[0]
+
+    updated = retrain_incremental.extend_forest(model, X[-80:], y[-80:], new_trees=10, class_weight=None)
+
+    assert updated.n_estimators == 40 and len(updated.estimators_) == 40 # same serving cost
+    assert updated.estimators_[0] is not first_tree # oldest trees were dropped
+    assert model.estimators_[0] is first_tree # original model untouched (it is what gets backed up)
+    assert list(updated.classes_) == [-1, 0, 1]
+
+
+def test_backup_and_rollback(tmp_path, monkeypatch):
+    monkeypatch.setattr(universe, "MODELS_DIR", str(tmp_path))
+    joblib.dump("old model", tmp_path / "stock_prediction_model.pkl")
+    (tmp_path / "model_metadata.json").write_text('{"created_date": "2025-01-01T00:00:00"}')
+
+    retrain_incremental.backup_current_model()
+    joblib.dump("new model", tmp_path / "stock_prediction_model.pkl")
+
+    assert retrain_incremental.rollback() == "2025-01-01T00-00-00"
+    assert joblib.load(tmp_path / "stock_prediction_model.pkl") == "old model"
+    assert os.listdir(tmp_path / "previous") == []
+
+
+def test_new_since_previous_marks_only_this_runs_rows():
+    meta = pd.DataFrame({"ticker": ["AAPL", "AAPL", "MSFT", "MSFT"], "date": ["2025-01-02", "2025-01-03", "2025-01-02", "2025-01-03"]})
+    dates = pd.to_datetime(meta["date"]).to_numpy()
+    new_rows = pd.DataFrame({"ticker": ["AAPL", "MSFT"], "date": ["2025-01-03", "2025-01-03"]})
+
+    assert list(retrain_incremental.new_since_previous(meta, dates, new_rows)) == [False, True, False, True]
+    assert not retrain_incremental.new_since_previous(meta, dates, new_rows.iloc[:0]).any()
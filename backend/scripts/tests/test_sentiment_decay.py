@@ -0,0 +1,45 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backend.scripts.sentiment_decay import EMPTY, update, value, values_at
+
+START = datetime(2025, 1, 6, 9, tzinfo=timezone.utc)
+
+
+def test_one_article_halves_every_half_life():
+    state = update(EMPTY, 0.8, START, half_life_hours=24)
+    assert value(state, START, 24) == pytest.approx(0.8)
+    assert value(state, START + timedelta(hours=24), 24) == pytest.approx(0.4)
+    assert value(state, START + timedelta(hours=48), 24) == pytest.approx(0.2)
+    assert value(EMPTY, START) == 0.0
+
+
+def test_fresh_articles_read_as_their_mean():
+    state = EMPTY
+    for score in (0.5, -0.1, 0.2):
+        state = update(state, score, START)
+    assert value(state, START) == pytest.approx(0.2)
+
+
+def test_arrival_order_does_not_matter():
+    rng = random.Random(0)
+    scored = sorted((START + timedelta(minutes=rng.randrange(0, 10_000)), rng.uniform(-1, 1)) for _ in range(200))
+    in_order = EMPTY
+    for at, score in scored:
+        in_order = update(in_order, score, at)
+    shuffled = EMPTY
+    for at, score in rng.sample(scored, len(scored)): # late articles, like a retried scoring batch
+        shuffled = update(shuffled, score, at)
+    read_at = START + timedelta(days=8)
+    assert value(shuffled, read_at) == pytest.approx(value(in_order, read_at), rel=1e-9)
+
+
+def test_values_at_only_sees_earlier_articles():
+    scored = [(START, 1.0), (START + timedelta(hours=10), -1.0)]
+    times = [START - timedelta(hours=1), START + timedelta(hours=5), START + timedelta(hours=10)]
+    before, between, after = values_at(scored, times, half_life_hours=24)
+    assert before == 0.0
+    assert between == pytest.approx(value(update(EMPTY, 1.0, START, 24), times[1], 24))
+    assert after == pytest.approx(value(update(update(EMPTY, 1.0, START, 24), -1.0, times[2], 24), times[2], 24))
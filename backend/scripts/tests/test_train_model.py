@@ -23,4 +23,84 @@ def test_prepare_features_missing_values():
 
     #assert missing values are filled
     assert X.isnull().values.any() == False, "Missing values were not filled" # essentially, if tf there are NO empty space, condition is passed
-    assert len(feature_cols) > 0, "Feature columns not identified correctly" # if you delete all feature col, then will return error
\ No newline at end of file
+    assert len(feature_cols) > 0, "Feature columns not identified correctly" # if you delete all feature col, then will return error
+
+def test_prepare_features_fills_within_each_ticker():
+    # MSFT's first MACD is missing, it must come from MSFT's next row, not AAPL's last one
+    df = pd.DataFrame({
+        "macd": [1.0, 2.0, None, 5.0],
+        "rsi": [50, float("inf"), 40, 45],
+        "target": [1, 0, -1, 0],
+        "date": ["2025-06-25", "2025-06-26", "2025-06-25", "2025-06-26"],
+        "ticker": ["AAPL", "AAPL", "MSFT", "MSFT"]
+    })
+    X, feature_cols = prepare_features(df)
+
+    assert feature_cols == ["macd", "rsi"]
+    assert X["macd"].tolist() == [1.0, 2.0, 5.0, 5.0]
+    assert X["rsi"].tolist() == [50.0, 50.0, 40.0, 45.0] # inf treated as missing
+    assert X.dtypes.unique().tolist() == ["float32"]
+
+
+def test_budget_selection_trims_to_fit():
+    import numpy as np
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import GridSearchCV
+    from backend.scripts.model_budget import measure_inference_cost, select_within_budget
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 5)).astype("float32")
+    y = (X[:, 0] > 0).astype(int)
+    grid = GridSearchCV(RandomForestClassifier(random_state=0), {"n_estimators": [100], "max_depth": [6]}, cv=2).fit(X, y)
+
+    full_size = measure_inference_cost(grid.best_estimator_, X)["pickle_mb"]
+    params, tried = select_within_budget(grid, X, y, {"max_size_mb": full_size / 3})
+
+    assert params["n_estimators"] < 100 # had to drop trees to fit
+    assert tried[0]["over_budget"] and tried[-1]["fits"]
+    assert tried[-1]["cost"]["pickle_mb"] <= full_size / 3
+
+
+def test_feature_reference_bins(tmp_path):
+    import bisect
+    import json
+    import numpy as np
+    from backend.scripts.feature_reference import build_reference, save_reference
+
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.normal(size=1000), np.where(rng.random(1000) < 0.5, 0.0, rng.random(1000))])
+    reference = build_reference(X, ["close", "news_sentiment"])
+
+    close = reference["features"]["close"]
+    assert len(close["edges"]) == 9 and np.allclose(close["fractions"], 0.1)
+    sentiment = reference["features"]["news_sentiment"]
+    assert len(sentiment["edges"]) < 9 # the zeros tie up several deciles
+    assert abs(sentiment["zero_share"] - 0.5) < 0.05
+    # the API bins with bisect_right on the same edges
+    counts = np.bincount([bisect.bisect_right(sentiment["edges"], v) for v in X[:, 1]], minlength=len(sentiment["fractions"]))
+    assert np.allclose(counts / len(X), sentiment["fractions"])
+
+    path = save_reference(reference, str(tmp_path), "v1")
+    assert json.load(open(path))["model_version"] == "v1"
+
+
+def test_model_family_trains_in_shared_memory_pool(tmp_path):
+    import json
+    import joblib
+    import numpy as np
+    from backend.scripts.model_family import read_manifest, train_family
+
+    rng = np.random.default_rng(0)
+    tickers = np.repeat(["AAPL", "MSFT", "XOM", "TINY"], [120, 120, 120, 30])
+    X = rng.normal(size=(len(tickers), 3)).astype(np.float32)
+    y = np.where(X[:, 0] > 0.5, 1, np.where(X[:, 0] < -0.5, -1, 0))
+    sectors = {"AAPL": "Tech", "MSFT": "Tech", "XOM": "Energy"}
+    params = {"n_estimators": 5, "max_depth": 3}
+
+    manifest = train_family(X, y, tickers, ["a", "b", "c"], workers=2, params=params, family_dir=str(tmp_path), sectors=sectors)
+    assert set(manifest["models"]) == {"global", "sector:Tech", "sector:Energy", "ticker:AAPL", "ticker:MSFT", "ticker:XOM"}
+    assert manifest["skipped"] == ["ticker:TINY"] # under MIN_ROWS, served by the global model
+    assert manifest["models"]["sector:Tech"]["rows"] == 240
+    assert read_manifest(str(tmp_path)) == json.loads(json.dumps(manifest))
+    model = joblib.load(tmp_path / manifest["directory"] / manifest["models"]["ticker:XOM"]["file"])
+    assert model.n_features_in_ == 3 and list(model.classes_) == [-1, 0, 1]
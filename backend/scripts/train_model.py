@@ -8,37 +8,64 @@
 
 import pandas as pd # Data Handling
 import numpy as np # Data Handling
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier # Main model
 from sklearn.model_selection import train_test_split, cross_val_score, GridSearchCV # data splitting, cross validation and grid search for hyperparam tuning
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score # Performance metrics
 import joblib # save trained model and related stuff
+import argparse
 import os
 from datetime import datetime
 
+try:
+    from . import profiling
+    from . import universe
+    from .feature_reference import build_reference, save_reference
+    from .model_family import LEVELS, MIN_ROWS, train_family
+    from .training_data import feature_columns, fill_gaps, load_with_report
+    from .model_budget import measure_inference_cost, over_budget, select_within_budget, shrink_to_budget
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+    from feature_reference import build_reference, save_reference
+    from model_family import LEVELS, MIN_ROWS, train_family
+    from training_data import feature_columns, fill_gaps, load_with_report
+    from model_budget import measure_inference_cost, over_budget, select_within_budget, shrink_to_budget
+
 # Main intuition => Instead of manually hard coding a MACD, RSI, BB range or OBV, model will ownself find out the best value and make a decision from there
 
 def prepare_features(df):
     # feature columns (exclude target, date, ticker, and future_return), this way predictive columns remain
-    exclude_cols = ['target', 'date', 'ticker', 'future_return']
-    feature_cols = [col for col in df.columns if col not in exclude_cols]
+    feature_cols = feature_columns(df.columns)
 
     print(f"Total features available: {len(feature_cols)}") # to confirm and ensure its 15 avail
 
-    # Handle missing values
-    X = df[feature_cols].copy()
-
-    # Fill missing values with forward fill, then backward fill, then 0
-    X = X.fillna(method='ffill').fillna(method='bfill').fillna(0)
-
-    # Check for infinite values and replace with NaN, then fill
-    X = X.replace([np.inf, -np.inf], np.nan).fillna(0)
+    # Handle missing values (inf counts as missing): forward fill, then backward fill, then 0, within each ticker
+    # so one ticker's gap is never filled with another ticker's last value. float32 = what the forest trains on
+    values = df[feature_cols].to_numpy(dtype=np.float32, copy=True)
+    group_codes = pd.factorize(df['ticker'])[0] if 'ticker' in df.columns else None
+    X = pd.DataFrame(fill_gaps(values, group_codes), columns=feature_cols, index=df.index)
 
     print(f"Features prepared: {X.shape}") # shows how many features will be fed to model
     return X, feature_cols
 
 
-def train_random_forest_model(X, y):
-# Random Forest training with Hyperparam Tuning
+# Hyperparameter grid (also used by retrain_incremental.py --compare-full)
+PARAM_GRID = { # Chosen arbitarily, by default n estimators is 100, None for Max Depth, split is 2, leaf is 1, max features is sqrt
+    'n_estimators': [100, 200], # End up choosing 200
+    'max_depth': [10, 11, 12, 13, 14, 15], # End Up choosing 11
+    'min_samples_split': [5, 10, 15], # End up choosing 15
+    'min_samples_leaf': [2, 4, 6], # End up choosing 6
+    'max_features': ['sqrt'] # Default
+}
+
+
+def base_forest():
+    return RandomForestClassifier(random_state=42, n_jobs=-1, class_weight='balanced')
+
+
+def train_random_forest_model(X, y, budget=None):
+# Random Forest training with Hyperparam Tuning (budget = serving latency/memory/size limits, see model_budget.py)
 # Split data
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=0.2, random_state=42, stratify=y # 80% Trng, 20% Test, 42 is just a random seed number to guarantee reproducibility.
@@ -50,15 +77,9 @@ def train_random_forest_model(X, y):
     print(f"Test set: {X_test.shape[0]:,} samples")
 
     # Hyperparameter tuning
-    param_grid = { # Chosen arbitarily, by default n estimators is 100, None for Max Depth, split is 2, leaf is 1, max features is sqrt
-        'n_estimators': [100, 200], # End up choosing 200
-        'max_depth': [10, 11, 12, 13, 14, 15], # End Up choosing 11
-        'min_samples_split': [5, 10, 15], # End up choosing 15
-        'min_samples_leaf': [2, 4, 6], # End up choosing 6
-        'max_features': ['sqrt'] # Default
-    }
+    param_grid = PARAM_GRID
 # Random forest
-    rf_base = RandomForestClassifier(random_state=42, n_jobs=-1, class_weight='balanced')
+    rf_base = base_forest()
     grid_search = GridSearchCV(
         rf_base, param_grid, cv=3, scoring='accuracy', # wrapping a base rf in GridSearchCV for a 3-fold cross validation
         n_jobs=-1, verbose=1
@@ -67,9 +88,17 @@ def train_random_forest_model(X, y):
     grid_search.fit(X_train, y_train) # Forces it to loop over the combi in param grid then do Inner CV, compute mean validation accuracies,
 # and select the best params (with highest cv accuracy). Will then  retrain on all of (X train and Y train)
 
-    # Best model
-    best_rf = grid_search.best_estimator_
-    print(f"Best parameters: {grid_search.best_params_}") # Ref to comments at Hyperparam testing component
+    # Best model (with a budget: most accurate candidate that is cheap enough to serve, refit on all of X train)
+    budget_candidates = None
+    if budget and any(v is not None for v in budget.values()):
+        params, budget_candidates = select_within_budget(grid_search, X_train, y_train, budget)
+        best_rf = shrink_to_budget(clone(rf_base).set_params(**params).fit(X_train, y_train), X_test, budget)
+        params = params | {'n_estimators': best_rf.n_estimators}
+        print(f"Within budget {budget}: {params} (tried {len(budget_candidates)} candidates)")
+    else:
+        params = grid_search.best_params_
+        best_rf = grid_search.best_estimator_
+    print(f"Best parameters: {params}") # Ref to comments at Hyperparam testing component
 
     # Evaluate model
     train_score = best_rf.score(X_train, y_train)
@@ -91,7 +120,21 @@ def train_random_forest_model(X, y):
     target_names = ['SELL', 'HOLD', 'BUY']
     print(classification_report(y_test, y_pred, target_names=target_names)) # Precision, reall, f1 score per class (Sell, Hold, Buy)
 
-    return best_rf, X_test, y_test, y_pred # Return retrained model
+    # What this model costs per request, goes into model_metadata.json
+    inference_cost = measure_inference_cost(best_rf, X_test)
+    print(f"Inference: {inference_cost['single_row_ms']:.1f} ms/row single, {inference_cost['batch_row_us']:.1f} us/row batched, "
+          f"{inference_cost['pickle_mb']:.1f} MB pickle, {inference_cost['memory_mb']:.1f} MB loaded")
+
+    training_info = {
+        'params': {k: v for k, v in params.items()},
+        'test_accuracy': float(test_score),
+        'cv_accuracy': float(cv_scores.mean()),
+        'inference_cost': inference_cost,
+        'budget': budget or {},
+        'over_budget': over_budget(inference_cost, budget or {}),
+        'budget_candidates': budget_candidates,
+    }
+    return best_rf, X_test, y_test, y_pred, training_info # Return retrained model
 
 # Analyse and show feature importance
 def analyse_feature_importance(model, feature_cols):
@@ -107,9 +150,10 @@ def analyse_feature_importance(model, feature_cols):
     return importance_df
 
 # Impt - Used to save the model + relevant files
-def save_model_artifacts(model, feature_importance, feature_cols):
+# reference = build_reference(training X), for the API's drift monitor
+def save_model_artifacts(model, feature_importance, feature_cols, training_info=None, reference=None):
     # Create models folder for it to be stored
-    models_dir = '../../Data Files/Models'
+    models_dir = universe.MODELS_DIR
     os.makedirs(models_dir, exist_ok=True)
 
     # Save model
@@ -131,41 +175,89 @@ def save_model_artifacts(model, feature_importance, feature_cols):
         'n_features': len(feature_cols),
         'target_classes': ['SELL (-1)', 'HOLD (0)', 'BUY (1)']
     }
+    metadata.update(training_info or {}) # params, accuracy, inference cost + budget
 
     metadata_path = os.path.join(models_dir, 'model_metadata.json')
     import json
     with open(metadata_path, 'w') as f:
         json.dump(metadata, f, indent=2)
 
+    # Save training feature distributions (tagged with this model's version)
+    if reference is not None:
+        save_reference(reference, models_dir, metadata['created_date'])
+
+
+# Reference distributions for the model already in Models/ (e.g. one trained before they were saved), no retraining
+def save_current_reference(input_file, source='csv'):
+    model_features = joblib.load(os.path.join(universe.MODELS_DIR, 'feature_columns.pkl'))
+    X, y, meta, feature_cols = load_with_report(input_file, source=source)
+    X = np.asarray(X)[:, [feature_cols.index(col) for col in model_features]]
+    import json
+    with open(os.path.join(universe.MODELS_DIR, 'model_metadata.json')) as f:
+        version = json.load(f).get('created_date')
+    path = save_reference(build_reference(X, model_features), universe.MODELS_DIR, version)
+    print(f"Reference distributions for {len(model_features)} features over {len(X):,} rows -> {path}")
+
+
+def env_limit(name):
+    value = float(os.environ.get(name) or 0)
+    return value or None
+
 
 def main(): #essentially the main function which calls the other fn above
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=universe.TRAINING_FILE)
+    parser.add_argument('--cache', action='store_true', help='keep a memory-mapped .npy copy next to the csv for the next run')
+    parser.add_argument('--source', choices=['csv', 'store'], default='csv', help='store = train from the feature store (api.FeatureRow)')
+    # serving budget, same env vars the API checks (0 / unset = no limit)
+    parser.add_argument('--max-latency-ms', type=float, default=env_limit('MODEL_MAX_LATENCY_MS'), help='single-row predict_proba')
+    parser.add_argument('--max-memory-mb', type=float, default=env_limit('MODEL_MAX_MEMORY_MB'), help='model memory once loaded')
+    parser.add_argument('--max-size-mb', type=float, default=env_limit('MODEL_MAX_SIZE_MB'), help='pickle size')
+    parser.add_argument('--reference-only', action='store_true', help='only (re)write feature_reference.json for the current model')
+    # model family for per-symbol routing (model_family.py) instead of the single grid searched model
+    parser.add_argument('--family', nargs='*', choices=LEVELS, help='train these levels of the model family (none given = all)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='--family: models fitted in parallel')
+    parser.add_argument('--min-rows', type=int, default=MIN_ROWS, help='--family: smallest sector / ticker that gets its own model')
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+    budget = {'max_latency_ms': args.max_latency_ms, 'max_memory_mb': args.max_memory_mb, 'max_size_mb': args.max_size_mb}
+
     # Load the labeled training data
-    input_file = '../../Data Files/Consolidated/ml_training_data.csv'
+    input_file = args.input
 
-    if not os.path.exists(input_file):
+    if args.source == 'csv' and not os.path.exists(input_file):
+        return
+    if args.reference_only:
+        save_current_reference(input_file, args.source)
         return
 
-    df = pd.read_csv(input_file)
+    # float32 feature matrix, gaps already filled per ticker (see training_data.py)
+    with profiling.stage(args, 'train_model-load'):
+        X, y, meta, feature_cols = load_with_report(input_file, cache=args.cache, source=args.source)
 
-    # Prepare features
-    X, feature_cols = prepare_features(df)
-    y = df['target']
+    if args.family is not None:
+        with profiling.stage(args, 'train_model-family'):
+            train_family(X, y, meta['ticker'].to_numpy(), feature_cols, args.family or LEVELS, args.workers, args.min_rows)
+        return
 
     print(f"\n Buy/Hold/Sell Distribution")
-    target_counts = y.value_counts().sort_index()
+    target_counts = pd.Series(y).value_counts().sort_index()
     for target, count in target_counts.items():
         label = "SELL" if target == -1 else "HOLD" if target == 0 else "BUY"
         print(f"{target:2d} ({label}): {count:4,} samples")
 
     # Train model
     print("Model Training Starts")
-    model, X_test, y_test, y_pred = train_random_forest_model(X, y)
+    with profiling.stage(args, 'train_model-train'): # grid search workers (n_jobs) are separate processes, not sampled
+        model, X_test, y_test, y_pred, training_info = train_random_forest_model(X, y, budget)
 
     # Analyse feature importance
     feature_importance = analyse_feature_importance(model, feature_cols)
 
     # Save everything
-    save_model_artifacts(model, feature_importance, feature_cols)
+    save_model_artifacts(model, feature_importance, feature_cols, training_info, build_reference(X, feature_cols))
+    if training_info['over_budget']:
+        print(f"WARNING model is over budget: {training_info['over_budget']}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+# Compact loader for ml_training_data.csv (or the feature store, source='store')
+# Features come back as one float32 matrix (the dtype the random forest works in anyway, so sklearn does not copy it
+# again), ticker/date as categoricals, target as int8. Gaps are filled per ticker (ffill -> bfill -> 0) in place,
+# so a missing value is never filled from the previous ticker's last row.
+# With cache=True the arrays are also saved next to the csv as .npy files and memory-mapped on the next load
+# (rebuilt when the csv changes):
+#   python training_data.py            -> load (build cache if needed) and report time + peak memory
+
+import argparse
+import json
+import os
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import profiling
+    from . import universe
+    from .create_target_labels import create_target_labels
+    from .django_env import setup_django
+except ImportError: # run as a script from backend/scripts
+    import profiling
+    import universe
+    from create_target_labels import create_target_labels
+    from django_env import setup_django
+
+EXCLUDE_COLS = ['target', 'date', 'ticker', 'future_return']
+
+
+def feature_columns(columns):
+    return [col for col in columns if col not in EXCLUDE_COLS]
+
+
+# ffill then bfill inside each group, then 0, column by column on X itself (only one int index column extra at a time)
+# group_codes must be contiguous (every ticker's rows together), which is how create_target_labels writes the file
+def fill_gaps(X, group_codes=None):
+    n = X.shape[0]
+    if n == 0:
+        return X
+    X[~np.isfinite(X)] = np.nan # inf counts as missing too
+    rows = np.arange(n)
+    if group_codes is None:
+        starts = np.zeros(n, dtype=np.int64)
+    else:
+        new_group = np.r_[True, group_codes[1:] != group_codes[:-1]]
+        starts = np.maximum.accumulate(np.where(new_group, rows, 0))
+        ends = np.minimum.accumulate(np.where(np.r_[new_group[1:], True], rows, n - 1)[::-1])[::-1]
+
+    for j in range(X.shape[1]):
+        col = X[:, j]
+        missing = np.isnan(col)
+        if not missing.any():
+            continue
+        # forward fill: index of the last valid row so far, only if it belongs to the same group
+        last = np.maximum.accumulate(np.where(missing, -1, rows))
+        ok = missing & (last >= starts)
+        col[ok] = col[last[ok]]
+        # backward fill for whatever is still missing at the start of a group
+        missing = np.isnan(col)
+        if missing.any():
+            nxt = np.minimum.accumulate(np.where(missing, n, rows)[::-1])[::-1]
+            limit = ends if group_codes is not None else np.full(n, n - 1)
+            ok = missing & (nxt <= limit)
+            col[ok] = col[nxt[ok]]
+        col[np.isnan(col)] = 0
+    return X
+
+
+def read_csv_compact(path):
+    columns = pd.read_csv(path, nrows=0).columns
+    features = feature_columns(columns)
+    dtypes = {col: np.float32 for col in features}
+    dtypes.update({'ticker': 'category', 'date': 'category', 'target': np.int8})
+    df = pd.read_csv(path, usecols=[c for c in columns if c != 'future_return'], dtype=dtypes)
+    return compact(df, features)
+
+
+# Same arrays straight from the feature store (api.FeatureRow), labelled here with create_target_labels
+def read_store_compact(symbols=None):
+    setup_django()
+    from api import feature_store
+    df = create_target_labels(feature_store.training_frame(symbols))
+    df = df.drop(columns=['future_return'])
+    df['date'] = df['date'].dt.strftime('%Y-%m-%d')
+    df = df.astype({'ticker': 'category', 'date': 'category', 'target': np.int8})
+    return compact(df, feature_store.FEATURE_COLUMNS)
+
+
+# df -> (X, y, meta, features). Takes the feature columns out of df one by one into a single float32 matrix
+def compact(df, features):
+    codes = df['ticker'].cat.codes.to_numpy()
+    blocks = 1 + np.count_nonzero(codes[1:] != codes[:-1]) if len(codes) else 0
+    if blocks > len(np.unique(codes)):
+        df = df.sort_values(['ticker', 'date'], kind='stable') # tickers not in blocks, group them so the fill stays per ticker
+
+    X = np.empty((len(df), len(features)), dtype=np.float32)
+    for j, col in enumerate(features): # one allocation, filled column by column
+        X[:, j] = df.pop(col).to_numpy()
+    meta = df[['ticker', 'date']].reset_index(drop=True)
+    y = df['target'].to_numpy()
+    fill_gaps(X, meta['ticker'].cat.codes.to_numpy())
+    return X, y, meta, features
+
+
+def cache_paths(path):
+    base = os.path.splitext(path)[0]
+    return {name: f"{base}.{name}.npy" for name in ('features', 'target', 'ticker', 'date')}, f"{base}.cache.json"
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def write_cache(path, X, y, meta, features):
+    arrays, info_path = cache_paths(path)
+    np.save(arrays['features'], X)
+    np.save(arrays['target'], y)
+    np.save(arrays['ticker'], meta['ticker'].cat.codes.to_numpy())
+    np.save(arrays['date'], meta['date'].cat.codes.to_numpy())
+    with open(info_path, 'w') as f:
+        json.dump({
+            'source': source_stamp(path),
+            'features': features,
+            'tickers': list(meta['ticker'].cat.categories),
+            'dates': list(meta['date'].cat.categories),
+        }, f)
+
+
+def read_cache(path):
+    arrays, info_path = cache_paths(path)
+    if not os.path.exists(info_path) or not all(os.path.exists(p) for p in arrays.values()):
+        return None
+    with open(info_path) as f:
+        info = json.load(f)
+    if info['source'] != source_stamp(path):
+        return None # csv changed since the cache was built
+    X = np.load(arrays['features'], mmap_mode='r') # pages are read on demand, not copied into memory
+    y = np.load(arrays['target'])
+    meta = pd.DataFrame({
+        'ticker': pd.Categorical.from_codes(np.load(arrays['ticker']), info['tickers']),
+        'date': pd.Categorical.from_codes(np.load(arrays['date']), info['dates']),
+    })
+    return X, y, meta, info['features']
+
+
+# -> (X float32 [n, features], y int8 [n], meta with categorical ticker/date, feature column names)
+# source='store' reads the feature store instead of the csv (never cached, it is the database)
+def load_training_data(path=universe.TRAINING_FILE, cache=False, source='csv'):
+    if source == 'store':
+        # whole store unless UNIVERSE / UNIVERSE_FILE narrows it down
+        explicit = os.environ.get('UNIVERSE') or os.environ.get('UNIVERSE_FILE')
+        return read_store_compact(universe.get_universe() if explicit else None)
+    if cache:
+        cached = read_cache(path)
+        if cached is not None:
+            return cached
+    X, y, meta, features = read_csv_compact(path)
+    if cache:
+        write_cache(path, X, y, meta, features)
+    return X, y, meta, features
+
+
+# load + print how long it took and how much memory it needed. The allocation peak comes from tracemalloc, which
+# slows the load down, so it is only read when --profile is tracing anyway; otherwise the time is untraced and
+# the peak RSS is the memory figure
+def load_with_report(path=universe.TRAINING_FILE, cache=False, source='csv'):
+    traced = tracemalloc.is_tracing()
+    if traced:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    X, y, meta, features = load_training_data(path, cache, source)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if traced else None
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if source == 'csv' and isinstance(X, np.memmap):
+        source = 'cache (mmap)'
+    allocated = f"peak allocated {peak / 1e6:.1f} MB (traced), " if traced else ''
+    print(f"Loaded {X.shape[0]:,} rows x {X.shape[1]} features from {source} in {elapsed:.2f}s, "
+          f"matrix {X.nbytes / 1e6:.1f} MB, {allocated}process peak RSS {rss_mb:.0f} MB")
+    return X, y, meta, features
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', default=universe.TRAINING_FILE)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--source', choices=['csv', 'store'], default='csv')
+    profiling.add_profile_arg(parser)
+    args = parser.parse_args()
+    with profiling.stage(args, 'training_data'):
+        load_with_report(args.input, cache=not args.no_cache, source=args.source)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# One definition of the ticker universe + where every stage reads/writes its files
+# Universe = UNIVERSE env var (comma separated) or UNIVERSE_FILE (one ticker per line), otherwise every ticker that
+# has both a raw price file and a news file in Data Files. PIPELINE_DATA_DIR points the whole pipeline at another
+# data folder (used by benchmark_pipeline.py)
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+# Finding Project root directory, need move 3 times, same as others
+PROJECT_ROOT = os.path.dirname(
+    os.path.dirname(
+        os.path.dirname(
+            os.path.abspath(__file__)
+        )
+    )
+)
+
+DATA_DIR = os.environ.get('PIPELINE_DATA_DIR', os.path.join(PROJECT_ROOT, "Data Files"))
+PRICE_DIR = os.path.join(DATA_DIR, "Price")
+PROCESSED_DIR = os.path.join(PRICE_DIR, "Processed")
+NEWS_DIR = os.path.join(DATA_DIR, "News Article")
+CONSOLIDATED_DIR = os.path.join(DATA_DIR, "Consolidated")
+MODELS_DIR = os.path.join(DATA_DIR, "Models")
+
+# IMPT! leave same format, just add the file names behind (with_indicators, complete_year, cleaned)
+PRICE_PATTERN = "13M Data {ticker} - Sheet1.csv"
+INDICATOR_PATTERN = "13M Data {ticker} - Sheet1_with_indicators.csv"
+CLEANED_PATTERN = "13M Data {ticker} - Sheet1_cleaned.csv"
+NEWS_PATTERN = "{ticker_lower}_news_complete_year.csv"
+MINUTE_DIR = os.path.join(PRICE_DIR, "Minute") # intraday source bars for resample.py
+MINUTE_PATTERN = "{ticker} minute.csv"
+
+CONSOLIDATED_FILE = os.path.join(CONSOLIDATED_DIR, "consolidated_data_with_sentiment.csv")
+TRAINING_FILE = os.path.join(CONSOLIDATED_DIR, "ml_training_data.csv")
+SECTOR_FILE = os.environ.get('SECTOR_FILE', os.path.join(DATA_DIR, "sectors.csv")) # ticker,sector (GICS sector names)
+
+
+def price_path(ticker):
+    return os.path.join(PRICE_DIR, PRICE_PATTERN.format(ticker=ticker))
+
+def indicators_path(ticker):
+    return os.path.join(PROCESSED_DIR, INDICATOR_PATTERN.format(ticker=ticker))
+
+def cleaned_path(ticker):
+    return os.path.join(PROCESSED_DIR, CLEANED_PATTERN.format(ticker=ticker))
+
+def news_path(ticker):
+    return os.path.join(NEWS_DIR, NEWS_PATTERN.format(ticker_lower=ticker.lower()))
+
+def minute_path(ticker):
+    return os.path.join(MINUTE_DIR, MINUTE_PATTERN.format(ticker=ticker))
+
+
+# every ticker with a minute bar file
+def minute_tickers():
+    suffix = MINUTE_PATTERN.replace("{ticker}", "")
+    if not os.path.isdir(MINUTE_DIR):
+        return []
+    return sorted(f[:-len(suffix)] for f in os.listdir(MINUTE_DIR) if f.endswith(suffix))
+
+
+# every ticker with a raw price csv + a news csv
+def discover_tickers():
+    price_re = re.compile("^" + re.escape(PRICE_PATTERN).replace(re.escape("{ticker}"), "(.+)") + "$")
+    tickers = []
+    if os.path.isdir(PRICE_DIR):
+        for f in os.listdir(PRICE_DIR):
+            match = price_re.match(f)
+            if match and os.path.exists(news_path(match.group(1))):
+                tickers.append(match.group(1))
+    return sorted(tickers)
+
+
+def get_universe(tickers=None):
+    if tickers:
+        return [t.upper() for t in tickers]
+    if os.environ.get('UNIVERSE'):
+        return [t.strip().upper() for t in os.environ['UNIVERSE'].split(',') if t.strip()]
+    if os.environ.get('UNIVERSE_FILE'):
+        with open(os.environ['UNIVERSE_FILE']) as f:
+            return [line.strip().upper() for line in f if line.strip() and not line.startswith('#')]
+    return discover_tickers()
+
+
+# {ticker: sector} from SECTOR_FILE, {} if there is none (tickers without a sector only get global / own models)
+def get_sectors():
+    if not os.path.exists(SECTOR_FILE):
+        return {}
+    sectors = {}
+    with open(SECTOR_FILE) as f:
+        for line in f:
+            ticker, _, sector = line.strip().partition(',')
+            if ticker and sector and ticker != 'ticker':
+                sectors[ticker.upper()] = sector.strip()
+    return sectors
+
+
+# shared cli flags for every stage
+def add_universe_args(parser):
+    parser.add_argument('--tickers', nargs='*', help='Override the universe for this run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Tickers processed in parallel (1 = no pool)')
+
+
+# Run fn(ticker) for every ticker, each in its own process so memory is only ever one ticker per worker.
+# Returns {ticker: (ok, result or error message)}. Results should be small (write big output to disk in fn)
+def run_per_ticker(fn, tickers, workers=None, initializer=None):
+    results = {}
+    if not workers or workers <= 1 or len(tickers) <= 1:
+        if initializer:
+            initializer()
+        for ticker in tickers:
+            results[ticker] = _call(fn, ticker)
+        return results
+
+    # fresh worker every 50 tickers so one huge ticker can't keep memory high for the rest of the run
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, max_tasks_per_child=50) as pool:
+        for ticker, result in zip(tickers, pool.map(_call, [fn] * len(tickers), tickers)):
+            results[ticker] = result
+    return results
+
+
+def _call(fn, ticker):
+    try:
+        return True, fn(ticker)
+    except Exception as e:
+        return False, f"{type(e).__name__}: {e}"